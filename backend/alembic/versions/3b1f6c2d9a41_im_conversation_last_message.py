@@ -0,0 +1,49 @@
+"""im_conversation_last_message
+
+Revision ID: 3b1f6c2d9a41
+Revises: 22786ca810d7
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b1f6c2d9a41'
+down_revision: Union[str, None] = '22786ca810d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """升级迁移"""
+    op.add_column('im_conversations', sa.Column('last_message_sender_id', sa.Integer(), nullable=True, comment='最后消息发送者ID'))
+    op.add_column('im_conversations', sa.Column('last_message_type', sa.String(length=20), nullable=True, comment='最后消息类型（撤回后为 recalled）'))
+    op.add_column('im_conversations', sa.Column('last_message_content', sa.Text(), nullable=True, comment='最后消息内容（加密存储）'))
+    
+    # 回填已有会话的最后消息
+    op.execute("""
+        UPDATE im_conversations SET
+            last_message_sender_id = (
+                SELECT m.sender_id FROM im_messages m WHERE m.id = im_conversations.last_message_id
+            ),
+            last_message_type = (
+                SELECT CASE WHEN m.is_recalled THEN 'recalled' ELSE m.type END
+                FROM im_messages m WHERE m.id = im_conversations.last_message_id
+            ),
+            last_message_content = (
+                SELECT CASE WHEN m.is_recalled THEN NULL ELSE m.content END
+                FROM im_messages m WHERE m.id = im_conversations.last_message_id
+            )
+        WHERE last_message_id IS NOT NULL
+    """)
+
+
+def downgrade() -> None:
+    """降级迁移"""
+    op.drop_column('im_conversations', 'last_message_content')
+    op.drop_column('im_conversations', 'last_message_type')
+    op.drop_column('im_conversations', 'last_message_sender_id')
@@ -0,0 +1,66 @@
+"""im_read_watermark
+
+Revision ID: 7c4e2a9f5b13
+Revises: 3b1f6c2d9a41
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c4e2a9f5b13'
+down_revision: Union[str, None] = '3b1f6c2d9a41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """升级迁移"""
+    # 以逐条已读记录中的最大消息ID回填成员已读水位（只进不退）
+    op.execute("""
+        UPDATE im_conversation_members SET last_read_message_id = (
+            SELECT MAX(r.message_id) FROM im_message_reads r
+            WHERE r.conversation_id = im_conversation_members.conversation_id
+              AND r.user_id = im_conversation_members.user_id
+        )
+        WHERE EXISTS (
+            SELECT 1 FROM im_message_reads r
+            WHERE r.conversation_id = im_conversation_members.conversation_id
+              AND r.user_id = im_conversation_members.user_id
+              AND (im_conversation_members.last_read_message_id IS NULL
+                   OR r.message_id > im_conversation_members.last_read_message_id)
+        )
+    """)
+    
+    # 已读状态改由水位比较得出，不再需要逐条记录
+    op.drop_index(op.f('ix_im_message_reads_user_id'), table_name='im_message_reads')
+    op.drop_index(op.f('ix_im_message_reads_message_id'), table_name='im_message_reads')
+    op.drop_index(op.f('ix_im_message_reads_conversation_id'), table_name='im_message_reads')
+    op.drop_index('idx_im_read_user_conv', table_name='im_message_reads')
+    op.drop_index('idx_im_read_msg_user', table_name='im_message_reads')
+    op.drop_table('im_message_reads')
+
+
+def downgrade() -> None:
+    """降级迁移"""
+    op.create_table('im_message_reads',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False, comment='主键ID'),
+    sa.Column('message_id', sa.Integer(), nullable=False, comment='消息ID'),
+    sa.Column('user_id', sa.Integer(), nullable=False, comment='用户ID'),
+    sa.Column('conversation_id', sa.Integer(), nullable=False, comment='会话ID'),
+    sa.Column('read_at', sa.DateTime(timezone=True), nullable=False, comment='阅读时间'),
+    sa.ForeignKeyConstraint(['conversation_id'], ['im_conversations.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['message_id'], ['im_messages.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['sys_users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    comment='即时通讯消息已读记录表'
+    )
+    op.create_index('idx_im_read_msg_user', 'im_message_reads', ['message_id', 'user_id'], unique=False)
+    op.create_index('idx_im_read_user_conv', 'im_message_reads', ['user_id', 'conversation_id'], unique=False)
+    op.create_index(op.f('ix_im_message_reads_conversation_id'), 'im_message_reads', ['conversation_id'], unique=False)
+    op.create_index(op.f('ix_im_message_reads_message_id'), 'im_message_reads', ['message_id'], unique=False)
+    op.create_index(op.f('ix_im_message_reads_user_id'), 'im_message_reads', ['user_id'], unique=False)
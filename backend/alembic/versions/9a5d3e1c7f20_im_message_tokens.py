@@ -0,0 +1,41 @@
+"""im_message_tokens
+
+Revision ID: 9a5d3e1c7f20
+Revises: 7c4e2a9f5b13
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a5d3e1c7f20'
+down_revision: Union[str, None] = '7c4e2a9f5b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """升级迁移"""
+    op.create_table('im_message_tokens',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False, comment='主键ID'),
+    sa.Column('conversation_id', sa.Integer(), nullable=False, comment='会话ID'),
+    sa.Column('message_id', sa.Integer(), nullable=False, comment='消息ID'),
+    sa.Column('token', sa.String(length=32), nullable=False, comment='HMAC令牌'),
+    sa.ForeignKeyConstraint(['conversation_id'], ['im_conversations.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['message_id'], ['im_messages.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    comment='即时通讯消息搜索盲索引表'
+    )
+    op.create_index('idx_im_token_conv_token', 'im_message_tokens', ['conversation_id', 'token'], unique=False)
+    op.create_index(op.f('ix_im_message_tokens_message_id'), 'im_message_tokens', ['message_id'], unique=False)
+
+
+def downgrade() -> None:
+    """降级迁移"""
+    op.drop_index(op.f('ix_im_message_tokens_message_id'), table_name='im_message_tokens')
+    op.drop_index('idx_im_token_conv_token', table_name='im_message_tokens')
+    op.drop_table('im_message_tokens')
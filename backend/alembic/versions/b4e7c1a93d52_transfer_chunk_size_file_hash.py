@@ -0,0 +1,30 @@
+"""transfer_chunk_size_file_hash
+
+Revision ID: b4e7c1a93d52
+Revises: 9a5d3e1c7f20
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4e7c1a93d52'
+down_revision: Union[str, None] = '9a5d3e1c7f20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """升级迁移"""
+    op.add_column('transfer_sessions', sa.Column('chunk_size', sa.Integer(), nullable=True, comment='协商的分块大小(字节)'))
+    op.add_column('transfer_sessions', sa.Column('file_hash', sa.String(length=64), nullable=True, comment='整文件树哈希(SHA-256)'))
+
+
+def downgrade() -> None:
+    """降级迁移"""
+    op.drop_column('transfer_sessions', 'file_hash')
+    op.drop_column('transfer_sessions', 'chunk_size')
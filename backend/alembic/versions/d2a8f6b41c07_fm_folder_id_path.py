@@ -0,0 +1,52 @@
+"""fm_folder_id_path
+
+Revision ID: d2a8f6b41c07
+Revises: b4e7c1a93d52
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a8f6b41c07'
+down_revision: Union[str, None] = 'b4e7c1a93d52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """升级迁移"""
+    op.add_column('fm_folders', sa.Column('id_path', sa.String(length=512), nullable=False, server_default='/', comment='祖先ID物化路径'))
+
+    # 回填物化路径：一次读出 id/parent_id，在内存中逐级拼接
+    conn = op.get_bind()
+    parents = dict(conn.execute(sa.text("SELECT id, parent_id FROM fm_folders")).fetchall())
+    paths = {}
+
+    def resolve(folder_id):
+        chain = []
+        current = folder_id
+        while current is not None and current not in paths and current not in chain:
+            chain.append(current)
+            current = parents.get(current)
+        prefix = paths.get(current, "/")
+        for node in reversed(chain):
+            prefix = f"{prefix}{node}/"
+            paths[node] = prefix
+        return paths[folder_id]
+
+    rows = [{"id": folder_id, "id_path": resolve(folder_id)} for folder_id in parents]
+    if rows:
+        conn.execute(sa.text("UPDATE fm_folders SET id_path = :id_path WHERE id = :id"), rows)
+
+    op.create_index('idx_fm_folder_idpath', 'fm_folders', ['user_id', 'id_path'], unique=False)
+
+
+def downgrade() -> None:
+    """降级迁移"""
+    op.drop_index('idx_fm_folder_idpath', table_name='fm_folders')
+    op.drop_column('fm_folders', 'id_path')
@@ -0,0 +1,28 @@
+"""schedule_reminder_due_index
+
+Revision ID: e6c3b9d25a18
+Revises: d2a8f6b41c07
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6c3b9d25a18'
+down_revision: Union[str, None] = 'd2a8f6b41c07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """升级迁移"""
+    op.create_index('idx_schedule_reminder_due', 'schedule_reminders', ['is_sent', 'remind_time'], unique=False)
+
+
+def downgrade() -> None:
+    """降级迁移"""
+    op.drop_index('idx_schedule_reminder_due', table_name='schedule_reminders')
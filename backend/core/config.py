@@ -78,6 +78,19 @@ class Settings(BaseSettings):
             return f"redis://default:{encoded_password}@{self.redis_host}:{self.redis_port}/{self.redis_db}"
         return f"redis://{self.redis_host}:{self.redis_port}/{self.redis_db}"
     
+    # 事件总线跨进程传输（Redis Streams，Redis 不可用时自动退化为进程内分发）
+    event_stream_enabled: bool = True
+    event_stream_name: str = "webos:events"
+    
+    # WebSocket 推送（单连接发送队列上限、发送超时秒数、Redis Pub/Sub 跨进程转发）
+    ws_send_queue_size: int = 64
+    ws_send_timeout: float = 5.0
+    ws_backplane_enabled: bool = True
+    ws_backplane_prefix: str = "webos:ws"
+    
+    # 即时通讯消息搜索盲索引（可选，开启后发送的文本消息写入 HMAC 令牌索引以支持内容搜索）
+    im_search_index_enabled: bool = False
+    
     # JWT令牌配置
     jwt_secret: str = "your-secret-key-change-in-production"
     jwt_secret_old: Optional[str] = None  # 旧密钥（用于密钥轮换）
@@ -96,6 +109,9 @@ class Settings(BaseSettings):
     # 文件存储
     upload_dir: str = "storage"
     max_upload_size: int = 100 * 1024 * 1024  # 100MB
+    storage_dedup_enabled: bool = False  # 内容寻址去重（相同文件硬链接到 system/blobs，支持秒传）
+    pdf_render_cache_mb: int = 512  # PDF 页面渲染磁盘缓存上限（system/pdf_render_cache）
+    ocr_cache_mb: int = 256  # OCR 识别结果磁盘缓存上限（system/ocr_cache）
     
     # 模块配置
     modules_dir: str = "modules"
@@ -125,6 +141,11 @@ class Settings(BaseSettings):
     # 认证：是否使用 HttpOnly Cookie 存放 Token（防 XSS 窃取，需前端 credentials + 同源或正确 CORS）
     auth_use_httponly_cookie: bool = True
 
+    # AI 本地推理配置
+    ai_local_n_ctx: int = 2048        # 本地模型上下文长度
+    ai_local_max_queue: int = 32      # 单模型最大排队请求数
+    ai_online_n_ctx: int = 32768      # 在线模型上下文长度（用于提示词预算）
+
     model_config = SettingsConfigDict(
         env_file=str(ENV_FILE),
         env_file_encoding="utf-8",
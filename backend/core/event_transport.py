@@ -0,0 +1,389 @@
+"""
+事件总线跨进程传输
+基于 Redis Streams 在多个 uvicorn worker 之间广播事件：
+- 每个进程一个消费组，保证每个进程都能收到全部事件
+- 处理完成后 XACK，消费中断（如连接断开）恢复后先重放未确认的事件（至少一次投递）
+- 接收端按事件 ID 去重（幂等）
+Redis 不可用时不启用，事件总线退化为仅本进程内分发
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from core.events import Event, EventBus
+
+logger = logging.getLogger(__name__)
+
+# 默认不跨进程转发的事件前缀（每个进程各自产生的生命周期事件）
+DEFAULT_EXCLUDE_PREFIXES = ("system.",)
+
+
+def _default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def serialize_event(event: Event, worker_id: str) -> Dict[str, str]:
+    """事件 -> Stream 字段"""
+    return {
+        "id": event.id,
+        "name": event.name,
+        "source": event.source,
+        "origin": worker_id,
+        "timestamp": event.timestamp.isoformat(),
+        "data": json.dumps(event.data, ensure_ascii=False, default=str),
+    }
+
+
+def deserialize_event(fields: Dict[Any, Any]) -> Event:
+    """Stream 字段 -> 事件"""
+    fields = {
+        (k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+        for k, v in fields.items()
+    }
+    event = Event(
+        name=fields["name"],
+        source=fields.get("source", ""),
+        data=json.loads(fields.get("data") or "{}"),
+        id=fields["id"],
+        origin=fields.get("origin") or "remote",
+    )
+    if fields.get("timestamp"):
+        try:
+            event.timestamp = datetime.fromisoformat(fields["timestamp"])
+        except ValueError:
+            pass
+    return event
+
+
+class RedisStreamTransport:
+    """Redis Streams 事件传输"""
+
+    def __init__(
+        self,
+        client: Any,
+        stream: str = "webos:events",
+        worker_id: Optional[str] = None,
+        maxlen: int = 10000,
+        batch_size: int = 100,
+        block_ms: int = 5000,
+        exclude_prefixes: Iterable[str] = DEFAULT_EXCLUDE_PREFIXES,
+        stale_group_seconds: int = 86400
+    ):
+        self.client = client
+        self.stream = stream
+        self.worker_id = worker_id or _default_worker_id()
+        self.group = f"{stream}:{self.worker_id}"
+        self.maxlen = maxlen
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.exclude_prefixes = tuple(exclude_prefixes)
+        self.stale_group_seconds = stale_group_seconds
+        self._bus: Optional[EventBus] = None
+        self._task: Optional[asyncio.Task] = None
+        self._running = False
+        self.published = 0
+        self.delivered = 0
+        self.failures = 0
+
+    def accepts(self, event_name: str) -> bool:
+        """是否转发该事件"""
+        return not event_name.startswith(self.exclude_prefixes)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "type": "redis_stream",
+            "stream": self.stream,
+            "worker_id": self.worker_id,
+            "published": self.published,
+            "delivered": self.delivered,
+            "failures": self.failures,
+        }
+
+    async def publish(self, event: Event):
+        """写入 Stream（失败只记录日志，不影响本地分发）"""
+        try:
+            await self.client.xadd(
+                self.stream,
+                serialize_event(event, self.worker_id),
+                maxlen=self.maxlen,
+                approximate=True
+            )
+            self.published += 1
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"事件跨进程发布失败 {event.name}: {e}")
+
+    async def _ensure_group(self):
+        try:
+            # 从当前位置开始消费：新进程不重放历史事件
+            await self.client.xgroup_create(self.stream, self.group, id="$", mkstream=True)
+        except Exception as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def _prune_stale_groups(self):
+        """清理异常退出进程遗留的消费组（长时间无消费者活动）"""
+        try:
+            groups = await self.client.xinfo_groups(self.stream)
+        except Exception:
+            return
+        for info in groups:
+            name = info.get("name")
+            name = name.decode() if isinstance(name, bytes) else name
+            if not name or name == self.group or not name.startswith(f"{self.stream}:"):
+                continue
+            try:
+                consumers = await self.client.xinfo_consumers(self.stream, name)
+                # 无消费者的组可能是刚启动的进程创建的，不清理
+                if consumers and min(c.get("idle", 0) for c in consumers) > self.stale_group_seconds * 1000:
+                    await self.client.xgroup_destroy(self.stream, name)
+                    logger.info(f"已清理过期事件消费组: {name}")
+            except Exception as e:
+                logger.debug(f"检查消费组失败 {name}: {e}")
+
+    async def _read(self, start_id: str) -> List[Tuple[str, Dict[str, Any]]]:
+        response = await self.client.xreadgroup(
+            self.group,
+            self.worker_id,
+            {self.stream: start_id},
+            count=self.batch_size,
+            block=None if start_id != ">" else self.block_ms
+        )
+        entries = []
+        for _stream, items in response or []:
+            entries.extend(items)
+        return entries
+
+    async def _handle(self, entries: List[Tuple[str, Dict[str, Any]]]):
+        for entry_id, fields in entries:
+            try:
+                if fields:
+                    event = deserialize_event(fields)
+                    # 本进程发布的事件已在本地分发
+                    if event.origin != self.worker_id and self._bus is not None:
+                        if await self._bus.deliver_remote(event):
+                            self.delivered += 1
+            except Exception as e:
+                logger.error(f"处理跨进程事件失败 {entry_id}: {e}", exc_info=True)
+            # 无论处理成功与否都确认，避免毒消息反复投递
+            await self.client.xack(self.stream, self.group, entry_id)
+
+    async def consume_once(self) -> int:
+        """读取并处理一批新事件，返回处理条数"""
+        entries = await self._read(">")
+        await self._handle(entries)
+        return len(entries)
+
+    async def _recover_pending(self):
+        """重放本消费者未确认的事件（上次处理中断）"""
+        while True:
+            entries = await self._read("0")
+            if not entries:
+                return
+            await self._handle(entries)
+
+    async def _consume_loop(self):
+        backoff = 1.0
+        while self._running:
+            try:
+                await self.consume_once()
+                backoff = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                logger.warning(f"跨进程事件消费失败，{backoff:.0f}s 后重试: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                try:
+                    await self._ensure_group()
+                    await self._recover_pending()
+                except Exception:
+                    pass
+
+    async def start(self, bus: EventBus):
+        """创建消费组并启动消费协程"""
+        self._bus = bus
+        await self._ensure_group()
+        await self._prune_stale_groups()
+        await self._recover_pending()
+        self._running = True
+        self._task = asyncio.create_task(self._consume_loop())
+        bus.set_transport(self)
+        logger.info(f"事件总线跨进程传输已启用: {self.stream} ({self.worker_id})")
+
+    async def stop(self, remove_group: bool = True):
+        """停止消费；正常退出时删除本进程的消费组"""
+        self._running = False
+        if self._bus is not None and self._bus.transport is self:
+            self._bus.set_transport(None)
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        if remove_group:
+            try:
+                await self.client.xgroup_destroy(self.stream, self.group)
+            except Exception as e:
+                logger.debug(f"删除事件消费组失败: {e}")
+
+
+class InMemoryStreamClient:
+    """
+    进程内 Redis Streams 模拟（仅实现本模块用到的命令）
+    用于离线测试多进程事件广播
+    """
+
+    def __init__(self):
+        self.streams: Dict[str, List[Tuple[str, Dict[str, str]]]] = {}
+        # (stream, group) -> {"last": last_delivered_id, "pending": {consumer: [ids]}}
+        self.groups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._seq = 0
+        self._cond: Optional[asyncio.Condition] = None
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    @staticmethod
+    def _key(entry_id: str) -> Tuple[int, int]:
+        ms, seq = entry_id.split("-")
+        return int(ms), int(seq)
+
+    async def xadd(self, name: str, fields: Dict[str, str], maxlen: Optional[int] = None, approximate: bool = True) -> str:
+        self._seq += 1
+        entry_id = f"{int(time.time() * 1000)}-{self._seq}"
+        entries = self.streams.setdefault(name, [])
+        entries.append((entry_id, dict(fields)))
+        if maxlen and len(entries) > maxlen:
+            del entries[:len(entries) - maxlen]
+        async with self._condition():
+            self._condition().notify_all()
+        return entry_id
+
+    async def xgroup_create(self, name: str, groupname: str, id: str = "$", mkstream: bool = False):
+        if name not in self.streams:
+            if not mkstream:
+                raise RuntimeError("ERR no such key")
+            self.streams[name] = []
+        if (name, groupname) in self.groups:
+            raise RuntimeError("BUSYGROUP Consumer Group name already exists")
+        entries = self.streams[name]
+        last = entries[-1][0] if id == "$" and entries else "0-0"
+        self.groups[(name, groupname)] = {"last": last, "pending": {}}
+        return True
+
+    async def xgroup_destroy(self, name: str, groupname: str) -> int:
+        return 1 if self.groups.pop((name, groupname), None) is not None else 0
+
+    async def xinfo_groups(self, name: str) -> List[Dict[str, Any]]:
+        return [{"name": group} for (stream, group) in self.groups if stream == name]
+
+    async def xinfo_consumers(self, name: str, groupname: str) -> List[Dict[str, Any]]:
+        group = self.groups.get((name, groupname), {"pending": {}})
+        return [{"name": consumer, "idle": 0} for consumer in group["pending"]]
+
+    def _read_now(self, groupname: str, consumername: str, streams: Dict[str, str], count: Optional[int]):
+        response = []
+        for name, start in streams.items():
+            group = self.groups.get((name, groupname))
+            if group is None:
+                raise RuntimeError("NOGROUP No such consumer group")
+            pending = group["pending"].setdefault(consumername, [])
+            entries = self.streams.get(name, [])
+            if start == ">":
+                last = self._key(group["last"])
+                items = [(eid, f) for eid, f in entries if self._key(eid) > last]
+                if count:
+                    items = items[:count]
+                if items:
+                    group["last"] = items[-1][0]
+                    pending.extend(eid for eid, _ in items)
+            else:
+                # 非 ">" 读取本消费者已投递未确认的事件
+                wanted = set(pending)
+                items = [(eid, f) for eid, f in entries if eid in wanted]
+                if count:
+                    items = items[:count]
+            if items:
+                response.append([name, items])
+        return response
+
+    async def xreadgroup(
+        self,
+        groupname: str,
+        consumername: str,
+        streams: Dict[str, str],
+        count: Optional[int] = None,
+        block: Optional[int] = None,
+        noack: bool = False
+    ):
+        response = self._read_now(groupname, consumername, streams, count)
+        if response or not block or any(v != ">" for v in streams.values()):
+            return response
+        cond = self._condition()
+        try:
+            async with cond:
+                await asyncio.wait_for(cond.wait(), timeout=block / 1000)
+        except asyncio.TimeoutError:
+            return []
+        return self._read_now(groupname, consumername, streams, count)
+
+    async def xack(self, name: str, groupname: str, *ids: str) -> int:
+        group = self.groups.get((name, groupname))
+        if group is None:
+            return 0
+        acked = 0
+        for pending in group["pending"].values():
+            for entry_id in ids:
+                if entry_id in pending:
+                    pending.remove(entry_id)
+                    acked += 1
+        return acked
+
+
+_transport: Optional[RedisStreamTransport] = None
+
+
+async def init_event_transport(bus: EventBus, client: Any = None) -> bool:
+    """
+    启用事件跨进程传输
+    client 为空时使用缓存模块的 Redis 连接；Redis 不可用时保持本进程分发
+    """
+    global _transport
+    from core.config import get_settings
+    settings = get_settings()
+    if not settings.event_stream_enabled:
+        return False
+    if client is None:
+        from core import cache
+        client = cache._redis_client
+    if client is None:
+        logger.debug("Redis 不可用，事件总线仅在本进程内分发")
+        return False
+    transport = RedisStreamTransport(client, stream=settings.event_stream_name)
+    try:
+        await transport.start(bus)
+    except Exception as e:
+        logger.warning(f"事件跨进程传输启用失败，仅在本进程内分发: {e}")
+        return False
+    _transport = transport
+    return True
+
+
+async def close_event_transport():
+    """停止事件跨进程传输"""
+    global _transport
+    if _transport is not None:
+        await _transport.stop()
+        _transport = None
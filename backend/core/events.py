@@ -3,11 +3,17 @@
 实现模块间的松耦合通信
 """
 
-from typing import Callable, Dict, List, Any
+from typing import Awaitable, Callable, Deque, Dict, List, Any, Optional, Set
+from collections import OrderedDict, deque
 from dataclasses import dataclass, field
 from datetime import datetime
 import asyncio
+import heapq
+import inspect
+import itertools
 import logging
+import time
+import uuid
 from utils.timezone import get_beijing_time
 
 logger = logging.getLogger(__name__)
@@ -20,84 +26,353 @@ class Event:
     source: str  # 发送模块ID
     data: Dict[str, Any] = field(default_factory=dict)
     timestamp: datetime = field(default_factory=get_beijing_time)
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)  # 幂等键（跨进程去重）
+    origin: Optional[str] = None  # 来源进程标识，None 表示本进程产生
 
 
 # 事件处理器类型
 EventHandler = Callable[[Event], Any]
 
+# 队列溢出策略
+OVERFLOW_DROP_NEW = "drop_new"        # 丢弃新事件
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # 丢弃队列中优先级最低、最早的事件
+
+
+@dataclass
+class _Subscription:
+    """订阅记录"""
+    handler: EventHandler
+    priority: int = 0
+    timeout: Optional[float] = None
+
+
+@dataclass
+class EventMetrics:
+    """单个事件的分发指标"""
+    count: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    dropped: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    last_ms: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "dropped": self.dropped,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "last_ms": round(self.last_ms, 3),
+        }
+
 
 class EventBus:
-    """事件总线 - 模块间通信桥梁"""
+    """
+    事件总线 - 模块间通信桥梁
     
-    def __init__(self):
+    - 同一事件的处理器并发执行，每个处理器独立超时，慢处理器不拖慢其他处理器
+    - 处理器按优先级（大者优先）启动，同步处理器按优先级顺序直接执行
+    - emit() 进入有界优先级队列，由固定数量的分发协程消费，队列满时按溢出策略丢弃
+    - 历史记录使用环形缓冲区，并记录每个事件的分发耗时指标
+    """
+    
+    def __init__(
+        self,
+        max_history: int = 1000,
+        max_queue_size: int = 1000,
+        overflow_policy: str = OVERFLOW_DROP_NEW,
+        handler_timeout: float = 30.0,
+        dispatch_workers: int = 4
+    ):
         self._handlers: Dict[str, List[EventHandler]] = {}
-        self._history: List[Event] = []
-        self._max_history = 1000
-    
-    def subscribe(self, event_name: str, handler: EventHandler):
-        """订阅事件"""
-        if event_name not in self._handlers:
-            self._handlers[event_name] = []
-        self._handlers[event_name].append(handler)
+        self._handler_options: Dict[str, Dict[EventHandler, _Subscription]] = {}
+        self._max_history = max_history
+        self._history: Deque[Event] = deque(maxlen=max_history)
+        self.max_queue_size = max_queue_size
+        self.overflow_policy = overflow_policy
+        self.handler_timeout = handler_timeout
+        self.dispatch_workers = dispatch_workers
+        self._metrics: Dict[str, EventMetrics] = {}
+        # 分发队列（按事件循环懒加载）
+        self._queue: List[tuple] = []
+        self._queue_seq = itertools.count()
+        self._queue_ready: Optional[asyncio.Event] = None
+        self._workers: Set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._inflight = 0
+        self._idle: Optional[asyncio.Event] = None
+        # 跨进程传输（未配置时仅本进程内分发）
+        self._transport = None
+        self._forward_tasks: Set[asyncio.Task] = set()
+        self._seen_ids: "OrderedDict[str, None]" = OrderedDict()
+        self._max_seen_ids = 10000
+    
+    def subscribe(
+        self,
+        event_name: str,
+        handler: EventHandler,
+        priority: int = 0,
+        timeout: Optional[float] = None
+    ):
+        """
+        订阅事件
+        
+        Args:
+            event_name: 事件名称
+            handler: 处理函数（同步或异步）
+            priority: 优先级，数值越大越先执行
+            timeout: 处理超时（秒），默认使用总线配置
+        """
+        handlers = self._handlers.setdefault(event_name, [])
+        options = self._handler_options.setdefault(event_name, {})
+        handlers.append(handler)
+        options[handler] = _Subscription(handler=handler, priority=priority, timeout=timeout)
+        # 稳定排序：同优先级保持订阅顺序
+        handlers.sort(key=lambda h: -options[h].priority)
         logger.debug(f"订阅事件: {event_name}")
     
     def unsubscribe(self, event_name: str, handler: EventHandler):
         """取消订阅"""
         if event_name in self._handlers:
             self._handlers[event_name].remove(handler)
+            if handler not in self._handlers[event_name]:
+                self._handler_options.get(event_name, {}).pop(handler, None)
             logger.debug(f"取消订阅: {event_name}")
     
+    def _metrics_for(self, event_name: str) -> EventMetrics:
+        metrics = self._metrics.get(event_name)
+        if metrics is None:
+            metrics = self._metrics[event_name] = EventMetrics()
+        return metrics
+    
+    async def _run_handler(self, sub: _Subscription, awaitable: Awaitable, event: Event, metrics: EventMetrics):
+        """等待单个异步处理器（独立超时与异常隔离）"""
+        timeout = sub.timeout if sub.timeout is not None else self.handler_timeout
+        name = getattr(sub.handler, "__name__", repr(sub.handler))
+        try:
+            await asyncio.wait_for(awaitable, timeout=timeout)
+        except asyncio.TimeoutError:
+            metrics.timeouts += 1
+            logger.error(f"事件处理超时 {event.name}: handler={name}")
+        except Exception as e:
+            metrics.errors += 1
+            logger.error(f"事件处理错误 {event.name}: {e}", exc_info=True)
+    
     async def publish(self, event: Event):
-        """发布事件（异常隔离：单个 handler 失败不影响其他 handler）"""
-        # 记录历史
+        """发布事件并等待所有处理器完成（处理器并发执行，异常与超时相互隔离）"""
         self._history.append(event)
-        self._trim_history()
-        
+        self._mark_seen(event.id)
         logger.debug(f"发布事件: {event.name} 来自 {event.source}")
+        if self._should_forward(event):
+            await self._transport.publish(event)
+        await self._dispatch(event)
+    
+    # ==================== 跨进程传输 ====================
+    
+    def set_transport(self, transport):
+        """设置跨进程传输（None 表示仅本进程内分发）"""
+        self._transport = transport
+    
+    @property
+    def transport(self):
+        return self._transport
+    
+    def _should_forward(self, event: Event) -> bool:
+        return (
+            self._transport is not None
+            and event.origin is None
+            and self._transport.accepts(event.name)
+        )
+    
+    def _mark_seen(self, event_id: str) -> bool:
+        """记录事件 ID，返回是否首次出现"""
+        if event_id in self._seen_ids:
+            self._seen_ids.move_to_end(event_id)
+            return False
+        self._seen_ids[event_id] = None
+        if len(self._seen_ids) > self._max_seen_ids:
+            self._seen_ids.popitem(last=False)
+        return True
+    
+    async def deliver_remote(self, event: Event) -> bool:
+        """
+        投递来自其他进程的事件（仅本地分发，不再转发）
+        按事件 ID 去重，重复投递返回 False
+        """
+        if not self._mark_seen(event.id):
+            logger.debug(f"忽略重复事件: {event.name} ({event.id})")
+            return False
+        self._history.append(event)
+        await self._dispatch(event)
+        return True
+    
+    async def _dispatch(self, event: Event):
+        metrics = self._metrics_for(event.name)
+        started = time.perf_counter()
         
-        # 通知所有订阅者（复制列表，防止遍历时被修改）
-        handlers = list(self._handlers.get(event.name, []))
-        for handler in handlers:
+        # 复制列表，防止执行时被修改
+        options = self._handler_options.get(event.name, {})
+        subscriptions = [
+            options.get(handler) or _Subscription(handler=handler)
+            for handler in list(self._handlers.get(event.name, []))
+        ]
+        # 按优先级依次启动：同步处理器直接执行，异步处理器收集后并发等待
+        coroutines = []
+        for sub in subscriptions:
             try:
-                if asyncio.iscoroutinefunction(handler):
-                    await asyncio.wait_for(handler(event), timeout=30.0)
-                else:
-                    handler(event)
-            except asyncio.TimeoutError:
-                logger.error(f"事件处理超时 {event.name}: handler={handler.__name__}")
+                result = sub.handler(event)
             except Exception as e:
+                metrics.errors += 1
                 logger.error(f"事件处理错误 {event.name}: {e}", exc_info=True)
+                continue
+            if inspect.isawaitable(result):
+                coroutines.append(self._run_handler(sub, result, event, metrics))
+        
+        if coroutines:
+            await asyncio.gather(*coroutines)
+        
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.count += 1
+        metrics.total_ms += elapsed_ms
+        metrics.last_ms = elapsed_ms
+        metrics.max_ms = max(metrics.max_ms, elapsed_ms)
     
-    def _trim_history(self):
-        """裁剪历史记录，防止内存无限增长"""
-        if len(self._history) > self._max_history:
-            self._history = self._history[-self._max_history:]
+    # ==================== 队列分发 ====================
+    
+    def _ensure_dispatcher(self, loop: asyncio.AbstractEventLoop):
+        """在当前事件循环上启动分发协程（循环变化时重建）"""
+        if self._loop is not loop:
+            self._loop = loop
+            self._queue = []
+            self._queue_ready = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._idle.set()
+            self._inflight = 0
+            self._workers = set()
+        self._workers = {task for task in self._workers if not task.done()}
+        while len(self._workers) < self.dispatch_workers:
+            task = loop.create_task(self._dispatch_worker())
+            self._workers.add(task)
+    
+    def _enqueue(self, event: Event, priority: int) -> bool:
+        """放入有界优先级队列，返回是否入队成功"""
+        if len(self._queue) >= self.max_queue_size:
+            if self.overflow_policy == OVERFLOW_DROP_OLDEST and self._queue:
+                # 淘汰优先级最低（排序键最大）的事件，同优先级淘汰最早的
+                victim = max(self._queue, key=lambda item: (item[0], -item[1]))
+                if victim[0] < -priority:
+                    self._metrics_for(event.name).dropped += 1
+                    logger.warning(f"事件队列已满，丢弃事件: {event.name}")
+                    return False
+                self._queue.remove(victim)
+                heapq.heapify(self._queue)
+                self._inflight -= 1
+                self._metrics_for(victim[2].name).dropped += 1
+                logger.warning(f"事件队列已满，丢弃事件: {victim[2].name}")
+            else:
+                self._metrics_for(event.name).dropped += 1
+                logger.warning(f"事件队列已满，丢弃事件: {event.name}")
+                return False
+        heapq.heappush(self._queue, (-priority, next(self._queue_seq), event))
+        self._inflight += 1
+        self._idle.clear()
+        self._queue_ready.set()
+        return True
+    
+    async def _dispatch_worker(self):
+        while True:
+            while not self._queue:
+                self._queue_ready.clear()
+                await self._queue_ready.wait()
+            _, _, event = heapq.heappop(self._queue)
+            try:
+                await self._dispatch(event)
+            except Exception as e:
+                logger.error(f"事件分发失败 {event.name}: {e}", exc_info=True)
+            finally:
+                self._inflight -= 1
+                if self._inflight <= 0:
+                    self._inflight = 0
+                    self._idle.set()
     
-    def emit(self, name: str, source: str, data: Dict[str, Any] = None):
-        """便捷发布方法（同步包装）"""
+    def emit(self, name: str, source: str, data: Dict[str, Any] = None, priority: int = 0) -> bool:
+        """
+        便捷发布方法（同步包装，不等待处理完成）
+        
+        事件进入有界队列后异步分发，返回是否成功入队
+        """
         event = Event(name=name, source=source, data=data or {})
+        self._history.append(event)
         try:
             loop = asyncio.get_running_loop()
-            if loop.is_running():
-                asyncio.create_task(self.publish(event))
-            else:
-                # 循环未运行（可能在关闭中），记录历史并记录日志
-                self._history.append(event)
-                self._trim_history()
-                logger.debug(f"EventBus.emit: 循环未运行，仅记录历史: {name}")
         except RuntimeError:
             # 完全没有运行中的循环（启动阶段），仅记录历史
-            self._history.append(event)
-            self._trim_history()
             logger.debug(f"EventBus.emit: 没有运行中的循环，仅记录历史: {name}")
+            return False
+        if not loop.is_running():
+            # 循环未运行（可能在关闭中），仅记录历史
+            logger.debug(f"EventBus.emit: 循环未运行，仅记录历史: {name}")
+            return False
+        self._mark_seen(event.id)
+        if self._should_forward(event):
+            task = loop.create_task(self._transport.publish(event))
+            self._forward_tasks.add(task)
+            task.add_done_callback(self._forward_tasks.discard)
+        self._ensure_dispatcher(loop)
+        return self._enqueue(event, priority)
+    
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """等待队列中的事件全部分发完成，返回是否在超时前完成"""
+        if self._idle is None or self._loop is not asyncio.get_running_loop():
+            return True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+    
+    async def shutdown(self, timeout: float = 5.0):
+        """停止分发协程（先尽量处理完队列中的事件）"""
+        if not await self.drain(timeout=timeout):
+            logger.warning(f"事件队列未在 {timeout}s 内处理完，剩余 {len(self._queue)} 个事件被丢弃")
+        if self._forward_tasks:
+            await asyncio.gather(*list(self._forward_tasks), return_exceptions=True)
+        workers = list(self._workers)
+        for task in workers:
+            task.cancel()
+        if workers:
+            await asyncio.gather(*workers, return_exceptions=True)
+        self._workers.clear()
+        self._queue.clear()
+        self._inflight = 0
+        if self._idle is not None:
+            self._idle.set()
+    
+    # ==================== 查询 ====================
     
     def get_history(self, event_name: str = None, limit: int = 100) -> List[Event]:
         """获取事件历史"""
         if event_name:
             filtered = [e for e in self._history if e.name == event_name]
         else:
-            filtered = self._history
+            filtered = list(self._history)
         return filtered[-limit:]
+    
+    def get_metrics(self, event_name: str = None) -> Dict[str, Any]:
+        """获取分发指标"""
+        if event_name:
+            metrics = self._metrics.get(event_name)
+            return metrics.to_dict() if metrics else EventMetrics().to_dict()
+        return {
+            "transport": self._transport.describe() if self._transport else "local",
+            "queue_size": len(self._queue),
+            "max_queue_size": self.max_queue_size,
+            "overflow_policy": self.overflow_policy,
+            "events": {name: m.to_dict() for name, m in self._metrics.items()},
+        }
 
 
 # 全局事件总线实例
@@ -3,6 +3,7 @@
 处理系统启动初始化（数据库、缓存、任务）和关闭时的资源清理
 """
 
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
@@ -13,8 +14,10 @@ from core.cache import init_cache, close_cache, Cache
 from core.bootstrap import init_admin_user, ensure_default_roles
 from core.loader import get_module_loader
 from core.events import event_bus, Events, Event
+from core.event_transport import init_event_transport, close_event_transport
 from core.scheduler import get_scheduler
 from core.ws_manager import manager as ws_manager
+from utils.process_pool import shutdown_process_pools
 from core.audit_utils import AuditLogger
 from core.rate_limit import init_rate_limiter
 from utils.jwt_rotate import get_jwt_rotator
@@ -151,7 +154,17 @@ async def lifespan(app: FastAPI):
         # init_cache 内部已有详细日志，此处不再重复警告
         pass
     else:
-        # 5.1 可选的缓存预热（通过环境变量控制）
+        # 5.1 事件总线跨进程传输（多 worker 部署时广播事件）
+        try:
+            await init_event_transport(event_bus)
+        except Exception as e:
+            logger.warning(f"⚠️ 事件跨进程传输初始化失败（已忽略）: {e}")
+        try:
+            await ws_manager.start_backplane()
+        except Exception as e:
+            logger.warning(f"⚠️ WebSocket 跨进程转发初始化失败（已忽略）: {e}")
+        
+        # 5.2 可选的缓存预热（通过环境变量控制）
         import os
         if os.environ.get("CACHE_WARM_ON_STARTUP", "").lower() in ("true", "1", "yes"):
             try:
@@ -202,7 +215,9 @@ async def lifespan(app: FastAPI):
             check_jwt_rotation,
             hour=current_settings.jwt_rotate_check_hour,
             minute=current_settings.jwt_rotate_check_minute,
-            name="JWT密钥轮换检查"
+            name="JWT密钥轮换检查",
+            singleton=True,
+            catch_up=True
         )
         
         async def check_jwt_cleanup():
@@ -222,53 +237,19 @@ async def lifespan(app: FastAPI):
             check_jwt_cleanup,
             hour=cleanup_hour,
             minute=current_settings.jwt_rotate_check_minute,
-            name="JWT旧密钥清理检查"
+            name="JWT旧密钥清理检查",
+            singleton=True,
+            catch_up=True
         )
         logger.info(f"✅ JWT密钥自动管理已启用 (轮换检查: {current_settings.jwt_rotate_check_hour:02d}:{current_settings.jwt_rotate_check_minute:02d})")
     
-    # 8.2 日程提醒推送
+    # 8.2 日程提醒推送（时间轮调度，到点触发）
+    reminder_dispatcher = None
     try:
-        from modules.schedule.schedule_services import ReminderService
-        from modules.schedule.schedule_models import ScheduleEvent
+        from modules.schedule.schedule_dispatcher import get_reminder_dispatcher
         
-        async def check_schedule_reminders():
-            """任务：检查并推送日程提醒"""
-            from sqlalchemy import select as sa_select
-            try:
-                async with get_db_session() as db:
-                    reminders = await ReminderService.get_pending_reminders(db)
-                    for reminder in reminders:
-                        try:
-                            stmt = sa_select(ScheduleEvent).where(ScheduleEvent.id == reminder.event_id)
-                            event = (await db.execute(stmt)).scalar_one_or_none()
-                            
-                            if event and not event.is_deleted:
-                                message = {
-                                    "type": "schedule_reminder",
-                                    "data": {
-                                        "event_id": event.id,
-                                        "title": event.title,
-                                        "start_date": event.start_date.isoformat() if event.start_date else None,
-                                        "start_time": event.start_time.isoformat() if event.start_time else None,
-                                        "location": event.location,
-                                        "is_all_day": event.is_all_day,
-                                        "remind_before_minutes": reminder.remind_before_minutes
-                                    }
-                                }
-                                await ws_manager.send_personal_message(message, event.user_id)
-                                logger.debug(f"📅 已推送提醒: {event.title} -> 用户 {event.user_id}")
-                            
-                            await ReminderService.mark_reminder_sent(db, reminder.id)
-                        except Exception as inner_e:
-                            logger.error(f"推送单个提醒失败: {inner_e}")
-            except Exception as task_e:
-                logger.error(f"检查日程提醒失败: {task_e}")
-        
-        await scheduler.schedule_periodic(
-            check_schedule_reminders,
-            interval_seconds=60,
-            name="日程提醒推送"
-        )
+        reminder_dispatcher = get_reminder_dispatcher()
+        await reminder_dispatcher.start()
         logger.info("✅ 日程提醒任务已就绪")
     except Exception as e:
         logger.warning(f"⚠️ 注册日程提醒任务失败: {e}")
@@ -281,12 +262,27 @@ async def lifespan(app: FastAPI):
         await scheduler.schedule_periodic(
             process_schedule_backups,
             interval_seconds=60, # 每分钟检查一次
-            name="自动备份调度检查"
+            name="自动备份调度检查",
+            singleton=True,
+            jitter_seconds=5
         )
         logger.info("✅ 自动备份调度任务已就绪")
     except Exception as e:
         logger.warning(f"⚠️ 注册自动备份任务失败: {e}")
-    
+
+    # 8.4 内容寻址存储回收（无引用 blob）
+    if current_settings.storage_dedup_enabled:
+        try:
+            async def collect_blob_garbage():
+                """任务：回收无引用的 blob"""
+                from utils.storage import get_storage_manager
+                await asyncio.to_thread(get_storage_manager().blobs.gc)
+
+            await scheduler.schedule_daily(collect_blob_garbage, hour=3, minute=30, name="存储 blob 回收", singleton=True)
+            logger.info("✅ 存储去重已启用（blob 回收 03:30）")
+        except Exception as e:
+            logger.warning(f"⚠️ 注册 blob 回收任务失败: {e}")
+
     # 9. 发送启动完成事件
     await event_bus.publish(Event(name=Events.SYSTEM_STARTUP, source="kernel"))
 
@@ -302,8 +298,14 @@ async def lifespan(app: FastAPI):
     # -------------------- [关闭阶段] --------------------
     logger.info("🛑 系统正在关闭...")
     await scheduler.stop()
+    if reminder_dispatcher is not None:
+        await reminder_dispatcher.stop()
     await AuditLogger.stop_auto_flush()
     await event_bus.publish(Event(name=Events.SYSTEM_SHUTDOWN, source="kernel"))
+    await event_bus.shutdown()
+    await close_event_transport()
+    shutdown_process_pools()
+    await ws_manager.stop_backplane()
     await close_cache()
     await close_db()
     logger.info("👋 系统已安全关闭")
@@ -1,30 +1,275 @@
 """
 后台任务调度器
 用于定期执行任务，如JWT密钥轮换
+
+多 worker 部署时，标记为 singleton 的任务按执行周期（periodic 的时间片 / daily 的日期）抢占租约，
+每个周期只有一个 worker 执行。租约基于 Redis SET NX PX，执行期间定时续期并附带单调递增的
+fencing 令牌；执行成功后租约保留到周期结束，作为"本周期已执行"的标记。
+未配置 Redis 时使用进程内租约（单进程部署）。
 """
 
+import os
+import time
+import uuid
+import random
+import socket
 import asyncio
 import logging
+from collections import deque
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from typing import Callable, Optional
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
 from utils.timezone import get_beijing_time
 
 logger = logging.getLogger(__name__)
 
+# 租约有效期（秒），执行期间每 1/3 有效期续期一次；持有者崩溃后最迟在此时长后由其他 worker 接管
+LEASE_TTL_SECONDS = 60
+# 每个任务保留的最近执行记录数
+HISTORY_SIZE = 20
+
+# 仅当值仍为本持有者时才续期/改写有效期，避免误操作其他 worker 的租约
+_LEASE_EXPIRE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_LEASE_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class MemoryJobLease:
+    """进程内任务租约（未配置 Redis 时使用）"""
+
+    def __init__(self):
+        self._leases: Dict[str, Tuple[float, str]] = {}
+        self._fences: Dict[str, int] = {}
+        self._last_runs: Dict[str, float] = {}
+
+    async def acquire(self, name: str, slot: str, owner: str, ttl: float) -> Optional[int]:
+        key = f"{name}:{slot}"
+        now = time.monotonic()
+        entry = self._leases.get(key)
+        if entry is not None and entry[0] > now:
+            return None
+        fence = self._fences.get(name, 0) + 1
+        self._fences[name] = fence
+        self._leases[key] = (now + ttl, f"{fence}:{owner}")
+        return fence
+
+    async def expire(self, name: str, slot: str, owner: str, fence: int, ttl: float) -> bool:
+        key = f"{name}:{slot}"
+        entry = self._leases.get(key)
+        if entry is None or entry[1] != f"{fence}:{owner}" or entry[0] <= time.monotonic():
+            return False
+        self._leases[key] = (time.monotonic() + ttl, entry[1])
+        return True
+
+    async def release(self, name: str, slot: str, owner: str, fence: int):
+        key = f"{name}:{slot}"
+        entry = self._leases.get(key)
+        if entry is not None and entry[1] == f"{fence}:{owner}":
+            del self._leases[key]
+
+    async def get_last_run(self, name: str) -> Optional[float]:
+        return self._last_runs.get(name)
+
+    async def set_last_run(self, name: str, timestamp: float):
+        self._last_runs[name] = timestamp
+
+
+class RedisJobLease:
+    """基于 Redis 的任务租约，多 worker 共享"""
+
+    def __init__(self, client, prefix: str = "scheduler"):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, name: str, slot: str) -> str:
+        return f"{self.prefix}:lease:{name}:{slot}"
+
+    async def acquire(self, name: str, slot: str, owner: str, ttl: float) -> Optional[int]:
+        key = self._key(name, slot)
+        # 本周期已有持有者时不递增 fencing 计数
+        if await self.client.exists(key):
+            return None
+        fence = await self.client.incr(f"{self.prefix}:fence:{name}")
+        if await self.client.set(key, f"{fence}:{owner}", nx=True, px=int(ttl * 1000)):
+            return fence
+        return None
+
+    async def expire(self, name: str, slot: str, owner: str, fence: int, ttl: float) -> bool:
+        result = await self.client.eval(
+            _LEASE_EXPIRE_SCRIPT, 1, self._key(name, slot), f"{fence}:{owner}", int(ttl * 1000)
+        )
+        return bool(result)
+
+    async def release(self, name: str, slot: str, owner: str, fence: int):
+        await self.client.eval(_LEASE_RELEASE_SCRIPT, 1, self._key(name, slot), f"{fence}:{owner}")
+
+    async def get_last_run(self, name: str) -> Optional[float]:
+        raw = await self.client.get(f"{self.prefix}:last_run:{name}")
+        return float(raw) if raw else None
+
+    async def set_last_run(self, name: str, timestamp: float):
+        await self.client.set(f"{self.prefix}:last_run:{name}", timestamp)
+
+
+_memory_lease = MemoryJobLease()
+
+
+def get_job_lease():
+    """Redis 可用时使用共享租约，否则退回进程内存"""
+    from core import cache
+    client = cache._redis_client
+    if client is not None:
+        return RedisJobLease(client)
+    return _memory_lease
+
+
+@dataclass
+class JobStats:
+    """单个任务的执行指标与最近执行记录"""
+    name: str
+    kind: str
+    singleton: bool = False
+    runs: int = 0
+    failures: int = 0
+    skipped: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    last_run_at: Optional[str] = None
+    last_error: Optional[str] = None
+    history: Deque[Dict[str, Any]] = field(default_factory=lambda: deque(maxlen=HISTORY_SIZE))
+
+    def record(self, started_at: datetime, duration_ms: float, status: str,
+               fence: Optional[int] = None, error: Optional[str] = None):
+        self.runs += 1
+        if status != "success":
+            self.failures += 1
+            self.last_error = error
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.last_run_at = started_at.isoformat()
+        self.history.append({
+            "started_at": self.last_run_at,
+            "duration_ms": round(duration_ms, 3),
+            "status": status,
+            "fence": fence,
+            "error": error,
+        })
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "singleton": self.singleton,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "avg_ms": round(self.total_ms / self.runs, 3) if self.runs else 0.0,
+            "max_ms": round(self.max_ms, 3),
+            "last_run_at": self.last_run_at,
+            "last_error": self.last_error,
+            "history": list(self.history),
+        }
+
+
+def _missed_daily_run(now: datetime, hour: int, minute: int, last_run: Optional[float]) -> bool:
+    """今日执行时间已过且此后没有成功执行过"""
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target > now:
+        return False
+    return last_run is None or last_run < target.timestamp()
+
 
 class Scheduler:
     """简单任务调度器"""
     
-    def __init__(self):
+    def __init__(self, lease_ttl: float = LEASE_TTL_SECONDS):
         self.tasks: list[asyncio.Task] = []
         self.running = False
+        self.lease_ttl = lease_ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.jobs: Dict[str, JobStats] = {}
+    
+    async def _keep_lease(self, lease, name: str, slot: str, fence: int):
+        """执行期间续期租约，续期失败说明租约已被接管"""
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                if not await lease.expire(name, slot, self.owner, fence, self.lease_ttl):
+                    logger.warning(f"任务 {name} 租约已丢失（fence={fence}），其他 worker 可能已接管")
+                    return
+            except Exception as e:
+                logger.warning(f"任务 {name} 租约续期失败: {e}")
+    
+    async def _execute(self, func: Callable, stats: JobStats, slot: str, hold_seconds: float) -> bool:
+        """
+        执行一次任务并记录指标
+        
+        singleton 任务先抢占本周期租约，未抢到时跳过；成功后租约保留 hold_seconds 作为本周期已执行标记，
+        失败则释放租约，允许重试。
+        
+        Returns:
+            本 worker 是否执行了任务
+        """
+        lease = get_job_lease()
+        fence = None
+        if stats.singleton:
+            fence = await lease.acquire(stats.name, slot, self.owner, self.lease_ttl)
+            if fence is None:
+                stats.skipped += 1
+                logger.debug(f"任务 {stats.name} 本周期已由其他 worker 执行，跳过")
+                return False
+        
+        keeper = asyncio.create_task(self._keep_lease(lease, stats.name, slot, fence)) if fence else None
+        started_at = get_beijing_time()
+        started = time.perf_counter()
+        status, error = "success", None
+        try:
+            await func()
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            status, error = "failed", str(e)
+            raise
+        finally:
+            stats.record(started_at, (time.perf_counter() - started) * 1000, status, fence, error)
+            if keeper is not None:
+                keeper.cancel()
+            try:
+                if status == "success":
+                    await lease.set_last_run(stats.name, time.time())
+                if fence is not None:
+                    if status == "success" and hold_seconds > 0:
+                        await lease.expire(stats.name, slot, self.owner, fence, hold_seconds)
+                    else:
+                        await lease.release(stats.name, slot, self.owner, fence)
+            except Exception as e:
+                logger.warning(f"任务 {stats.name} 更新租约失败: {e}")
+        return True
+    
+    def get_job_stats(self) -> Dict[str, Any]:
+        """获取各任务的执行指标"""
+        return {
+            "owner": self.owner,
+            "jobs": {name: stats.to_dict() for name, stats in self.jobs.items()},
+        }
     
     async def schedule_periodic(
         self,
         func: Callable,
         interval_seconds: int,
         name: str = "periodic_task",
-        max_retries: int = 3
+        max_retries: int = 3,
+        singleton: bool = False,
+        jitter_seconds: float = 0
     ):
         """
         调度定期任务
@@ -34,13 +279,20 @@ class Scheduler:
             interval_seconds: 执行间隔（秒）
             name: 任务名称
             max_retries: 单次执行失败时的最大重试次数
+            singleton: 多 worker 下每个间隔时间片只执行一次
+            jitter_seconds: 每次间隔追加的随机抖动上限，打散多个 worker 的唤醒时刻（应小于间隔）
         """
+        stats = self.jobs[name] = JobStats(name=name, kind="periodic", singleton=singleton)
+        
         async def periodic_task():
             consecutive_failures = 0
             while self.running:
                 try:
                     logger.debug(f"执行定期任务: {name}")
-                    await func()
+                    now = time.time()
+                    slot = int(now // interval_seconds)
+                    hold = (slot + 1) * interval_seconds - now
+                    await self._execute(func, stats, str(slot), hold)
                     consecutive_failures = 0  # 成功后重置计数
                 except asyncio.CancelledError:
                     break
@@ -58,18 +310,21 @@ class Scheduler:
                         logger.warning(f"定期任务 {name} 连续失败 {consecutive_failures} 次，等待下次正常周期")
                         consecutive_failures = 0
                 
-                await asyncio.sleep(interval_seconds)
+                await asyncio.sleep(interval_seconds + random.uniform(0, jitter_seconds))
         
         task = asyncio.create_task(periodic_task())
         self.tasks.append(task)
-        logger.debug(f"已调度定期任务: {name}, 间隔: {interval_seconds}秒")
+        logger.debug(f"已调度定期任务: {name}, 间隔: {interval_seconds}秒{'（单实例）' if singleton else ''}")
     
     async def schedule_daily(
         self,
         func: Callable,
         hour: int = 0,
         minute: int = 0,
-        name: str = "daily_task"
+        name: str = "daily_task",
+        singleton: bool = False,
+        jitter_seconds: float = 0,
+        catch_up: bool = False
     ):
         """
         调度每日任务
@@ -79,8 +334,25 @@ class Scheduler:
             hour: 执行小时（0-23）
             minute: 执行分钟（0-59）
             name: 任务名称
+            singleton: 多 worker 下每天只执行一次
+            jitter_seconds: 在执行时间后追加的随机延迟上限
+            catch_up: 启动时若今日执行时间已过且未执行过（如停机错过），立即补跑一次
         """
+        stats = self.jobs[name] = JobStats(name=name, kind="daily", singleton=singleton)
+        
         async def daily_task():
+            if catch_up:
+                try:
+                    now = get_beijing_time()
+                    last_run = await get_job_lease().get_last_run(name)
+                    if _missed_daily_run(now, hour, minute, last_run):
+                        logger.info(f"补跑错过的每日任务: {name}")
+                        await self._execute(func, stats, now.date().isoformat(), 86400)
+                except asyncio.CancelledError:
+                    return
+                except Exception as e:
+                    logger.error(f"每日任务补跑失败 {name}: {e}", exc_info=True)
+            
             while self.running:
                 try:
                     now = get_beijing_time()
@@ -91,7 +363,7 @@ class Scheduler:
                         target_time += timedelta(days=1)
                     
                     # 计算等待时间
-                    wait_seconds = (target_time - now).total_seconds()
+                    wait_seconds = (target_time - now).total_seconds() + random.uniform(0, jitter_seconds)
                     logger.debug(f"每日任务 {name} 将在 {target_time.strftime('%Y-%m-%d %H:%M:%S')} 执行")
                     
                     await asyncio.sleep(wait_seconds)
@@ -100,7 +372,8 @@ class Scheduler:
                         break
                     
                     logger.info(f"执行每日任务: {name}")
-                    await func()
+                    # 租约按日期区分，执行成功后保留一天，其他 worker 当天不再执行
+                    await self._execute(func, stats, target_time.date().isoformat(), 86400)
                     
                     # 执行完成后，循环会重新计算下一天的等待时间
                     # 短暂休眠避免在同一秒内重复执行
@@ -114,7 +387,7 @@ class Scheduler:
         
         task = asyncio.create_task(daily_task())
         self.tasks.append(task)
-        logger.debug(f"已调度每日任务: {name}, 执行时间: {hour:02d}:{minute:02d}")
+        logger.debug(f"已调度每日任务: {name}, 执行时间: {hour:02d}:{minute:02d}{'（单实例）' if singleton else ''}")
     
     def start(self):
         """启动调度器"""
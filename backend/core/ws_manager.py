@@ -1,104 +1,388 @@
 """
 WebSocket 管理器
 处理 WebSocket 连接和消息推送
+
+- 消息只序列化一次，并发推送到所有目标连接
+- 每个连接独立的有界发送队列，积压超限或发送超时的慢连接会被断开，不拖慢其他连接
+- 多 worker 部署时通过 Redis Pub/Sub 按用户频道转发，Redis 不可用时仅在本进程内推送
 """
 
+import asyncio
 import json
 import logging
-from typing import Dict, Set
+import os
+import socket
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional, Set
 from fastapi import WebSocket, WebSocketDisconnect
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
 
+def _dumps(message: dict) -> str:
+    return json.dumps(message, ensure_ascii=False)
+
+
+class _ConnectionSender:
+    """
+    单连接发送器
+
+    同一连接同一时刻只有一个发送在进行；发送进行中到达的消息进入有界队列，
+    由正在发送的协程顺序写出。队列满或单次发送超时即视为慢连接。
+    """
+
+    def __init__(self, websocket: WebSocket, max_queue: int, send_timeout: float):
+        self.websocket = websocket
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self._pending: Deque[str] = deque()
+        self._busy = False
+        self.closed = False
+
+    async def send(self, text: str) -> bool:
+        """发送文本，返回 False 表示连接需要断开"""
+        if self.closed:
+            return False
+        if self._busy:
+            if len(self._pending) >= self.max_queue:
+                self.closed = True
+                return False
+            self._pending.append(text)
+            return True
+
+        self._busy = True
+        try:
+            await asyncio.wait_for(self.websocket.send_text(text), self.send_timeout)
+            while self._pending and not self.closed:
+                await asyncio.wait_for(
+                    self.websocket.send_text(self._pending.popleft()), self.send_timeout
+                )
+            return not self.closed
+        except Exception as e:
+            logger.debug(f"WebSocket 发送失败: {e}")
+            self.closed = True
+            return False
+        finally:
+            self._busy = False
+            if self.closed:
+                self._pending.clear()
+
+
+class RedisBackplane:
+    """
+    基于 Redis Pub/Sub 的跨 worker 转发
+
+    每个 worker 只订阅本进程在线用户的频道和广播频道，消息携带来源 worker，
+    发送方在本地直接推送，收到自己发布的消息时忽略。
+    """
+
+    def __init__(self, client: Any, prefix: str = "webos:ws", worker_id: Optional[str] = None):
+        self.client = client
+        self.prefix = prefix
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.broadcast_channel = f"{prefix}:broadcast"
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._manager: Optional["ConnectionManager"] = None
+
+    def user_channel(self, user_id: int) -> str:
+        return f"{self.prefix}:user:{user_id}"
+
+    async def start(self, manager: "ConnectionManager"):
+        self._manager = manager
+        self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        channels = [self.broadcast_channel]
+        channels.extend(self.user_channel(uid) for uid in manager.active_connections)
+        await self._pubsub.subscribe(*channels)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._listener = None
+        if self._pubsub is not None:
+            try:
+                await self._pubsub.aclose()
+            except Exception:
+                pass
+            self._pubsub = None
+
+    async def subscribe_user(self, user_id: int):
+        if self._pubsub is not None:
+            await self._pubsub.subscribe(self.user_channel(user_id))
+
+    async def unsubscribe_user(self, user_id: int):
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(self.user_channel(user_id))
+
+    async def publish_user(self, user_id: int, text: str):
+        payload = _dumps({"origin": self.worker_id, "text": text})
+        await self.client.publish(self.user_channel(user_id), payload)
+
+    async def publish_broadcast(self, text: str, exclude_user_ids: Iterable[int]):
+        payload = _dumps({
+            "origin": self.worker_id,
+            "text": text,
+            "exclude": list(exclude_user_ids),
+        })
+        await self.client.publish(self.broadcast_channel, payload)
+
+    async def publish_users(self, user_ids: Iterable[int], text: str):
+        """一次发布发给多个用户的消息（各 worker 只推送给本进程在线的用户）"""
+        payload = _dumps({
+            "origin": self.worker_id,
+            "text": text,
+            "users": list(user_ids),
+        })
+        await self.client.publish(self.broadcast_channel, payload)
+
+    async def handle_message(self, channel: str, data: str):
+        """处理从 Redis 收到的一条消息"""
+        if isinstance(channel, bytes):
+            channel = channel.decode()
+        if isinstance(data, bytes):
+            data = data.decode()
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            logger.warning(f"忽略无法解析的 WebSocket 转发消息: {channel}")
+            return
+        if payload.get("origin") == self.worker_id or self._manager is None:
+            return
+        text = payload.get("text", "")
+        if channel == self.broadcast_channel:
+            if "users" in payload:
+                await self._manager._send_local_many(text, payload["users"])
+            else:
+                await self._manager._broadcast_local(text, set(payload.get("exclude") or ()))
+        elif channel.startswith(f"{self.prefix}:user:"):
+            try:
+                user_id = int(channel.rsplit(":", 1)[1])
+            except ValueError:
+                return
+            await self._manager._send_local(text, user_id)
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=1.0
+                )
+                if message and message.get("type") == "message":
+                    await self.handle_message(message["channel"], message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"WebSocket 转发订阅异常: {e}")
+                await asyncio.sleep(1)
+
+
 class ConnectionManager:
     """WebSocket 连接管理器"""
-    
-    def __init__(self):
+
+    def __init__(self, max_queue: int = 64, send_timeout: float = 5.0):
         # 用户ID -> WebSocket 连接集合（一个用户可能有多个连接）
         self.active_connections: Dict[int, Set[WebSocket]] = {}
-    
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self._senders: Dict[WebSocket, _ConnectionSender] = {}
+        self.backplane: Optional[RedisBackplane] = None
+        self.dropped_connections = 0
+
     async def connect(self, websocket: WebSocket, user_id: int, subprotocol: str = None):
         """接受连接"""
         if subprotocol:
             await websocket.accept(subprotocol=subprotocol)
         else:
             await websocket.accept()
-        
-        if user_id not in self.active_connections:
+
+        first_connection = user_id not in self.active_connections
+        if first_connection:
             self.active_connections[user_id] = set()
-        
+
         self.active_connections[user_id].add(websocket)
         logger.debug(f"WebSocket 连接已建立: 用户 {user_id}")
-    
+
+        if first_connection and self.backplane:
+            try:
+                await self.backplane.subscribe_user(user_id)
+            except Exception as e:
+                logger.warning(f"订阅用户频道失败: {e}")
+
     def disconnect(self, websocket: WebSocket, user_id: int):
         """断开连接"""
+        self._senders.pop(websocket, None)
         if user_id in self.active_connections:
             self.active_connections[user_id].discard(websocket)
             if not self.active_connections[user_id]:
                 del self.active_connections[user_id]
+                if self.backplane:
+                    self._schedule(self._unsubscribe_if_offline(user_id))
             logger.debug(f"WebSocket 连接已断开: 用户 {user_id}")
-    
-    async def send_personal_message(self, message: dict, user_id: int):
-        """向指定用户发送消息"""
-        if user_id in self.active_connections:
-            disconnected = set()
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_text(json.dumps(message, ensure_ascii=False))
-                except Exception as e:
-                    logger.error(f"发送消息失败: {e}")
-                    disconnected.add(connection)
-            
-            # 清理断开的连接
-            for conn in disconnected:
-                self.disconnect(conn, user_id)
+
+    async def _unsubscribe_if_offline(self, user_id: int):
+        # 异步执行期间用户可能已重新连接
+        if self.backplane and user_id not in self.active_connections:
+            try:
+                await self.backplane.unsubscribe_user(user_id)
+            except Exception as e:
+                logger.debug(f"取消订阅用户频道失败: {e}")
+
+    @staticmethod
+    def _schedule(coro):
+        try:
+            asyncio.get_running_loop().create_task(coro)
+        except RuntimeError:
+            coro.close()
+
+    def _sender(self, websocket: WebSocket) -> _ConnectionSender:
+        sender = self._senders.get(websocket)
+        if sender is None:
+            sender = _ConnectionSender(websocket, self.max_queue, self.send_timeout)
+            self._senders[websocket] = sender
+        return sender
+
+    async def _drop(self, websocket: WebSocket, user_id: int):
+        """断开慢连接或已失效的连接"""
+        self.dropped_connections += 1
+        self.disconnect(websocket, user_id)
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    async def _deliver(self, text: str, targets: Dict[int, Iterable[WebSocket]]):
+        """将已序列化的文本并发推送到目标连接"""
+        pairs = [(uid, ws) for uid, connections in targets.items() for ws in list(connections)]
+        if not pairs:
+            return
+        results = await asyncio.gather(
+            *(self._sender(ws).send(text) for _, ws in pairs)
+        )
+        for (uid, ws), ok in zip(pairs, results):
+            if not ok:
+                logger.warning(f"WebSocket 连接发送失败或积压过多，已断开: 用户 {uid}")
+                await self._drop(ws, uid)
+
+    async def _send_local(self, text: str, user_id: int):
+        connections = self.active_connections.get(user_id)
+        if connections:
+            await self._deliver(text, {user_id: connections})
         else:
             logger.debug(f"忽略离线用户消息推送: {user_id}")
-    
+
+    async def _send_local_many(self, text: str, user_ids: Iterable[int]):
+        targets = {
+            uid: self.active_connections[uid]
+            for uid in user_ids
+            if uid in self.active_connections
+        }
+        await self._deliver(text, targets)
+
+    async def _broadcast_local(self, text: str, exclude_user_ids: Set[int]):
+        targets = {
+            uid: connections
+            for uid, connections in self.active_connections.items()
+            if uid not in exclude_user_ids
+        }
+        await self._deliver(text, targets)
+
+    async def send_personal_message(self, message: dict, user_id: int):
+        """向指定用户发送消息"""
+        text = _dumps(message)
+        await self._send_local(text, user_id)
+        if self.backplane:
+            try:
+                await self.backplane.publish_user(user_id, text)
+            except Exception as e:
+                logger.warning(f"跨进程推送消息失败: {e}")
+
+    async def send_to_users(self, message: dict, user_ids: Iterable[int]):
+        """
+        向多个用户发送同一消息
+        只序列化一次、并发推送，跨进程时只发布一条转发消息
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return
+        text = _dumps(message)
+        await self._send_local_many(text, user_ids)
+        if self.backplane:
+            try:
+                await self.backplane.publish_users(user_ids, text)
+            except Exception as e:
+                logger.warning(f"跨进程推送消息失败: {e}")
+
     async def broadcast(self, message: dict, exclude_user_ids: Set[int] = None):
         """广播消息给所有用户"""
         if exclude_user_ids is None:
             exclude_user_ids = set()
-        
-        disconnected_users = []
-        for user_id, connections in self.active_connections.items():
-            if user_id in exclude_user_ids:
-                continue
-            
-            disconnected = set()
-            for connection in connections:
-                try:
-                    await connection.send_text(json.dumps(message, ensure_ascii=False))
-                except Exception as e:
-                    logger.error(f"广播消息失败: {e}")
-                    disconnected.add(connection)
-            
-            # 清理断开的连接
-            for conn in disconnected:
-                self.disconnect(conn, user_id)
-                if not self.active_connections.get(user_id):
-                    disconnected_users.append(user_id)
-        
-        # 清理空连接
-        for user_id in disconnected_users:
-            if user_id in self.active_connections and not self.active_connections[user_id]:
-                del self.active_connections[user_id]
-    
+        text = _dumps(message)
+        await self._broadcast_local(text, set(exclude_user_ids))
+        if self.backplane:
+            try:
+                await self.backplane.publish_broadcast(text, exclude_user_ids)
+            except Exception as e:
+                logger.warning(f"跨进程广播消息失败: {e}")
+
+    async def start_backplane(self, client: Any = None) -> bool:
+        """
+        启用跨 worker 转发
+        client 为空时使用缓存模块的 Redis 连接；Redis 不可用时仅在本进程内推送
+        """
+        from core.config import get_settings
+        settings = get_settings()
+        if not settings.ws_backplane_enabled:
+            return False
+        if client is None:
+            from core import cache
+            client = cache._redis_client
+        if client is None:
+            logger.debug("Redis 不可用，WebSocket 消息仅在本进程内推送")
+            return False
+        backplane = RedisBackplane(client, prefix=settings.ws_backplane_prefix)
+        try:
+            await backplane.start(self)
+        except Exception as e:
+            logger.warning(f"WebSocket 跨进程转发启用失败，仅在本进程内推送: {e}")
+            await backplane.stop()
+            return False
+        self.backplane = backplane
+        logger.info(f"WebSocket 跨进程转发已启用: {backplane.prefix} ({backplane.worker_id})")
+        return True
+
+    async def stop_backplane(self):
+        """停止跨 worker 转发"""
+        if self.backplane is not None:
+            backplane, self.backplane = self.backplane, None
+            await backplane.stop()
+
     def get_online_users(self) -> Set[int]:
-        """获取在线用户ID集合"""
+        """获取在线用户ID集合（本进程）"""
         return set(self.active_connections.keys())
-    
+
     def get_connection_count(self) -> int:
-        """获取总连接数"""
+        """获取总连接数（本进程）"""
         return sum(len(connections) for connections in self.active_connections.values())
 
 
-# 全局连接管理器
-manager = ConnectionManager()
-
-
-
+def _create_manager() -> ConnectionManager:
+    try:
+        from core.config import get_settings
+        settings = get_settings()
+        return ConnectionManager(
+            max_queue=settings.ws_send_queue_size,
+            send_timeout=settings.ws_send_timeout,
+        )
+    except Exception:
+        return ConnectionManager()
 
 
+# 全局连接管理器
+manager = _create_manager()
@@ -0,0 +1,342 @@
+"""
+AI 对话上下文组装
+按模型上下文长度（n_ctx）为系统提示词、参考资料和历史对话分配 token 预算，
+超出预算的早期对话压缩为滚动摘要（带缓存），保证单次请求的提示词评估开销有上限
+"""
+
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 每条消息的聊天模板开销（角色标记、分隔符等）估算
+MESSAGE_OVERHEAD_TOKENS = 8
+
+_CJK_RE = re.compile(r"[　-鿿가-힯＀-￯]")
+
+
+class TokenCounter:
+    """
+    Token 计数器
+    优先使用已加载模型的分词器，无模型时（在线模式）按字符类型估算
+    """
+
+    def __init__(self, llm: Any = None, cache_size: int = 2048):
+        self.llm = llm
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def estimate(text: str) -> int:
+        """估算 token 数：中日韩字符约 1 token/字，其余约 4 字符/token"""
+        if not text:
+            return 0
+        cjk = len(_CJK_RE.findall(text))
+        return cjk + (len(text) - cjk + 3) // 4
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        with self._lock:
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                return cached
+        if self.llm is not None:
+            try:
+                tokens = len(self.llm.tokenize(text.encode("utf-8"), add_bos=False))
+            except Exception as e:
+                logger.debug(f"模型分词失败，改用估算: {e}")
+                tokens = self.estimate(text)
+        else:
+            tokens = self.estimate(text)
+        with self._lock:
+            self._cache[text] = tokens
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return tokens
+
+    def count_message(self, message: Dict[str, str]) -> int:
+        return self.count(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        return sum(self.count_message(m) for m in messages)
+
+    def truncate(self, text: str, max_tokens: int, suffix: str = "…") -> str:
+        """截断文本到指定 token 数以内（二分查找截断点）"""
+        if max_tokens <= 0 or not text:
+            return ""
+        if self.count(text) <= max_tokens:
+            return text
+        suffix_tokens = self.count(suffix)
+        if suffix_tokens >= max_tokens:
+            suffix, suffix_tokens = "", 0
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.count(text[:mid]) + suffix_tokens <= max_tokens:
+                lo = mid
+            else:
+                hi = mid - 1
+        return text[:lo] + suffix if lo else ""
+
+
+class ConversationSummarizer:
+    """
+    滚动对话摘要
+    早期对话按轮次逐步并入摘要，每个前缀的摘要都会缓存，
+    同一会话后续请求只需在已有摘要基础上追加新移出窗口的轮次
+    """
+
+    # 每轮对话在摘要中保留的最大字符数
+    TURN_EXCERPT_CHARS = 120
+    ROLE_LABELS = {"user": "用户", "assistant": "助手", "system": "系统"}
+
+    def __init__(self, max_entries: int = 512):
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prefix_keys(turns: List[Dict[str, str]], budget: int) -> List[str]:
+        """每个前缀的缓存键（滚动哈希）"""
+        keys = []
+        digest = hashlib.sha1(f"budget:{budget}".encode())
+        for turn in turns:
+            digest.update(b"\x00")
+            digest.update(turn.get("role", "").encode())
+            digest.update(b"\x01")
+            digest.update(turn.get("content", "").encode("utf-8"))
+            keys.append(digest.copy().hexdigest())
+        return keys
+
+    def _excerpt(self, turn: Dict[str, str]) -> str:
+        content = " ".join((turn.get("content") or "").split())
+        if len(content) > self.TURN_EXCERPT_CHARS:
+            content = content[:self.TURN_EXCERPT_CHARS] + "…"
+        role = self.ROLE_LABELS.get(turn.get("role", ""), turn.get("role", ""))
+        return f"- {role}: {content}"
+
+    def _merge(self, summary: str, turn: Dict[str, str], budget: int, counter: TokenCounter) -> str:
+        lines = summary.split("\n") if summary else []
+        lines.append(self._excerpt(turn))
+        # 超出预算时丢弃最早的要点
+        while len(lines) > 1 and counter.count("\n".join(lines)) > budget:
+            lines.pop(0)
+        merged = "\n".join(lines)
+        if counter.count(merged) > budget:
+            merged = counter.truncate(merged, budget)
+        return merged
+
+    def summarize(self, turns: List[Dict[str, str]], budget: int, counter: TokenCounter) -> str:
+        """生成不超过 budget tokens 的摘要"""
+        if not turns or budget <= 0:
+            return ""
+        keys = self._prefix_keys(turns, budget)
+        summary, start = "", 0
+        with self._lock:
+            for index in range(len(keys) - 1, -1, -1):
+                cached = self._cache.get(keys[index])
+                if cached is not None:
+                    self._cache.move_to_end(keys[index])
+                    summary, start = cached, index + 1
+                    break
+        for index in range(start, len(turns)):
+            summary = self._merge(summary, turns[index], budget, counter)
+            with self._lock:
+                self._cache[keys[index]] = summary
+                if len(self._cache) > self._max_entries:
+                    self._cache.popitem(last=False)
+        return summary
+
+
+@dataclass
+class AssembledPrompt:
+    """组装结果"""
+    messages: List[Dict[str, str]]
+    prompt_tokens: int
+    budget: int
+    max_tokens: int
+    summarized_turns: int = 0
+    dropped_chunks: int = 0
+    stats: Dict[str, int] = field(default_factory=dict)
+
+
+class ContextBuilder:
+    """
+    基于 token 预算的提示词组装器
+
+    预算 = n_ctx - 回复预留，依次分配：
+    1. 系统提示词与当前问题（必须保留，过长时截断）
+    2. 参考资料（知识库片段、数据分析上下文），最多占剩余的 context_ratio
+    3. 历史对话：从最近一轮向前保留，放不下的早期轮次压缩为摘要（最多占 summary_ratio）
+    """
+
+    SUMMARY_HEADER = "以下是更早对话的摘要：\n"
+    CONTEXT_HEADER = "\n\n以下是相关的上下文信息，请结合这些信息来回答用户的问题：\n"
+
+    def __init__(
+        self,
+        n_ctx: int,
+        counter: Optional[TokenCounter] = None,
+        summarizer: Optional[ConversationSummarizer] = None,
+        response_tokens: Optional[int] = None,
+        context_ratio: float = 0.4,
+        summary_ratio: float = 0.15
+    ):
+        self.n_ctx = n_ctx
+        self.counter = counter or TokenCounter()
+        self.summarizer = summarizer or default_summarizer
+        # 回复预留：默认 n_ctx 的 1/4，最多 1024
+        self.response_tokens = response_tokens if response_tokens is not None else min(1024, n_ctx // 4)
+        self.context_ratio = context_ratio
+        self.summary_ratio = summary_ratio
+
+    @property
+    def budget(self) -> int:
+        return max(0, self.n_ctx - self.response_tokens)
+
+    def _fit_chunks(self, chunks: List[str], budget: int) -> Tuple[List[str], int]:
+        """按顺序放入参考片段，最后一个放不下的截断"""
+        fitted, used = [], 0
+        for index, chunk in enumerate(chunks):
+            cost = self.counter.count(chunk) + 1
+            if used + cost <= budget:
+                fitted.append(chunk)
+                used += cost
+                continue
+            remain = budget - used - 1
+            if remain > 16:
+                fitted.append(self.counter.truncate(chunk, remain))
+                index += 1
+            return fitted, len(chunks) - index
+        return fitted, 0
+
+    def build(
+        self,
+        system_prompt: str,
+        query: str,
+        history: Optional[List[Dict[str, str]]] = None,
+        context_sections: Optional[List[Tuple[str, List[str]]]] = None
+    ) -> AssembledPrompt:
+        """
+        组装消息列表
+
+        Args:
+            system_prompt: 基础系统提示词（角色预设）
+            query: 当前用户问题
+            history: 历史对话（时间正序）
+            context_sections: [(标题, [片段...])]，按优先级排列
+        """
+        history = [m for m in (history or []) if m.get("content")]
+        counter = self.counter
+        budget = self.budget
+        stats: Dict[str, int] = {}
+
+        # 1. 必需部分：系统提示词 + 当前问题（问题最多占一半预算）
+        query_text = counter.truncate(query, max(1, budget // 2))
+        query_cost = counter.count(query_text) + MESSAGE_OVERHEAD_TOKENS
+        system_base = counter.truncate(system_prompt, max(1, budget - query_cost - MESSAGE_OVERHEAD_TOKENS))
+        fixed_cost = query_cost + counter.count(system_base) + MESSAGE_OVERHEAD_TOKENS
+        remaining = max(0, budget - fixed_cost)
+        stats["system"] = counter.count(system_base)
+        stats["query"] = query_cost
+
+        # 2. 参考资料
+        context_text = ""
+        dropped_chunks = 0
+        if context_sections:
+            context_budget = int(remaining * self.context_ratio) - counter.count(self.CONTEXT_HEADER)
+            parts = []
+            for title, chunks in context_sections:
+                chunks = [c for c in chunks if c]
+                if not chunks or context_budget <= 0:
+                    dropped_chunks += len(chunks)
+                    continue
+                header = f"\n--- {title} ---\n"
+                section_budget = context_budget - counter.count(header)
+                fitted, dropped = self._fit_chunks(chunks, section_budget)
+                dropped_chunks += dropped
+                if fitted:
+                    section = header + "\n".join(fitted)
+                    parts.append(section)
+                    context_budget -= counter.count(section) + 1
+            if parts:
+                context_text = self.CONTEXT_HEADER + "\n".join(parts)
+        system_content = system_base + context_text
+        context_cost = counter.count(system_content) - counter.count(system_base)
+        remaining = max(0, remaining - context_cost)
+        stats["context"] = context_cost
+
+        # 3. 历史对话：从最近一轮向前保留
+        kept: List[Dict[str, str]] = []
+        used = 0
+        split = len(history)
+        for index in range(len(history) - 1, -1, -1):
+            cost = counter.count_message(history[index])
+            if used + cost > remaining:
+                break
+            kept.insert(0, history[index])
+            used += cost
+            split = index
+        older = history[:split]
+
+        summary_text = ""
+        if older:
+            summary_budget = int(budget * self.summary_ratio) - counter.count(self.SUMMARY_HEADER)
+            # 为摘要腾出空间：从最早的保留轮次开始移出
+            while kept and used + summary_budget + counter.count(self.SUMMARY_HEADER) > remaining:
+                moved = kept.pop(0)
+                used -= counter.count_message(moved)
+                older.append(moved)
+            summary_budget = min(summary_budget, remaining - used - counter.count(self.SUMMARY_HEADER))
+            summary = self.summarizer.summarize(older, summary_budget, counter) if summary_budget > 0 else ""
+            if summary:
+                summary_text = "\n\n" + self.SUMMARY_HEADER + summary
+                if counter.count(system_content + summary_text) - counter.count(system_content) > remaining - used:
+                    summary_text = ""
+        stats["history"] = used
+        stats["summary"] = counter.count(system_content + summary_text) - counter.count(system_content) if summary_text else 0
+
+        def _assemble() -> List[Dict[str, str]]:
+            assembled = [{"role": "system", "content": system_content + summary_text}]
+            assembled.extend({"role": m["role"], "content": m["content"]} for m in kept)
+            assembled.append({"role": "user", "content": query_text})
+            return assembled
+
+        messages = _assemble()
+        prompt_tokens = counter.count_messages(messages)
+        # 分段计数与整体分词可能略有出入，超出时依次收缩历史、摘要、参考资料
+        while prompt_tokens > budget:
+            if kept:
+                kept.pop(0)
+            elif summary_text:
+                summary_text = ""
+            elif system_content != system_base:
+                overflow = prompt_tokens - budget
+                system_content = counter.truncate(system_content, max(0, counter.count(system_content) - overflow))
+                if counter.count(system_content) <= counter.count(system_base):
+                    system_content = system_base
+            else:
+                break
+            messages = _assemble()
+            prompt_tokens = counter.count_messages(messages)
+        return AssembledPrompt(
+            messages=messages,
+            prompt_tokens=prompt_tokens,
+            budget=budget,
+            max_tokens=max(1, self.n_ctx - prompt_tokens),
+            summarized_turns=len(older) if summary_text else 0,
+            dropped_chunks=dropped_chunks,
+            stats=stats
+        )
+
+
+# 全局摘要缓存（跨请求复用）
+default_summarizer = ConversationSummarizer()
@@ -0,0 +1,265 @@
+"""
+本地模型推理调度器
+每个模型一个专用推理线程，请求按用户轮转公平排队，
+token 通过线程安全回调推送到事件循环，客户端断开时取消生成
+"""
+
+import asyncio
+import itertools
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 流结束标记
+_DONE = object()
+
+
+class InferenceQueueFull(RuntimeError):
+    """推理队列已满"""
+
+
+class InferenceRequest:
+    """单次推理请求"""
+
+    _id_counter = itertools.count(1)
+
+    def __init__(
+        self,
+        user_key: Any,
+        messages: List[Dict[str, str]],
+        params: Dict[str, Any],
+        stream: bool,
+        loop: asyncio.AbstractEventLoop
+    ):
+        self.id = next(self._id_counter)
+        self.user_key = user_key
+        self.messages = messages
+        self.params = params
+        self.stream = stream
+        self.loop = loop
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.cancelled = threading.Event()
+        self.last_position: Optional[int] = None
+
+    def push(self, item: Any):
+        """从推理线程向事件循环推送数据"""
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+        except RuntimeError:
+            # 事件循环已关闭，视为客户端已离开
+            self.cancelled.set()
+
+
+class ModelWorker:
+    """
+    单模型推理工作线程
+
+    llama.cpp 的 Llama 实例非线程安全，所有推理在同一线程串行执行。
+    等待中的请求按用户分组轮转出队，避免单个用户的连续请求占满队列。
+    串行执行同时让 llama.cpp 可以复用上一轮留下的 KV 状态（相同前缀无需重新计算）。
+    """
+
+    def __init__(self, model_name: str, llm: Any, max_pending: int = 32):
+        self.model_name = model_name
+        self.llm = llm
+        self.max_pending = max_pending
+        # 用户 -> 等待中的请求队列（OrderedDict 顺序即轮转顺序）
+        self._pending: "OrderedDict[Any, Deque[InferenceRequest]]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._running = True
+        self._current: Optional[InferenceRequest] = None
+        self._thread = threading.Thread(
+            target=self._run, name=f"llm-worker-{model_name}", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def pending_count(self) -> int:
+        with self._cond:
+            return sum(len(q) for q in self._pending.values())
+
+    def submit(self, request: InferenceRequest):
+        """加入等待队列"""
+        with self._cond:
+            if not self._running:
+                raise RuntimeError(f"模型 {self.model_name} 推理线程已停止")
+            if sum(len(q) for q in self._pending.values()) >= self.max_pending:
+                raise InferenceQueueFull("本地推理队列已满，请稍后重试")
+            self._pending.setdefault(request.user_key, deque()).append(request)
+            self._publish_positions()
+            self._cond.notify()
+
+    def cancel(self, request: InferenceRequest):
+        """取消请求：排队中的直接移除，执行中的在下一个 token 处停止"""
+        request.cancelled.set()
+        with self._cond:
+            user_queue = self._pending.get(request.user_key)
+            if user_queue and request in user_queue:
+                user_queue.remove(request)
+                if not user_queue:
+                    del self._pending[request.user_key]
+                self._publish_positions()
+
+    def stop(self):
+        """停止工作线程（当前请求完成后退出）"""
+        with self._cond:
+            self._running = False
+            for user_queue in self._pending.values():
+                for request in user_queue:
+                    request.push(RuntimeError("推理服务已停止"))
+                    request.push(_DONE)
+            self._pending.clear()
+            if self._current:
+                self._current.cancelled.set()
+            self._cond.notify_all()
+
+    def _ordered_pending(self) -> List[InferenceRequest]:
+        """按轮转规则展开的等待顺序"""
+        queues = [list(q) for q in self._pending.values()]
+        order = []
+        for round_items in itertools.zip_longest(*queues):
+            order.extend(r for r in round_items if r is not None)
+        return order
+
+    def _publish_positions(self):
+        """推送排队位置（仅在位置变化时推送），需持有锁"""
+        for index, request in enumerate(self._ordered_pending(), start=1):
+            if request.stream and request.last_position != index:
+                request.last_position = index
+                request.push({"queue_position": index})
+
+    def _next_request(self) -> Optional[InferenceRequest]:
+        """取下一个请求，需持有锁"""
+        while self._running and not self._pending:
+            self._cond.wait()
+        if not self._running:
+            return None
+        user_key, user_queue = next(iter(self._pending.items()))
+        request = user_queue.popleft()
+        # 当前用户移到队尾，实现轮转
+        del self._pending[user_key]
+        if user_queue:
+            self._pending[user_key] = user_queue
+        self._publish_positions()
+        return request
+
+    def _run(self):
+        while True:
+            with self._cond:
+                request = self._next_request()
+                if request is None:
+                    return
+                self._current = request
+            try:
+                if not request.cancelled.is_set():
+                    self._execute(request)
+            except Exception as e:
+                logger.error(f"本地推理失败 ({self.model_name}): {e}")
+                request.push(e)
+            finally:
+                with self._cond:
+                    self._current = None
+                request.push(_DONE)
+
+    def _execute(self, request: InferenceRequest):
+        if request.stream:
+            request.push({"queue_position": 0})
+        result = self.llm.create_chat_completion(
+            messages=request.messages, stream=request.stream, **request.params
+        )
+        if not request.stream:
+            request.push(result)
+            return
+        try:
+            for chunk in result:
+                if request.cancelled.is_set():
+                    logger.debug(f"推理请求 {request.id} 已取消，停止生成")
+                    break
+                request.push(chunk)
+        finally:
+            close = getattr(result, "close", None)
+            if close:
+                close()
+
+
+class InferenceScheduler:
+    """推理调度器：按模型管理工作线程"""
+
+    def __init__(self, max_pending: int = 32):
+        self.max_pending = max_pending
+        self._workers: Dict[str, ModelWorker] = {}
+        self._lock = threading.Lock()
+
+    def get_worker(self, model_name: str, llm: Any) -> ModelWorker:
+        with self._lock:
+            worker = self._workers.get(model_name)
+            if worker is None or worker.llm is not llm:
+                if worker:
+                    worker.stop()
+                worker = ModelWorker(model_name, llm, max_pending=self.max_pending)
+                self._workers[model_name] = worker
+            return worker
+
+    def queue_size(self, model_name: str) -> int:
+        worker = self._workers.get(model_name)
+        return worker.pending_count if worker else 0
+
+    def submit(
+        self,
+        model_name: str,
+        llm: Any,
+        messages: List[Dict[str, str]],
+        user_key: Any = None,
+        stream: bool = True,
+        **params
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        提交推理请求，返回异步迭代器
+
+        流式模式下会先输出 {"queue_position": n} 排队信息（0 表示开始生成），
+        随后输出与 llama-cpp 一致的 chunk。迭代器被关闭/取消时自动取消推理。
+        """
+        worker = self.get_worker(model_name, llm)
+        request = InferenceRequest(
+            user_key=user_key,
+            messages=messages,
+            params=params,
+            stream=stream,
+            loop=asyncio.get_running_loop()
+        )
+        worker.submit(request)
+
+        async def _stream():
+            try:
+                while True:
+                    item = await request.queue.get()
+                    if item is _DONE:
+                        break
+                    if isinstance(item, BaseException):
+                        raise item
+                    yield item
+            finally:
+                worker.cancel(request)
+
+        return _stream()
+
+    def shutdown(self):
+        with self._lock:
+            for worker in self._workers.values():
+                worker.stop()
+            self._workers.clear()
+
+
+def _default_max_pending() -> int:
+    try:
+        from core.config import get_settings
+        return int(get_settings().ai_local_max_queue)
+    except Exception:
+        return 32
+
+
+# 全局推理调度器
+inference_scheduler = InferenceScheduler(max_pending=_default_max_pending())
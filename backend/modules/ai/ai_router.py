@@ -184,6 +184,7 @@ async def chat(
     async def event_generator():
         ai_content = ""
         cancelled = False
+        response_iter = None
         try:
             # 立即发送连接确认，确保响应头立即发送给各层中间件
             yield ": connection established\n\n"
@@ -199,7 +200,8 @@ async def chat(
                     provider=request.provider,
                     role_preset=request.role_preset,
                     model_name=request.model_name,
-                    api_config=db_api_config or request.api_config # 优先使用数据库配置
+                    api_config=db_api_config or request.api_config, # 优先使用数据库配置
+                    user_id=user.user_id
                 )
 
                 if asyncio.iscoroutine(response_iter):
@@ -217,6 +219,11 @@ async def chat(
 
             async for chunk in response_iter:
                 try:
+                    # 本地推理排队位置（0 表示开始生成）
+                    if "queue_position" in chunk:
+                        data = json.dumps({"queue_position": chunk["queue_position"]})
+                        yield f"data: {data}\n\n"
+                        continue
                     if "choices" in chunk and len(chunk["choices"]) > 0:
                         delta = chunk["choices"][0].get("delta", {})
                         content = delta.get("content", "")
@@ -338,8 +345,12 @@ async def chat(
                 # 客户端已断开，忽略
                 pass
         finally:
-            # 确保生成器正常结束，即使发生异常
-            pass
+            # 关闭推理迭代器，客户端断开时释放本地推理队列中的位置
+            if response_iter is not None and hasattr(response_iter, "aclose"):
+                try:
+                    await response_iter.aclose()
+                except Exception as close_err:
+                    logger.debug(f"关闭推理流失败: {close_err}")
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -15,6 +15,8 @@ from llama_cpp import Llama
 
 from core.config import get_settings
 from utils.storage import get_storage_manager
+from .ai_inference import inference_scheduler
+from .ai_context import ContextBuilder, TokenCounter
 
 logger = logging.getLogger(__name__)
 storage_manager = get_storage_manager()
@@ -35,6 +37,11 @@ class AIService:
     # 默认模型
     DEFAULT_MODEL = "qwen2.5-coder-7b-instruct-q4_k_m.gguf"
     
+    # 本地模型上下文长度（可通过 AI_LOCAL_N_CTX 配置）
+    DEFAULT_N_CTX = 2048
+    # 提示词 KV 状态缓存容量（字节），用于复用相同前缀（系统提示词、历史对话）
+    PROMPT_CACHE_BYTES = 512 * 1024 * 1024
+    
     @classmethod
     def get_available_models(cls) -> List[str]:
         """获取可用的本地模型列表"""
@@ -55,6 +62,29 @@ class AIService:
     # 记录加载失败的模型，避免重复尝试
     _failed_models = set()
     
+    @classmethod
+    def get_n_ctx(cls) -> int:
+        """本地模型上下文长度"""
+        return int(getattr(get_settings(), "ai_local_n_ctx", cls.DEFAULT_N_CTX) or cls.DEFAULT_N_CTX)
+
+    # 在线模型上下文长度（可通过 AI_ONLINE_N_CTX 配置）
+    DEFAULT_ONLINE_N_CTX = 32768
+    _token_counters: Dict[str, TokenCounter] = {}
+
+    @classmethod
+    def get_online_n_ctx(cls) -> int:
+        """在线模型上下文长度"""
+        return int(getattr(get_settings(), "ai_online_n_ctx", cls.DEFAULT_ONLINE_N_CTX) or cls.DEFAULT_ONLINE_N_CTX)
+
+    @classmethod
+    def _get_token_counter(cls, model_name: str, llm: Any) -> TokenCounter:
+        """获取模型对应的 token 计数器（带计数缓存）"""
+        counter = cls._token_counters.get(model_name)
+        if counter is None or counter.llm is not llm:
+            counter = TokenCounter(llm)
+            cls._token_counters[model_name] = counter
+        return counter
+
     @classmethod
     def _get_llm(cls, model_filename: str) -> Llama:
         """获取或初始化本地模型实例"""
@@ -76,13 +106,20 @@ class AIService:
             
             try:
                 logger.info(f"正在加载本地模型: {model_path}...")
-                cls._model_instances[model_filename] = Llama(
+                llm = Llama(
                     model_path=model_path,
-                    n_ctx=2048,
+                    n_ctx=cls.get_n_ctx(),
                     n_threads=os.cpu_count(),
                     n_gpu_layers=0,
                     verbose=False
                 )
+                # 启用提示词状态缓存：多轮对话的相同前缀无需重新计算
+                try:
+                    from llama_cpp import LlamaRAMCache
+                    llm.set_cache(LlamaRAMCache(capacity_bytes=cls.PROMPT_CACHE_BYTES))
+                except Exception as cache_err:
+                    logger.debug(f"提示词缓存不可用: {cache_err}")
+                cls._model_instances[model_filename] = llm
                 logger.info("本地模型加载完成")
             except Exception as e:
                 # 记录失败的模型
@@ -101,8 +138,8 @@ class AIService:
         return cls._model_instances[model_filename]
 
     @classmethod
-    async def _chat_local(cls, messages: List[Dict[str, str]], stream: bool = True, model_name: Optional[str] = None) -> Any:
-        """本地模型推理"""
+    async def _resolve_local_model(cls, model_name: Optional[str] = None):
+        """选择并加载本地模型，返回 (模型名, Llama 实例)"""
         loop = asyncio.get_running_loop()
 
         # 获取可用模型列表（排除已知失败的模型）
@@ -150,38 +187,31 @@ class AIService:
                 # 所有模型都失败了
                 raise RuntimeError(f"无法加载任何本地模型。请检查模型文件或使用在线模式。原始错误: {e}")
 
-        def _create_generator():
-            return llm.create_chat_completion(
-                messages=messages,
-                stream=stream,
-                temperature=0.7,
-                max_tokens=2048
-            )
-
-        # 获取同步迭代器
-        sync_iterator = await loop.run_in_executor(None, _create_generator)
+        return model_name, llm
 
-        # 转换为异步迭代器，并在线程中执行计算密集型的 next()
-        async def _async_generator():
-            # 定义一个带有异常捕获的迭代辅助函数
-            def _get_next():
-                try:
-                    return next(sync_iterator)
-                except StopIteration:
-                    return None # 使用 None 作为结束信号
-            
-            while True:
-                try:
-                    # 在线程池中获取下一个 token
-                    chunk = await loop.run_in_executor(None, _get_next)
-                    if chunk is None:
-                        break
-                    yield chunk
-                except Exception as e:
-                    logger.error(f"Local inference error: {e}")
-                    break
-        
-        return _async_generator()
+    @classmethod
+    async def _chat_local(
+        cls,
+        messages: List[Dict[str, str]],
+        stream: bool = True,
+        model_name: Optional[str] = None,
+        user_id: Optional[int] = None,
+        max_tokens: int = 2048
+    ) -> Any:
+        """
+        本地模型推理
+        请求进入模型专属推理队列（按用户公平轮转），流式输出排队位置与生成内容
+        """
+        model_name, llm = await cls._resolve_local_model(model_name)
+        return inference_scheduler.submit(
+            model_name,
+            llm,
+            messages,
+            user_key=user_id,
+            stream=stream,
+            temperature=0.7,
+            max_tokens=max_tokens
+        )
 
     @classmethod
     async def _chat_online(cls, messages: List[Dict[str, str]], stream: bool = True, api_config: Optional[Dict[str, str]] = None) -> Any:
@@ -581,13 +611,17 @@ class AIService:
         provider: str = "local", # "local" 或 "online"
         role_preset: str = "default",  # 角色预设
         model_name: Optional[str] = None,  # 本地模型名称
-        api_config: Optional[Dict[str, str]] = None
+        api_config: Optional[Dict[str, str]] = None,
+        user_id: Optional[int] = None  # 用于本地推理队列公平调度
     ) -> Any:
-        """带有上下文的混合模式对话"""
+        """
+        带有上下文的混合模式对话
+        提示词按模型上下文长度分配 token 预算组装，早期对话压缩为滚动摘要
+        """
         
-        context = ""
+        context_sections = []
         
-        # 1. 知识库集成 (RAG)
+        # 1. 知识库集成 (RAG)，片段按相关度排序
         if knowledge_base_id:
             try:
                 from modules.knowledge.knowledge_services import KnowledgeService
@@ -595,9 +629,10 @@ class AIService:
                 async with async_session() as db:
                     search_results = await KnowledgeService.search(db, knowledge_base_id, query)
                     if search_results:
-                        context += "\n--- 参考知识库资料 ---\n"
-                        for res in search_results:
-                            context += f"- {res['content']}\n"
+                        context_sections.append((
+                            "参考知识库资料",
+                            [f"- {res['content']}" for res in search_results]
+                        ))
             except Exception as e:
                 logger.error(f"RAG search error: {e}")
 
@@ -606,9 +641,10 @@ class AIService:
             try:
                 analysis_context = await cls._get_analysis_context(query)
                 if analysis_context:
-                    context += "\n--- 数据分析助手信息 ---"
-                    context += analysis_context
-                    context += "\n\n你可以使用这些数据集信息来回答用户的问题。"
+                    context_sections.append((
+                        "数据分析助手信息",
+                        [analysis_context.strip(), "你可以使用这些数据集信息来回答用户的问题。"]
+                    ))
             except Exception as e:
                 logger.error(f"数据分析助手错误: {e}", exc_info=True)
 
@@ -618,15 +654,26 @@ class AIService:
         
         if use_analysis:
             sys_prompt += " 你具备数据分析能力，可以帮助用户查询、分析和理解数据。"
-        
-        if context:
-            sys_prompt += f"\n\n以下是相关的上下文信息，请结合这些信息来回答用户的问题：\n{context}"
-
-        messages = [{"role": "system", "content": sys_prompt}]
-        messages.extend(history)
-        messages.append({"role": "user", "content": query})
 
         if provider == "online":
-            return await cls._chat_online(messages, stream=True, api_config=api_config)
-        else:
-            return await cls._chat_local(messages, stream=True, model_name=model_name)
+            builder = ContextBuilder(n_ctx=cls.get_online_n_ctx(), counter=TokenCounter())
+            prompt = builder.build(sys_prompt, query, history, context_sections)
+            return await cls._chat_online(prompt.messages, stream=True, api_config=api_config)
+
+        # 本地模式使用已加载模型的分词器计数
+        model_name, llm = await cls._resolve_local_model(model_name)
+        n_ctx = llm.n_ctx() if hasattr(llm, "n_ctx") else cls.get_n_ctx()
+        builder = ContextBuilder(n_ctx=n_ctx, counter=cls._get_token_counter(model_name, llm))
+        prompt = builder.build(sys_prompt, query, history, context_sections)
+        if prompt.summarized_turns or prompt.dropped_chunks:
+            logger.debug(
+                f"上下文已压缩: 摘要 {prompt.summarized_turns} 条历史, 丢弃 {prompt.dropped_chunks} 个参考片段, "
+                f"提示词 {prompt.prompt_tokens}/{prompt.budget} tokens"
+            )
+        return await cls._chat_local(
+            prompt.messages,
+            stream=True,
+            model_name=model_name,
+            user_id=user_id,
+            max_tokens=min(2048, prompt.max_tokens)
+        )
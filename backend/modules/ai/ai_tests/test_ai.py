@@ -436,3 +436,291 @@ class TestAIManifest:
         from modules.ai.ai_manifest import manifest
         assert manifest.id == "ai"
         assert manifest.enabled is True
+
+
+# ==================== 本地推理调度测试 ====================
+
+class FakeLlama:
+    """模拟 llama-cpp 模型：逐 token 输出，记录调用顺序"""
+
+    def __init__(self, tokens=("a", "b", "c"), delay: float = 0.0):
+        import threading
+        self.tokens = tokens
+        self.delay = delay
+        self.calls = []
+        self.emitted = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.active = 0
+        self.max_active = 0
+
+    def create_chat_completion(self, messages, stream=True, **kwargs):
+        import time
+        tag = messages[-1]["content"]
+        self.calls.append(tag)
+        if not stream:
+            return {"choices": [{"message": {"content": tag}}]}
+
+        def _gen():
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            try:
+                self.gate.wait(5)
+                for token in self.tokens:
+                    if self.delay:
+                        time.sleep(self.delay)
+                    self.emitted.append((tag, token))
+                    yield {"choices": [{"delta": {"content": token}}]}
+            finally:
+                self.active -= 1
+        return _gen()
+
+
+async def _collect(stream):
+    chunks = []
+    async for chunk in stream:
+        chunks.append(chunk)
+    return chunks
+
+
+class TestInferenceScheduler:
+    """本地推理调度器测试"""
+
+    @pytest.mark.asyncio
+    async def test_stream_tokens_and_position(self):
+        from modules.ai.ai_inference import InferenceScheduler
+        scheduler = InferenceScheduler()
+        llm = FakeLlama()
+        try:
+            chunks = await _collect(scheduler.submit("m", llm, [{"role": "user", "content": "q"}], user_key=1))
+            contents = [c["choices"][0]["delta"]["content"] for c in chunks if "choices" in c]
+            assert contents == ["a", "b", "c"]
+            assert {"queue_position": 0} in chunks
+        finally:
+            scheduler.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_fair_round_robin_order(self):
+        """同一用户的多个请求不会挤占其他用户"""
+        import asyncio
+        from modules.ai.ai_inference import InferenceScheduler
+        scheduler = InferenceScheduler()
+        llm = FakeLlama(tokens=("x",))
+        llm.gate.clear()
+        try:
+            blocker = scheduler.submit("m", llm, [{"role": "user", "content": "blocker"}], user_key=0)
+            blocker_task = asyncio.create_task(_collect(blocker))
+            # 等待阻塞请求开始执行
+            for _ in range(100):
+                if llm.calls:
+                    break
+                await asyncio.sleep(0.01)
+            streams = [
+                scheduler.submit("m", llm, [{"role": "user", "content": "A1"}], user_key="A"),
+                scheduler.submit("m", llm, [{"role": "user", "content": "A2"}], user_key="A"),
+                scheduler.submit("m", llm, [{"role": "user", "content": "A3"}], user_key="A"),
+                scheduler.submit("m", llm, [{"role": "user", "content": "B1"}], user_key="B"),
+            ]
+            assert scheduler.queue_size("m") == 4
+            llm.gate.set()
+            results = await asyncio.gather(blocker_task, *[_collect(s) for s in streams])
+            assert llm.calls == ["blocker", "A1", "B1", "A2", "A3"]
+            # 推理串行执行
+            assert llm.max_active == 1
+            # 轮转后 B1 排在 A1 之后（第 2 位），出队过程中位置前移
+            positions = [c["queue_position"] for c in results[4] if "queue_position" in c]
+            assert positions[0] == 2
+            assert positions[-1] == 0
+            assert positions == sorted(positions, reverse=True)
+        finally:
+            llm.gate.set()
+            scheduler.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_cancel_running_request(self):
+        """客户端断开后停止生成"""
+        import asyncio
+        from modules.ai.ai_inference import InferenceScheduler
+        scheduler = InferenceScheduler()
+        llm = FakeLlama(tokens=tuple(str(i) for i in range(50)), delay=0.01)
+        try:
+            stream = scheduler.submit("m", llm, [{"role": "user", "content": "long"}], user_key=1)
+            async for chunk in stream:
+                if "choices" in chunk:
+                    break
+            await stream.aclose()
+            await asyncio.sleep(0.1)
+            emitted = len(llm.emitted)
+            assert emitted < 50
+            await asyncio.sleep(0.1)
+            assert len(llm.emitted) == emitted
+            assert llm.active == 0
+        finally:
+            scheduler.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_cancel_queued_request(self):
+        """排队中的请求取消后不会被执行"""
+        import asyncio
+        from modules.ai.ai_inference import InferenceScheduler
+        scheduler = InferenceScheduler()
+        llm = FakeLlama(tokens=("x",))
+        llm.gate.clear()
+        try:
+            first = asyncio.create_task(_collect(scheduler.submit("m", llm, [{"role": "user", "content": "first"}], user_key=1)))
+            for _ in range(100):
+                if llm.calls:
+                    break
+                await asyncio.sleep(0.01)
+            queued = scheduler.submit("m", llm, [{"role": "user", "content": "queued"}], user_key=2)
+            await queued.__anext__()  # 排队位置
+            await queued.aclose()
+            assert scheduler.queue_size("m") == 0
+            llm.gate.set()
+            await first
+            await asyncio.sleep(0.05)
+            assert llm.calls == ["first"]
+        finally:
+            llm.gate.set()
+            scheduler.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_queue_full(self):
+        from modules.ai.ai_inference import InferenceScheduler, InferenceQueueFull
+        scheduler = InferenceScheduler(max_pending=1)
+        llm = FakeLlama()
+        llm.gate.clear()
+        try:
+            running = scheduler.submit("m", llm, [{"role": "user", "content": "1"}], user_key=1)
+            await running.__anext__()
+            # 等待第一个请求出队开始执行
+            import asyncio
+            for _ in range(100):
+                if llm.calls:
+                    break
+                await asyncio.sleep(0.01)
+            scheduler.submit("m", llm, [{"role": "user", "content": "2"}], user_key=2)
+            with pytest.raises(InferenceQueueFull):
+                scheduler.submit("m", llm, [{"role": "user", "content": "3"}], user_key=3)
+        finally:
+            llm.gate.set()
+            scheduler.shutdown()
+
+
+# ==================== 上下文预算组装测试 ====================
+
+class FakeTokenizer:
+    """按字节计数的模拟分词器（每 3 字节 1 token）"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def tokenize(self, data: bytes, add_bos: bool = False):
+        self.calls += 1
+        return list(range((len(data) + 2) // 3))
+
+
+def _history(turns: int, size: int = 200):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"问题{i} " + "内容" * size})
+        history.append({"role": "assistant", "content": f"回答{i} " + "answer " * size})
+    return history
+
+
+class TestContextBuilder:
+    """基于 token 预算的上下文组装测试"""
+
+    def test_uses_model_tokenizer(self):
+        from modules.ai.ai_context import TokenCounter
+        llm = FakeTokenizer()
+        counter = TokenCounter(llm)
+        assert counter.count("abcdef") == 2
+        # 计数结果被缓存
+        counter.count("abcdef")
+        assert llm.calls == 1
+
+    def test_estimate_without_model(self):
+        from modules.ai.ai_context import TokenCounter
+        counter = TokenCounter()
+        assert counter.count("你好世界") == 4
+        assert counter.count("abcdefgh") == 2
+
+    def test_truncate(self):
+        from modules.ai.ai_context import TokenCounter
+        counter = TokenCounter()
+        text = "数据" * 100
+        truncated = counter.truncate(text, 10)
+        assert counter.count(truncated) <= 10
+        assert truncated.endswith("…")
+
+    def test_short_conversation_kept_intact(self):
+        from modules.ai.ai_context import ContextBuilder, TokenCounter
+        builder = ContextBuilder(n_ctx=4096, counter=TokenCounter())
+        history = [{"role": "user", "content": "你好"}, {"role": "assistant", "content": "你好！"}]
+        prompt = builder.build("系统提示", "今天天气如何", history)
+        assert prompt.messages[0] == {"role": "system", "content": "系统提示"}
+        assert prompt.messages[1:3] == history
+        assert prompt.messages[-1] == {"role": "user", "content": "今天天气如何"}
+        assert prompt.summarized_turns == 0
+
+    @pytest.mark.parametrize("n_ctx", [512, 1024, 2048, 4096])
+    @pytest.mark.parametrize("turns", [0, 3, 20, 80])
+    def test_prompt_never_exceeds_budget(self, n_ctx, turns):
+        from modules.ai.ai_context import ContextBuilder, TokenCounter, ConversationSummarizer
+        counter = TokenCounter(FakeTokenizer())
+        builder = ContextBuilder(n_ctx=n_ctx, counter=counter, summarizer=ConversationSummarizer())
+        sections = [
+            ("参考知识库资料", ["- 片段" + "资料" * 300 for _ in range(6)]),
+            ("数据分析助手信息", ["数据集 " * 500]),
+        ]
+        prompt = builder.build("你是一个全能智能助手。" * 5, "请总结" * 50, _history(turns), sections)
+        assert prompt.prompt_tokens <= prompt.budget
+        assert counter.count_messages(prompt.messages) == prompt.prompt_tokens
+        assert prompt.prompt_tokens + prompt.max_tokens <= n_ctx
+        assert prompt.messages[0]["role"] == "system"
+        assert prompt.messages[-1]["role"] == "user"
+
+    def test_older_turns_summarized(self):
+        from modules.ai.ai_context import ContextBuilder, TokenCounter, ConversationSummarizer
+        builder = ContextBuilder(n_ctx=2048, counter=TokenCounter(), summarizer=ConversationSummarizer())
+        history = _history(30)
+        prompt = builder.build("系统提示", "继续", history)
+        assert prompt.summarized_turns > 0
+        system = prompt.messages[0]["content"]
+        assert ContextBuilder.SUMMARY_HEADER.strip() in system
+        # 保留最近的对话原文
+        assert prompt.messages[-2] == history[-1]
+
+    def test_summary_cached_and_rolling(self):
+        from modules.ai.ai_context import ConversationSummarizer, TokenCounter
+        summarizer = ConversationSummarizer()
+        counter = TokenCounter()
+        turns = _history(10, size=10)
+        merges = []
+        original = summarizer._merge
+
+        def _tracking_merge(*args, **kwargs):
+            merges.append(1)
+            return original(*args, **kwargs)
+
+        summarizer._merge = _tracking_merge
+        first = summarizer.summarize(turns[:10], 200, counter)
+        assert len(merges) == 10
+        # 相同前缀直接命中缓存
+        assert summarizer.summarize(turns[:10], 200, counter) == first
+        assert len(merges) == 10
+        # 新增轮次只需增量合并
+        summarizer.summarize(turns[:14], 200, counter)
+        assert len(merges) == 14
+        assert counter.count(summarizer.summarize(turns, 50, counter)) <= 50
+
+    def test_context_chunks_trimmed_to_budget(self):
+        from modules.ai.ai_context import ContextBuilder, TokenCounter
+        builder = ContextBuilder(n_ctx=1024, counter=TokenCounter())
+        chunks = [f"- 第{i}段" + "资料" * 200 for i in range(10)]
+        prompt = builder.build("系统提示", "问题", [], [("参考知识库资料", chunks)])
+        assert prompt.dropped_chunks > 0
+        assert "第0段" in prompt.messages[0]["content"]
+        assert "第9段" not in prompt.messages[0]["content"]
+        assert prompt.prompt_tokens <= prompt.budget
@@ -4,8 +4,8 @@
 """
 
 import os
-from fastapi import APIRouter, Depends, UploadFile, File, Query
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import APIRouter, Depends, UploadFile, File, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.database import get_db
@@ -13,6 +13,7 @@ from core.security import get_current_user, get_optional_user, TokenData
 from core.errors import NotFoundException, PermissionException, AuthException, BusinessException, ErrorCode
 from schemas.response import success, error
 from utils.storage import get_storage_manager
+from utils.download import file_response, content_disposition
 
 from .album_schemas import (
     AlbumCreate, AlbumUpdate, AlbumResponse, AlbumListResponse, AlbumDetailResponse,
@@ -259,6 +260,7 @@ async def get_album_photos(
 @router.get("/photos/{photo_id}/file", summary="获取照片原图")
 async def get_photo_file(
     photo_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(get_optional_user)
 ):
@@ -293,7 +295,8 @@ async def get_photo_file(
     if not resolved.startswith(storage_root):
         raise PermissionException("文件路径非法")
     
-    return FileResponse(
+    return file_response(
+        request,
         resolved,
         media_type=photo.mime_type or "image/jpeg",
         filename=photo.filename
@@ -303,6 +306,7 @@ async def get_photo_file(
 @router.get("/photos/{photo_id}/thumbnail", summary="获取照片缩略图")
 async def get_photo_thumbnail(
     photo_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(get_optional_user)
 ):
@@ -340,7 +344,8 @@ async def get_photo_thumbnail(
     if not resolved.startswith(storage_root):
         raise PermissionException("文件路径非法")
     
-    return FileResponse(
+    return file_response(
+        request,
         resolved,
         media_type=photo.mime_type or "image/jpeg"
     )
@@ -452,6 +457,6 @@ async def batch_download_photos(
     return StreamingResponse(
         zip_stream,
         media_type="application/zip",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        headers={"Content-Disposition": content_disposition(filename)}
     )
 
@@ -4,8 +4,10 @@
 """
 
 import os
+import asyncio
+import hashlib
 import logging
-from typing import Optional, List, Tuple
+from typing import Iterator, Optional, List, Tuple
 from datetime import datetime
 from sqlalchemy import select, func, and_, update
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -13,6 +15,7 @@ from sqlalchemy.orm import selectinload
 from PIL import Image
 import io
 
+from utils.zip_stream import iter_zip
 from .album_models import Album, AlbumPhoto
 from .album_schemas import AlbumCreate, AlbumUpdate, PhotoUpdate
 
@@ -24,21 +27,13 @@ THUMBNAIL_SIZE = (300, 300)
 ALLOWED_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp'}
 ALLOWED_MIME_TYPES = {'image/jpeg', 'image/png', 'image/gif', 'image/webp', 'image/bmp'}
 
-import zipfile
-
-def create_zip_stream(files: List[Tuple[str, str]]) -> io.BytesIO:
+def create_zip_stream(files: List[Tuple[str, str]]) -> Iterator[bytes]:
     """
-    创建 ZIP 文件流
+    创建 ZIP 文件流（边读边输出，照片按原样存储不重复压缩）
     参数:
         files: 文件列表，每个元素为 (file_path, archive_name)
     """
-    memory_file = io.BytesIO()
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        for file_path, archive_name in files:
-            if os.path.exists(file_path):
-                zf.write(file_path, archive_name)
-    memory_file.seek(0)
-    return memory_file
+    return iter_zip(files)
 
 
 class AlbumService:
@@ -214,6 +209,14 @@ class AlbumService:
         with open(photo_path, 'wb') as f:
             f.write(file_content)
         
+        # 相同照片在各模块间共享一份内容
+        if storage_manager.dedup_enabled:
+            await asyncio.to_thread(
+                storage_manager.deduplicate,
+                os.path.relpath(photo_path, storage_manager.root_dir).replace('\\', '/'),
+                hashlib.sha256(file_content).hexdigest()
+            )
+        
         # 获取图片信息并生成缩略图
         width, height = None, None
         try:
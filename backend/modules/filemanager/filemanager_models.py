@@ -16,7 +16,9 @@ class VirtualFolder(Base):
     __table_args__ = (
         Index("idx_fm_folder_user", "user_id"),
         Index("idx_fm_folder_parent", "parent_id"),
-        # path 字段太长无法建索引，通过 user_id 和 parent_id 查询
+        # path 字段太长无法建索引，通过 user_id 和 parent_id 查询；
+        # 子树查询走 id_path 前缀索引
+        Index("idx_fm_folder_idpath", "user_id", "id_path"),
         {"extend_existing": True, "comment": "文件管理虚拟文件夹表"}
     )
     
@@ -25,6 +27,8 @@ class VirtualFolder(Base):
     parent_id = Column(Integer, ForeignKey("fm_folders.id", ondelete="CASCADE"), nullable=True, comment="父文件夹ID")
     user_id = Column(Integer, ForeignKey("sys_users.id", ondelete="CASCADE"), nullable=False, comment="所属用户ID")
     path = Column(String(1024), nullable=False, default="/", comment="完整路径")
+    # 物化路径：从根到自身的文件夹 ID，如 /1/5/23/，前缀匹配即整棵子树
+    id_path = Column(String(512), nullable=False, default="/", comment="祖先ID物化路径")
     
     created_at = Column(DateTime(timezone=True), default=get_beijing_time, comment="创建时间")
     updated_at = Column(DateTime(timezone=True), default=get_beijing_time, onupdate=get_beijing_time, comment="更新时间")
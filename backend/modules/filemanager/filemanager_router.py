@@ -6,7 +6,7 @@ RESTful 风格，提供完整的文件管理功能
 from typing import Optional, List
 import os
 from urllib.parse import quote
-from fastapi import APIRouter, Depends, Query, UploadFile, File, Form, BackgroundTasks
+from fastapi import APIRouter, Depends, Query, UploadFile, File, Form, BackgroundTasks, Request
 from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -17,7 +17,7 @@ from schemas import success
 
 from .filemanager_schemas import (
     FolderCreate, FolderUpdate, FolderMove, FolderInfo,
-    FileUpdate, FileMove, FileInfo, DirectoryContents, StorageStats,
+    FileUpdate, FileMove, FileInfo, FileInstantUpload, DirectoryContents, StorageStats,
     BatchDeleteRequest, BatchDeleteResult
 )
 from .filemanager_models import VirtualFolder, VirtualFile
@@ -25,6 +25,8 @@ from sqlalchemy import select
 import logging
 from .filemanager_services import FileManagerService
 from utils.storage import get_storage_manager
+from utils.download import file_response, content_disposition
+from utils.zip_stream import iter_zip
 
 logger = logging.getLogger(__name__)
 
@@ -232,12 +234,15 @@ async def _stream_upload_to_temp(
     display_name: str,
     storage,
     content_length: Optional[int],
-) -> tuple[str, int]:
+) -> tuple[str, int, str]:
+    """流式写入临时文件，边写边计算 SHA-256，返回 (临时路径, 大小, 摘要)"""
     import tempfile
+    import hashlib
 
     max_size = storage.max_size
     max_size_mb = max_size / 1024 / 1024
     total_size = 0
+    digest = hashlib.sha256()
     suffix = os.path.splitext(display_name or "")[1]
     temp_fd, temp_file_path = tempfile.mkstemp(suffix=suffix)
 
@@ -256,6 +261,7 @@ async def _stream_upload_to_temp(
                     )
 
                 tmp_f.write(chunk)
+                digest.update(chunk)
 
                 if content_length and total_size > content_length:
                     logger.warning(
@@ -270,7 +276,7 @@ async def _stream_upload_to_temp(
                 pass
         raise
 
-    return temp_file_path, total_size
+    return temp_file_path, total_size, digest.hexdigest()
 
 async def _process_single_file(
     file: UploadFile,
@@ -302,7 +308,7 @@ async def _process_single_file(
     
     temp_file_path = None
     try:
-        temp_file_path, actual_size = await _stream_upload_to_temp(
+        temp_file_path, actual_size, sha256 = await _stream_upload_to_temp(
             file, display_name, storage, content_length
         )
     except AppException:
@@ -318,7 +324,8 @@ async def _process_single_file(
             mime_type=file.content_type or "application/octet-stream",
             folder_id=folder_id,
             description=description,
-            file_size=actual_size
+            file_size=actual_size,
+            sha256=sha256
         )
     except ValueError as e:
         return {
@@ -389,7 +396,7 @@ async def _process_single_file_with_name(
 
     temp_file_path = None
     try:
-        temp_file_path, actual_size = await _stream_upload_to_temp(
+        temp_file_path, actual_size, sha256 = await _stream_upload_to_temp(
             file, filename, storage, content_length
         )
     except AppException:
@@ -405,7 +412,8 @@ async def _process_single_file_with_name(
             mime_type=file.content_type or "application/octet-stream",
             folder_id=folder_id,
             description=description,
-            file_size=actual_size
+            file_size=actual_size,
+            sha256=sha256
         )
     except ValueError as e:
         return {
@@ -529,6 +537,34 @@ async def upload_file(
     }, message)
 
 
+@router.post("/upload/instant")
+async def upload_file_instant(
+    data: FileInstantUpload,
+    db: AsyncSession = Depends(get_db),
+    user: TokenData = Depends(require_permission("filemanager.upload"))
+):
+    """
+    秒传：客户端先提交文件 SHA-256 与大小，内容已存在时直接创建文件，无需上传数据
+    
+    返回 hit=false 时客户端应继续走 /upload 普通上传
+    """
+    service = get_service(db, user)
+    try:
+        uploaded = await service.upload_file_by_hash(
+            filename=data.name,
+            sha256=data.sha256,
+            file_size=data.size,
+            folder_id=data.folder_id,
+            description=data.description
+        )
+    except ValueError as e:
+        raise BusinessException(ErrorCode.VALIDATION_ERROR, str(e))
+    
+    if uploaded is None:
+        return success({"hit": False, "file": None}, "内容不存在，请上传文件")
+    return success({"hit": True, "file": service._file_to_info(uploaded).model_dump()}, "秒传成功")
+
+
 @router.post("/upload/folder")
 async def upload_folder(
     files: List[UploadFile] = File(...),
@@ -690,7 +726,6 @@ async def upload_folder(
 @router.get("/folders/{folder_id}/download")
 async def download_folder(
     folder_id: int,
-    background_tasks: BackgroundTasks,
     token: Optional[str] = Query(None),
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(require_permission("filemanager.download"))
@@ -698,12 +733,9 @@ async def download_folder(
     """
     下载文件夹（打包为 ZIP 文件）
     
-    递归获取文件夹下所有文件，打包成 ZIP 流式返回
+    一次查询取出整棵子树的文件，边读边压缩流式返回，内存占用与文件夹大小无关
     """
-    import zipfile
-    import tempfile
     from datetime import datetime
-    from starlette.background import BackgroundTasks
     
     service = get_service(db, user)
     storage = get_storage_manager()
@@ -715,89 +747,24 @@ async def download_folder(
     
     folder_name = folder.name
     
-    # 递归收集文件夹下所有文件
-    async def collect_files(fid: int, path_prefix: str = "") -> list:
-        """递归收集文件夹下的所有文件"""
-        files = []
-        
-        # 获取当前文件夹的文件
-        from .filemanager_models import VirtualFile, VirtualFolder
-        from sqlalchemy import select
-        
-        file_result = await db.execute(
-            select(VirtualFile).where(
-                VirtualFile.folder_id == fid,
-                VirtualFile.user_id == user.user_id
-            )
-        )
-        for f in file_result.scalars().all():
-            file_path = storage.get_file_path(f.storage_path)
-            if file_path and file_path.exists():
-                files.append({
-                    "name": f"{path_prefix}{f.name}" if path_prefix else f.name,
-                    "path": file_path
-                })
-        
-        # 递归处理子文件夹
-        subfolder_result = await db.execute(
-            select(VirtualFolder).where(
-                VirtualFolder.parent_id == fid,
-                VirtualFolder.user_id == user.user_id
-            )
-        )
-        for sf in subfolder_result.scalars().all():
-            sub_prefix = f"{path_prefix}{sf.name}/" if path_prefix else f"{sf.name}/"
-            files.extend(await collect_files(sf.id, sub_prefix))
-        
-        return files
+    entries = []
+    for relative_path, f in await service.list_subtree_files(folder):
+        file_path = storage.get_file_path(f.storage_path)
+        if file_path:
+            # 在 ZIP 中保持目录结构
+            entries.append((file_path, f"{folder_name}/{relative_path}"))
     
-    all_files = await collect_files(folder_id)
-    
-    if not all_files:
+    if not entries:
         raise BusinessException(ErrorCode.INVALID_OPERATION, "文件夹为空，无法下载")
-        
-    # 检查总大小，防止过大 (限制为 2GB)
-    total_size = sum(f["path"].stat().st_size for f in all_files)
-    if total_size > 2 * 1024 * 1024 * 1024:
-        raise BusinessException(ErrorCode.FILE_TOO_LARGE, "文件夹内容过大 (>2GB)，暂不支持打包下载")
     
-    # 创建临时文件
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".zip")
-    temp_path = temp_file.name
-    temp_file.close() # 关闭句柄，让zipfile重新打开
+    zip_filename = f"{folder_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    logger.info(f"用户 {user.user_id} 下载文件夹: {folder_name}，包含 {len(entries)} 个文件")
     
-    try:
-        with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED) as zf:
-            for file_info in all_files:
-                try:
-                    # 在 ZIP 中保持目录结构
-                    arcname = f"{folder_name}/{file_info['name']}"
-                    zf.write(file_info["path"], arcname)
-                except Exception as e:
-                    logger.warning(f"添加文件到ZIP失败: {file_info['name']}, 错误: {e}")
-                    
-        # 后台任务删除临时文件
-        background_tasks.add_task(os.remove, temp_path)
-        
-        # 处理文件名编码
-        zip_filename = f"{folder_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-        encoded_filename = encode_filename_for_header(zip_filename)
-        cd_header = f"attachment; filename*={encoded_filename}" if not encoded_filename.startswith('"') else f'attachment; filename={encoded_filename}'
-        
-        logger.info(f"用户 {user.user_id} 下载文件夹: {folder_name}，包含 {len(all_files)} 个文件，临时文件: {temp_path}")
-        
-        return FileResponse(
-            temp_path,
-            media_type="application/zip",
-            headers={"Content-Disposition": cd_header}
-        )
-        
-    except Exception as e:
-        # 上传失败清理临时文件
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        logger.error(f"打包下载失败: {e}", exc_info=True)
-        raise BusinessException(ErrorCode.INTERNAL_ERROR, f"打包下载失败: {str(e)}")
+    return StreamingResponse(
+        iter_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition(zip_filename)}
+    )
 
 
 @router.get("/files/{file_id}")
@@ -911,6 +878,7 @@ async def batch_delete(
 @router.get("/download/{file_id}")
 async def download_file(
     file_id: int,
+    request: Request,
     token: Optional[str] = Query(None),
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(require_permission("filemanager.download"))
@@ -927,28 +895,28 @@ async def download_file(
     if not file_path or not file_path.exists():
         raise NotFoundException("文件")
     
-    # 处理文件名编码
-    encoded_filename = encode_filename_for_header(file.name)
     # SVG 可包含嵌入脚本，必须以附件方式下载，防止 XSS
     if file.mime_type and file.mime_type != 'image/svg+xml' and ('image' in file.mime_type or 'video' in file.mime_type or 'pdf' in file.mime_type):
         cd_type = 'inline'
     else:
         cd_type = 'attachment'
-    cd_header = f"{cd_type}; filename={encoded_filename}" if encoded_filename.startswith('"') else f"{cd_type}; filename*={encoded_filename}"
     
-    return FileResponse(
-        path=str(file_path),
+    return file_response(
+        request,
+        file_path,
         media_type=file.mime_type or "application/octet-stream",
-        headers={"Content-Disposition": cd_header}
+        filename=file.name,
+        disposition_type=cd_type
     )
 
 
 @router.get("/preview/{file_id}")
 async def preview_file(
     file_id: int,
+    request: Request,
     token: Optional[str] = Query(None),
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(require_permission("filemanager.download"))
 ):
     """预览文件（在线查看，不触发下载）"""
-    return await download_file(file_id, token, db, user)
+    return await download_file(file_id, request, token, db, user)
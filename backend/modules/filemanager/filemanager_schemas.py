@@ -64,6 +64,15 @@ class FileUpload(BaseModel):
     description: Optional[str] = Field(None, max_length=500, description="文件描述")
 
 
+class FileInstantUpload(BaseModel):
+    """秒传参数"""
+    name: str = Field(..., min_length=1, max_length=255, description="文件名")
+    sha256: str = Field(..., pattern=r"^[0-9a-fA-F]{64}$", description="文件内容 SHA-256")
+    size: int = Field(..., ge=0, description="文件大小(字节)")
+    folder_id: Optional[int] = Field(None, description="目标文件夹ID")
+    description: Optional[str] = Field(None, max_length=500, description="文件描述")
+
+
 class FileUpdate(BaseModel):
     """更新文件"""
     name: Optional[str] = Field(None, min_length=1, max_length=255, description="文件名")
@@ -4,6 +4,8 @@
 
 import os
 import shutil
+import asyncio
+import hashlib
 import logging
 from pathlib import Path
 from typing import Optional, List, Tuple
@@ -12,7 +14,7 @@ import aiofiles
 from utils.timezone import get_beijing_time
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, func, update, delete, literal
 
 from .filemanager_models import VirtualFolder, VirtualFile
 from models import User
@@ -27,8 +29,17 @@ logger = logging.getLogger(__name__)
 settings = get_settings()
 
 
+# 物化路径最大长度（与 VirtualFolder.id_path 列宽一致）
+MAX_ID_PATH_LENGTH = 512
+
+
 class FileManagerService:
-    """文件管理服务"""
+    """
+    文件管理服务
+    
+    文件夹层级以物化路径 id_path（如 /1/5/23/）保存，面包屑、子树移动、
+    子树删除与子树统计都是基于前缀匹配的单条集合语句，与树的规模无关。
+    """
     
     def __init__(self, db: AsyncSession, user_id: int):
         self.db = db
@@ -53,6 +64,20 @@ class FileManagerService:
         )
         return result.scalar_one_or_none()
     
+    def _subtree(self, folder: VirtualFolder):
+        """匹配文件夹自身及全部后代的条件"""
+        return (
+            VirtualFolder.user_id == self.user_id,
+            VirtualFolder.id_path.like(f"{folder.id_path}%")
+        )
+    
+    async def _assign_id_path(self, folder: VirtualFolder, parent: Optional[VirtualFolder]):
+        """新文件夹 flush 得到 ID 后写入物化路径"""
+        await self.db.flush()
+        folder.id_path = f"{parent.id_path if parent else '/'}{folder.id}/"
+        if len(folder.id_path) > MAX_ID_PATH_LENGTH:
+            raise ValueError("文件夹层级过深")
+    
     async def init_system_folders(self):
         """初始化用户的系统文件夹（保留空实现，兼容性考虑）"""
         pass
@@ -91,7 +116,7 @@ class FileManagerService:
                 icon="📁"
             )
             self.db.add(folder)
-            await self.db.flush()
+            await self._assign_id_path(folder, None)
             
         # 2. 处理重名（限制最大尝试次数防止无限循环）
         base_name, ext = os.path.splitext(filename)
@@ -175,6 +200,7 @@ class FileManagerService:
         """创建文件夹"""
         self._validate_name(data.name)
         parent_path = "/"
+        parent = None
         if data.parent_id:
             parent = await self.get_folder(data.parent_id)
             if not parent:
@@ -193,6 +219,11 @@ class FileManagerService:
             path=full_path
         )
         self.db.add(folder)
+        try:
+            await self._assign_id_path(folder, parent)
+        except ValueError:
+            await self.db.rollback()
+            raise
         await self.db.commit()
         await self.db.refresh(folder)
         
@@ -218,29 +249,35 @@ class FileManagerService:
             if existing and existing.id != folder_id:
                 raise ValueError("同名文件夹已存在")
             
+            await self._rewrite_subtree(folder, folder.id_path, old_path, new_path)
             folder.name = data.name
-            folder.path = new_path
             folder.updated_at = get_beijing_time()
-            
-            await self._update_children_paths(folder_id, old_path, new_path)
             await self.db.commit()
+            await self.db.refresh(folder)
         else:
             folder.updated_at = get_beijing_time()
             await self.db.commit()
         
         return folder
     
-    async def _update_children_paths(self, parent_id: int, old_prefix: str, new_prefix: str):
-        """递归更新子文件夹路径"""
-        result = await self.db.execute(
-            select(VirtualFolder)
-            .where(VirtualFolder.parent_id == parent_id, VirtualFolder.user_id == self.user_id)
+    async def _rewrite_subtree(
+        self,
+        folder: VirtualFolder,
+        new_id_path: str,
+        old_path: str,
+        new_path: str
+    ):
+        """单条语句替换整棵子树（含自身）的 id_path 与 path 前缀"""
+        old_id_path = folder.id_path
+        await self.db.execute(
+            update(VirtualFolder)
+            .where(*self._subtree(folder))
+            .values(
+                id_path=literal(new_id_path) + func.substr(VirtualFolder.id_path, len(old_id_path) + 1),
+                path=literal(new_path) + func.substr(VirtualFolder.path, len(old_path) + 1)
+            )
+            .execution_options(synchronize_session=False)
         )
-        children = result.scalars().all()
-        
-        for child in children:
-            child.path = child.path.replace(old_prefix, new_prefix, 1)
-            await self._update_children_paths(child.id, old_prefix, new_prefix)
     
     async def move_folder(self, folder_id: int, target_parent_id: Optional[int]) -> Optional[VirtualFolder]:
         """移动文件夹"""
@@ -249,6 +286,7 @@ class FileManagerService:
             return None
         
         new_parent_path = "/"
+        new_parent_id_path = "/"
         if target_parent_id:
             if target_parent_id == folder_id:
                 raise ValueError("不能将文件夹移动到自己")
@@ -257,73 +295,108 @@ class FileManagerService:
             if not target:
                 raise ValueError("目标文件夹不存在")
             
-            if target.path.startswith(folder.path + "/"):
+            if target.id_path.startswith(folder.id_path):
                 raise ValueError("不能将文件夹移动到其子文件夹")
             
             new_parent_path = target.path
+            new_parent_id_path = target.id_path
         
         old_path = folder.path
         new_path = f"{new_parent_path.rstrip('/')}/{folder.name}"
+        new_id_path = f"{new_parent_id_path}{folder.id}/"
         
         existing = await self.get_folder_by_path(new_path)
         if existing and existing.id != folder_id:
             raise ValueError("目标位置已存在同名文件夹")
         
+        # 子树中最深的物化路径移动后不能超出列宽
+        deepest = (await self.db.execute(
+            select(func.max(func.length(VirtualFolder.id_path))).where(*self._subtree(folder))
+        )).scalar() or len(folder.id_path)
+        if deepest - len(folder.id_path) + len(new_id_path) > MAX_ID_PATH_LENGTH:
+            raise ValueError("文件夹层级过深")
+        
+        await self._rewrite_subtree(folder, new_id_path, old_path, new_path)
         folder.parent_id = target_parent_id
-        folder.path = new_path
         folder.updated_at = get_beijing_time()
-        
-        await self._update_children_paths(folder_id, old_path, new_path)
         await self.db.commit()
         await self.db.refresh(folder)
         
         return folder
     
-    async def delete_folder(self, folder_id: int, _is_root: bool = True) -> bool:
-        """删除文件夹（级联删除文件），仅顶层调用 commit 保证事务一致性"""
+    async def delete_folder(self, folder_id: int) -> bool:
+        """删除文件夹及整棵子树（含文件），数据库部分在一个事务内完成"""
         folder = await self.get_folder(folder_id)
         if not folder:
             return False
-            
-        if folder.is_system:
+        
+        subtree = self._subtree(folder)
+        protected = await self.db.execute(
+            select(VirtualFolder.id).where(*subtree, VirtualFolder.is_system == True).limit(1)
+        )
+        if protected.first():
             raise ValueError("系统保护文件夹不允许删除")
         
-        await self._delete_folder_files(folder_id)
+        subtree_ids = select(VirtualFolder.id).where(*subtree)
+        file_filter = (VirtualFile.user_id == self.user_id, VirtualFile.folder_id.in_(subtree_ids))
+        storage_paths = (await self.db.execute(
+            select(VirtualFile.storage_path).where(*file_filter)
+        )).scalars().all()
         
-        result = await self.db.execute(
-            select(VirtualFolder)
-            .where(VirtualFolder.parent_id == folder_id, VirtualFolder.user_id == self.user_id)
+        await self.db.execute(
+            delete(VirtualFile).where(*file_filter).execution_options(synchronize_session=False)
         )
-        children = result.scalars().all()
-        for child in children:
-            await self.delete_folder(child.id, _is_root=False)
-        
-        await self.db.delete(folder)
+        # 先断开父子引用，整棵子树一条 DELETE 删除，不依赖外键级联的层数限制
+        await self.db.execute(
+            update(VirtualFolder).where(*subtree).values(parent_id=None)
+            .execution_options(synchronize_session=False)
+        )
+        await self.db.execute(
+            delete(VirtualFolder).where(*subtree).execution_options(synchronize_session=False)
+        )
+        await self.db.commit()
         
-        # 仅在顶层调用 commit，避免递归中多次 commit 导致不一致
-        if _is_root:
-            await self.db.commit()
+        # 数据库提交成功后再删除物理文件
+        for storage_path in storage_paths:
+            try:
+                file_path = self.storage.get_file_path(storage_path)
+                if file_path and file_path.exists():
+                    self.storage.delete_file(storage_path)
+            except Exception as e:
+                logger.warning(f"删除物理文件失败: {storage_path}, 错误: {e}")
         
-        logger.info(f"用户 {self.user_id} 删除文件夹: {folder.path}")
+        logger.info(f"用户 {self.user_id} 删除文件夹: {folder.path}（{len(storage_paths)} 个文件）")
         return True
     
-    async def _delete_folder_files(self, folder_id: int):
-        """删除文件夹下的所有物理文件及其数据库记录"""
+    async def get_subtree_stats(self, folder: VirtualFolder) -> Tuple[int, int]:
+        """统计整棵子树的文件数与总大小"""
         result = await self.db.execute(
-            select(VirtualFile)
-            .where(VirtualFile.folder_id == folder_id, VirtualFile.user_id == self.user_id)
+            select(func.count(VirtualFile.id), func.coalesce(func.sum(VirtualFile.file_size), 0))
+            .join(VirtualFolder, VirtualFolder.id == VirtualFile.folder_id)
+            .where(*self._subtree(folder), VirtualFile.user_id == self.user_id)
         )
-        files = result.scalars().all()
+        count, total_size = result.one()
+        return count, int(total_size)
+    
+    async def list_subtree_files(self, folder: VirtualFolder) -> List[Tuple[str, VirtualFile]]:
+        """
+        列出整棵子树的文件
         
-        for file in files:
-            try:
-                file_path = self.storage.get_file_path(file.storage_path)
-                if file_path and file_path.exists():
-                    self.storage.delete_file(file.storage_path)
-            except Exception as e:
-                logger.warning(f"删除物理文件失败: {file.storage_path}, 错误: {e}")
-            # 同时删除数据库记录，避免孤儿记录
-            await self.db.delete(file)
+        Returns:
+            (相对 folder 的路径, 文件) 列表，如 ("sub/a.txt", file)
+        """
+        result = await self.db.execute(
+            select(VirtualFolder.path, VirtualFile)
+            .join(VirtualFolder, VirtualFolder.id == VirtualFile.folder_id)
+            .where(*self._subtree(folder), VirtualFile.user_id == self.user_id)
+            .order_by(VirtualFolder.path, VirtualFile.name)
+        )
+        base = len(folder.path.rstrip('/')) + 1
+        items = []
+        for folder_path, file in result.all():
+            relative_dir = folder_path[base:]
+            items.append((f"{relative_dir}/{file.name}" if relative_dir else file.name, file))
+        return items
     
     async def get_folder_tree(self) -> List[FolderTreeNode]:
         """获取完整文件夹树"""
@@ -417,6 +490,11 @@ class FileManagerService:
         except Exception as e:
             raise ValueError(f"文件保存失败: {str(e)}")
         
+        if self.storage.dedup_enabled:
+            await asyncio.to_thread(
+                self.storage.deduplicate, relative_path, hashlib.sha256(content).hexdigest()
+            )
+        
         file = VirtualFile(
             name=filename,
             folder_id=folder_id,
@@ -440,9 +518,10 @@ class FileManagerService:
         mime_type: str,
         folder_id: Optional[int] = None,
         description: Optional[str] = None,
-        file_size: Optional[int] = None
+        file_size: Optional[int] = None,
+        sha256: Optional[str] = None
     ) -> VirtualFile:
-        """Upload a file already streamed to disk."""
+        """Upload a file already streamed to disk (sha256: digest computed while streaming, used for dedup)."""
         if folder_id:
             folder = await self.get_folder(folder_id)
             if not folder:
@@ -474,6 +553,9 @@ class FileManagerService:
         except Exception as e:
             raise ValueError(f"File save failed: {str(e)}")
 
+        if self.storage.dedup_enabled:
+            await asyncio.to_thread(self.storage.deduplicate, relative_path, sha256)
+
         file = VirtualFile(
             name=filename,
             folder_id=folder_id,
@@ -494,6 +576,59 @@ class FileManagerService:
         logger.info(f"User {self.user_id} uploaded file: {filename}")
         return file
 
+    async def upload_file_by_hash(
+        self,
+        filename: str,
+        sha256: str,
+        file_size: int,
+        mime_type: Optional[str] = None,
+        folder_id: Optional[int] = None,
+        description: Optional[str] = None
+    ) -> Optional[VirtualFile]:
+        """
+        秒传：内容已存在于 blob 存储时直接链接，无需上传文件数据
+        
+        Returns:
+            新建的文件记录；未启用去重或内容不存在时返回 None，客户端应走普通上传
+        """
+        if not self.storage.dedup_enabled or not self.storage.blobs.exists(sha256, file_size):
+            return None
+        
+        if folder_id:
+            folder = await self.get_folder(folder_id)
+            if not folder:
+                raise ValueError("文件夹不存在")
+        
+        self._validate_name(filename)
+        await self._check_storage_quota(file_size)
+        is_valid, error_msg = self.storage.validate_file(filename, file_size)
+        if not is_valid:
+            raise ValueError(error_msg)
+        
+        relative_path, _ = self.storage.generate_filename(filename, self.user_id)
+        if not await asyncio.to_thread(self.storage.link_blob, sha256, relative_path):
+            return None
+        
+        file = VirtualFile(
+            name=filename,
+            folder_id=folder_id,
+            user_id=self.user_id,
+            storage_path=relative_path,
+            file_size=file_size,
+            mime_type=mime_type or self._guess_mime(filename),
+            description=description
+        )
+        self.db.add(file)
+        try:
+            await self.db.commit()
+            await self.db.refresh(file)
+        except Exception:
+            self.storage.delete_file(relative_path)
+            raise
+        
+        logger.info(f"用户 {self.user_id} 秒传文件: {filename}")
+        return file
+
     async def update_file(self, file_id: int, data: FileUpdate) -> Optional[VirtualFile]:
         """更新文件信息"""
         file = await self.get_file(file_id)
@@ -606,7 +741,7 @@ class FileManagerService:
             if not current_folder:
                 raise ValueError("文件夹不存在")
         
-        breadcrumbs = await self._get_breadcrumbs(folder_id)
+        breadcrumbs = await self._get_breadcrumbs(current_folder)
         
         # 获取子文件夹
         folder_query = select(VirtualFolder).where(
@@ -697,43 +832,25 @@ class FileManagerService:
             total_files=len(file_infos)
         )
 
-    async def _get_breadcrumbs(self, folder_id: Optional[int]) -> List[BreadcrumbItem]:
-        """获取面包屑导航（优化：收集所有祖先 ID 后批量查询）"""
+    async def _get_breadcrumbs(self, folder: Optional[VirtualFolder]) -> List[BreadcrumbItem]:
+        """获取面包屑导航（由物化路径一次查出全部祖先）"""
         breadcrumbs = [BreadcrumbItem(id=None, name="根目录", path="/")]
-        if not folder_id:
-            return breadcrumbs
-        
-        # 先收集所有祖先 ID（逐级上溯，但只查 id 和 parent_id）
-        ancestor_ids = []
-        current_id = folder_id
-        # 最多 20 层防止无限循环
-        for _ in range(20):
-            if current_id is None:
-                break
-            ancestor_ids.append(current_id)
-            result = await self.db.execute(
-                select(VirtualFolder.parent_id).where(VirtualFolder.id == current_id)
-            )
-            row = result.scalar_one_or_none()
-            current_id = row if row else None
-        
-        if not ancestor_ids:
+        if not folder:
             return breadcrumbs
         
-        # 批量查询所有祖先文件夹
+        ancestor_ids = [int(part) for part in folder.id_path.strip('/').split('/') if part]
         result = await self.db.execute(
-            select(VirtualFolder).where(VirtualFolder.id.in_(ancestor_ids))
+            select(VirtualFolder).where(
+                VirtualFolder.id.in_(ancestor_ids),
+                VirtualFolder.user_id == self.user_id
+            )
         )
         folders_map = {f.id: f for f in result.scalars().all()}
         
-        # 按 ancestor_ids 倒序（从根到当前）构建面包屑
-        path_parts = []
-        for aid in reversed(ancestor_ids):
-            folder = folders_map.get(aid)
-            if folder:
-                path_parts.append(BreadcrumbItem(id=folder.id, name=folder.name, path=folder.path))
-        
-        breadcrumbs.extend(path_parts)
+        for aid in ancestor_ids:
+            ancestor = folders_map.get(aid)
+            if ancestor:
+                breadcrumbs.append(BreadcrumbItem(id=ancestor.id, name=ancestor.name, path=ancestor.path))
         return breadcrumbs
     
     async def _count_folder_files(self, folder_id: int) -> int:
@@ -112,6 +112,185 @@ class TestFilemanagerService:
 
         await svc.delete_file(uploaded.id)
 
+    @pytest.mark.asyncio
+    async def test_instant_upload_by_hash(self, db_session, tmp_workspace, tmp_path, monkeypatch):
+        import hashlib
+        import utils.storage
+        from core.config import get_settings
+        from modules.filemanager.filemanager_services import FileManagerService
+        from tests.test_conftest import create_test_user
+
+        monkeypatch.setattr(get_settings(), "storage_dedup_enabled", True)
+        utils.storage._storage_manager = None
+        user = await create_test_user(db_session, {
+            "username": "instantup",
+            "password": "Test@123456",
+            "phone": "13800138019",
+        })
+        svc = FileManagerService(db_session, user_id=user["id"])
+        payload = b"dedup me" * 100
+        digest = hashlib.sha256(payload).hexdigest()
+
+        # 内容不存在时返回 None，客户端走普通上传
+        assert await svc.upload_file_by_hash("a.txt", digest, len(payload)) is None
+
+        source = tmp_path / "a.txt"
+        source.write_bytes(payload)
+        first = await svc.upload_file_from_path(
+            filename="a.txt", source_path=source, mime_type="text/plain", sha256=digest
+        )
+        second = await svc.upload_file_by_hash("b.txt", digest, len(payload))
+
+        first_path = svc.storage.get_file_path(first.storage_path)
+        second_path = svc.storage.get_file_path(second.storage_path)
+        assert second.file_size == len(payload)
+        assert second_path.read_bytes() == payload
+        assert first_path.stat().st_ino == second_path.stat().st_ino
+        assert svc.storage.blobs.refcount(digest) == 2
+
+        await svc.delete_file(first.id)
+        assert second_path.read_bytes() == payload
+        assert svc.storage.blobs.refcount(digest) == 1
+        utils.storage._storage_manager = None
+
+
+class _QueryCounter:
+    """统计执行的 SQL 语句数"""
+
+    def __init__(self, session):
+        self.engine = session.bind.sync_engine
+        self.count = 0
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+class TestFolderHierarchy:
+    """物化路径：面包屑、子树移动/重命名/删除/统计"""
+
+    async def _build_tree(self, svc, db_session, width=3):
+        """根 A 下 width 个子目录，每个子目录再挂一层孙目录，每个目录放一个文件"""
+        root = await svc.create_folder(FolderCreate(name="A"))
+        folders = [root]
+        for i in range(width):
+            child = await svc.create_folder(FolderCreate(name=f"B{i}", parent_id=root.id))
+            grandchild = await svc.create_folder(FolderCreate(name="C", parent_id=child.id))
+            folders.extend([child, grandchild])
+        for folder in folders:
+            db_session.add(VirtualFile(
+                name=f"f{folder.id}.txt", folder_id=folder.id, user_id=1,
+                storage_path=f"missing/{folder.id}.txt", file_size=10
+            ))
+        await db_session.commit()
+        return root, folders
+
+    @pytest.mark.asyncio
+    async def test_id_path_assigned(self, db_session):
+        from modules.filemanager.filemanager_services import FileManagerService
+        svc = FileManagerService(db_session, user_id=1)
+        parent = await svc.create_folder(FolderCreate(name="P"))
+        child = await svc.create_folder(FolderCreate(name="Q", parent_id=parent.id))
+        assert parent.id_path == f"/{parent.id}/"
+        assert child.id_path == f"/{parent.id}/{child.id}/"
+
+    @pytest.mark.asyncio
+    async def test_breadcrumbs_single_query(self, db_session):
+        from modules.filemanager.filemanager_services import FileManagerService
+        svc = FileManagerService(db_session, user_id=1)
+        folder = None
+        for name in ["L1", "L2", "L3", "L4", "L5"]:
+            folder = await svc.create_folder(FolderCreate(name=name, parent_id=folder.id if folder else None))
+
+        with _QueryCounter(db_session) as counter:
+            crumbs = await svc._get_breadcrumbs(folder)
+        assert counter.count == 1
+        assert [c.name for c in crumbs] == ["根目录", "L1", "L2", "L3", "L4", "L5"]
+        assert crumbs[-1].path == "/L1/L2/L3/L4/L5"
+
+    @pytest.mark.asyncio
+    async def test_move_subtree(self, db_session):
+        from modules.filemanager.filemanager_services import FileManagerService
+        svc = FileManagerService(db_session, user_id=1)
+        root, folders = await self._build_tree(svc, db_session)
+        target = await svc.create_folder(FolderCreate(name="T"))
+        child, grandchild = folders[1], folders[2]
+
+        with pytest.raises(ValueError):
+            await svc.move_folder(root.id, grandchild.id)
+
+        with _QueryCounter(db_session) as counter:
+            moved = await svc.move_folder(child.id, target.id)
+        assert moved.parent_id == target.id
+        assert moved.path == "/T/B0"
+        await db_session.refresh(grandchild)
+        assert grandchild.path == "/T/B0/C"
+        assert grandchild.id_path == f"/{target.id}/{child.id}/{grandchild.id}/"
+        # 语句数与子树大小无关
+        assert counter.count <= 8
+
+    @pytest.mark.asyncio
+    async def test_rename_rewrites_descendant_paths(self, db_session):
+        from modules.filemanager.filemanager_services import FileManagerService
+        from modules.filemanager.filemanager_schemas import FolderUpdate
+        svc = FileManagerService(db_session, user_id=1)
+        root, folders = await self._build_tree(svc, db_session)
+        renamed = await svc.update_folder(root.id, FolderUpdate(name="Z"))
+        assert renamed.path == "/Z"
+        await db_session.refresh(folders[-1])
+        assert folders[-1].path == "/Z/B2/C"
+
+    @pytest.mark.asyncio
+    async def test_subtree_stats_and_listing(self, db_session):
+        from modules.filemanager.filemanager_services import FileManagerService
+        svc = FileManagerService(db_session, user_id=1)
+        root, folders = await self._build_tree(svc, db_session)
+        assert await svc.get_subtree_stats(root) == (7, 70)
+        assert await svc.get_subtree_stats(folders[1]) == (2, 20)
+        listing = [path for path, _ in await svc.list_subtree_files(folders[1])]
+        assert listing == [f"f{folders[1].id}.txt", f"C/f{folders[2].id}.txt"]
+
+    @pytest.mark.asyncio
+    async def test_delete_subtree_constant_queries(self, db_session):
+        from sqlalchemy import select, func
+        from modules.filemanager.filemanager_services import FileManagerService
+        svc = FileManagerService(db_session, user_id=1)
+        root, folders = await self._build_tree(svc, db_session, width=6)
+        keep = await svc.create_folder(FolderCreate(name="keep"))
+
+        with _QueryCounter(db_session) as counter:
+            assert await svc.delete_folder(root.id) is True
+        assert counter.count <= 8
+
+        remaining = (await db_session.execute(
+            select(func.count(VirtualFolder.id)).where(VirtualFolder.user_id == 1)
+        )).scalar()
+        assert remaining == 1
+        files = (await db_session.execute(
+            select(func.count(VirtualFile.id)).where(VirtualFile.user_id == 1)
+        )).scalar()
+        assert files == 0
+        assert await svc.get_folder(keep.id) is not None
+
+    @pytest.mark.asyncio
+    async def test_delete_refuses_protected_descendant(self, db_session):
+        from modules.filemanager.filemanager_services import FileManagerService
+        svc = FileManagerService(db_session, user_id=1)
+        parent = await svc.create_folder(FolderCreate(name="含系统目录"))
+        child = await svc.create_folder(FolderCreate(name="系统", parent_id=parent.id))
+        child.is_system = True
+        await db_session.commit()
+        with pytest.raises(ValueError):
+            await svc.delete_folder(parent.id)
+
 
 @pytest.mark.asyncio
 class TestFilemanagerAPI:
@@ -148,6 +327,24 @@ class TestFilemanagerAPI:
         resp = await admin_client.get("/api/v1/filemanager/starred")
         assert resp.status_code == 200
 
+    async def test_download_folder_zip(self, admin_client: AsyncClient):
+        import io
+        import zipfile
+        cr = await admin_client.post("/api/v1/filemanager/folders", json={"name": "打包"})
+        fid = cr.json()["data"]["id"]
+        up = await admin_client.post(
+            "/api/v1/filemanager/upload",
+            files=[("files", ("a.txt", b"zip me" * 100, "text/plain"))],
+            data={"folder_id": str(fid)}
+        )
+        assert up.json()["data"]["summary"]["success"] == 1
+
+        resp = await admin_client.get(f"/api/v1/filemanager/folders/{fid}/download")
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/zip"
+        with zipfile.ZipFile(io.BytesIO(resp.content)) as zf:
+            assert zf.read("打包/a.txt") == b"zip me" * 100
+
 
 class TestFilemanagerManifest:
     def test_manifest(self):
@@ -0,0 +1,31 @@
+"""
+即时通讯模块事件处理器
+处理会话成员变更后的缓存失效（多 worker 部署时经事件总线广播）
+"""
+
+import logging
+from core.events import event_bus, Event
+from .im_services import member_cache, MEMBERS_CHANGED_EVENT
+
+logger = logging.getLogger(__name__)
+
+
+async def handle_members_changed(event: Event):
+    """会话成员变更，失效成员缓存"""
+    conversation_id = event.data.get("conversation_id")
+    if conversation_id is not None:
+        member_cache.invalidate(conversation_id)
+
+
+def register_im_events():
+    """注册即时通讯相关的事件监听"""
+    if handle_members_changed not in event_bus._handlers.get(MEMBERS_CHANGED_EVENT, []):
+        event_bus.subscribe(MEMBERS_CHANGED_EVENT, handle_members_changed)
+        logger.debug("已注册即时通讯事件监听器")
+
+
+def unregister_im_events():
+    """取消即时通讯相关的事件监听"""
+    if handle_members_changed in event_bus._handlers.get(MEMBERS_CHANGED_EVENT, []):
+        event_bus.unsubscribe(MEMBERS_CHANGED_EVENT, handle_members_changed)
+    member_cache.clear()
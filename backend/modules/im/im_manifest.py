@@ -22,6 +22,8 @@ async def on_enable():
     模块启用时执行
     每次系统启动且模块被加载时都会调用
     """
+    from .im_events import register_im_events
+    register_im_events()
     logger.debug("即时通讯模块已启用")
 
 
@@ -29,6 +31,8 @@ async def on_disable():
     """
     模块禁用时执行
     """
+    from .im_events import unregister_im_events
+    unregister_im_events()
     logger.debug("即时通讯模块已禁用")
 
 
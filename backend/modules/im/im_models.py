@@ -27,6 +27,9 @@ class IMConversation(Base):
     owner_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey(User.id), nullable=True, comment="群主ID")
     last_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, comment="最后消息ID")
     last_message_time: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True, comment="最后消息时间")
+    last_message_sender_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, comment="最后消息发送者ID")
+    last_message_type: Mapped[Optional[str]] = mapped_column(String(20), nullable=True, comment="最后消息类型（撤回后为 recalled）")
+    last_message_content: Mapped[Optional[str]] = mapped_column(Text, nullable=True, comment="最后消息内容（加密存储）")
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=get_beijing_time, comment="创建时间")
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=get_beijing_time, onupdate=get_beijing_time, comment="更新时间")
 
@@ -45,7 +48,7 @@ class IMConversationMember(Base):
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey(User.id), index=True, comment="用户ID")
     role: Mapped[str] = mapped_column(String(20), default="member", comment="角色")
     unread_count: Mapped[int] = mapped_column(Integer, default=0, comment="未读数")
-    last_read_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, comment="最后已读消息ID")
+    last_read_message_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True, comment="已读水位（该ID及之前的消息均已读）")
     is_pinned: Mapped[bool] = mapped_column(Boolean, default=False, comment="是否置顶")
     is_muted: Mapped[bool] = mapped_column(Boolean, default=False, comment="是否免打扰")
     joined_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=get_beijing_time, comment="加入时间")
@@ -77,20 +80,18 @@ class IMMessage(Base):
     reply_to_message: Mapped[Optional["IMMessage"]] = relationship("IMMessage", remote_side=[id])
 
 
-class IMMessageRead(Base):
-    """消息已读记录表"""
-    __tablename__ = "im_message_reads"
+class IMMessageToken(Base):
+    """消息搜索盲索引表（仅存储 n-gram 的 HMAC 令牌，不含明文）"""
+    __tablename__ = "im_message_tokens"
     __table_args__ = (
-        Index("idx_im_read_msg_user", "message_id", "user_id"),
-        Index("idx_im_read_user_conv", "user_id", "conversation_id"),
-        {"extend_existing": True, "comment": "即时通讯消息已读记录表"}
+        Index("idx_im_token_conv_token", "conversation_id", "token"),
+        {"extend_existing": True, "comment": "即时通讯消息搜索盲索引表"}
     )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True, comment="主键ID")
+    conversation_id: Mapped[int] = mapped_column(Integer, ForeignKey("im_conversations.id", ondelete="CASCADE"), comment="会话ID")
     message_id: Mapped[int] = mapped_column(Integer, ForeignKey("im_messages.id", ondelete="CASCADE"), index=True, comment="消息ID")
-    user_id: Mapped[int] = mapped_column(Integer, ForeignKey(User.id), index=True, comment="用户ID")
-    conversation_id: Mapped[int] = mapped_column(Integer, ForeignKey("im_conversations.id", ondelete="CASCADE"), index=True, comment="会话ID")
-    read_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=get_beijing_time, comment="阅读时间")
+    token: Mapped[str] = mapped_column(String(32), comment="HMAC令牌")
 
 
 class IMContact(Base):
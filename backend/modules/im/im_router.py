@@ -2,6 +2,7 @@
 即时通讯模块API路由
 """
 
+import asyncio
 import logging
 from typing import Optional, List
 import aiofiles
@@ -10,7 +11,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, and_
 
 from core.database import get_db
-from core.security import get_current_user, require_permission, TokenData
+from core.security import get_current_user, require_permission, require_admin, TokenData
 from core.errors import NotFoundException, BusinessException, success_response, ErrorCode
 from core.pagination import create_page_response
 from utils.storage import get_storage_manager
@@ -21,7 +22,7 @@ from .im_schemas import (
     ContactCreate, ContactUpdate, ContactResponse,
     ConversationAddMember, MarkReadRequest, UserStatusResponse
 )
-from .im_services import IMService
+from .im_services import IMService, notify_members_changed
 from .im_models import IMMessage, IMConversation
 from .im_websocket import notify_new_message, notify_message_recalled, notify_message_read
 from models import User
@@ -66,14 +67,11 @@ async def get_conversation_list(
 ):
     """获取会话列表"""
     service = get_service(db)
+    # 列表查询已包含成员设置、对方及群主信息，无需逐个会话加载
     conversations, total = await service.get_conversation_list(
         user.user_id, page, page_size
     )
     
-    # 加载用户信息
-    for conv in conversations:
-        await _load_conversation_user_info(db, conv, user.user_id)
-    
     return create_page_response(
         items=[ConversationListItem.model_validate(conv) for conv in conversations],
         total=total,
@@ -152,6 +150,7 @@ async def delete_conversation(
         stmt = delete(IMConversation).where(IMConversation.id == conversation_id)
         await db.execute(stmt)
         await db.commit()
+        notify_members_changed(conversation_id)
         return success_response(message="会话已删除")
     else:
         # 退出会话
@@ -163,6 +162,7 @@ async def delete_conversation(
         )
         await db.execute(stmt)
         await db.commit()
+        notify_members_changed(conversation_id)
         return success_response(message="已退出会话")
 
 
@@ -304,6 +304,9 @@ async def upload_message_file(
     except Exception as e:
         raise BusinessException(ErrorCode.INTERNAL_ERROR, f"保存文件失败: {str(e)}")
     
+    if storage.dedup_enabled:
+        await asyncio.to_thread(storage.deduplicate, rel_path)
+    
     # 获取文件MIME类型
     file_mime = None
     try:
@@ -368,10 +371,12 @@ async def get_messages(
         conversation_id, user.user_id, page, page_size, before_message_id, keyword
     )
     
-    # 加载用户信息和已读状态
+    # 加载用户信息
     for msg in messages:
         await _load_message_user_info(db, msg)
-        await _load_message_read_status(db, msg, user.user_id)
+    
+    # 已读状态由成员已读水位比较得出（一次查询）
+    await service.apply_read_status(conversation_id, user.user_id, messages)
     
     # 检查是否有更多消息
     has_more = (page * page_size) < total
@@ -396,18 +401,35 @@ async def mark_messages_read(
 ):
     """标记消息已读"""
     service = get_service(db)
-    success = await service.mark_messages_read(
+    watermark = await service.mark_messages_read(
         data.conversation_id,
         user.user_id,
         data.message_ids,
         data.last_message_id
     )
     
-    if success:
+    if watermark is not None:
         # 发送 WebSocket 广播通知
-        await notify_message_read(db, data.conversation_id, user.user_id, data.last_message_id)
+        await notify_message_read(db, data.conversation_id, user.user_id, watermark)
     
-    return success_response(message="已标记为已读")
+    return success_response(
+        data={"last_read_message_id": watermark},
+        message="已标记为已读"
+    )
+
+
+@router.get("/messages/{message_id}/reads", response_model=dict, summary="获取消息已读明细")
+async def get_message_readers(
+    message_id: int,
+    db: AsyncSession = Depends(get_db),
+    user: TokenData = Depends(get_current_user)
+):
+    """获取消息已读/未读成员（小群返回逐人明细，大群仅返回计数）"""
+    service = get_service(db)
+    detail = await service.get_message_readers(message_id, user.user_id)
+    if detail is None:
+        raise NotFoundException("消息", message_id)
+    return success_response(data=detail, message="获取成功")
 
 
 @router.post("/messages/{message_id}/recall", response_model=dict, summary="撤回消息")
@@ -434,6 +456,20 @@ async def recall_message(
     return success_response(message="消息已撤回")
 
 
+@router.post("/search-index/rebuild", response_model=dict, summary="补建消息搜索索引")
+async def rebuild_search_index(
+    db: AsyncSession = Depends(get_db),
+    user: TokenData = Depends(require_admin())
+):
+    """为历史文本消息补建搜索盲索引（需启用 IM_SEARCH_INDEX_ENABLED）"""
+    from .im_services import search_index_enabled
+    if not search_index_enabled():
+        raise BusinessException(ErrorCode.VALIDATION_ERROR, "消息搜索索引未启用")
+    service = get_service(db)
+    count = await service.rebuild_search_index()
+    return success_response(data={"indexed": count}, message="索引补建完成")
+
+
 # ==================== 联系人管理 ====================
 
 @router.post("/contacts", response_model=dict, summary="添加联系人")
@@ -579,21 +615,6 @@ async def _load_message_user_info(db: AsyncSession, message):
     await service.load_message_details(message)
 
 
-async def _load_message_read_status(db: AsyncSession, message, user_id: int):
-    """加载消息的已读状态"""
-    from .im_models import IMMessageRead
-    
-    stmt = select(IMMessageRead).where(
-        and_(
-            IMMessageRead.message_id == message.id,
-            IMMessageRead.user_id == user_id
-        )
-    )
-    result = await db.execute(stmt)
-    read_record = result.scalar_one_or_none()
-    message.is_read = read_record is not None
-
-
 async def _load_contact_user_info(db: AsyncSession, contact):
     """加载联系人的用户信息"""
     stmt = select(User).where(User.id == contact.contact_id)
@@ -65,6 +65,9 @@ class ConversationListItem(BaseModel):
     avatar: Optional[str]
     last_message_id: Optional[int]
     last_message_time: Optional[datetime]
+    last_message: Optional[str] = Field(None, description="最后消息预览")
+    last_message_type: Optional[str] = None
+    last_message_sender_id: Optional[int] = None
     unread_count: int = 0
     is_pinned: bool = False
     is_muted: bool = False
@@ -110,6 +113,7 @@ class MessageResponse(BaseModel):
     reply_to_message: Optional["MessageResponse"] = None
     is_recalled: bool
     is_read: bool = False  # 当前用户是否已读
+    read_count: Optional[int] = None  # 自己发送的消息：已读的其他成员数
     created_at: datetime
     
     model_config = ConfigDict(from_attributes=True)
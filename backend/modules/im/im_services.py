@@ -3,13 +3,20 @@
 包含消息加密/解密功能
 """
 
+import bisect
+import hashlib
+import hmac
 import json
 import logging
+import re
+import time
+import unicodedata
+from collections import OrderedDict
 from typing import List, Optional, Tuple
 from datetime import timedelta
 from utils.timezone import get_beijing_time, BEIJING_TZ
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, desc, and_, or_, update
+from sqlalchemy import select, func, desc, and_, or_, update, delete
 from sqlalchemy.orm import selectinload
 from sqlalchemy.exc import InvalidRequestError
 from cryptography.fernet import Fernet
@@ -20,7 +27,7 @@ import base64
 import os
 
 from .im_models import (
-    IMConversation, IMConversationMember, IMMessage, IMMessageRead, IMContact
+    IMConversation, IMConversationMember, IMMessage, IMMessageToken, IMContact
 )
 from .im_schemas import (
     ConversationCreate, ConversationUpdate, MessageCreate,
@@ -31,6 +38,15 @@ from utils.storage import get_storage_manager
 
 logger = logging.getLogger(__name__)
 
+# 会话列表最后消息预览长度
+PREVIEW_LENGTH = 50
+
+# 返回逐人已读明细的最大成员数（更大的群只返回计数）
+READ_DETAIL_MAX_MEMBERS = 100
+
+# 会话成员变更事件
+MEMBERS_CHANGED_EVENT = "im.members_changed"
+
 
 class MessageEncryption:
     """消息加密工具类"""
@@ -68,6 +84,9 @@ class MessageEncryption:
                 )
                 key = base64.urlsafe_b64encode(kdf.derive(key))
             self.cipher = Fernet(key)
+        
+        # 搜索盲索引使用独立派生的密钥，与加密密钥互不可推
+        self.index_key = hmac.new(key, b"im-blind-index", hashlib.sha256).digest()
     
     def encrypt(self, plaintext: str) -> str:
         """加密消息"""
@@ -100,6 +119,65 @@ class MessageEncryption:
                 return "[加密消息]"
 
 
+class BlindIndex:
+    """
+    消息搜索盲索引
+    
+    对归一化后的单字和相邻双字计算带会话ID的 HMAC 令牌，索引表只保存令牌，
+    不可逆推出明文；查询时对关键词做同样处理，按令牌命中后再解密核对当页结果。
+    """
+    
+    MAX_TOKENS = 512
+    _SPLIT = re.compile(r"[\W_]+", re.UNICODE)
+    
+    def __init__(self, key: bytes):
+        self.key = key
+    
+    @classmethod
+    def normalize(cls, text: str) -> List[str]:
+        """NFKC 归一化、转小写并按空白/标点切分"""
+        text = unicodedata.normalize("NFKC", text or "").lower()
+        return [seg for seg in cls._SPLIT.split(text) if seg]
+    
+    @classmethod
+    def grams(cls, text: str) -> List[str]:
+        """消息内容的索引 n-gram（单字 + 双字）"""
+        grams = {}
+        for seg in cls.normalize(text):
+            for i, ch in enumerate(seg):
+                grams.setdefault(ch, None)
+                if i + 1 < len(seg):
+                    grams.setdefault(seg[i:i + 2], None)
+        return list(grams)[:cls.MAX_TOKENS]
+    
+    @classmethod
+    def query_grams(cls, keyword: str) -> List[str]:
+        """关键词的查询 n-gram（单字关键词用单字，否则用双字）"""
+        grams = {}
+        for seg in cls.normalize(keyword):
+            if len(seg) == 1:
+                grams.setdefault(seg, None)
+            for i in range(len(seg) - 1):
+                grams.setdefault(seg[i:i + 2], None)
+        return list(grams)
+    
+    def token(self, conversation_id: int, gram: str) -> str:
+        digest = hmac.new(self.key, f"{conversation_id}:{gram}".encode("utf-8"), hashlib.sha256)
+        return digest.hexdigest()[:32]
+    
+    def tokens(self, conversation_id: int, text: str) -> List[str]:
+        return [self.token(conversation_id, g) for g in self.grams(text)]
+    
+    def query_tokens(self, conversation_id: int, keyword: str) -> List[str]:
+        return [self.token(conversation_id, g) for g in self.query_grams(keyword)]
+    
+    @classmethod
+    def matches(cls, text: str, keyword: str) -> bool:
+        """解密后核对关键词（与索引使用相同的归一化）"""
+        haystack = " ".join(cls.normalize(text))
+        return all(seg in haystack for seg in cls.normalize(keyword))
+
+
 # 全局加密实例
 _encryption = None
 
@@ -111,12 +189,65 @@ def get_encryption() -> MessageEncryption:
     return _encryption
 
 
+def search_index_enabled() -> bool:
+    """是否启用消息搜索盲索引"""
+    from core.config import get_settings
+    return bool(get_settings().im_search_index_enabled)
+
+
+class ConversationMemberCache:
+    """
+    会话成员ID缓存（进程内）
+    推送消息时免去每次查询成员表；成员变更时主动失效，TTL 兜底
+    """
+    
+    def __init__(self, ttl: float = 60.0, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items: "OrderedDict[int, Tuple[float, Tuple[int, ...]]]" = OrderedDict()
+    
+    def get(self, conversation_id: int) -> Optional[Tuple[int, ...]]:
+        item = self._items.get(conversation_id)
+        if item is None:
+            return None
+        expires_at, member_ids = item
+        if expires_at < time.monotonic():
+            self._items.pop(conversation_id, None)
+            return None
+        self._items.move_to_end(conversation_id)
+        return member_ids
+    
+    def set(self, conversation_id: int, member_ids: List[int]):
+        self._items[conversation_id] = (time.monotonic() + self.ttl, tuple(member_ids))
+        self._items.move_to_end(conversation_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+    
+    def invalidate(self, conversation_id: int):
+        self._items.pop(conversation_id, None)
+    
+    def clear(self):
+        self._items.clear()
+
+
+# 全局成员缓存
+member_cache = ConversationMemberCache()
+
+
+def notify_members_changed(conversation_id: int):
+    """成员变更：失效本进程缓存，并通过事件总线通知其他 worker"""
+    from core.events import event_bus
+    member_cache.invalidate(conversation_id)
+    event_bus.emit(MEMBERS_CHANGED_EVENT, "im", {"conversation_id": conversation_id})
+
+
 class IMService:
     """即时通讯服务"""
     
     def __init__(self, db: AsyncSession):
         self.db = db
         self.encryption = get_encryption()
+        self.blind_index = BlindIndex(self.encryption.index_key)
         self.storage = get_storage_manager()
     
     # ==================== 会话管理 ====================
@@ -252,76 +383,116 @@ class IMService:
         result = await self.db.execute(stmt)
         return result.scalar_one_or_none()
     
+    async def get_member_ids(self, conversation_id: int) -> List[int]:
+        """获取会话成员ID（带缓存）"""
+        cached = member_cache.get(conversation_id)
+        if cached is not None:
+            return list(cached)
+        stmt = select(IMConversationMember.user_id).where(
+            IMConversationMember.conversation_id == conversation_id
+        )
+        member_ids = list((await self.db.execute(stmt)).scalars().all())
+        member_cache.set(conversation_id, member_ids)
+        return member_ids
+    
     async def get_conversation_list(
         self,
         user_id: int,
         page: int = 1,
         page_size: int = 20
     ) -> Tuple[List[IMConversation], int]:
-        """获取会话列表"""
-        # 查询用户参与的所有会话
-        stmt = select(IMConversation).join(IMConversationMember).where(
-            IMConversationMember.user_id == user_id
-        ).order_by(desc(IMConversation.updated_at))
+        """
+        获取会话列表
+        未读数、最后消息均为冗余字段，连同成员设置、私聊对方、群主信息一次查询取出，
+        查询次数与会话数量无关
+        """
+        from sqlalchemy.orm import aliased
         
-        # 总数
-        count_stmt = select(func.count()).select_from(IMConversation).join(IMConversationMember).where(
-            IMConversationMember.user_id == user_id
-        )
-        total_result = await self.db.execute(count_stmt)
-        total = total_result.scalar() or 0
+        me = aliased(IMConversationMember)
+        peer = aliased(IMConversationMember)
+        peer_user = aliased(User)
+        owner = aliased(User)
+        
+        stmt = select(
+            IMConversation, me, peer_user, owner,
+            func.count().over().label("total")
+        ).join(
+            me, and_(me.conversation_id == IMConversation.id, me.user_id == user_id)
+        ).outerjoin(
+            peer, and_(
+                IMConversation.type == "private",
+                peer.conversation_id == IMConversation.id,
+                peer.user_id != user_id
+            )
+        ).outerjoin(
+            peer_user, peer_user.id == peer.user_id
+        ).outerjoin(
+            owner, owner.id == IMConversation.owner_id
+        ).order_by(
+            desc(IMConversation.updated_at), desc(IMConversation.id)
+        ).offset((page - 1) * page_size).limit(page_size)
         
-        # 分页
-        stmt = stmt.offset((page - 1) * page_size).limit(page_size)
         result = await self.db.execute(stmt)
-        conversations = result.scalars().all()
+        rows = result.all()
         
-        # 为每个会话加载成员信息和未读数
-        for conv in conversations:
-            await self._load_conversation_extra(conv, user_id)
+        if rows:
+            total = rows[0].total
+        else:
+            # 页码超出范围时窗口函数无结果，单独计数
+            count_stmt = select(func.count()).select_from(IMConversationMember).where(
+                IMConversationMember.user_id == user_id
+            )
+            total = (await self.db.execute(count_stmt)).scalar() or 0
         
-        return list(conversations), total
+        conversations = []
+        for conv, member, other_user, owner_user, _ in rows:
+            self._apply_member_view(conv, member, other_user, owner_user)
+            conversations.append(conv)
+        return conversations, total
     
-    async def _load_conversation_extra(
+    def _apply_member_view(
         self,
         conversation: IMConversation,
-        user_id: int
+        member: IMConversationMember,
+        other_user: Optional[User],
+        owner_user: Optional[User]
     ):
-        """加载会话的额外信息（未读数、对方信息等）"""
-        # 1. 加载当前用户的成员设置
-        stmt = select(IMConversationMember).where(
-            and_(
-                IMConversationMember.conversation_id == conversation.id,
-                IMConversationMember.user_id == user_id
-            )
-        )
-        result = await self.db.execute(stmt)
-        member = result.scalar_one_or_none()
-        if member:
-            conversation.unread_count = member.unread_count
-            conversation.is_pinned = member.is_pinned
-            conversation.is_muted = member.is_muted
-            conversation.last_read_message_id = member.last_read_message_id
-
-        # 2. 如果是私聊且没有名称，则显示对方的昵称
+        """填充当前用户视角的会话信息（未读数、对方信息、最后消息预览等）"""
+        conversation.unread_count = member.unread_count or 0
+        conversation.is_pinned = member.is_pinned
+        conversation.is_muted = member.is_muted
+        conversation.last_read_message_id = member.last_read_message_id
+        
+        if owner_user:
+            conversation.owner_username = owner_user.username
+            conversation.owner_nickname = owner_user.nickname
+            conversation.owner_avatar = owner_user.avatar
+        
+        # 私聊显示对方的昵称和头像
         if conversation.type == "private":
-            # 查找对方成员信息
-            # 从User模型获取用户信息
-            stmt = select(User).join(
-                IMConversationMember, IMConversationMember.user_id == User.id
-            ).where(
-                and_(
-                    IMConversationMember.conversation_id == conversation.id,
-                    IMConversationMember.user_id != user_id
-                )
-            )
-            result = await self.db.execute(stmt)
-            other_user = result.scalar_one_or_none()
             if other_user:
+                conversation.target_user_id = other_user.id
                 conversation.name = other_user.nickname or other_user.username
                 conversation.avatar = other_user.avatar
             else:
                 conversation.name = "已销号用户"
+        
+        conversation.last_message = self._message_preview(
+            conversation.last_message_type, conversation.last_message_content
+        )
+    
+    def _message_preview(self, msg_type: Optional[str], content: Optional[str]) -> Optional[str]:
+        """生成最后消息预览文本"""
+        if not msg_type:
+            return None
+        if msg_type == "recalled":
+            return "[消息已撤回]"
+        if msg_type == "image":
+            return "[图片]"
+        if msg_type in ("file", "video", "audio"):
+            return "[文件]"
+        text = self.encryption.decrypt(content or "")
+        return text[:PREVIEW_LENGTH]
     
     async def update_conversation(
         self,
@@ -401,6 +572,7 @@ class IMService:
         if new_members:
             self.db.add_all(new_members)
             await self.db.commit()
+            notify_members_changed(conversation_id)
         
         return True
     
@@ -444,6 +616,7 @@ class IMService:
             await self.db.delete(target_member)
             await self.db.flush()
             await self.db.commit()
+            notify_members_changed(conversation_id)
             return True
         
         return False
@@ -475,9 +648,12 @@ class IMService:
         self.db.add(message)
         await self.db.flush()
         
-        # 更新会话最后消息
+        # 更新会话最后消息（冗余存储，会话列表无需再查消息表）
         conversation.last_message_id = message.id
         conversation.last_message_time = get_beijing_time()
+        conversation.last_message_sender_id = user_id
+        conversation.last_message_type = data.type
+        conversation.last_message_content = encrypted_content
         
         # 更新所有成员的未读数（除了发送者）
         stmt = update(IMConversationMember).where(
@@ -488,6 +664,19 @@ class IMService:
         ).values(unread_count=IMConversationMember.unread_count + 1)
         await self.db.execute(stmt)
         
+        # 写入搜索盲索引
+        if data.type == "text" and search_index_enabled():
+            self._add_search_tokens(message.conversation_id, message.id, data.content)
+        
+        # 发送者的已读水位推进到自己的消息
+        stmt = update(IMConversationMember).where(
+            and_(
+                IMConversationMember.conversation_id == data.conversation_id,
+                IMConversationMember.user_id == user_id
+            )
+        ).values(unread_count=0, last_read_message_id=message.id)
+        await self.db.execute(stmt)
+        
         await self.db.commit()
         await self.db.refresh(message)
         
@@ -522,9 +711,11 @@ class IMService:
         if before_message_id:
             stmt = stmt.where(IMMessage.id < before_message_id)
         
-        # 关键词搜索（由于消息加密存储，仅支持文件名搜索）
+        # 关键词搜索：文件名直接匹配，文本内容通过盲索引匹配
+        keyword_filter = None
         if keyword:
-            stmt = stmt.where(IMMessage.file_name.ilike(f"%{keyword}%"))
+            keyword_filter = self._keyword_filter(conversation_id, keyword)
+            stmt = stmt.where(keyword_filter)
             
         # 总数
         count_stmt = select(func.count()).where(
@@ -532,8 +723,8 @@ class IMService:
         )
         if before_message_id:
             count_stmt = count_stmt.where(IMMessage.id < before_message_id)
-        if keyword:
-            count_stmt = count_stmt.where(IMMessage.file_name.ilike(f"%{keyword}%"))
+        if keyword_filter is not None:
+            count_stmt = count_stmt.where(keyword_filter)
         total_result = await self.db.execute(count_stmt)
         total = total_result.scalar() or 0
         
@@ -547,85 +738,199 @@ class IMService:
         result = await self.db.execute(stmt)
         messages = result.scalars().all()
         
+        if keyword:
+            # 盲索引按 n-gram 命中，只解密当页结果核对关键词，排除误命中
+            messages = [
+                m for m in messages
+                if (m.file_name and keyword.lower() in m.file_name.lower())
+                or (m.type == "text" and not m.is_recalled
+                    and BlindIndex.matches(self.encryption.decrypt(m.content), keyword))
+            ]
+        
         # 解密消息内容（在Service层不直接修改，由Router层处理）
         return list(reversed(messages)), total  # 反转列表，使最旧的在前面
     
+    def _add_search_tokens(self, conversation_id: int, message_id: int, text: str):
+        """为一条文本消息写入盲索引令牌（随当前事务提交）"""
+        self.db.add_all([
+            IMMessageToken(conversation_id=conversation_id, message_id=message_id, token=token)
+            for token in self.blind_index.tokens(conversation_id, text)
+        ])
+    
+    def _keyword_filter(self, conversation_id: int, keyword: str):
+        """构造关键词过滤条件"""
+        condition = IMMessage.file_name.ilike(f"%{keyword}%")
+        if not search_index_enabled():
+            return condition
+        tokens = self.blind_index.query_tokens(conversation_id, keyword)
+        if tokens:
+            # 同时命中全部查询令牌的消息
+            matched = select(IMMessageToken.message_id).where(
+                and_(
+                    IMMessageToken.conversation_id == conversation_id,
+                    IMMessageToken.token.in_(tokens)
+                )
+            ).group_by(IMMessageToken.message_id).having(
+                func.count(func.distinct(IMMessageToken.token)) == len(tokens)
+            )
+            condition = or_(condition, IMMessage.id.in_(matched))
+        return condition
+    
+    async def rebuild_search_index(self, batch_size: int = 500) -> int:
+        """
+        为尚未建立索引的历史文本消息补建盲索引
+        按消息ID分批处理，返回本次处理的消息数
+        """
+        indexed = select(IMMessageToken.message_id).where(
+            IMMessageToken.message_id == IMMessage.id
+        ).exists()
+        processed = 0
+        last_id = 0
+        while True:
+            stmt = select(IMMessage.id, IMMessage.conversation_id, IMMessage.content).where(
+                and_(
+                    IMMessage.id > last_id,
+                    IMMessage.type == "text",
+                    IMMessage.is_recalled == False,  # noqa: E712
+                    ~indexed
+                )
+            ).order_by(IMMessage.id).limit(batch_size)
+            rows = (await self.db.execute(stmt)).all()
+            if not rows:
+                break
+            for message_id, conversation_id, content in rows:
+                self._add_search_tokens(conversation_id, message_id, self.encryption.decrypt(content))
+            await self.db.commit()
+            processed += len(rows)
+            last_id = rows[-1][0]
+        return processed
+    
     async def mark_messages_read(
         self,
         conversation_id: int,
         user_id: int,
         message_ids: Optional[List[int]] = None,
         last_message_id: Optional[int] = None
-    ) -> bool:
+    ) -> Optional[int]:
         """
         标记消息已读
-        使用批量查询和批量插入，避免N+1查询问题
+        只推进成员的已读水位（last_read_message_id），不再逐条写入已读记录，
+        写入量与消息数量无关。返回标记后的水位，无权限时返回 None
         """
-        # 检查会话权限
         conversation = await self.get_conversation(conversation_id, user_id)
         if not conversation:
-            return False
+            return None
         
-        # 确定需要标记的消息ID列表
-        if message_ids:
-            # 标记指定消息已读
-            ids_to_mark = message_ids
-        elif last_message_id:
-            # 标记该消息及之前的所有消息已读
-            stmt = select(IMMessage.id).where(
-                and_(
-                    IMMessage.conversation_id == conversation_id,
-                    IMMessage.id <= last_message_id
-                )
-            )
-            result = await self.db.execute(stmt)
-            ids_to_mark = [row[0] for row in result.all()]
+        latest = conversation.last_message_id or 0
+        if last_message_id:
+            target = last_message_id
+        elif message_ids:
+            target = max(message_ids)
         else:
-            # 标记会话所有消息已读
-            stmt = select(IMMessage.id).where(
-                IMMessage.conversation_id == conversation_id
-            )
-            result = await self.db.execute(stmt)
-            ids_to_mark = [row[0] for row in result.all()]
+            target = latest
+        target = min(target, latest)
         
-        if ids_to_mark:
-            # 批量查询已存在的已读记录
-            existing_stmt = select(IMMessageRead.message_id).where(
-                and_(
-                    IMMessageRead.message_id.in_(ids_to_mark),
-                    IMMessageRead.user_id == user_id
-                )
-            )
-            existing_result = await self.db.execute(existing_stmt)
-            existing_ids = set(row[0] for row in existing_result.all())
-            
-            # 批量插入不存在的已读记录
-            new_ids = [msg_id for msg_id in ids_to_mark if msg_id not in existing_ids]
-            if new_ids:
-                new_records = [
-                    IMMessageRead(
-                        message_id=msg_id,
-                        user_id=user_id,
-                        conversation_id=conversation_id
-                    )
-                    for msg_id in new_ids
-                ]
-                self.db.add_all(new_records)
-        
-        # 更新成员的未读数和最后已读消息ID
-        stmt = update(IMConversationMember).where(
+        stmt = select(IMConversationMember).where(
             and_(
                 IMConversationMember.conversation_id == conversation_id,
                 IMConversationMember.user_id == user_id
             )
-        ).values(
-            unread_count=0,
-            last_read_message_id=last_message_id or conversation.last_message_id
         )
-        await self.db.execute(stmt)
+        member = (await self.db.execute(stmt)).scalar_one_or_none()
+        if not member:
+            return None
         
+        # 水位只进不退
+        watermark = max(member.last_read_message_id or 0, target)
+        if watermark >= latest:
+            unread = 0
+        else:
+            unread_stmt = select(func.count()).where(
+                and_(
+                    IMMessage.conversation_id == conversation_id,
+                    IMMessage.id > watermark,
+                    IMMessage.sender_id != user_id
+                )
+            )
+            unread = (await self.db.execute(unread_stmt)).scalar() or 0
+        
+        member.last_read_message_id = watermark or None
+        member.unread_count = unread
         await self.db.commit()
-        return True
+        return watermark
+    
+    async def get_read_watermarks(
+        self,
+        conversation_id: int,
+        exclude_user_id: Optional[int] = None
+    ) -> List[Tuple[int, int]]:
+        """获取会话成员的已读水位 [(user_id, last_read_message_id)]"""
+        stmt = select(
+            IMConversationMember.user_id, IMConversationMember.last_read_message_id
+        ).where(IMConversationMember.conversation_id == conversation_id)
+        if exclude_user_id is not None:
+            stmt = stmt.where(IMConversationMember.user_id != exclude_user_id)
+        result = await self.db.execute(stmt)
+        return [(uid, mark or 0) for uid, mark in result.all()]
+    
+    async def apply_read_status(
+        self,
+        conversation_id: int,
+        user_id: int,
+        messages: List[IMMessage]
+    ):
+        """
+        根据已读水位填充消息的已读状态
+        is_read：当前用户是否已读；read_count：自己发送的消息被多少其他成员读过
+        """
+        if not messages:
+            return
+        marks = await self.get_read_watermarks(conversation_id)
+        own_mark = 0
+        others = []
+        for uid, mark in marks:
+            if uid == user_id:
+                own_mark = mark
+            else:
+                others.append(mark)
+        others.sort()
+        for message in messages:
+            message.is_read = message.sender_id == user_id or message.id <= own_mark
+            if message.sender_id == user_id:
+                message.read_count = len(others) - bisect.bisect_left(others, message.id)
+    
+    async def get_message_readers(
+        self,
+        message_id: int,
+        user_id: int,
+        max_members: int = READ_DETAIL_MAX_MEMBERS
+    ) -> Optional[dict]:
+        """
+        获取单条消息的已读/未读成员明细（仅限小群，大群只返回计数）
+        由成员已读水位比较得出
+        """
+        message = (await self.db.execute(
+            select(IMMessage).where(IMMessage.id == message_id)
+        )).scalar_one_or_none()
+        if not message:
+            return None
+        if not await self.get_conversation(message.conversation_id, user_id):
+            return None
+        
+        marks = await self.get_read_watermarks(
+            message.conversation_id, exclude_user_id=message.sender_id
+        )
+        read_ids = [uid for uid, mark in marks if mark >= message.id]
+        unread_ids = [uid for uid, mark in marks if mark < message.id]
+        detail = {
+            "message_id": message_id,
+            "read_count": len(read_ids),
+            "unread_count": len(unread_ids),
+        }
+        if len(marks) <= max_members:
+            detail["read_user_ids"] = read_ids
+            detail["unread_user_ids"] = unread_ids
+        return detail
     
     async def recall_message(
         self,
@@ -658,6 +963,19 @@ class IMService:
             raise ValueError("消息发送超过2分钟，无法撤回")
         
         message.is_recalled = True
+        await self.db.execute(
+            delete(IMMessageToken).where(IMMessageToken.message_id == message.id)
+        )
+        
+        # 撤回的是最后一条消息时同步更新会话预览
+        await self.db.execute(
+            update(IMConversation).where(
+                and_(
+                    IMConversation.id == message.conversation_id,
+                    IMConversation.last_message_id == message.id
+                )
+            ).values(last_message_type="recalled", last_message_content=None)
+        )
         await self.db.commit()
         return True
     
@@ -95,6 +95,286 @@ class TestIMService:
         assert result is True
 
 
+async def _create_users(session, count):
+    from models import User
+    users = [
+        User(username=f"im_user_{i}", password_hash="x", phone=f"1390000{i:04d}",
+             nickname=f"成员{i}", role="user", is_active=True)
+        for i in range(count)
+    ]
+    session.add_all(users)
+    await session.commit()
+    return [u.id for u in users]
+
+
+class _QueryCounter:
+    """统计执行的 SQL 语句数"""
+
+    def __init__(self, session):
+        self.engine = session.bind.sync_engine
+        self.count = 0
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, "before_cursor_execute", self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, "before_cursor_execute", self._on_execute)
+
+
+class TestIMConversationList:
+    """会话列表冗余字段与查询次数测试"""
+
+    @pytest.mark.asyncio
+    async def test_list_query_count_constant(self, db_session):
+        from modules.im.im_services import IMService
+        svc = IMService(db_session)
+        me, *others = await _create_users(db_session, 13)
+
+        for other in others[:2]:
+            await svc.create_conversation(me, ConversationCreate(type="private", member_ids=[other]))
+        with _QueryCounter(db_session) as few:
+            convs, total = await svc.get_conversation_list(me, page_size=50)
+        assert total == 2
+
+        for other in others[2:]:
+            await svc.create_conversation(me, ConversationCreate(type="private", member_ids=[other]))
+        await svc.create_conversation(me, ConversationCreate(type="group", name="群", member_ids=others))
+        with _QueryCounter(db_session) as many:
+            convs, total = await svc.get_conversation_list(me, page_size=50)
+        assert total == 13
+        assert len(convs) == 13
+        assert many.count == few.count == 1
+
+    @pytest.mark.asyncio
+    async def test_list_uses_denormalized_fields(self, db_session):
+        from modules.im.im_services import IMService
+        svc = IMService(db_session)
+        alice, bob = await _create_users(db_session, 2)
+        conv = await svc.create_conversation(alice, ConversationCreate(type="private", member_ids=[bob]))
+        await svc.send_message(alice, MessageCreate(conversation_id=conv.id, content="第一条"))
+        msg = await svc.send_message(alice, MessageCreate(conversation_id=conv.id, content="最新消息"))
+
+        convs, _ = await svc.get_conversation_list(bob)
+        item = convs[0]
+        assert item.last_message_id == msg.id
+        assert item.last_message == "最新消息"
+        assert item.last_message_sender_id == alice
+        assert item.unread_count == 2
+        assert item.target_user_id == alice
+        assert item.name == "成员0"
+        # 消息内容在库中保持加密
+        assert item.last_message_content != "最新消息"
+
+        await svc.mark_messages_read(conv.id, bob)
+        convs, _ = await svc.get_conversation_list(bob)
+        assert convs[0].unread_count == 0
+
+        await svc.recall_message(msg.id, alice)
+        convs, _ = await svc.get_conversation_list(bob)
+        assert convs[0].last_message == "[消息已撤回]"
+
+    @pytest.mark.asyncio
+    async def test_list_page_out_of_range(self, db_session):
+        from modules.im.im_services import IMService
+        svc = IMService(db_session)
+        alice, bob = await _create_users(db_session, 2)
+        await svc.create_conversation(alice, ConversationCreate(type="private", member_ids=[bob]))
+        convs, total = await svc.get_conversation_list(alice, page=5)
+        assert convs == []
+        assert total == 1
+
+
+class TestIMReadWatermark:
+    """已读水位测试"""
+
+    @pytest.mark.asyncio
+    async def test_mark_read_is_constant_writes(self, db_session):
+        from modules.im.im_services import IMService
+        svc = IMService(db_session)
+        alice, bob, carol = await _create_users(db_session, 3)
+        conv = await svc.create_conversation(alice, ConversationCreate(type="group", name="群", member_ids=[bob, carol]))
+        msgs = [
+            await svc.send_message(alice, MessageCreate(conversation_id=conv.id, content=f"消息{i}"))
+            for i in range(30)
+        ]
+
+        with _QueryCounter(db_session) as counter:
+            watermark = await svc.mark_messages_read(conv.id, bob, last_message_id=msgs[9].id)
+        assert watermark == msgs[9].id
+        # 权限检查 + 成员查询 + 未读计数 + 更新，与消息数量无关
+        assert counter.count <= 4
+
+        convs, _ = await svc.get_conversation_list(bob)
+        assert convs[0].unread_count == 20
+        assert convs[0].last_read_message_id == msgs[9].id
+
+        # 水位只进不退
+        assert await svc.mark_messages_read(conv.id, bob, last_message_id=msgs[3].id) == msgs[9].id
+        assert await svc.mark_messages_read(conv.id, bob) == msgs[-1].id
+        convs, _ = await svc.get_conversation_list(bob)
+        assert convs[0].unread_count == 0
+
+    @pytest.mark.asyncio
+    async def test_read_status_derived_from_watermarks(self, db_session):
+        from modules.im.im_services import IMService
+        svc = IMService(db_session)
+        alice, bob, carol = await _create_users(db_session, 3)
+        conv = await svc.create_conversation(alice, ConversationCreate(type="group", name="群", member_ids=[bob, carol]))
+        first = await svc.send_message(alice, MessageCreate(conversation_id=conv.id, content="一"))
+        second = await svc.send_message(alice, MessageCreate(conversation_id=conv.id, content="二"))
+        await svc.mark_messages_read(conv.id, bob, last_message_id=first.id)
+        await svc.mark_messages_read(conv.id, carol)
+
+        messages, _ = await svc.get_messages(conv.id, alice)
+        await svc.apply_read_status(conv.id, alice, messages)
+        counts = {m.id: m.read_count for m in messages}
+        assert counts == {first.id: 2, second.id: 1}
+
+        messages, _ = await svc.get_messages(conv.id, bob)
+        await svc.apply_read_status(conv.id, bob, messages)
+        assert {m.id: m.is_read for m in messages} == {first.id: True, second.id: False}
+
+        detail = await svc.get_message_readers(second.id, alice)
+        assert detail["read_count"] == 1
+        assert detail["read_user_ids"] == [carol]
+        assert detail["unread_user_ids"] == [bob]
+        detail = await svc.get_message_readers(second.id, alice, max_members=1)
+        assert "read_user_ids" not in detail
+        assert await svc.get_message_readers(second.id, 999999) is None
+
+
+@pytest.fixture
+def search_index_on(monkeypatch):
+    from core.config import get_settings
+    monkeypatch.setattr(get_settings(), "im_search_index_enabled", True)
+
+
+class TestIMBlindIndex:
+    """消息搜索盲索引测试"""
+
+    def test_tokens_hide_plaintext(self):
+        from modules.im.im_services import BlindIndex
+        index = BlindIndex(b"k" * 32)
+        tokens = index.tokens(1, "Hello 世界")
+        assert all(len(t) == 32 for t in tokens)
+        assert not any("he" in t or "世" in t for t in tokens)
+        # 同一内容在不同会话中生成不同令牌
+        assert set(tokens).isdisjoint(index.tokens(2, "Hello 世界"))
+        # 关键词令牌是内容令牌的子集
+        assert set(index.query_tokens(1, "ELLO")) <= set(tokens)
+        assert set(index.query_tokens(1, "世")) <= set(tokens)
+
+    @pytest.mark.asyncio
+    async def test_search_message_content(self, db_session, search_index_on):
+        from modules.im.im_services import IMService
+        from modules.im.im_models import IMMessageToken
+        from sqlalchemy import select, func
+        svc = IMService(db_session)
+        alice, bob = await _create_users(db_session, 2)
+        conv = await svc.create_conversation(alice, ConversationCreate(type="private", member_ids=[bob]))
+        hit = await svc.send_message(alice, MessageCreate(conversation_id=conv.id, content="明天下午开项目评审会"))
+        await svc.send_message(bob, MessageCreate(conversation_id=conv.id, content="收到，评估一下时间"))
+        # 含有全部双字令牌但不连续的误命中，在解密核对后排除
+        await svc.send_message(bob, MessageCreate(conversation_id=conv.id, content="审会，评审"))
+
+        messages, total = await svc.get_messages(conv.id, alice, keyword="评审会")
+        assert [m.id for m in messages] == [hit.id]
+
+        messages, _ = await svc.get_messages(conv.id, alice, keyword="没有的词")
+        assert messages == []
+
+        await svc.recall_message(hit.id, alice)
+        count = await db_session.scalar(
+            select(func.count()).select_from(IMMessageToken).where(IMMessageToken.message_id == hit.id)
+        )
+        assert count == 0
+
+    @pytest.mark.asyncio
+    async def test_rebuild_index(self, db_session, monkeypatch):
+        from core.config import get_settings
+        from modules.im.im_services import IMService
+        svc = IMService(db_session)
+        alice, bob = await _create_users(db_session, 2)
+        conv = await svc.create_conversation(alice, ConversationCreate(type="private", member_ids=[bob]))
+        msg = await svc.send_message(alice, MessageCreate(conversation_id=conv.id, content="历史消息 quarterly report"))
+
+        monkeypatch.setattr(get_settings(), "im_search_index_enabled", True)
+        messages, _ = await svc.get_messages(conv.id, alice, keyword="report")
+        assert messages == []
+        assert await svc.rebuild_search_index(batch_size=1) == 1
+        assert await svc.rebuild_search_index() == 0
+        messages, _ = await svc.get_messages(conv.id, alice, keyword="Report")
+        assert [m.id for m in messages] == [msg.id]
+
+
+class TestIMNotifyFanout:
+    """WebSocket 推送测试"""
+
+    @pytest.mark.asyncio
+    async def test_new_message_decrypt_and_serialize_once(self, db_session, monkeypatch):
+        import json
+        from unittest.mock import AsyncMock, patch
+        from core.ws_manager import ConnectionManager
+        from modules.im import im_websocket
+        from modules.im.im_services import IMService, member_cache
+
+        member_cache.clear()
+        ws_manager = ConnectionManager()
+        monkeypatch.setattr(im_websocket, "manager", ws_manager)
+        svc = IMService(db_session)
+        owner, *members = await _create_users(db_session, 6)
+        conv = await svc.create_conversation(owner, ConversationCreate(type="group", name="群", member_ids=members))
+        sockets = {uid: AsyncMock() for uid in [owner, *members]}
+        for uid, ws in sockets.items():
+            await ws_manager.connect(ws, uid)
+        msg = await svc.send_message(owner, MessageCreate(conversation_id=conv.id, content="大家好"))
+
+        encryption = svc.encryption
+        with patch.object(encryption, "decrypt", wraps=encryption.decrypt) as decrypt, \
+                patch("core.ws_manager.json.dumps", wraps=json.dumps) as dumps:
+            await im_websocket.notify_new_message(db_session, msg, exclude_user_id=owner)
+        assert decrypt.call_count == 1
+        assert dumps.call_count == 1
+        sockets[owner].send_text.assert_not_called()
+        for uid in members:
+            payload = json.loads(sockets[uid].send_text.call_args[0][0])
+            assert payload["data"]["content"] == "大家好"
+
+        # 成员列表命中缓存，不再查库
+        with _QueryCounter(db_session) as counter:
+            await im_websocket.notify_message_read(db_session, conv.id, members[0], msg.id)
+        assert counter.count == 0
+
+    @pytest.mark.asyncio
+    async def test_member_cache_invalidated_on_change(self, db_session):
+        from modules.im.im_services import IMService, member_cache
+        from modules.im.im_events import handle_members_changed
+        from core.events import Event
+
+        member_cache.clear()
+        svc = IMService(db_session)
+        owner, a, b = await _create_users(db_session, 3)
+        conv = await svc.create_conversation(owner, ConversationCreate(type="group", name="群", member_ids=[a]))
+        assert sorted(await svc.get_member_ids(conv.id)) == sorted([owner, a])
+
+        await svc.add_conversation_members(conv.id, owner, [b])
+        assert sorted(await svc.get_member_ids(conv.id)) == sorted([owner, a, b])
+
+        await svc.remove_conversation_member(conv.id, owner, a)
+        assert sorted(await svc.get_member_ids(conv.id)) == sorted([owner, b])
+
+        # 其他 worker 的变更通过事件失效
+        member_cache.set(conv.id, [owner])
+        await handle_members_changed(Event(name="im.members_changed", source="im", data={"conversation_id": conv.id}))
+        assert member_cache.get(conv.id) is None
+
+
 @pytest.mark.asyncio
 class TestIMAPI:
     async def test_create_conversation(self, admin_client: AsyncClient):
@@ -9,104 +9,79 @@ from utils.timezone import get_beijing_time
 from typing import Optional, List
 from fastapi import WebSocket
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 
 from core.ws_manager import manager
 from core.database import get_db, async_session
 from .im_services import IMService, get_encryption
 from .im_schemas import MessageCreate, MessageResponse
-from .im_models import IMMessage, IMConversationMember
+from .im_models import IMMessage
 
 logger = logging.getLogger(__name__)
 
 
-async def notify_new_message(db: AsyncSession, message: IMMessage, exclude_user_id: Optional[int] = None):
-    """通知会话成员收到新消息"""
-    # 获取会话成员
-    stmt = select(IMConversationMember).where(
-        IMConversationMember.conversation_id == message.conversation_id
-    )
-    result = await db.execute(stmt)
-    members = result.scalars().all()
-    
-    # 解密消息内容 (如果尚为密文)
-    encryption = get_encryption()
-    decrypted_content = message.content
-    
-    if str(message.content).startswith("gAAAA"):
+async def _get_member_ids(db: AsyncSession, conversation_id: int) -> List[int]:
+    """获取会话成员ID（成员缓存命中时不查库）"""
+    return await IMService(db).get_member_ids(conversation_id)
+
+
+def _decrypt_content(message: IMMessage) -> str:
+    """解密消息内容（如果尚为密文）"""
+    content = message.content
+    if str(content).startswith("gAAAA"):
         try:
-            decrypted_content = encryption.decrypt(message.content)
+            return get_encryption().decrypt(content)
         except Exception as e:
             logger.warning(f"WebSocket消息解密失败 (MsgID: {message.id}): {e}")
-            decrypted_content = "[消息内容]"
+            return "[消息内容]"
+    return content
+
+
+async def notify_new_message(db: AsyncSession, message: IMMessage, exclude_user_id: Optional[int] = None):
+    """
+    通知会话成员收到新消息
+    消息只解密、序列化一次，并发推送给所有成员
+    """
+    member_ids = await _get_member_ids(db, message.conversation_id)
     
-    # 临时将 content 替换为解密后的内容用于序列化（不保存到库）
-    # 注意：如果 message 已经 detached，修改它是安全的
-    original_content = message.content
-    message.content = decrypted_content
+    # 序列化后替换为明文内容，不修改 ORM 对象
+    data = MessageResponse.model_validate(message).model_dump(mode='json')
+    data["content"] = _decrypt_content(message)
     
-    try:
-        data = MessageResponse.model_validate(message).model_dump(mode='json')
-    finally:
-        # 恢复（如果需要的话，但在 notify 中通常不需要，只是为了副作用最小化）
-        if not str(original_content).startswith("gAAAA") and str(message.content) == str(original_content):
-            pass # 没变
-        elif str(original_content).startswith("gAAAA"):
-             message.content = original_content
-
-    # 发送给会话所有成员
     logger.debug(f"IM: 准备推送新消息 (MsgID: {message.id})")
-    for member in members:
-        if exclude_user_id and member.user_id == exclude_user_id:
-            continue
-            
-        await manager.send_personal_message({
-            "type": "im_message_new",
-            "data": data,
-            "timestamp": get_beijing_time().isoformat()
-        }, member.user_id)
+    await manager.send_to_users({
+        "type": "im_message_new",
+        "data": data,
+        "timestamp": get_beijing_time().isoformat()
+    }, [uid for uid in member_ids if uid != exclude_user_id])
     logger.debug(f"IM: 新消息推送完成 (MsgID: {message.id})")
 
 
 async def notify_message_recalled(db: AsyncSession, conversation_id: int, message_id: int, user_id: int):
     """通知撤回消息"""
-    stmt = select(IMConversationMember).where(
-        IMConversationMember.conversation_id == conversation_id
-    )
-    result = await db.execute(stmt)
-    members = result.scalars().all()
-    
-    for member in members:
-        await manager.send_personal_message({
-            "type": "im_message_recalled",
-            "data": {
-                "message_id": message_id,
-                "conversation_id": conversation_id,
-                "recalled_by": user_id
-            },
-            "timestamp": get_beijing_time().isoformat()
-        }, member.user_id)
+    member_ids = await _get_member_ids(db, conversation_id)
+    await manager.send_to_users({
+        "type": "im_message_recalled",
+        "data": {
+            "message_id": message_id,
+            "conversation_id": conversation_id,
+            "recalled_by": user_id
+        },
+        "timestamp": get_beijing_time().isoformat()
+    }, member_ids)
 
 
 async def notify_message_read(db: AsyncSession, conversation_id: int, user_id: int, last_message_id: int):
     """通知消息已读"""
-    stmt = select(IMConversationMember).where(
-        IMConversationMember.conversation_id == conversation_id
-    )
-    result = await db.execute(stmt)
-    members = result.scalars().all()
-    
-    for member in members:
-        if member.user_id != user_id:
-            await manager.send_personal_message({
-                "type": "im_message_read_notify",
-                "data": {
-                    "conversation_id": conversation_id,
-                    "user_id": user_id,
-                    "last_read_message_id": last_message_id
-                },
-                "timestamp": get_beijing_time().isoformat()
-            }, member.user_id)
+    member_ids = await _get_member_ids(db, conversation_id)
+    await manager.send_to_users({
+        "type": "im_message_read_notify",
+        "data": {
+            "conversation_id": conversation_id,
+            "user_id": user_id,
+            "last_read_message_id": last_message_id
+        },
+        "timestamp": get_beijing_time().isoformat()
+    }, [uid for uid in member_ids if uid != user_id])
 
 
 async def handle_im_message(
@@ -150,24 +125,18 @@ async def handle_im_message(
                 conversation_id = data.get("conversation_id")
                 is_typing = data.get("is_typing", True)
                 
-                # 通知会话其他成员
-                stmt = select(IMConversationMember).where(
-                    IMConversationMember.conversation_id == conversation_id
-                )
-                result = await db.execute(stmt)
-                members = result.scalars().all()
-                
-                for member in members:
-                    if member.user_id != user_id:
-                        await manager.send_personal_message({
-                            "type": "im_typing",
-                            "data": {
-                                "conversation_id": conversation_id,
-                                "user_id": user_id,
-                                "is_typing": is_typing
-                            },
-                            "timestamp": get_beijing_time().isoformat()
-                        }, member.user_id)
+                # 通知会话其他成员（非成员不推送）
+                member_ids = await _get_member_ids(db, conversation_id)
+                if user_id in member_ids:
+                    await manager.send_to_users({
+                        "type": "im_typing",
+                        "data": {
+                            "conversation_id": conversation_id,
+                            "user_id": user_id,
+                            "is_typing": is_typing
+                        },
+                        "timestamp": get_beijing_time().isoformat()
+                    }, [uid for uid in member_ids if uid != user_id])
             
             # 其他消息类型（im_read, im_recall 等）建议走 HTTP 保证可靠性，然后再由服务器路由到 WS 广播
             # 如果前端已经发了 WS 消息，也可以在这里处理
@@ -176,8 +145,9 @@ async def handle_im_message(
                 last_message_id = data.get("last_message_id")
                 message_ids = data.get("message_ids")
                 
-                await service.mark_messages_read(conversation_id, user_id, message_ids, last_message_id)
-                await notify_message_read(db, conversation_id, user_id, last_message_id or (message_ids[-1] if message_ids else 0))
+                watermark = await service.mark_messages_read(conversation_id, user_id, message_ids, last_message_id)
+                if watermark is not None:
+                    await notify_message_read(db, conversation_id, user_id, watermark)
 
         except Exception as e:
             logger.error(f"处理实时IM消息失败: {e}", exc_info=True)
@@ -5,6 +5,14 @@ NotebookLM水印清除模块清单
 
 from core.loader import ModuleManifest, ModuleAssets
 
+
+async def on_disable():
+    # 释放页面处理进程池
+    from utils.process_pool import shutdown_process_pool
+    from .lm_cleaner_pipeline import POOL_NAME
+    shutdown_process_pool(POOL_NAME)
+
+
 manifest = ModuleManifest(
     id="lm_cleaner",
     name="NotebookLM水印清除",
@@ -38,6 +46,8 @@ manifest = ModuleManifest(
     ],
     
     dependencies=[],
+    
+    on_disable=on_disable,
 )
 
 
@@ -0,0 +1,366 @@
+"""
+NotebookLM水印清除 - 图像处理与 PDF 页面流水线
+
+PDF 页面在进程池中处理，像素数据在内存中传递，不再落临时 PNG。
+默认只渲染右下角水印区域，清除后作为补丁覆盖在原页面上，页面文字与矢量内容保持可检索；
+整页栅格化模式保留为兜底（旋转页面或区域处理失败时自动使用）。
+主进程按页码顺序把结果拼入输出文档，先完成的页面在内存中等待前序页面，
+同时在途页数受限，内存占用与总页数无关。
+
+本模块会在进程池子进程中导入，只依赖 PyMuPDF / OpenCV / NumPy
+"""
+
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+from utils.process_pool import get_process_pool, pool_size
+
+logger = logging.getLogger(__name__)
+
+# PDF 页面渲染分辨率
+RENDER_DPI = 300
+# 进程池名称
+POOL_NAME = "lm_cleaner"
+# 处理模式：region 只清除水印区域并保留矢量内容，raster 整页栅格化（兜底）
+CLEAN_MODES = ("region", "raster")
+# 区域模式渲染时在水印矩形外扩的像素数（覆盖背景采样边距与修复边界）
+REGION_MARGIN_PX = 16
+
+# 进度回调：(已完成页数, 总页数)
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+
+class CleanCancelled(Exception):
+    """处理被用户取消"""
+
+
+def _import_cv():
+    try:
+        import cv2
+        import numpy as np
+    except ImportError:
+        logger.error("缺少 opencv-python-headless 依赖，无法执行高级去水印")
+        raise ImportError("请先安装 opencv-python-headless 以启用高级去水印功能")
+    return cv2, np
+
+
+def watermark_box(width: int, height: int) -> Tuple[int, int, int, int]:
+    """
+    计算右下角水印区域 (x1, y1, x2, y2)（像素）
+    NotebookLM 水印位于右下角，通过精细化尺寸避免误伤文字，根据分辨率分档处理
+    """
+    if width > 3000: # 4K / 高清 PDF
+        target_w, target_h = 550, 100
+    elif width > 1500: # 1080p - 2K (常见尺寸)
+        target_w, target_h = 320, 80
+    else: # 低分图
+        target_w, target_h = 240, 60
+
+    # 安全限制：不超过宽度的 40%，高度的 15%
+    mask_w = min(target_w, int(width * 0.4))
+    mask_h = min(target_h, int(height * 0.15))
+
+    # 坐标定义 (x1,y1) -> (x2,y2) 为右下角矩形
+    return width - mask_w, height - mask_h, width, height
+
+
+def erase_box(img, box: Tuple[int, int, int, int]):
+    """
+    清除图像（BGR 数组）中紧贴右下角的矩形区域
+    优化策略：
+    1. 优先检测区域外侧背景是否为纯色（如白底），若是则直接填充颜色，效果最完美且无模糊。
+    2. 若为复杂背景，则使用 Inpainting 算法修复，并缩小 Mask 范围以减少对周边文字的干扰。
+    """
+    cv2, np = _import_cv()
+    x1, y1, x2, y2 = box
+
+    # 1. 智能背景检测
+    # 采样区域：紧贴 Mask 的左侧和上方边缘的一圈像素
+    # 如果这些像素颜色方差极小，说明背景是纯色
+    sample_margin = 10
+    sx_start = max(0, x1 - sample_margin)
+    sy_start = max(0, y1 - sample_margin)
+
+    # 提取采样点
+    samples = []
+
+    # 上边缘采样 (Taking a strip above the watermark)
+    if sy_start < y1:
+        top_strip = img[sy_start:y1, sx_start:x2]
+        if top_strip.size > 0:
+            samples.append(top_strip.reshape(-1, 3))
+
+    # 左边缘采样 (Taking a strip left of the watermark)
+    if sx_start < x1:
+        left_strip = img[sy_start:y2, sx_start:x1] # extends to bottom
+        if left_strip.size > 0:
+            samples.append(left_strip.reshape(-1, 3))
+
+    is_solid_bg = False
+    fill_color = None
+
+    if samples:
+        # 合并所有采样像素
+        all_pixels = np.vstack(samples)
+        # 计算标准差和均值
+        std_dev = np.std(all_pixels, axis=0)
+        mean_color = np.mean(all_pixels, axis=0)
+        current_std_dev = np.max(std_dev)
+
+        # 判断逻辑：BGR 三个通道的标准差都小于阈值 (如 15.0)
+        # 且像素数量足够
+        if current_std_dev < 15.0 and len(all_pixels) > 50:
+            is_solid_bg = True
+            fill_color = mean_color
+
+    # 2. 执行去除
+    if is_solid_bg and fill_color is not None:
+        # 策略 A: 纯色填充 (完美效果，无模糊)
+        color_int = (int(fill_color[0]), int(fill_color[1]), int(fill_color[2]))
+        cv2.rectangle(img, (x1, y1), (x2, y2), color_int, thickness=-1)
+    else:
+        # 策略 B: Inpainting (复杂背景)
+        mask = np.zeros(img.shape[:2], np.uint8)
+        # 稍微扩大一点 Mask 区域以覆盖边界效应
+        pad = 2
+        mx1 = max(0, x1 - pad)
+        my1 = max(0, y1 - pad)
+        cv2.rectangle(mask, (mx1, my1), (x2, y2), (255), thickness=-1)
+
+        # 使用 Telea 算法，半径减小以减少涂抹感
+        img = cv2.inpaint(img, mask, 3, cv2.INPAINT_TELEA)
+
+    return img
+
+
+def remove_watermark(img):
+    """清除整幅图像（BGR 数组）右下角水印"""
+    height, width = img.shape[:2]
+    return erase_box(img, watermark_box(width, height))
+
+
+def clean_image_file(input_path: str, output_path: str):
+    """读取图片文件、去水印后写回（同步，调用方放入线程执行）"""
+    cv2, np = _import_cv()
+    # 注意：cv2.imread/imwrite 不支持中文路径，需要用 numpy 读写
+    try:
+        img_array = np.fromfile(input_path, dtype=np.uint8)
+        img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+    except Exception as e:
+        logger.error(f"读取图片失败: {e}")
+        raise ValueError(f"无法读取图片文件: {input_path}")
+
+    if img is None:
+        raise ValueError("无法解码图片文件")
+
+    img = remove_watermark(img)
+
+    ext = os.path.splitext(output_path)[1]
+    is_success, buffer = cv2.imencode(ext, img)
+    if is_success:
+        buffer.tofile(output_path)
+    else:
+        raise ValueError("保存图片失败")
+
+
+# 子进程内缓存最近打开的源文档，同一文件的后续页面无需重复解析
+_worker_doc: Dict[str, "fitz.Document"] = {}
+
+
+def _open_source(input_path: str) -> "fitz.Document":
+    doc = _worker_doc.get(input_path)
+    if doc is None:
+        for old in _worker_doc.values():
+            old.close()
+        _worker_doc.clear()
+        doc = _worker_doc[input_path] = fitz.open(input_path)
+    return doc
+
+
+def _pixmap_to_bgr(pix: "fitz.Pixmap"):
+    """Pixmap 缓冲区直接转为 BGR 数组，不经过图片编码"""
+    cv2, np = _import_cv()
+    img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width * pix.n]
+    img = img.reshape(pix.height, pix.width, pix.n)
+    code = cv2.COLOR_GRAY2BGR if pix.n == 1 else cv2.COLOR_RGB2BGR
+    return cv2.cvtColor(img, code)
+
+
+def _encode_png(img, page_index: int) -> bytes:
+    cv2, _ = _import_cv()
+    ok, png = cv2.imencode(".png", img)
+    if not ok:
+        raise ValueError(f"第 {page_index + 1} 页编码失败")
+    return png.tobytes()
+
+
+def render_clean_page(input_path: str, page_index: int, dpi: int = RENDER_DPI) -> bytes:
+    """
+    整页栅格模式：渲染整页并去水印，返回该页的单页 PDF
+
+    输出页面保持原页面尺寸，但内容变为图片（文字不可再检索）
+    """
+    page = _open_source(input_path)[page_index]
+    zoom = dpi / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    png = _encode_png(remove_watermark(_pixmap_to_bgr(pix)), page_index)
+
+    out = fitz.open()
+    try:
+        rect = page.rect
+        out_page = out.new_page(width=rect.width, height=rect.height)
+        out_page.insert_image(out_page.rect, stream=png)
+        return out.tobytes()
+    finally:
+        out.close()
+
+
+def render_clean_region(input_path: str, page_index: int, dpi: int = RENDER_DPI) -> Tuple[Tuple[float, float, float, float], bytes]:
+    """
+    区域模式：只渲染右下角水印区域（外扩采样边距），清除后返回 (补丁矩形, PNG)
+
+    水印区域按整页渲染尺寸计算，与整页模式一致；补丁只覆盖水印矩形本身，
+    页面其余矢量内容保持不变
+    """
+    page = _open_source(input_path)[page_index]
+    zoom = dpi / 72
+    rect = page.rect
+    width_px, height_px = round(rect.width * zoom), round(rect.height * zoom)
+    x1, y1, x2, y2 = watermark_box(width_px, height_px)
+    mask_w, mask_h = x2 - x1, y2 - y1
+
+    clip = fitz.Rect(
+        rect.x0 + max(x1 - REGION_MARGIN_PX, 0) / zoom,
+        rect.y0 + max(y1 - REGION_MARGIN_PX, 0) / zoom,
+        rect.x1,
+        rect.y1
+    )
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, alpha=False)
+    img = _pixmap_to_bgr(pix)
+    h, w = img.shape[:2]
+    img = erase_box(img, (w - mask_w, h - mask_h, w, h))
+
+    patch = img[h - mask_h:, w - mask_w:]
+    patch_rect = (rect.x1 - mask_w / zoom, rect.y1 - mask_h / zoom, rect.x1, rect.y1)
+    return patch_rect, _encode_png(patch, page_index)
+
+
+def clean_page(input_path: str, page_index: int, dpi: int = RENDER_DPI, mode: str = "region") -> Tuple[int, str, object]:
+    """
+    处理单页（在进程池子进程中执行）
+
+    区域模式不适用（页面旋转）或失败时退回整页栅格模式
+
+    Returns:
+        (页码, "patch" | "page", 补丁 (矩形, PNG) 或单页 PDF)
+    """
+    if mode == "region":
+        page = _open_source(input_path)[page_index]
+        if page.rotation == 0:
+            try:
+                return page_index, "patch", render_clean_region(input_path, page_index, dpi)
+            except Exception as e:
+                logger.warning(f"第 {page_index + 1} 页区域清除失败，改用整页模式: {e}")
+    return page_index, "page", render_clean_page(input_path, page_index, dpi)
+
+
+def _apply_results(output_doc: "fitz.Document", start: int, results: List[Tuple[str, object]], in_place: bool):
+    """
+    按页序写入处理结果
+
+    in_place 时 output_doc 为源文档副本：补丁覆盖在原页面上，整页结果替换原页面；
+    否则依次追加整页结果
+    """
+    for offset, (kind, data) in enumerate(results):
+        index = start + offset
+        if kind == "patch":
+            patch_rect, png = data
+            page = output_doc[index]
+            rect = fitz.Rect(patch_rect)
+            # 移除水印区域内的文字对象（视觉上已被补丁覆盖），避免水印文字残留在文本层；图片与矢量图形保留
+            page.add_redact_annot(rect)
+            page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE, graphics=fitz.PDF_REDACT_LINE_ART_NONE)
+            page.insert_image(rect, stream=png, keep_proportion=False)
+            continue
+        with fitz.open("pdf", data) as page_doc:
+            if in_place:
+                output_doc.delete_page(index)
+                output_doc.insert_pdf(page_doc, start_at=index)
+            else:
+                output_doc.insert_pdf(page_doc)
+
+
+async def clean_pdf(
+    input_path: str,
+    output_path: str,
+    on_progress: Optional[ProgressCallback] = None,
+    cancel_event: Optional[asyncio.Event] = None,
+    dpi: int = RENDER_DPI,
+    mode: str = "region"
+):
+    """
+    并行清除 PDF 各页水印并按页序组装输出
+
+    Args:
+        input_path: 源 PDF
+        output_path: 输出 PDF
+        on_progress: 每批页面写入后回调 (已完成页数, 总页数)
+        cancel_event: 置位后停止提交新页面、取消排队中的页面并抛出 CleanCancelled
+        dpi: 渲染分辨率
+        mode: region 只处理水印区域并保留原页面矢量内容；raster 整页栅格化
+    """
+    if mode not in CLEAN_MODES:
+        raise ValueError(f"不支持的处理模式: {mode}")
+    in_place = mode == "region"
+
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool(POOL_NAME)
+    # 在途页数上限：保证每个进程都有活干，又不让乱序完成的页面无限堆积
+    window = pool_size(pool) * 2
+
+    output_doc = fitz.open(input_path) if in_place else fitz.open()
+    if in_place:
+        total = output_doc.page_count
+    else:
+        with fitz.open(input_path) as src:
+            total = src.page_count
+    in_flight = set()
+    ready: Dict[int, Tuple[str, object]] = {}
+    next_submit = next_write = 0
+    try:
+        while next_write < total:
+            if cancel_event is not None and cancel_event.is_set():
+                raise CleanCancelled()
+
+            while next_submit < total and next_submit - next_write < window:
+                in_flight.add(loop.run_in_executor(pool, clean_page, input_path, next_submit, dpi, mode))
+                next_submit += 1
+
+            done, in_flight = await asyncio.wait(
+                in_flight,
+                timeout=0.5 if cancel_event is not None else None,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            for fut in done:
+                page_index, kind, data = fut.result()
+                ready[page_index] = (kind, data)
+
+            batch = []
+            while next_write + len(batch) in ready:
+                batch.append(ready.pop(next_write + len(batch)))
+            if batch:
+                await asyncio.to_thread(_apply_results, output_doc, next_write, batch, in_place)
+                next_write += len(batch)
+                if on_progress:
+                    await on_progress(next_write, total)
+
+        await asyncio.to_thread(output_doc.save, output_path, garbage=3, deflate=True)
+    finally:
+        # 取消尚未开始的页面，已在子进程中运行的页面完成后丢弃
+        for fut in in_flight:
+            fut.cancel()
+        output_doc.close()
@@ -3,11 +3,12 @@ NotebookLM水印清除模块API路由
 定义 RESTful API 接口
 """
 
+import asyncio
 import logging
 import os
 import uuid
 import aiofiles
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from fastapi import APIRouter, Depends, Query, UploadFile, File, BackgroundTasks
 from fastapi.responses import FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -15,7 +16,7 @@ from pathlib import Path
 
 from core.database import get_db
 from core.security import get_current_user, require_permission, TokenData
-from core.errors import NotFoundException, success_response, ErrorCode, ValidationException
+from core.errors import NotFoundException, success_response, ErrorCode, ValidationException, BusinessException
 from core.pagination import create_page_response
 from utils.storage import get_storage_manager
 
@@ -25,20 +26,43 @@ from .lm_cleaner_schemas import (
     LmCleanerListResponse
 )
 from .lm_cleaner_services import LmCleanerService
+from .lm_cleaner_pipeline import CleanCancelled
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 storage_manager = get_storage_manager()
 
+# 处理中任务的取消信号，键为 (用户ID, 客户端任务ID)
+_cancel_events: Dict[Tuple[int, str], asyncio.Event] = {}
+
+
+def _progress_notifier(user_id: int, task_id: Optional[str]):
+    """PDF 逐页处理进度通过 WebSocket 推送给本人"""
+    async def notify(done: int, total: int):
+        from core.ws_manager import manager
+        try:
+            await manager.send_personal_message({
+                "type": "lm_cleaner_progress",
+                "data": {"task_id": task_id, "done": done, "total": total}
+            }, user_id)
+        except Exception:
+            pass
+    return notify
+
 @router.post("/clean", response_model=dict, summary="处理文件（清除水印）")
 async def clean_file(
     file: UploadFile = File(...),
+    task_id: Optional[str] = Query(None, max_length=64, description="客户端任务ID，用于进度推送与取消"),
+    mode: str = Query("region", pattern="^(region|raster)$", description="PDF 处理模式：region 仅处理水印区域并保留文字，raster 整页栅格化"),
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(get_current_user)
 ):
     """
     上传文件并清除 NotebookLM 水印
+
+    PDF 按页并行处理，进度以 lm_cleaner_progress 消息推送；
+    携带 task_id 时可通过 POST /clean/{task_id}/cancel 取消
     """
     # 1. 验证文件
     total_size = 0
@@ -65,12 +89,19 @@ async def clean_file(
                 break
             await f.write(chunk)
     
+    cancel_key = (user.user_id, task_id) if task_id else None
+    cancel_event = asyncio.Event() if cancel_key else None
+    if cancel_key:
+        _cancel_events[cancel_key] = cancel_event
     try:
         # 3. 处理文件
         output_path = await LmCleanerService.process_file(
             str(temp_input_path), 
             file.filename, 
-            user.user_id
+            user.user_id,
+            on_progress=_progress_notifier(user.user_id, task_id),
+            cancel_event=cancel_event,
+            mode=mode
         )
         
         # 4. 创建记录
@@ -90,12 +121,31 @@ async def clean_file(
             },
             message="水印处理成功"
         )
+    except CleanCancelled:
+        if temp_input_path.exists():
+            os.remove(temp_input_path)
+        raise BusinessException(ErrorCode.OPERATION_FAILED, "处理已取消")
     except Exception as e:
         # 仅在失败时删除原始文件
         if temp_input_path.exists():
             os.remove(temp_input_path)
         raise e
+    finally:
+        if cancel_key:
+            _cancel_events.pop(cancel_key, None)
+
 
+@router.post("/clean/{task_id}/cancel", response_model=dict, summary="取消处理")
+async def cancel_clean(
+    task_id: str,
+    user: TokenData = Depends(get_current_user)
+):
+    """取消本人正在进行的处理任务"""
+    event = _cancel_events.get((user.user_id, task_id))
+    if not event:
+        raise NotFoundException("处理任务", task_id)
+    event.set()
+    return success_response(message="已请求取消")
 
 
 @router.get("/download/{item_id}", summary="下载文件")
@@ -67,6 +67,79 @@ class TestLmCleanerService:
         assert result is True
 
 
+def _make_pdf(path, pages: int):
+    import fitz
+    doc = fitz.open()
+    for i in range(pages):
+        # 每页宽度不同，用于校验输出页序
+        page = doc.new_page(width=200 + i * 10, height=300)
+        page.insert_text((20, 40), f"page {i + 1}")
+    doc.save(str(path))
+    doc.close()
+
+
+class TestLmCleanerPipeline:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("mode", ["region", "raster"])
+    async def test_clean_pdf_keeps_page_order(self, tmp_path, mode):
+        import fitz
+        from modules.lm_cleaner.lm_cleaner_pipeline import clean_pdf
+        source, output = tmp_path / "in.pdf", tmp_path / "out.pdf"
+        _make_pdf(source, 5)
+
+        progress = []
+
+        async def on_progress(done, total):
+            progress.append((done, total))
+
+        await clean_pdf(str(source), str(output), on_progress=on_progress, dpi=72, mode=mode)
+        with fitz.open(str(output)) as doc:
+            assert [round(page.rect.width) for page in doc] == [200, 210, 220, 230, 240]
+            assert all(page.get_images() for page in doc)
+        assert progress[-1] == (5, 5)
+        assert [done for done, _ in progress] == sorted(done for done, _ in progress)
+
+    @pytest.mark.asyncio
+    async def test_region_mode_keeps_text_layer(self, tmp_path):
+        import fitz
+        from modules.lm_cleaner.lm_cleaner_pipeline import clean_pdf
+        source = tmp_path / "in.pdf"
+        doc = fitz.open()
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((50, 80), "Quarterly report")
+        page.insert_text((530, 835), "NotebookLM", fontsize=8)
+        doc.save(str(source))
+        doc.close()
+
+        region, raster = tmp_path / "region.pdf", tmp_path / "raster.pdf"
+        await clean_pdf(str(source), str(region), dpi=150, mode="region")
+        await clean_pdf(str(source), str(raster), dpi=150, mode="raster")
+
+        with fitz.open(str(region)) as doc:
+            text = doc[0].get_text()
+            assert "Quarterly report" in text
+            assert "NotebookLM" not in text
+            # 补丁只覆盖右下角
+            info, = doc[0].get_image_info()
+            x0, y0, _, _ = info["bbox"]
+            assert x0 > 595 * 0.5 and y0 > 842 * 0.8
+        with fitz.open(str(raster)) as doc:
+            assert doc[0].get_text().strip() == ""
+        assert region.stat().st_size < raster.stat().st_size
+
+    @pytest.mark.asyncio
+    async def test_clean_pdf_cancel(self, tmp_path):
+        import asyncio
+        from modules.lm_cleaner.lm_cleaner_pipeline import clean_pdf, CleanCancelled
+        source, output = tmp_path / "in.pdf", tmp_path / "out.pdf"
+        _make_pdf(source, 3)
+        cancel = asyncio.Event()
+        cancel.set()
+        with pytest.raises(CleanCancelled):
+            await clean_pdf(str(source), str(output), cancel_event=cancel, dpi=72)
+        assert not output.exists()
+
+
 @pytest.mark.asyncio
 class TestLmCleanerAPI:
     async def test_get_list(self, admin_client: AsyncClient):
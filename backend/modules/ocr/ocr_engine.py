@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+OCR 识别引擎（进程池子进程侧）
+
+每个工作进程按语言持有自己的 RapidOCR 实例，首次使用时加载模型，之后常驻复用。
+PDF 按页分发，每页渲染后以像素内容摘要查询共享磁盘缓存，同一扫描页出现在不同文档中也能命中。
+
+识别前先做自适应预处理（analyze_layout）：在缩小的分析图上用连通域估计文字高度并找出文字区域，
+- 按文字高度选择缩放档位，在保证文字不低于 MIN_TEXT_HEIGHT 的前提下尽量缩小；
+- 文字区域只占图片一小部分时（大片空白的扫描件），只把这些区域裁剪出来送去检测与识别；
+- 没有任何文字迹象的空白页直接跳过。
+PDF 页面已有可提取的文字层时（extract_text_layer）直接采用，不渲染也不识别。
+各阶段耗时记录在结果的 timings 中。
+
+本模块会在进程池子进程中导入，模块级只依赖标准库；模型文件由主进程在分发前准备好
+"""
+
+import time
+import json
+import hashlib
+import logging
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.disk_cache import DiskCache
+
+logger = logging.getLogger(__name__)
+
+# 图片最大边长（超过则压缩）
+MAX_IMAGE_SIZE = 4000
+
+# 自适应预处理参数
+# 版面分析图的最大边长
+ANALYSIS_SIZE = 1024
+# 缩放档位（只缩小不放大），从小到大尝试
+SCALE_TIERS = (0.25, 0.33, 0.5, 0.75, 1.0)
+# 缩放后文字高度下限（像素），低于此值检测与识别精度明显下降
+MIN_TEXT_HEIGHT = 24
+# 判定为有文字所需的最少字符状连通域数
+MIN_TEXT_COMPONENTS = 3
+# 文字区域总面积低于整图该比例时按区域裁剪识别
+CROP_AREA_RATIO = 0.5
+# 区域数超过该值时整图识别（逐块调用的开销超过裁剪收益）
+MAX_REGIONS = 12
+# 文字区域外扩边距（估计文字高度的倍数）
+REGION_PADDING = 1.5
+# PDF 页面文字层达到该字符数即直接采用，不再识别
+TEXT_LAYER_MIN_CHARS = 50
+# 文字层较短时，图片覆盖页面超过该比例视为扫描页（文字可能只是页眉或水印）
+SCANNED_IMAGE_COVERAGE = 0.5
+
+# (检测模型, 识别模型, 方向分类模型) 路径
+ModelPaths = Tuple[str, str, Optional[str]]
+
+# 本进程的 RapidOCR 实例，按语言缓存
+_instances: Dict[str, Any] = {}
+# 本进程的结果缓存句柄，按缓存目录缓存
+_caches: Dict[str, DiskCache] = {}
+
+
+def _get_engine(language: str, model_paths: ModelPaths):
+    engine = _instances.get(language)
+    if engine is None:
+        try:
+            from rapidocr_onnxruntime import RapidOCR
+        except ImportError as e:
+            raise RuntimeError("RapidOCR 模块未安装，请运行: pip install rapidocr-onnxruntime") from e
+        det_model, rec_model, cls_model = model_paths
+        engine = _instances[language] = RapidOCR(
+            det_model_path=det_model,
+            rec_model_path=rec_model,
+            cls_model_path=cls_model
+        )
+        logger.info(f"RapidOCR ({language}) 已在工作进程中初始化")
+    return engine
+
+
+def _run(img_array, language: str, model_paths: ModelPaths):
+    ocr = _get_engine(language, model_paths)
+    try:
+        result, _ = ocr(img_array)
+    except Exception as e:
+        logger.error(f"RapidOCR ({language}) 识别异常: {e}")
+        raise RuntimeError(f"OCR识别引擎错误: {str(e)}")
+    return result or []
+
+
+def _parse(result, page: Optional[int] = None) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """解析 RapidOCR 结果：item 为 [box, text, score]"""
+    boxes = []
+    texts = []
+    for item in result:
+        if len(item) >= 3:
+            text = str(item[1])
+            box = {
+                "text": text,
+                "confidence": float(item[2]) if item[2] else 0.0,
+                "box": [[int(p[0]), int(p[1])] for p in item[0]]
+            }
+            if page is not None:
+                box = {"page": page, **box}
+            boxes.append(box)
+            texts.append(text)
+    return boxes, texts
+
+
+def analyze_layout(img) -> Tuple[Optional[float], List[Tuple[int, int, int, int]]]:
+    """
+    估计文字高度并检测文字区域
+
+    在缩小的灰度分析图上自适应二值化，按尺寸、宽高比与填充率筛选出字符状连通域，
+    取其高度中位数作为文字高度；再把字符按文字高度膨胀连成块，块的外接矩形即文字区域
+
+    Returns:
+        (文字高度（原图像素）, 文字区域 [(x0, y0, x1, y1)]，原图坐标，按阅读顺序排列)；
+        没有文字迹象时返回 (None, [])
+    """
+    import cv2
+    import numpy as np
+
+    h, w = img.shape[:2]
+    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY) if img.ndim == 3 else img
+    factor = min(1.0, ANALYSIS_SIZE / max(h, w))
+    if factor < 1.0:
+        gray = cv2.resize(gray, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    sh, sw = gray.shape[:2]
+
+    binary = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 25, 15)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    if count <= 1:
+        return None, []
+    cw, ch, area = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT], stats[1:, cv2.CC_STAT_AREA]
+    fill = area / np.maximum(cw * ch, 1)
+    is_char = (
+        (ch >= 2) & (ch <= sh / 8) & (cw <= sw / 4)
+        & (cw <= ch * 10) & (ch <= cw * 10) & (fill >= 0.1)
+    )
+    if int(is_char.sum()) < MIN_TEXT_COMPONENTS:
+        return None, []
+    text_height = float(np.median(ch[is_char]))
+
+    # 只保留字符连通域，排除噪点、表格线与大块图形
+    mask = np.isin(labels, np.flatnonzero(is_char) + 1).astype(np.uint8) * 255
+    kx = max(3, int(text_height * 2))
+    ky = max(3, int(text_height))
+    blocks = cv2.dilate(mask, cv2.getStructuringElement(cv2.MORPH_RECT, (kx, ky)))
+    contours, _ = cv2.findContours(blocks, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    pad = text_height * REGION_PADDING
+    regions = []
+    for contour in contours:
+        x, y, bw, bh = cv2.boundingRect(contour)
+        regions.append((
+            max(0, int((x - pad) / factor)), max(0, int((y - pad) / factor)),
+            min(w, int((x + bw + pad) / factor)), min(h, int((y + bh + pad) / factor))
+        ))
+    return text_height / factor, _merge_regions(regions)
+
+
+def _merge_regions(regions: List[Tuple[int, int, int, int]]) -> List[Tuple[int, int, int, int]]:
+    """合并相互重叠的区域，按从上到下、从左到右排列"""
+    merged = True
+    while merged:
+        merged = False
+        result: List[Tuple[int, int, int, int]] = []
+        for r in regions:
+            for i, m in enumerate(result):
+                if r[0] < m[2] and m[0] < r[2] and r[1] < m[3] and m[1] < r[3]:
+                    result[i] = (min(r[0], m[0]), min(r[1], m[1]), max(r[2], m[2]), max(r[3], m[3]))
+                    merged = True
+                    break
+            else:
+                result.append(r)
+        regions = result
+    return sorted(regions, key=lambda r: (r[1], r[0]))
+
+
+def choose_scale(text_height: float, width: int, height: int) -> float:
+    """
+    选择检测/识别分辨率
+
+    取能让文字高度不低于 MIN_TEXT_HEIGHT 的最小档位，同时保证最长边不超过 MAX_IMAGE_SIZE
+    """
+    scale = 1.0
+    for tier in SCALE_TIERS:
+        if text_height * tier >= MIN_TEXT_HEIGHT:
+            scale = tier
+            break
+    return min(scale, MAX_IMAGE_SIZE / max(width, height))
+
+
+def _recognize_array(img, language: str, model_paths: ModelPaths, page: Optional[int] = None) -> Tuple[List[Dict[str, Any]], List[str], Dict[str, float]]:
+    """
+    预处理并识别图像
+
+    Returns:
+        (检测框（原图坐标）, 文本行, 各阶段耗时)
+    """
+    import cv2
+
+    t0 = time.time()
+    h, w = img.shape[:2]
+    text_height, regions = analyze_layout(img)
+    if text_height is None:
+        # 空白页：没有文字迹象，跳过检测与识别
+        return [], [], {"preprocess": round(time.time() - t0, 3), "ocr": 0.0}
+
+    scale = choose_scale(text_height, w, h)
+    region_area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in regions)
+    if not regions or len(regions) > MAX_REGIONS or region_area >= w * h * CROP_AREA_RATIO:
+        regions = [(0, 0, w, h)]
+
+    crops = []
+    for x0, y0, x1, y1 in regions:
+        crop = img[y0:y1, x0:x1]
+        if scale < 1.0:
+            crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        crops.append(crop)
+    t1 = time.time()
+    logger.debug(
+        f"OCR 预处理: {w}x{h}, 文字高度约 {text_height:.0f}px, 缩放 {scale:.2f}, 区域 {len(regions)}"
+    )
+
+    boxes: List[Dict[str, Any]] = []
+    texts: List[str] = []
+    for (x0, y0, _, _), crop in zip(regions, crops):
+        for item in _run(crop, language, model_paths):
+            if len(item) >= 3:
+                # 区域坐标还原到原图
+                item = [[[p[0] / scale + x0, p[1] / scale + y0] for p in item[0]], item[1], item[2]]
+                part_boxes, part_texts = _parse([item], page=page)
+                boxes.extend(part_boxes)
+                texts.extend(part_texts)
+    timings = {"preprocess": round(t1 - t0, 3), "ocr": round(time.time() - t1, 3)}
+    return boxes, texts, timings
+
+
+def recognize_image_bytes(image_data: bytes, language: str, model_paths: ModelPaths) -> Dict[str, Any]:
+    """识别单张图片"""
+    import numpy as np
+    from PIL import Image
+
+    start_time = time.time()
+
+    image = Image.open(BytesIO(image_data))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    img_array = np.array(image)
+    decode_time = time.time() - start_time
+
+    boxes, texts, timings = _recognize_array(img_array, language, model_paths)
+    avg_confidence = sum(b["confidence"] for b in boxes) / len(boxes) if boxes else 0.0
+
+    return {
+        "text": "\n".join(texts),
+        "boxes": boxes,
+        "confidence": round(avg_confidence, 4),
+        "processing_time": round(time.time() - start_time, 3),
+        "timings": {"decode": round(decode_time, 3), **timings}
+    }
+
+
+def extract_text_layer(page, zoom: float) -> Optional[Dict[str, Any]]:
+    """
+    提取 PDF 页面自带的文字层（在主进程中调用）
+
+    检测框换算到按 zoom 渲染后的页面坐标，与识别结果一致；
+    没有文字层或判定为扫描页时返回 None
+    """
+    import fitz  # PyMuPDF
+
+    text = page.get_text().strip()
+    if not text:
+        return None
+    if len(text) < TEXT_LAYER_MIN_CHARS:
+        page_area = abs(page.rect)
+        covered = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+        if page_area and covered / page_area >= SCANNED_IMAGE_COVERAGE:
+            return None
+
+    matrix = page.rotation_matrix * fitz.Matrix(zoom, zoom)
+    lines = []
+    boxes = []
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", []):
+            line_text = "".join(span["text"] for span in line["spans"]).strip()
+            if not line_text:
+                continue
+            quad = fitz.Rect(line["bbox"]).quad * matrix
+            lines.append(line_text)
+            boxes.append({
+                "page": page.number + 1,
+                "text": line_text,
+                "confidence": 1.0,
+                "box": [[int(p.x), int(p.y)] for p in (quad.ul, quad.ur, quad.lr, quad.ll)]
+            })
+    return {"page": page.number + 1, "lines": lines, "boxes": boxes}
+
+
+def page_cache_key(samples: bytes, width: int, height: int, options_key: str) -> str:
+    """页面缓存键：渲染像素摘要 + 尺寸 + 语言/参数"""
+    digest = hashlib.sha256(samples)
+    digest.update(f"\0{width}x{height}\0{options_key}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def recognize_pdf_page(
+    pdf_path: str,
+    page_index: int,
+    zoom: float,
+    language: str,
+    model_paths: ModelPaths,
+    cache_root: str,
+    cache_max_bytes: int,
+    options_key: str
+) -> Dict[str, Any]:
+    """
+    识别 PDF 单页
+
+    Returns:
+        {"page": 页码(从 1 开始), "lines": 文本行, "boxes": 检测框, "timings": 各阶段耗时, "from_cache": 是否命中缓存}
+    """
+    import fitz  # PyMuPDF
+    import numpy as np
+
+    t0 = time.time()
+    with fitz.open(pdf_path) as doc:
+        pix = doc.load_page(page_index).get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    render_time = round(time.time() - t0, 3)
+
+    cache = _caches.get(cache_root)
+    if cache is None:
+        cache = _caches[cache_root] = DiskCache(cache_root, cache_max_bytes)
+    key = page_cache_key(pix.samples, pix.width, pix.height, options_key)
+    cached = cache.get(key, "json")
+    if cached is not None:
+        return {**json.loads(cached), "from_cache": True}
+
+    img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    boxes, lines, timings = _recognize_array(img_array, language, model_paths, page=page_index + 1)
+    result = {"page": page_index + 1, "lines": lines, "boxes": boxes, "timings": {"render": render_time, **timings}}
+    try:
+        cache.put(key, "json", json.dumps(result, ensure_ascii=False).encode("utf-8"))
+    except OSError as e:
+        logger.warning(f"写入 OCR 缓存失败: {e}")
+    return {**result, "from_cache": False}
@@ -59,7 +59,10 @@ async def on_enable():
     pass
 
 async def on_disable():
-    pass
+    # 释放识别进程池
+    from utils.process_pool import shutdown_process_pool
+    from .ocr_services import POOL_NAME
+    shutdown_process_pool(POOL_NAME)
 
 # 重新注入钩子
 manifest.on_enable = on_enable
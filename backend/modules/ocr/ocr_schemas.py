@@ -4,7 +4,7 @@ OCR 模块数据验证模型
 """
 
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 
@@ -21,6 +21,7 @@ class OCRResult(BaseModel):
     boxes: List[OCRBox] = Field(default=[], description="详细的文字检测框列表")
     confidence: float = Field(..., description="平均置信度")
     processing_time: float = Field(..., description="处理耗时（秒）")
+    timings: Dict[str, float] = Field(default={}, description="各阶段耗时（秒）：预处理、识别等")
 
 
 class OCRRecognizeRequest(BaseModel):
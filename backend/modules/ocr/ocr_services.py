@@ -3,31 +3,48 @@
 OCR 模块核心服务
 基于 RapidOCR 的离线图文识别
 支持中文、英文、西班牙语（拉丁语系）
+
+识别在进程池中执行（见 ocr_engine），每个工作进程持有自己的 RapidOCR 实例，PDF 各页分发到不同进程并行识别。
+结果写入有容量上限的磁盘缓存（system/ocr_cache），按内容摘要 + 语言 + 参数寻址，
+各模块、各 worker 共享且重启后仍然有效
 """
 
 import os
 import time
+import json
 import logging
 import base64
 import hashlib
-from io import BytesIO
+import tempfile
+import threading
+from functools import partial
 from typing import List, Dict, Any, Optional
 from pathlib import Path
 
+from utils.disk_cache import DiskCache
+from utils.process_pool import default_workers, get_process_pool
 from utils.storage import get_storage_manager
 
+from . import ocr_engine
+
 logger = logging.getLogger(__name__)
 storage_manager = get_storage_manager()
 
+# OCR 进程池
+POOL_NAME = "ocr"
+OCR_WORKERS = default_workers()
+# 缓存格式版本，结果结构变化时递增使旧条目失效
+CACHE_VERSION = 2
+# PDF 页面渲染倍率：为了性能和效果平衡，使用 2.0 倍率 (约 144 DPI)
+PDF_ZOOM = 2.0
+
 
 class OCRService:
     """OCR 识别服务（基于 RapidOCR）"""
     
-    _ocr_instances = {}  # 按语言缓存实例
     _initialized = False
-    _cache = {}          # 识别结果缓存 {md5: result}
-    _max_cache_size = 50 # 最大缓存数量
-    _max_image_size = 4000  # 图片最大边长（超过则压缩）
+    _models_lock = threading.Lock()
+    _result_cache: Optional[DiskCache] = None
     
     # 语言与对应识别模型的映射
     LANG_MODEL_MAP = {
@@ -35,6 +52,8 @@ class OCRService:
         "mixed": "ch_PP-OCRv4_rec_infer.onnx",
         "en": "en_PP-OCRv3_rec_infer.onnx",
     }
+    DET_MODEL = "ch_PP-OCRv4_det_infer.onnx"
+    CLS_MODEL = "ch_ppocr_mobile_v2.0_cls_infer.onnx"
     
     @classmethod
     def get_models_dir(cls) -> Path:
@@ -42,57 +61,86 @@ class OCRService:
         return storage_manager.get_module_dir("ocr", "ocr_models")
     
     @classmethod
-    def _get_ocr(cls, language: str = "ch"):
-        """
-        获取或初始化 RapidOCR 实例
-        首次调用时会自动下载对应语言的模型到 storage/modules/ocr/ocr_models/
-        """
+    def _resolve_language(cls, language: str) -> str:
         if language not in cls.LANG_MODEL_MAP:
             logger.warning(f"不支持的语言: {language}, 回退到中文模式")
-            language = "ch"
+            return "ch"
+        return language
+    
+    @classmethod
+    def _get_model_paths(cls, language: str) -> ocr_engine.ModelPaths:
+        """
+        准备指定语言的模型文件，返回 (检测, 识别, 方向分类) 模型路径
+        首次调用时会自动下载对应语言的模型到 storage/modules/ocr/ocr_models/，
+        在主进程中完成，工作进程只负责加载
+        """
+        if not cls.is_available():
+            raise RuntimeError("RapidOCR 模块未安装，请运行: pip install rapidocr-onnxruntime")
+        
+        models_dir = cls.get_models_dir()
+        det_model = models_dir / cls.DET_MODEL
+        rec_model = models_dir / cls.LANG_MODEL_MAP[language]
+        cls_model = models_dir / cls.CLS_MODEL
+        
+        with cls._models_lock:
+            models_dir.mkdir(parents=True, exist_ok=True)
+            # 检查并下载缺失的模型
+            needed_models = []
+            if not det_model.exists(): needed_models.append("det")
+            if not rec_model.exists(): needed_models.append(language)
+            if not cls_model.exists(): needed_models.append("cls")
             
-        if language not in cls._ocr_instances:
-            try:
-                from rapidocr_onnxruntime import RapidOCR
-                
-                models_dir = cls.get_models_dir()
-                models_dir.mkdir(parents=True, exist_ok=True)
-                
-                # 模型路径定义
-                det_model = models_dir / "ch_PP-OCRv4_det_infer.onnx"
-                rec_model_name = cls.LANG_MODEL_MAP[language]
-                rec_model = models_dir / rec_model_name
-                cls_model = models_dir / "ch_ppocr_mobile_v2.0_cls_infer.onnx"
-                
-                # 检查并下载缺失的模型
-                needed_models = []
-                if not det_model.exists(): needed_models.append("det")
-                if not rec_model.exists(): needed_models.append(language)
-                if not cls_model.exists(): needed_models.append("cls")
-                
-                if needed_models:
-                    logger.info(f"模型文件不完整 ({needed_models})，正在下载到项目目录...")
-                    cls._download_models(models_dir, needed_models)
-                
-                # 初始化 RapidOCR
-                logger.info(f"正在初始化 RapidOCR ({language})...")
-                cls._ocr_instances[language] = RapidOCR(
-                    det_model_path=str(det_model),
-                    rec_model_path=str(rec_model),
-                    cls_model_path=str(cls_model) if cls_model.exists() else None
-                )
-                
-                cls._initialized = True
-                logger.info(f"RapidOCR ({language}) 初始化完成")
-                
-            except ImportError as e:
-                logger.error(f"RapidOCR 未安装: {e}")
-                raise RuntimeError("RapidOCR 模块未安装，请运行: pip install rapidocr-onnxruntime")
-            except Exception as e:
-                logger.error(f"RapidOCR ({language}) 初始化失败: {e}")
-                raise
+            if needed_models:
+                logger.info(f"模型文件不完整 ({needed_models})，正在下载到项目目录...")
+                cls._download_models(models_dir, needed_models)
         
-        return cls._ocr_instances[language]
+        return str(det_model), str(rec_model), str(cls_model) if cls_model.exists() else None
+    
+    @classmethod
+    def _get_pool(cls):
+        return get_process_pool(POOL_NAME, OCR_WORKERS)
+    
+    @classmethod
+    def _get_cache(cls) -> DiskCache:
+        """识别结果磁盘缓存"""
+        from core.config import get_settings
+        root = get_storage_manager().get_system_dir("ocr_cache")
+        if cls._result_cache is None or cls._result_cache.root != root:
+            cls._result_cache = DiskCache(root, get_settings().ocr_cache_mb * 1024 * 1024)
+        return cls._result_cache
+    
+    @classmethod
+    def _options_key(cls, language: str, **options) -> str:
+        """语言、模型与识别参数，参与缓存寻址"""
+        return json.dumps({
+            "v": CACHE_VERSION,
+            "language": language,
+            "det": cls.DET_MODEL,
+            "rec": cls.LANG_MODEL_MAP[language],
+            **options
+        }, sort_keys=True)
+    
+    @classmethod
+    def _cache_key(cls, data: bytes, options_key: str) -> str:
+        digest = hashlib.sha256(data)
+        digest.update(b"\0" + options_key.encode("utf-8"))
+        return digest.hexdigest()
+    
+    @classmethod
+    def _cache_get(cls, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            data = cls._get_cache().get(key, "json")
+        except OSError as e:
+            logger.warning(f"读取 OCR 缓存失败: {e}")
+            return None
+        return json.loads(data) if data is not None else None
+    
+    @classmethod
+    def _cache_put(cls, key: str, result: Dict[str, Any]):
+        try:
+            cls._get_cache().put(key, "json", json.dumps(result, ensure_ascii=False).encode("utf-8"))
+        except OSError as e:
+            logger.warning(f"写入 OCR 缓存失败: {e}")
     
     @classmethod
     def _download_models(cls, target_dir: Path, languages: List[str]):
@@ -120,8 +168,8 @@ class OCRService:
         
         for key in languages:
             filename = cls.LANG_MODEL_MAP.get(key)
-            if key == "det": filename = "ch_PP-OCRv4_det_infer.onnx"
-            if key == "cls": filename = "ch_ppocr_mobile_v2.0_cls_infer.onnx"
+            if key == "det": filename = cls.DET_MODEL
+            if key == "cls": filename = cls.CLS_MODEL
             
             if not filename: continue
             
@@ -193,85 +241,24 @@ class OCRService:
         if image_data.startswith(b"%PDF"):
             return cls.recognize_pdf(image_data, detect_direction, language)
         
-        # 计算图片 MD5 用于缓存
-        cache_key = hashlib.md5(image_data + language.encode()).hexdigest()
+        language = cls._resolve_language(language)
+        cache_key = cls._cache_key(image_data, cls._options_key(language, max_size=ocr_engine.MAX_IMAGE_SIZE))
         
         # 检查缓存
-        if cache_key in cls._cache:
+        cached = cls._cache_get(cache_key)
+        if cached is not None:
             logger.info(f"命中缓存 ({language})")
-            cached = cls._cache[cache_key].copy()
             cached["from_cache"] = True
             return cached
-            
-        import numpy as np
-        from PIL import Image
-        
-        start_time = time.time()
-        
-        # 预处理图片
-        image = Image.open(BytesIO(image_data))
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-        
-        # 大图压缩（超过 4000px 自动缩放）
-        max_size = cls._max_image_size
-        if image.width > max_size or image.height > max_size:
-            ratio = min(max_size / image.width, max_size / image.height)
-            new_size = (int(image.width * ratio), int(image.height * ratio))
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-            logger.info(f"大图压缩: 原尺寸 {image.width}x{image.height} -> {new_size}")
-        
-        img_array = np.array(image)
         
-        # 获取对应语言的 OCR 实例
-        ocr = cls._get_ocr(language)
-        
-        try:
-            # 执行识别
-            result, elapse = ocr(img_array)
-        except Exception as e:
-            logger.error(f"RapidOCR ({language}) 识别异常: {e}")
-            raise RuntimeError(f"OCR识别引擎错误: {str(e)}")
-        
-        processing_time = time.time() - start_time
-        
-        # 解析结果
-        boxes = []
-        all_text = []
-        total_confidence = 0.0
-        
-        if result:
-            for item in result:
-                # item: [box, text, score]
-                if len(item) >= 3:
-                    box_coords = item[0]
-                    text = str(item[1])
-                    confidence = float(item[2]) if item[2] else 0.0
-                    
-                    boxes.append({
-                        "text": text,
-                        "confidence": confidence,
-                        "box": [[int(p[0]), int(p[1])] for p in box_coords]
-                    })
-                    all_text.append(text)
-                    total_confidence += confidence
-        
-        avg_confidence = total_confidence / len(boxes) if boxes else 0.0
-        
-        result_data = {
-            "text": "\n".join(all_text),
-            "boxes": boxes,
-            "confidence": round(avg_confidence, 4),
-            "processing_time": round(processing_time, 3)
-        }
+        model_paths = cls._get_model_paths(language)
+        result_data = cls._get_pool().submit(
+            ocr_engine.recognize_image_bytes, image_data, language, model_paths
+        ).result()
+        cls._initialized = True
         
         # 保存到缓存
-        if len(cls._cache) >= cls._max_cache_size:
-            # 移除最早的缓存
-            oldest_key = next(iter(cls._cache))
-            del cls._cache[oldest_key]
-        cls._cache[cache_key] = result_data.copy()
-        
+        cls._cache_put(cache_key, result_data)
         return result_data
 
     @classmethod
@@ -283,77 +270,100 @@ class OCRService:
     ) -> Dict[str, Any]:
         """
         识别 PDF 中的文字（将页面转为图片识别）
+
+        整份文档先按内容摘要查缓存；未命中时已有文字层的页面直接采用，
+        其余页面分发到进程池并行识别，每页再按渲染像素摘要查缓存，相同的扫描页在不同文档中只识别一次
         """
         try:
             import fitz  # PyMuPDF
-            import numpy as np
-            from PIL import Image
         except ImportError:
             raise RuntimeError("PDF 识别需要安装 pymupdf 库: pip install pymupdf")
 
+        language = cls._resolve_language(language)
+        options_key = cls._options_key(language, zoom=PDF_ZOOM)
+        cache_key = cls._cache_key(pdf_data, options_key)
+        cached = cls._cache_get(cache_key)
+        if cached is not None:
+            logger.info(f"命中缓存 ({language})")
+            cached["from_cache"] = True
+            return cached
+
         start_time = time.time()
+        cache = cls._get_cache()
         
-        all_text = []
-        all_boxes = []
-        total_confidence = 0.0
-        box_count = 0
-        
+        # 各工作进程按路径打开文档，避免把整份 PDF 随每页任务重复传输
+        fd, tmp_path = tempfile.mkstemp(suffix=".pdf")
         try:
-            doc = fitz.open(stream=pdf_data, filetype="pdf")
-            
-            # 为了性能和效果平衡，使用 2.0 倍率 (约 144 DPI)
-            zoom = 2.0
-            mat = fitz.Matrix(zoom, zoom)
-            
-            # 获取对应语言的 OCR 实例
-            ocr = cls._get_ocr(language)
-            
-            for page_index in range(len(doc)):
-                page = doc.load_page(page_index)
-                pix = page.get_pixmap(matrix=mat)
-                
-                # 转为 Image -> Numpy
-                img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                img_array = np.array(img)
-                
-                # 识别当前页
-                result, _ = ocr(img_array)
-                
-                if result:
-                    page_text = []
-                    for item in result:
-                        if len(item) >= 3:
-                            text = str(item[1])
-                            conf = float(item[2])
-                            
-                            page_text.append(text)
-                            all_boxes.append({
-                                "page": page_index + 1,
-                                "text": text,
-                                "confidence": conf,
-                                "box": [[int(p[0]), int(p[1])] for p in item[0]]
-                            })
-                            total_confidence += conf
-                            box_count += 1
-                    
-                    all_text.append(f"--- 第 {page_index + 1} 页 ---\n" + "\n".join(page_text))
+            with os.fdopen(fd, "wb") as f:
+                f.write(pdf_data)
             
-            doc.close()
+            # 已有文字层的页面直接采用，只把扫描页分发识别
+            with fitz.open(tmp_path) as doc:
+                page_count = doc.page_count
+                pages = {}
+                for page in doc:
+                    layer = ocr_engine.extract_text_layer(page, PDF_ZOOM)
+                    if layer is not None:
+                        pages[page.number] = layer
+            text_layer_time = time.time() - start_time
+            scan_pages = [i for i in range(page_count) if i not in pages]
             
+            if scan_pages:
+                model_paths = cls._get_model_paths(language)
+                recognized = cls._get_pool().map(
+                    partial(
+                        ocr_engine.recognize_pdf_page,
+                        tmp_path,
+                        zoom=PDF_ZOOM,
+                        language=language,
+                        model_paths=model_paths,
+                        cache_root=str(cache.root),
+                        cache_max_bytes=cache.max_bytes,
+                        options_key=options_key
+                    ),
+                    scan_pages
+                )
+                for page_index, page in zip(scan_pages, recognized):
+                    pages[page_index] = page
+                cls._initialized = True
+        except RuntimeError:
+            raise
         except Exception as e:
             logger.error(f"PDF OCR 识别异常: {e}")
             raise RuntimeError(f"PDF识别错误: {str(e)}")
-            
+        finally:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+        
+        all_text = []
+        all_boxes = []
+        timings = {"text_layer": round(text_layer_time, 3), "render": 0.0, "preprocess": 0.0, "ocr": 0.0}
+        for page_index in range(page_count):
+            page = pages[page_index]
+            if page["lines"]:
+                all_text.append(f"--- 第 {page['page']} 页 ---\n" + "\n".join(page["lines"]))
+                all_boxes.extend(page["boxes"])
+            # 命中页面缓存的页没有本次耗时
+            if not page.get("from_cache"):
+                for stage, seconds in page.get("timings", {}).items():
+                    timings[stage] = round(timings.get(stage, 0.0) + seconds, 3)
+        
         processing_time = time.time() - start_time
-        avg_confidence = total_confidence / box_count if box_count > 0 else 0.0
+        avg_confidence = sum(b["confidence"] for b in all_boxes) / len(all_boxes) if all_boxes else 0.0
         
-        return {
+        result_data = {
             "text": "\n\n".join(all_text),
             "boxes": all_boxes,
             "confidence": round(avg_confidence, 4),
             "processing_time": round(processing_time, 3),
-            "pages": len(all_text)
+            "pages": len(all_text),
+            "text_layer_pages": page_count - len(scan_pages),
+            "timings": timings
         }
+        cls._cache_put(cache_key, result_data)
+        return result_data
     
     @classmethod
     def recognize_from_base64(
@@ -389,8 +399,8 @@ class OCRService:
         for lang, model_file in cls.LANG_MODEL_MAP.items():
             downloaded[lang] = (models_dir / model_file).exists()
             
-        downloaded["detection"] = (models_dir / "ch_PP-OCRv4_det_infer.onnx").exists()
-        downloaded["classification"] = (models_dir / "ch_ppocr_mobile_v2.0_cls_infer.onnx").exists()
+        downloaded["detection"] = (models_dir / cls.DET_MODEL).exists()
+        downloaded["classification"] = (models_dir / cls.CLS_MODEL).exists()
         
         return {
             "available": cls.is_available(),
@@ -398,5 +408,6 @@ class OCRService:
             "models_dir": str(models_dir),
             "models_downloaded": downloaded,
             "engine": "RapidOCR",
+            "workers": OCR_WORKERS,
             "supported_languages": list(cls.LANG_MODEL_MAP.keys())
         }
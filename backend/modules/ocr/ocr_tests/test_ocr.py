@@ -80,3 +80,188 @@ class TestOCRManifest:
         from modules.ocr.ocr_manifest import manifest
         assert manifest.id == "ocr"
         assert manifest.enabled is True
+
+
+# ==================== 进程池与结果缓存测试 ====================
+def _make_pdf(path, lines, title="", scanned=True):
+    """生成测试 PDF；scanned 为真时每页只有一张图片（无文字层），模拟扫描件"""
+    import fitz
+    doc = fitz.open()
+    for text in lines:
+        page = doc.new_page(width=300, height=200)
+        if scanned:
+            with fitz.open() as src:
+                src_page = src.new_page(width=300, height=200)
+                src_page.insert_text((30, 60), text, fontsize=20)
+                page.insert_image(page.rect, pixmap=src_page.get_pixmap())
+        else:
+            page.insert_text((30, 60), text)
+    doc.set_metadata({"title": title})
+    doc.save(str(path))
+    doc.close()
+    return path.read_bytes()
+
+
+class TestOCRCache:
+    def test_cache_key_depends_on_language_and_options(self):
+        """测试缓存键区分内容、语言与参数"""
+        from modules.ocr.ocr_services import OCRService
+        ch = OCRService._options_key("ch", zoom=2.0)
+        assert OCRService._cache_key(b"a", ch) == OCRService._cache_key(b"a", OCRService._options_key("ch", zoom=2.0))
+        assert OCRService._cache_key(b"a", ch) != OCRService._cache_key(b"b", ch)
+        assert OCRService._cache_key(b"a", ch) != OCRService._cache_key(b"a", OCRService._options_key("en", zoom=2.0))
+        assert OCRService._cache_key(b"a", ch) != OCRService._cache_key(b"a", OCRService._options_key("ch", zoom=3.0))
+
+    async def test_image_result_survives_restart(self, tmp_workspace):
+        """测试图片结果落盘：清空进程内状态后仍命中，无需识别引擎"""
+        from modules.ocr import ocr_engine
+        from modules.ocr.ocr_services import OCRService
+        image_data = b"\x89PNG fake image"
+        key = OCRService._cache_key(
+            image_data, OCRService._options_key("ch", max_size=ocr_engine.MAX_IMAGE_SIZE)
+        )
+        OCRService._cache_put(key, {"text": "合同", "boxes": [], "confidence": 0.9, "processing_time": 1.2})
+
+        OCRService._result_cache = None
+        result = OCRService.recognize_image(image_data, language="ch")
+        assert result["text"] == "合同"
+        assert result["from_cache"] is True
+
+    async def test_pdf_page_cache_keyed_by_pixels(self, tmp_workspace, tmp_path):
+        """测试 PDF 页面缓存按渲染像素寻址：相同页面出现在不同文档中也命中"""
+        import json
+        import fitz
+        from modules.ocr import ocr_engine
+        from modules.ocr.ocr_services import OCRService, PDF_ZOOM
+
+        _make_pdf(tmp_path / "a.pdf", ["Contract"], title="A")
+        _make_pdf(tmp_path / "b.pdf", ["Contract"], title="B")
+        assert (tmp_path / "a.pdf").read_bytes() != (tmp_path / "b.pdf").read_bytes()
+
+        cache = OCRService._get_cache()
+        options_key = OCRService._options_key("ch", zoom=PDF_ZOOM)
+        with fitz.open(tmp_path / "a.pdf") as doc:
+            pix = doc.load_page(0).get_pixmap(matrix=fitz.Matrix(PDF_ZOOM, PDF_ZOOM), alpha=False)
+        key = ocr_engine.page_cache_key(pix.samples, pix.width, pix.height, options_key)
+        cache.put(key, "json", json.dumps({"page": 1, "lines": ["Contract"], "boxes": []}).encode())
+
+        result = ocr_engine.recognize_pdf_page(
+            str(tmp_path / "b.pdf"), 0, PDF_ZOOM, "ch", ("det", "rec", None),
+            str(cache.root), cache.max_bytes, options_key
+        )
+        assert result["from_cache"] is True
+        assert result["lines"] == ["Contract"]
+
+    async def test_pdf_pages_fan_out_and_document_cache(self, tmp_workspace, tmp_path, monkeypatch):
+        """测试 PDF 各页分发到进程池并按页序汇总，整份结果再写入文档级缓存"""
+        import json
+        import fitz
+        from modules.ocr import ocr_engine, ocr_services
+        from modules.ocr.ocr_services import OCRService, PDF_ZOOM
+        from utils.process_pool import shutdown_process_pool
+
+        pdf_data = _make_pdf(tmp_path / "scan.pdf", ["one", "two", "three"])
+        cache = OCRService._get_cache()
+        options_key = OCRService._options_key("ch", zoom=PDF_ZOOM)
+        # 预置各页结果，工作进程全部命中页面缓存，不加载识别模型
+        with fitz.open(tmp_path / "scan.pdf") as doc:
+            for page in doc:
+                pix = page.get_pixmap(matrix=fitz.Matrix(PDF_ZOOM, PDF_ZOOM), alpha=False)
+                key = ocr_engine.page_cache_key(pix.samples, pix.width, pix.height, options_key)
+                text = ["one", "two", "three"][page.number]
+                box = {"page": page.number + 1, "text": text, "confidence": 0.5 + page.number * 0.1, "box": []}
+                cache.put(key, "json", json.dumps({"page": page.number + 1, "lines": [text], "boxes": [box]}).encode())
+
+        monkeypatch.setattr(OCRService, "_get_model_paths", classmethod(lambda cls, language: ("det", "rec", None)))
+        monkeypatch.setattr(ocr_services, "OCR_WORKERS", 2)
+        shutdown_process_pool(ocr_services.POOL_NAME)
+        try:
+            result = OCRService.recognize_pdf(pdf_data, language="ch")
+        finally:
+            shutdown_process_pool(ocr_services.POOL_NAME)
+        assert result["text"] == "--- 第 1 页 ---\none\n\n--- 第 2 页 ---\ntwo\n\n--- 第 3 页 ---\nthree"
+        assert [b["page"] for b in result["boxes"]] == [1, 2, 3]
+        assert result["confidence"] == 0.6
+        assert result["pages"] == 3
+
+        again = OCRService.recognize_pdf(pdf_data, language="ch")
+        assert again["from_cache"] is True
+        assert again["text"] == result["text"]
+
+
+# ==================== 自适应预处理测试 ====================
+def _text_image(width, height, lines, origin=(60, 80), font_scale=1.0):
+    """白底图片，从 origin 开始逐行绘制文字"""
+    import cv2
+    import numpy as np
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    x, y = origin
+    for text in lines:
+        cv2.putText(img, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0, 0, 0), 2)
+        y += int(40 * font_scale)
+    return img
+
+
+class TestOCRPreprocess:
+    def test_blank_page_has_no_text(self):
+        """测试空白页不做识别"""
+        import numpy as np
+        from modules.ocr import ocr_engine
+        blank = np.full((2800, 2000, 3), 255, dtype=np.uint8)
+        assert ocr_engine.analyze_layout(blank) == (None, [])
+
+    def test_sparse_page_is_cropped_to_text(self):
+        """测试大片空白的扫描页只保留文字区域，文字高度估计合理"""
+        from modules.ocr import ocr_engine
+        img = _text_image(2000, 2800, ["INVOICE 2024-001", "Total amount 1200", "Signed by ACME"], font_scale=2.0)
+        text_height, regions = ocr_engine.analyze_layout(img)
+        assert 20 <= text_height <= 80
+        assert regions
+        area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in regions)
+        assert area < 2000 * 2800 * ocr_engine.CROP_AREA_RATIO
+        # 区域覆盖全部文字
+        x0, y0 = min(r[0] for r in regions), min(r[1] for r in regions)
+        x1, y1 = max(r[2] for r in regions), max(r[3] for r in regions)
+        assert x0 <= 60 and y0 <= 40 and y1 >= 80 + 80 * 2 and x1 >= 600
+
+    def test_choose_scale(self):
+        """测试缩放档位：文字越大缩得越小，文字高度不低于下限，最长边受限"""
+        from modules.ocr import ocr_engine
+        assert ocr_engine.choose_scale(100, 2000, 2000) == 0.25
+        assert ocr_engine.choose_scale(40, 2000, 2000) == 0.75
+        assert ocr_engine.choose_scale(20, 2000, 2000) == 1.0
+        assert ocr_engine.choose_scale(20, 10000, 2000) == 0.4
+
+    def test_blank_image_skips_engine(self):
+        """测试空白图片直接返回空结果并记录各阶段耗时（不加载识别模型）"""
+        import io
+        from PIL import Image
+        from modules.ocr import ocr_engine
+        buffer = io.BytesIO()
+        Image.new("RGB", (1200, 1600), "white").save(buffer, format="PNG")
+        result = ocr_engine.recognize_image_bytes(buffer.getvalue(), "ch", ("det", "rec", None))
+        assert result["text"] == ""
+        assert set(result["timings"]) == {"decode", "preprocess", "ocr"}
+
+    async def test_pdf_text_layer_pages_skip_ocr(self, tmp_workspace, tmp_path):
+        """测试已有文字层的 PDF 页面直接采用，不需要识别引擎"""
+        from modules.ocr.ocr_services import OCRService, PDF_ZOOM
+        line = "This contract is made between the parties listed below"
+        pdf_data = _make_pdf(tmp_path / "text.pdf", [line, line], scanned=False)
+        result = OCRService.recognize_pdf(pdf_data, language="ch")
+        assert result["text_layer_pages"] == 2
+        assert result["text"] == f"--- 第 1 页 ---\n{line}\n\n--- 第 2 页 ---\n{line}"
+        assert result["boxes"][0]["confidence"] == 1.0
+        # 检测框与识别结果一样使用渲染后的页面坐标
+        (x, y) = result["boxes"][0]["box"][0]
+        assert 30 * PDF_ZOOM - 2 <= x <= 30 * PDF_ZOOM + 2
+        assert "text_layer" in result["timings"]
+
+    def test_short_text_on_scan_is_not_text_layer(self, tmp_path):
+        """测试扫描页上只有少量文字（页眉/水印）时仍按扫描页识别"""
+        import fitz
+        from modules.ocr import ocr_engine
+        _make_pdf(tmp_path / "scan.pdf", ["body"])
+        with fitz.open(tmp_path / "scan.pdf") as doc:
+            doc[0].insert_text((10, 15), "Page 1", fontsize=8)
+            assert ocr_engine.extract_text_layer(doc[0], 2.0) is None
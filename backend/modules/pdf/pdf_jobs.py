@@ -0,0 +1,469 @@
+"""
+PDF 转换任务
+
+压缩、合并、拆分、加水印及 PDF 转图片 / Word / Excel 以任务方式执行，不在请求处理中同步计算：
+- 逐页类操作按页码分段提交到进程池（见 pdf_workers），主进程按段序汇总并边收边写盘，
+  在途分段数受限，内存占用与总页数无关；
+- 输出先写入同目录的临时文件，成功后原子替换为目标文件，失败或取消不会留下半成品；
+- 状态与进度通过 WebSocket（pdf_job）推送给本人，任务可随时取消；
+- 同一用户以相同输入内容与参数提交的任务合并为同一个任务，已完成且输出仍在的直接复用结果。
+
+任务状态保存在当前进程内存中，完成后保留 JOB_RETENTION_SECONDS 供查询
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+import zipfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import fitz  # PyMuPDF
+
+from core import database
+from utils.blob_store import hash_file
+from utils.process_pool import default_workers, get_process_pool, pool_size
+
+from . import pdf_workers
+
+logger = logging.getLogger(__name__)
+
+# 任务进程池
+POOL_NAME = "pdf_jobs"
+JOB_WORKERS = default_workers()
+# 每个分段的最大页数（图片压缩时为图片数）
+CHUNK_SIZE = 8
+# 已结束任务的保留时间（秒）与保留上限
+JOB_RETENTION_SECONDS = 3600
+MAX_FINISHED_JOBS = 200
+
+# 支持的操作及失败提示前缀（与原同步接口的错误信息保持一致）
+JOB_OPERATIONS = {
+    "merge": "合并",
+    "split": "拆分",
+    "compress": "压缩",
+    "watermark": "添加水印",
+    "pdf2img": "转换",
+    "pdf2word": "转换",
+    "pdf2excel": "转换",
+}
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_SUCCESS = "success"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+
+class PdfJobCancelled(ValueError):
+    """任务被用户取消"""
+
+    def __init__(self):
+        super().__init__("任务已取消")
+
+
+@dataclass
+class PdfJob:
+    """PDF 转换任务"""
+    id: str
+    user_id: int
+    operation: str
+    key: str
+    status: str = JOB_PENDING
+    done: int = 0
+    total: int = 0
+    result: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    cancel_event: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_SUCCESS, JOB_FAILED, JOB_CANCELLED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "operation": self.operation,
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "path": self.result,
+            "error": self.error,
+        }
+
+    async def wait(self) -> str:
+        """
+        等待任务结束并返回输出路径
+
+        调用方被取消不会影响任务本身；任务失败抛出 ValueError，被取消抛出 PdfJobCancelled
+        """
+        await asyncio.shield(self.task)
+        if self.status == JOB_SUCCESS:
+            return self.result
+        if self.status == JOB_CANCELLED:
+            raise PdfJobCancelled()
+        raise ValueError(self.error)
+
+
+class JobContext:
+    """传给任务执行函数的上下文：进度上报、取消检查与进程池调度"""
+
+    def __init__(self, runner: "PdfJobRunner", job: PdfJob):
+        self.runner = runner
+        self.job = job
+
+    def check_cancelled(self):
+        if self.job.cancel_event.is_set():
+            raise PdfJobCancelled()
+
+    async def progress(self, done: int, total: Optional[int] = None):
+        self.job.done = done
+        if total is not None:
+            self.job.total = total
+        await self.runner.notify(self.job)
+
+    async def _wait(self, futures, return_when=asyncio.FIRST_COMPLETED):
+        """等待进程池结果，期间每 0.5 秒检查一次取消标记"""
+        while True:
+            self.check_cancelled()
+            done, pending = await asyncio.wait(futures, timeout=0.5, return_when=return_when)
+            if done:
+                return done, pending
+
+    async def call(self, func: Callable, *args) -> Any:
+        """在进程池中执行单个整文档任务"""
+        loop = asyncio.get_running_loop()
+        await self.progress(0, 1)
+        future = loop.run_in_executor(get_process_pool(POOL_NAME, JOB_WORKERS), func, *args)
+        try:
+            await self._wait({future})
+        finally:
+            future.cancel()
+        result = future.result()
+        await self.progress(1)
+        return result
+
+    async def map_chunks(
+        self,
+        func: Callable,
+        path: str,
+        items: Sequence[int],
+        *args,
+        on_result: Callable[[Any], Awaitable[None]]
+    ):
+        """
+        把 items（页码或图片 xref）分段并行执行 func(path, 分段, *args)，按段序逐段交给 on_result
+
+        后完成的前序分段到达前，已完成的分段在内存中等待；在途分段数为进程数的两倍
+        """
+        loop = asyncio.get_running_loop()
+        pool = get_process_pool(POOL_NAME, JOB_WORKERS)
+        workers = pool_size(pool)
+        # 文档较小时缩小分段，让每个进程都分到页面
+        size = max(1, min(CHUNK_SIZE, -(-len(items) // workers)))
+        chunks = [list(items[i:i + size]) for i in range(0, len(items), size)]
+        window = workers * 2
+
+        await self.progress(0, len(items))
+        in_flight: Dict[asyncio.Future, int] = {}
+        ready: Dict[int, Any] = {}
+        next_submit = next_write = processed = 0
+        try:
+            while next_write < len(chunks):
+                while next_submit < len(chunks) and next_submit - next_write < window:
+                    future = loop.run_in_executor(pool, func, path, chunks[next_submit], *args)
+                    in_flight[future] = next_submit
+                    next_submit += 1
+
+                done, _ = await self._wait(set(in_flight))
+                for future in done:
+                    ready[in_flight.pop(future)] = future.result()
+
+                while next_write in ready:
+                    await on_result(ready.pop(next_write))
+                    processed += len(chunks[next_write])
+                    next_write += 1
+                    await self.progress(processed)
+        finally:
+            # 取消尚未开始的分段，已在子进程中运行的分段完成后丢弃
+            for future in in_flight:
+                future.cancel()
+
+
+# 任务执行函数：(上下文, 临时输出路径)
+JobRun = Callable[[JobContext, str], Awaitable[None]]
+# 任务完成后的收尾（记录历史、注册到文件管理器）：(数据库会话, 输出路径)
+JobFinalize = Callable[[Any, str], Awaitable[None]]
+
+
+class PdfJobRunner:
+    """PDF 任务调度器"""
+
+    def __init__(self):
+        self._jobs: Dict[str, PdfJob] = {}
+        self._keys: Dict[str, str] = {}
+        # 输入文件摘要缓存：(路径, 大小, mtime) -> sha256
+        self._digests: Dict[Tuple[str, int, int], str] = {}
+
+    async def _digest(self, path: str) -> str:
+        st = await asyncio.to_thread(os.stat, path)
+        cache_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        digest = self._digests.get(cache_key)
+        if digest is None:
+            digest = await asyncio.to_thread(hash_file, path)
+            if len(self._digests) > 1024:
+                self._digests.clear()
+            self._digests[cache_key] = digest
+        return digest
+
+    async def make_key(self, user_id: int, operation: str, inputs: Sequence[str], options: Dict[str, Any]) -> str:
+        """任务去重键：用户 + 操作 + 输入内容摘要 + 参数"""
+        digests = [await self._digest(p) for p in inputs]
+        raw = json.dumps(
+            {"user_id": user_id, "operation": operation, "inputs": digests, "options": options},
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def notify(self, job: PdfJob):
+        """推送任务状态给本人，推送失败不影响任务"""
+        try:
+            from core.ws_manager import manager
+            await manager.send_personal_message({"type": "pdf_job", "data": job.to_dict()}, job.user_id)
+        except Exception:
+            pass
+
+    async def submit(
+        self,
+        user_id: int,
+        operation: str,
+        inputs: Sequence[str],
+        options: Dict[str, Any],
+        output_path: str,
+        run: JobRun,
+        finalize: Optional[JobFinalize] = None
+    ) -> PdfJob:
+        """
+        提交任务
+
+        Args:
+            inputs: 输入文件路径，按内容参与去重
+            options: 影响输出的参数，参与去重
+            output_path: 最终输出路径
+            run: 执行函数，把结果写入传入的临时路径
+            finalize: 成功后在独立数据库会话中执行的收尾
+        """
+        if operation not in JOB_OPERATIONS:
+            raise ValueError(f"不支持的任务类型: {operation}")
+        key = await self.make_key(user_id, operation, inputs, {**options, "output": str(output_path)})
+
+        existing = self._jobs.get(self._keys.get(key, ""))
+        if existing is not None:
+            if not existing.finished:
+                return existing
+            if existing.status == JOB_SUCCESS and os.path.exists(existing.result):
+                return existing
+
+        job = PdfJob(id=uuid.uuid4().hex, user_id=user_id, operation=operation, key=key)
+        self._jobs[job.id] = job
+        self._keys[key] = job.id
+        job.task = asyncio.create_task(self._execute(job, str(output_path), run, finalize))
+        self._prune()
+        return job
+
+    async def _execute(self, job: PdfJob, output_path: str, run: JobRun, finalize: Optional[JobFinalize]):
+        target = Path(output_path)
+        # 临时文件与目标同目录（保证原子替换），保留扩展名
+        tmp_path = str(target.with_name(f".{job.id}.{target.name}"))
+        job.status = JOB_RUNNING
+        await self.notify(job)
+        try:
+            await run(JobContext(self, job), tmp_path)
+            await asyncio.to_thread(os.replace, tmp_path, output_path)
+            if finalize is not None:
+                async with database.get_db_session() as db:
+                    await finalize(db, output_path)
+            job.result = output_path
+            job.status = JOB_SUCCESS
+        except PdfJobCancelled:
+            job.status = JOB_CANCELLED
+        except asyncio.CancelledError:
+            job.status = JOB_CANCELLED
+            raise
+        except Exception as e:
+            logger.error(f"PDF 任务失败 ({job.operation}): {e}")
+            job.status = JOB_FAILED
+            job.error = f"{JOB_OPERATIONS[job.operation]}失败: {e}"
+        finally:
+            job.finished_at = time.time()
+            if job.status != JOB_SUCCESS:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+            await self.notify(job)
+
+    def _prune(self):
+        now = time.time()
+        finished = sorted(
+            (j for j in self._jobs.values() if j.finished),
+            key=lambda j: j.finished_at
+        )
+        excess = len(finished) - MAX_FINISHED_JOBS
+        for i, job in enumerate(finished):
+            if i >= excess and now - job.finished_at < JOB_RETENTION_SECONDS:
+                break
+            self._jobs.pop(job.id, None)
+            if self._keys.get(job.key) == job.id:
+                self._keys.pop(job.key, None)
+
+    def get(self, job_id: str, user_id: int) -> Optional[PdfJob]:
+        job = self._jobs.get(job_id)
+        return job if job is not None and job.user_id == user_id else None
+
+    def list(self, user_id: int) -> List[PdfJob]:
+        """本人的任务，最新的在前"""
+        jobs = [j for j in self._jobs.values() if j.user_id == user_id]
+        return sorted(jobs, key=lambda j: j.created_at, reverse=True)
+
+    def cancel(self, job_id: str, user_id: int) -> Optional[PdfJob]:
+        """请求取消任务；已结束的任务不受影响"""
+        job = self.get(job_id, user_id)
+        if job is not None and not job.finished:
+            job.cancel_event.set()
+        return job
+
+
+_runner: Optional[PdfJobRunner] = None
+
+
+def get_job_runner() -> PdfJobRunner:
+    """获取任务调度器单例"""
+    global _runner
+    if _runner is None:
+        _runner = PdfJobRunner()
+    return _runner
+
+
+# ==================== 任务执行函数 ====================
+
+def get_page_count(path: str) -> int:
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def _collect_images(path: str) -> Dict[int, int]:
+    """文档中的图片 xref 及其首次出现的页码"""
+    images: Dict[int, int] = {}
+    with fitz.open(path) as doc:
+        for page in doc:
+            for img in page.get_images():
+                images.setdefault(img[0], page.number)
+    return images
+
+
+async def compress_document(ctx: JobContext, src: str, dst: str, level: int):
+    """
+    压缩 PDF
+
+    level 1 仅清理冗余对象；level >= 2 并行把图片重新编码为 JPEG，level >= 3 同时缩放大图
+    """
+    doc = await asyncio.to_thread(fitz.open, src)
+    try:
+        if level >= 2:
+            images = await asyncio.to_thread(_collect_images, src)
+
+            def apply(results: List[Tuple[int, bytes]]):
+                for xref, data in results:
+                    # replace_image 按 JPEG 写入图片对象（DCTDecode），直接改写流会被当作原始像素
+                    doc.load_page(images[xref]).replace_image(xref, stream=data)
+
+            async def on_result(results):
+                await asyncio.to_thread(apply, results)
+
+            await ctx.map_chunks(pdf_workers.compress_images, src, list(images), level, on_result=on_result)
+        ctx.check_cancelled()
+        # garbage=4: 去重内容与流并清理未引用对象
+        await asyncio.to_thread(doc.save, dst, garbage=4, deflate=True)
+    finally:
+        doc.close()
+
+
+async def render_document_images(ctx: JobContext, src: str, dst: str, pages: Optional[List[int]], zoom: float = 2.0):
+    """PDF 转图片：按页并行渲染，按页序边收边写入 zip"""
+    if pages is None:
+        pages = list(range(await asyncio.to_thread(get_page_count, src)))
+    zf = zipfile.ZipFile(dst, "w", zipfile.ZIP_DEFLATED)
+    try:
+        def write(results: List[Tuple[int, bytes]]):
+            for i, data in results:
+                zf.writestr(f"page_{i+1:03d}.png", data)
+
+        async def on_result(results):
+            await asyncio.to_thread(write, results)
+
+        await ctx.map_chunks(pdf_workers.render_pages, src, pages, zoom, on_result=on_result)
+    finally:
+        await asyncio.to_thread(zf.close)
+
+
+async def document_to_word(ctx: JobContext, src: str, dst: str):
+    """PDF 转 Word：pdf2docx 可用时保留版式整文档转换，否则并行提取文本生成简单文档"""
+    import importlib.util
+    if importlib.util.find_spec("pdf2docx") is not None:
+        await ctx.call(pdf_workers.convert_docx, src, dst)
+        return
+
+    from docx import Document
+    word_doc = Document()
+
+    async def on_result(results: List[Tuple[int, str]]):
+        for page_num, text in results:
+            if page_num > 0:
+                word_doc.add_page_break()
+            word_doc.add_paragraph(text)
+
+    pages = list(range(await asyncio.to_thread(get_page_count, src)))
+    await ctx.map_chunks(pdf_workers.extract_text, src, pages, on_result=on_result)
+    await asyncio.to_thread(word_doc.save, dst)
+
+
+async def document_to_excel(ctx: JobContext, src: str, dst: str, pages: Optional[List[int]]):
+    """PDF 转 Excel：按页并行提取表格，以只写模式逐行写入工作表"""
+    from openpyxl import Workbook
+
+    if pages is None:
+        pages = list(range(await asyncio.to_thread(get_page_count, src)))
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("表格数据")
+
+    def write(results):
+        for page_num, tables, text in results:
+            if tables:
+                for rows in tables:
+                    # 写入表头分隔
+                    ws.append([f"--- 第 {page_num + 1} 页表格 ---"])
+                    for row_data in rows:
+                        ws.append([cell_value or "" for cell_value in row_data])
+                    ws.append([])  # 表格之间空一行
+            elif text.strip():
+                # Fallback: 未检测到表格时写入纯文本
+                ws.append([f"--- 第 {page_num + 1} 页文本（未检测到表格）---"])
+                for line in text.split('\n'):
+                    if line.strip():
+                        ws.append([line.strip()])
+                ws.append([])
+
+    async def on_result(results):
+        await asyncio.to_thread(write, results)
+
+    await ctx.map_chunks(pdf_workers.extract_tables, src, pages, on_result=on_result)
+    await asyncio.to_thread(wb.save, dst)
@@ -0,0 +1,193 @@
+"""
+PDF 页面渲染
+
+渲染在独立进程池中执行，不阻塞事件循环。每个工作进程按 (路径, mtime) 维护已打开文档的 LRU，
+连续翻页不再重复解析文件；文件被修改后 mtime 变化，旧文档自然失效。
+
+渲染结果写入有容量上限的磁盘缓存，按 (文件, 页码, 缩放, 格式) 寻址，超限时淘汰最久未访问的条目。
+返回当前页后在后台预取相邻页面；同一页面的并发请求合并为一次渲染。
+
+本模块会在进程池子进程中导入，模块级只依赖 PyMuPDF
+"""
+
+import os
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+import fitz  # PyMuPDF
+
+from utils.disk_cache import DiskCache
+from utils.process_pool import default_workers, get_process_pool
+
+logger = logging.getLogger(__name__)
+
+# 渲染进程池
+RENDER_POOL = "pdf_render"
+RENDER_WORKERS = default_workers(4)
+# 每个工作进程保留的已打开文档数
+DOC_CACHE_SIZE = 8
+# 预取范围：向后 / 向前页数
+PREFETCH_AHEAD = 2
+PREFETCH_BEHIND = 1
+# JPEG 输出质量
+JPEG_QUALITY = 85
+# 支持的输出格式及 MIME 类型
+RENDER_FORMATS = {"png": "image/png", "jpeg": "image/jpeg"}
+
+# 工作进程内的已打开文档 LRU
+_documents: "OrderedDict[Tuple[str, int], fitz.Document]" = OrderedDict()
+
+
+def _open_document(path: str, mtime_ns: int) -> "fitz.Document":
+    key = (path, mtime_ns)
+    doc = _documents.get(key)
+    if doc is not None:
+        _documents.move_to_end(key)
+        return doc
+    doc = fitz.open(path)
+    _documents[key] = doc
+    while len(_documents) > DOC_CACHE_SIZE:
+        _, old = _documents.popitem(last=False)
+        old.close()
+    return doc
+
+
+def render_page_image(path: str, mtime_ns: int, page_num: int, zoom: float, fmt: str) -> Tuple[bytes, int]:
+    """
+    渲染单页（在进程池子进程中执行）
+
+    Returns:
+        (图片数据, 文档总页数)
+    """
+    doc = _open_document(path, mtime_ns)
+    if page_num < 0 or page_num >= doc.page_count:
+        raise ValueError(f"页码超出范围 (0-{doc.page_count-1})")
+    pix = doc.load_page(page_num).get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    if fmt == "jpeg":
+        return pix.tobytes("jpeg", jpg_quality=JPEG_QUALITY), doc.page_count
+    return pix.tobytes("png"), doc.page_count
+
+
+class RenderCache(DiskCache):
+    """
+    磁盘渲染缓存
+
+    按 (文件, 页码, 缩放, 格式) 寻址，条目后缀为输出格式；容量淘汰见 DiskCache
+    """
+
+    @staticmethod
+    def make_key(path: str, st: os.stat_result, page_num: int, zoom: float, fmt: str) -> str:
+        # 文件以路径 + 大小 + mtime 标识，内容变化后旧条目不再命中，由容量淘汰回收
+        raw = f"{path}\0{st.st_size}\0{st.st_mtime_ns}\0{page_num}\0{zoom:.3f}\0{fmt}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class PageRenderer:
+    """PDF 页面渲染器：磁盘缓存 + 进程池渲染 + 请求合并 + 相邻页预取"""
+
+    def __init__(self):
+        self._cache: Optional[RenderCache] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._prefetching: Set[asyncio.Task] = set()
+        self._page_counts: Dict[Tuple[str, int], int] = {}
+
+    @property
+    def cache(self) -> RenderCache:
+        from core.config import get_settings
+        from utils.storage import get_storage_manager
+        root = get_storage_manager().get_system_dir("pdf_render_cache")
+        if self._cache is None or self._cache.root != root:
+            self._cache = RenderCache(root, get_settings().pdf_render_cache_mb * 1024 * 1024)
+        return self._cache
+
+    async def _render_uncached(self, key: str, path: str, st: os.stat_result,
+                               page_num: int, zoom: float, fmt: str, cache: RenderCache) -> bytes:
+        loop = asyncio.get_running_loop()
+        data, page_count = await loop.run_in_executor(
+            get_process_pool(RENDER_POOL, RENDER_WORKERS),
+            render_page_image, path, st.st_mtime_ns, page_num, zoom, fmt
+        )
+        if len(self._page_counts) > 1024:
+            self._page_counts.clear()
+        self._page_counts[(path, st.st_mtime_ns)] = page_count
+        try:
+            await asyncio.to_thread(cache.put, key, fmt, data)
+        except OSError as e:
+            logger.warning(f"写入 PDF 渲染缓存失败: {e}")
+        return data
+
+    async def _get(self, path: str, st: os.stat_result, page_num: int, zoom: float, fmt: str) -> bytes:
+        cache = self.cache
+        key = cache.make_key(path, st, page_num, zoom, fmt)
+        task = self._inflight.get(key)
+        if task is None:
+            data = await asyncio.to_thread(cache.get, key, fmt)
+            if data is not None:
+                return data
+            task = self._inflight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._render_uncached(key, path, st, page_num, zoom, fmt, cache))
+                self._inflight[key] = task
+                task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _prefetch_page(self, path: str, st: os.stat_result, page_num: int, zoom: float, fmt: str):
+        cache = self.cache
+        key = cache.make_key(path, st, page_num, zoom, fmt)
+        try:
+            if key in self._inflight or await asyncio.to_thread(cache.contains, key, fmt):
+                return
+            await self._get(path, st, page_num, zoom, fmt)
+        except Exception as e:
+            logger.debug(f"预取 PDF 页面失败: {path}#{page_num}, {e}")
+
+    def _schedule_prefetch(self, path: str, st: os.stat_result, page_num: int, zoom: float, fmt: str):
+        page_count = self._page_counts.get((path, st.st_mtime_ns))
+        if page_count is None:
+            return
+        # 预取只使用空闲的渲染进程，不与用户请求争抢
+        budget = RENDER_WORKERS - len(self._inflight)
+        neighbours = [page_num + i for i in range(1, PREFETCH_AHEAD + 1)]
+        neighbours += [page_num - i for i in range(1, PREFETCH_BEHIND + 1)]
+        for target in neighbours:
+            if budget <= 0:
+                break
+            if 0 <= target < page_count:
+                task = asyncio.ensure_future(self._prefetch_page(path, st, target, zoom, fmt))
+                self._prefetching.add(task)
+                task.add_done_callback(self._prefetching.discard)
+                budget -= 1
+
+    async def render(self, path: str, page_num: int, zoom: float = 2.0, fmt: str = "png", prefetch: bool = True) -> bytes:
+        """
+        渲染指定页面
+
+        Args:
+            path: PDF 绝对路径
+            page_num: 页码（从 0 开始）
+            zoom: 缩放比例
+            fmt: 输出格式（png / jpeg）
+            prefetch: 是否在后台预取相邻页面
+        """
+        if fmt not in RENDER_FORMATS:
+            raise ValueError(f"不支持的输出格式: {fmt}")
+        path = os.path.abspath(path)
+        st = await asyncio.to_thread(os.stat, path)
+        data = await self._get(path, st, page_num, zoom, fmt)
+        if prefetch:
+            self._schedule_prefetch(path, st, page_num, zoom, fmt)
+        return data
+
+
+_renderer: Optional[PageRenderer] = None
+
+
+def get_page_renderer() -> PageRenderer:
+    """获取页面渲染器单例"""
+    global _renderer
+    if _renderer is None:
+        _renderer = PageRenderer()
+    return _renderer
@@ -43,6 +43,8 @@ from .pdf_schemas import (
     PdfSaveTextRequest
 )
 from .pdf_services import PdfService
+from .pdf_render import RENDER_FORMATS
+from .pdf_jobs import get_job_runner
 
 logger = logging.getLogger(__name__)
 
@@ -238,11 +240,12 @@ async def render_page(
     path: Optional[str] = Query(None, description="逻辑存储路径 (用于虚拟挂载文件)"),
     page: int = Query(0, ge=0, description="页码"),
     zoom: float = Query(2.0, ge=0.5, le=5.0, description="缩放比例"),
+    format: str = Query("png", pattern="^(png|jpeg)$", description="图片格式"),
     source: str = Query("filemanager"),
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(get_current_user)
 ):
-    """将 PDF 某页渲染为 PNG 图片返回"""
+    """将 PDF 某页渲染为图片返回（默认 PNG）"""
     try:
         if file_id is not None:
              file_path, _ = await PdfService.get_file_path(db, file_id, user.user_id, source)
@@ -251,8 +254,8 @@ async def render_page(
         else:
              raise BusinessException(ErrorCode.VALIDATION_ERROR, "必须提供 file_id 或 path")
              
-        img_data = await PdfService.render_page(file_path, page, zoom)
-        return Response(content=img_data, media_type="image/png")
+        img_data = await PdfService.render_page(file_path, page, zoom, format)
+        return Response(content=img_data, media_type=RENDER_FORMATS[format])
     except ValueError as e:
         raise BusinessException(ErrorCode.VALIDATION_ERROR, str(e))
 
@@ -312,11 +315,15 @@ async def preview_file(
 @router.post("/merge", response_model=dict, summary="合并 PDF")
 async def merge_pdf(
     request: PdfMergeRequest,
+    background: bool = Query(False, description="后台执行：立即返回任务，进度通过 WebSocket 推送"),
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(require_permission("pdf.create"))
 ):
     """合并多个 PDF 文件"""
     try:
+        if background:
+            job = await PdfService.submit_job(db, user.user_id, "merge", request)
+            return success_response(data=job.to_dict(), message="任务已提交")
         output_path = await PdfService.merge_pdfs(db, user.user_id, request)
         await db.commit()
         return success_response(data={"path": output_path}, message="合并成功")
@@ -327,11 +334,15 @@ async def merge_pdf(
 @router.post("/split", response_model=dict, summary="拆分 PDF")
 async def split_pdf(
     request: PdfSplitRequest,
+    background: bool = Query(False, description="后台执行：立即返回任务，进度通过 WebSocket 推送"),
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(require_permission("pdf.create"))
 ):
     """拆分 PDF 文件"""
     try:
+        if background:
+            job = await PdfService.submit_job(db, user.user_id, "split", request)
+            return success_response(data=job.to_dict(), message="任务已提交")
         output_path = await PdfService.split_pdf(db, user.user_id, request)
         await db.commit()
         return success_response(data={"path": output_path}, message="拆分成功")
@@ -342,11 +353,15 @@ async def split_pdf(
 @router.post("/compress", response_model=dict, summary="压缩 PDF")
 async def compress_pdf(
     request: PdfCompressRequest,
+    background: bool = Query(False, description="后台执行：立即返回任务，进度通过 WebSocket 推送"),
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(require_permission("pdf.create"))
 ):
     """压缩 PDF 文件"""
     try:
+        if background:
+            job = await PdfService.submit_job(db, user.user_id, "compress", request)
+            return success_response(data=job.to_dict(), message="任务已提交")
         output_path = await PdfService.compress_pdf(db, user.user_id, request)
         await db.commit()
         return success_response(data={"path": output_path}, message="压缩成功")
@@ -357,11 +372,15 @@ async def compress_pdf(
 @router.post("/watermark", response_model=dict, summary="添加水印")
 async def add_watermark(
     request: PdfWatermarkRequest,
+    background: bool = Query(False, description="后台执行：立即返回任务，进度通过 WebSocket 推送"),
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(require_permission("pdf.create"))
 ):
     """为 PDF 添加水印"""
     try:
+        if background:
+            job = await PdfService.submit_job(db, user.user_id, "watermark", request)
+            return success_response(data=job.to_dict(), message="任务已提交")
         output_path = await PdfService.add_watermark(db, user.user_id, request)
         await db.commit()
         return success_response(data={"path": output_path}, message="添加水印成功")
@@ -387,11 +406,15 @@ async def images_to_pdf(
 @router.post("/pdf-to-images", response_model=dict, summary="PDF 转图片")
 async def pdf_to_images(
     request: PdfToImagesRequest,
+    background: bool = Query(False, description="后台执行：立即返回任务，进度通过 WebSocket 推送"),
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(require_permission("pdf.create"))
 ):
     """将 PDF 转换为图片压缩包"""
     try:
+        if background:
+            job = await PdfService.submit_job(db, user.user_id, "pdf2img", request)
+            return success_response(data=job.to_dict(), message="任务已提交")
         output_path = await PdfService.pdf_to_images(db, user.user_id, request)
         await db.commit()
         return success_response(data={"path": output_path}, message="转换成功")
@@ -399,6 +422,39 @@ async def pdf_to_images(
         return error_response(message=str(e))
 
 
+@router.get("/jobs", response_model=dict, summary="获取转换任务列表")
+async def list_jobs(
+    user: TokenData = Depends(get_current_user)
+):
+    """获取本人近期的转换任务（进行中与最近完成的）"""
+    jobs = get_job_runner().list(user.user_id)
+    return success_response(data=[job.to_dict() for job in jobs], message="获取成功")
+
+
+@router.get("/jobs/{job_id}", response_model=dict, summary="获取转换任务状态")
+async def get_job(
+    job_id: str,
+    user: TokenData = Depends(get_current_user)
+):
+    """获取本人转换任务的状态与进度"""
+    job = get_job_runner().get(job_id, user.user_id)
+    if not job:
+        raise NotFoundException("转换任务", job_id)
+    return success_response(data=job.to_dict(), message="获取成功")
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=dict, summary="取消转换任务")
+async def cancel_job(
+    job_id: str,
+    user: TokenData = Depends(get_current_user)
+):
+    """取消本人进行中的转换任务"""
+    job = get_job_runner().cancel(job_id, user.user_id)
+    if not job:
+        raise NotFoundException("转换任务", job_id)
+    return success_response(data=job.to_dict(), message="已请求取消")
+
+
 @router.get("/download-result", summary="下载处理结果")
 async def download_result(
     filename: str = Query(..., description="文件名"),
@@ -477,11 +533,15 @@ async def extract_text(
 @router.post("/pdf-to-word", response_model=dict, summary="PDF 转 Word")
 async def pdf_to_word(
     request: PdfToWordRequest,
+    background: bool = Query(False, description="后台执行：立即返回任务，进度通过 WebSocket 推送"),
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(require_permission("pdf.create"))
 ):
     """将 PDF 转换为 Word 文档"""
     try:
+        if background:
+            job = await PdfService.submit_job(db, user.user_id, "pdf2word", request)
+            return success_response(data=job.to_dict(), message="任务已提交")
         output_path = await PdfService.pdf_to_word(db, user.user_id, request)
         await db.commit()
         return success_response(data={"path": output_path}, message="转换成功")
@@ -492,11 +552,15 @@ async def pdf_to_word(
 @router.post("/pdf-to-excel", response_model=dict, summary="PDF 转 Excel")
 async def pdf_to_excel(
     request: PdfToExcelRequest,
+    background: bool = Query(False, description="后台执行：立即返回任务，进度通过 WebSocket 推送"),
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(require_permission("pdf.create"))
 ):
     """将 PDF 中的表格提取为 Excel"""
     try:
+        if background:
+            job = await PdfService.submit_job(db, user.user_id, "pdf2excel", request)
+            return success_response(data=job.to_dict(), message="任务已提交")
         output_path = await PdfService.pdf_to_excel(db, user.user_id, request)
         await db.commit()
         return success_response(data={"path": output_path}, message="转换成功")
@@ -4,16 +4,28 @@ PDF 工具模块业务逻辑
 """
 
 import os
+import asyncio
 import logging
 import fitz  # PyMuPDF
-import zipfile
-import io
 from typing import Optional, List, Tuple, Dict, Any
 from sqlalchemy import select, func, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 from pathlib import Path
 
 from .pdf_models import Pdf
+from .pdf_render import get_page_renderer
+from . import pdf_workers
+from .pdf_jobs import (
+    JOB_OPERATIONS,
+    JobContext,
+    PdfJob,
+    get_job_runner,
+    compress_document,
+    render_document_images,
+    document_to_word,
+    document_to_excel,
+    get_page_count
+)
 from .pdf_schemas import (
     PdfMetadata, 
     PdfMergeRequest, 
@@ -169,10 +181,38 @@ class PdfService:
             logger.error(f"注册到文件管理器失败: {e}")
             # 注册失败不影响主流程
 
+    @staticmethod
+    def _job_finalizer(user_id: int, title: str, filename: str, operation: str):
+        """任务完成后记录历史并注册到文件管理器（在任务自己的数据库会话中执行）"""
+        async def finalize(db: AsyncSession, path: str):
+            await PdfService._save_history(db, user_id, title, filename, operation)
+            await PdfService._register_to_filemanager(db, user_id, filename, path, os.path.getsize(path))
+        return finalize
+
+    @staticmethod
+    async def submit_job(db: AsyncSession, user_id: int, operation: str, request: Any) -> PdfJob:
+        """
+        提交 PDF 转换任务（合并 / 拆分 / 压缩 / 水印 / 转图片 / 转 Word / 转 Excel）
+
+        在请求上下文中解析输入文件与参数，计算在进程池中进行；
+        相同输入与参数的任务会合并，返回已有任务
+        """
+        if operation not in JOB_OPERATIONS:
+            raise ValueError(f"不支持的任务类型: {operation}")
+        try:
+            return await getattr(PdfService, f"_job_{operation}")(db, user_id, request)
+        except Exception as e:
+            logger.error(f"提交 PDF 任务失败 ({operation}): {e}")
+            raise ValueError(f"{JOB_OPERATIONS[operation]}失败: {str(e)}")
+
 
     @staticmethod
     async def get_metadata(file_path: str) -> PdfMetadata:
-        """获取 PDF 元数据"""
+        """获取 PDF 元数据（解析文件在线程中执行）"""
+        return await asyncio.to_thread(PdfService._read_metadata, file_path)
+
+    @staticmethod
+    def _read_metadata(file_path: str) -> PdfMetadata:
         try:
             doc = fitz.open(file_path)
             # PyMuPDF metadata 可能为 None（例如加密文档未解锁时）
@@ -208,19 +248,13 @@ class PdfService:
 
 
     @staticmethod
-    async def render_page(file_path: str, page_num: int, zoom: float = 2.0) -> bytes:
-        """渲染 PDF 指定页面为图片 (PNG)"""
+    async def render_page(file_path: str, page_num: int, zoom: float = 2.0, fmt: str = "png") -> bytes:
+        """
+        渲染 PDF 指定页面为图片 (PNG / JPEG)
+        在渲染进程池中执行并写入磁盘缓存，同时预取相邻页面（见 pdf_render）
+        """
         try:
-            doc = fitz.open(file_path)
-            if page_num < 0 or page_num >= doc.page_count:
-                raise ValueError(f"页码超出范围 (0-{doc.page_count-1})")
-            
-            page = doc.load_page(page_num)
-            mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat, alpha=False)
-            img_data = pix.tobytes("png")
-            doc.close()
-            return img_data
+            return await get_page_renderer().render(file_path, page_num, zoom, fmt)
         except Exception as e:
             logger.error(f"渲染 PDF 页面失败: {e}")
             raise ValueError(f"渲染失败: {str(e)}")
@@ -228,88 +262,62 @@ class PdfService:
     @staticmethod
     async def merge_pdfs(db: AsyncSession, user_id: int, request: PdfMergeRequest) -> str:
         """合并多个 PDF"""
-        try:
-            result_doc = fitz.open()
-            # 收集文件路径
-            file_paths = []
-            if request.file_ids:
-                for fid in request.file_ids:
-                    fpath, _ = await PdfService.get_file_path(db, fid, user_id)
-                    file_paths.append(fpath)
-            if request.paths:
-                for p in request.paths:
-                    fpath, _ = await PdfService.get_file_path_by_storage(user_id, p)
-                    file_paths.append(fpath)
+        job = await PdfService.submit_job(db, user_id, "merge", request)
+        return await job.wait()
 
-            for fpath in file_paths:
-                with fitz.open(fpath) as doc:
-                    result_doc.insert_pdf(doc)
-            
-            output_name = request.output_name
-            if not output_name.lower().endswith(".pdf"):
-                output_name += ".pdf"
-            
-            save_path = PdfService._get_output_path(user_id, output_name)
-            result_doc.save(str(save_path))
-            result_doc.close()
-            
-            await PdfService._save_history(db, user_id, f"合并 PDF: {output_name}", output_name, "merge")
-            await PdfService._register_to_filemanager(db, user_id, output_name, str(save_path), os.path.getsize(save_path))
-
-            
-            return str(save_path)
-        except Exception as e:
-            logger.error(f"合并 PDF 失败: {e}")
-            raise ValueError(f"合并失败: {str(e)}")
+    @staticmethod
+    async def _job_merge(db: AsyncSession, user_id: int, request: PdfMergeRequest) -> PdfJob:
+        # 收集文件路径
+        file_paths = []
+        if request.file_ids:
+            for fid in request.file_ids:
+                fpath, _ = await PdfService.get_file_path(db, fid, user_id)
+                file_paths.append(fpath)
+        if request.paths:
+            for p in request.paths:
+                fpath, _ = await PdfService.get_file_path_by_storage(user_id, p)
+                file_paths.append(fpath)
+
+        output_name = request.output_name
+        if not output_name.lower().endswith(".pdf"):
+            output_name += ".pdf"
+        save_path = PdfService._get_output_path(user_id, output_name)
+
+        async def run(ctx: JobContext, tmp_path: str):
+            await ctx.call(pdf_workers.merge_files, file_paths, tmp_path)
+
+        return await get_job_runner().submit(
+            user_id, "merge", file_paths, {}, save_path, run,
+            PdfService._job_finalizer(user_id, f"合并 PDF: {output_name}", output_name, "merge")
+        )
 
     @staticmethod
     async def split_pdf(db: AsyncSession, user_id: int, request: PdfSplitRequest) -> str:
         """拆分 PDF"""
-        try:
-            fpath, old_name = await PdfService._resolve_file(db, user_id, request.file_id, request.path)
-            doc = fitz.open(fpath)
-            
-            pages_to_keep = []
-            for part in request.page_ranges.split(','):
-                part = part.strip()
-                if not part: continue
-                if '-' in part:
-                    try:
-                        start, end = map(int, part.split('-'))
-                        pages_to_keep.extend(range(start - 1, end))
-                    except ValueError:
-                        continue
-                else:
-                    try:
-                        pages_to_keep.append(int(part) - 1)
-                    except ValueError:
-                        continue
-            
-            pages_to_keep = sorted(list(set([p for p in pages_to_keep if 0 <= p < doc.page_count])))
-            
-            if not pages_to_keep:
-                raise ValueError("未选择有效的页码范围")
-            
-            # 使用 select 方法保留/重排选中的页面
-            # 注意：select 是就地修改，但只要我们不覆盖源文件保存，就是安全的
-            doc.select(pages_to_keep)
-            
-            output_name = request.output_name or f"split_{old_name}"
-            if not output_name.lower().endswith(".pdf"):
-                output_name += ".pdf"
-                
-            save_path = PdfService._get_output_path(user_id, output_name)
-            doc.save(str(save_path))
-            doc.close()
-            
-            await PdfService._save_history(db, user_id, f"拆分 PDF: {output_name}", output_name, "split")
-            await PdfService._register_to_filemanager(db, user_id, output_name, str(save_path), os.path.getsize(save_path))
+        job = await PdfService.submit_job(db, user_id, "split", request)
+        return await job.wait()
 
-            
-            return str(save_path)
-        except Exception as e:
-            logger.error(f"拆分 PDF 失败: {e}")
-            raise ValueError(f"拆分失败: {str(e)}")
+    @staticmethod
+    async def _job_split(db: AsyncSession, user_id: int, request: PdfSplitRequest) -> PdfJob:
+        fpath, old_name = await PdfService._resolve_file(db, user_id, request.file_id, request.path)
+        total_pages = await asyncio.to_thread(get_page_count, fpath)
+        pages_to_keep = PdfService._parse_page_ranges(request.page_ranges, total_pages)
+        if not pages_to_keep:
+            raise ValueError("未选择有效的页码范围")
+
+        output_name = request.output_name or f"split_{old_name}"
+        if not output_name.lower().endswith(".pdf"):
+            output_name += ".pdf"
+        save_path = PdfService._get_output_path(user_id, output_name)
+
+        async def run(ctx: JobContext, tmp_path: str):
+            # 使用 select 保留/重排选中的页面（在子进程中打开副本，不修改源文件）
+            await ctx.call(pdf_workers.select_pages, fpath, pages_to_keep, tmp_path)
+
+        return await get_job_runner().submit(
+            user_id, "split", [fpath], {"pages": pages_to_keep}, save_path, run,
+            PdfService._job_finalizer(user_id, f"拆分 PDF: {output_name}", output_name, "split")
+        )
 
     @staticmethod
     async def extract_text(file_path: str) -> str:
@@ -328,138 +336,58 @@ class PdfService:
     @staticmethod
     async def compress_pdf(db: AsyncSession, user_id: int, request: PdfCompressRequest) -> str:
         """压缩 PDF"""
-        try:
-            # 延迟导入以避免循环依赖或不必要的加载
-            from PIL import Image
-            import io
-            
-            fpath, old_name = await PdfService._resolve_file(db, user_id, request.file_id, request.path)
-            doc = fitz.open(fpath)
-            
-            # 只有当 level >= 2 时才启用激进的图片压缩
-            # level 1: 仅清理 (Quick)
-            # level 2: 图片压缩 (Standard)
-            # level 3: 图片压缩+缩放 (Max)
-            if request.level >= 2:
-                processed_xrefs = set()
-                
-                for page in doc:
-                    images = page.get_images()
-                    for img in images:
-                        xref = img[0]
-                        if xref in processed_xrefs:
-                            continue
-                        processed_xrefs.add(xref)
-                        
-                        try:
-                            # 提取图片
-                            pix = fitz.Pixmap(doc, xref)
-                            
-                            # 如果图片很小 (<50KB) 或尺寸很小，跳过
-                            if pix.size < 50 * 1024 or pix.width < 100 or pix.height < 100:
-                                pix = None
-                                continue
-                                
-                            # 处理颜色空间
-                            if pix.n - pix.alpha > 3: # CMYK 等
-                                pix0 = fitz.Pixmap(fitz.csRGB, pix)
-                                pix = pix0
-                            
-                            # 转 PIL 处理
-                            img_data = pix.tobytes()
-                            image = Image.open(io.BytesIO(img_data))
-                            
-                            # 确定压缩参数
-                            quality = 75
-                            new_size = None
-                            
-                            if request.level >= 3:
-                                quality = 50
-                                # 如果图片过大，进行缩放
-                                if image.width > 1500 or image.height > 1500:
-                                    factor = 1500 / max(image.width, image.height)
-                                    new_size = (int(image.width * factor), int(image.height * factor))
-                            
-                            if new_size:
-                                image = image.resize(new_size, Image.Resampling.LANCZOS)
-                                
-                            # 压缩
-                            buffer = io.BytesIO()
-                            # 统一转 RGB 并存为 JPEG
-                            image.convert("RGB").save(buffer, format="JPEG", quality=quality, optimize=True)
-                            new_bytes = buffer.getvalue()
-                            
-                            # 只有当压缩后体积确实减小时才替换
-                            if len(new_bytes) < pix.size:
-                                doc.update_stream(xref, new_bytes)
-                                
-                            pix = None
-                        except Exception as e:
-                            # 个别图片处理失败不应中断整个流程
-                            logger.warning(f"压缩图片失败 xref={xref}: {e}")
-                            continue
-
-            output_name = request.output_name or f"compressed_{old_name}"
-            if not output_name.lower().endswith(".pdf"):
-                output_name += ".pdf"
-            
-            save_path = PdfService._get_output_path(user_id, output_name)
-            
-            # 使用最大程度的垃圾清理
-            # garbage=4: dedup contents, streams, unused objects
-            doc.save(str(save_path), garbage=4, deflate=True)
-            doc.close()
-            
-            await PdfService._save_history(db, user_id, f"压缩 PDF: {output_name}", output_name, "compress")
-            await PdfService._register_to_filemanager(db, user_id, output_name, str(save_path), os.path.getsize(save_path))
+        job = await PdfService.submit_job(db, user_id, "compress", request)
+        return await job.wait()
 
-            return str(save_path)
-        except Exception as e:
-            logger.error(f"压缩 PDF 失败: {e}")
-            raise ValueError(f"压缩失败: {str(e)}")
+    @staticmethod
+    async def _job_compress(db: AsyncSession, user_id: int, request: PdfCompressRequest) -> PdfJob:
+        fpath, old_name = await PdfService._resolve_file(db, user_id, request.file_id, request.path)
+
+        output_name = request.output_name or f"compressed_{old_name}"
+        if not output_name.lower().endswith(".pdf"):
+            output_name += ".pdf"
+        save_path = PdfService._get_output_path(user_id, output_name)
+
+        # level 1: 仅清理 (Quick)
+        # level 2: 图片压缩 (Standard)
+        # level 3: 图片压缩+缩放 (Max)
+        async def run(ctx: JobContext, tmp_path: str):
+            await compress_document(ctx, fpath, tmp_path, request.level)
+
+        return await get_job_runner().submit(
+            user_id, "compress", [fpath], {"level": request.level}, save_path, run,
+            PdfService._job_finalizer(user_id, f"压缩 PDF: {output_name}", output_name, "compress")
+        )
 
     @staticmethod
     async def add_watermark(db: AsyncSession, user_id: int, request: PdfWatermarkRequest) -> str:
         """添加水印"""
-        try:
-            fpath, old_name = await PdfService._resolve_file(db, user_id, request.file_id, request.path)
-            doc = fitz.open(fpath)
-            
-            output_name = request.output_name or f"watermarked_{old_name}"
-            if not output_name.lower().endswith(".pdf"):
-                output_name += ".pdf"
-            
-            for page in doc:
-                rect = page.rect
-                
-                # 使用 insert_text 配合 morph 矩阵实现旋转
-                # 计算页面中心
-                center_point = fitz.Point(rect.width / 2, rect.height / 2)
-                
-                # 创建旋转矩阵 (顺时针 45 度)
-                mat = fitz.Matrix(45)
-                
-                page.insert_text(
-                    center_point,
-                    request.text,
-                    fontsize=request.fontsize,
-                    fontname="china-s",  # 支持简体中文的内置字体
-                    color=request.color,
-                    fill_opacity=request.opacity,
-                    morph=(center_point, mat)  # (固定点, 矩阵) 实现围绕该点旋转
-                )
-                
-            save_path = PdfService._get_output_path(user_id, output_name)
-            doc.save(str(save_path))
-            doc.close()
-            
-            await PdfService._save_history(db, user_id, f"添加水印: {output_name}", output_name, "watermark")
-            await PdfService._register_to_filemanager(db, user_id, output_name, str(save_path), os.path.getsize(save_path))
+        job = await PdfService.submit_job(db, user_id, "watermark", request)
+        return await job.wait()
 
-            return str(save_path)
-        except Exception as e:
-            logger.error(f"添加水印失败: {e}")
-            raise ValueError(f"添加水印失败: {str(e)}")
+    @staticmethod
+    async def _job_watermark(db: AsyncSession, user_id: int, request: PdfWatermarkRequest) -> PdfJob:
+        fpath, old_name = await PdfService._resolve_file(db, user_id, request.file_id, request.path)
+
+        output_name = request.output_name or f"watermarked_{old_name}"
+        if not output_name.lower().endswith(".pdf"):
+            output_name += ".pdf"
+        save_path = PdfService._get_output_path(user_id, output_name)
+
+        async def run(ctx: JobContext, tmp_path: str):
+            await ctx.call(
+                pdf_workers.watermark_file, fpath, tmp_path,
+                request.text, request.fontsize, request.color, request.opacity
+            )
+
+        options = {
+            "text": request.text, "fontsize": request.fontsize,
+            "color": request.color, "opacity": request.opacity
+        }
+        return await get_job_runner().submit(
+            user_id, "watermark", [fpath], options, save_path, run,
+            PdfService._job_finalizer(user_id, f"添加水印: {output_name}", output_name, "watermark")
+        )
 
     @staticmethod
     async def images_to_pdf(db: AsyncSession, user_id: int, request: PdfImagesToPdfRequest) -> str:
@@ -505,32 +433,29 @@ class PdfService:
     @staticmethod
     async def pdf_to_images(db: AsyncSession, user_id: int, request: PdfToImagesRequest) -> str:
         """PDF 转图片 (Zip)"""
-        try:
-            fpath, old_name = await PdfService._resolve_file(db, user_id, request.file_id, request.path)
-            doc = fitz.open(fpath)
-            
-            base_name = os.path.splitext(old_name)[0]
-            zip_name = f"{base_name}_images.zip"
-            save_path = PdfService._get_output_path(user_id, zip_name)
-            
-            with zipfile.ZipFile(save_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                pages_to_process = range(doc.page_count)
-                # 如果有范围过滤逻辑可以加在这里
-                
-                for i in pages_to_process:
-                    page = doc.load_page(i)
-                    pix = page.get_pixmap(matrix=fitz.Matrix(2, 2)) # 2x zoom for quality
-                    img_data = pix.tobytes("png")
-                    zf.writestr(f"page_{i+1:03d}.png", img_data)
-            
-            doc.close()
-            
-            await PdfService._save_history(db, user_id, f"PDF 转图片: {zip_name}", zip_name, "pdf2img")
-            await PdfService._register_to_filemanager(db, user_id, zip_name, str(save_path), os.path.getsize(save_path))
-            return str(save_path)
-        except Exception as e:
-            logger.error(f"PDF转图片失败: {e}")
-            raise ValueError(f"转换失败: {str(e)}")
+        job = await PdfService.submit_job(db, user_id, "pdf2img", request)
+        return await job.wait()
+
+    @staticmethod
+    async def _job_pdf2img(db: AsyncSession, user_id: int, request: PdfToImagesRequest) -> PdfJob:
+        fpath, old_name = await PdfService._resolve_file(db, user_id, request.file_id, request.path)
+
+        base_name = os.path.splitext(old_name)[0]
+        zip_name = f"{base_name}_images.zip"
+        save_path = PdfService._get_output_path(user_id, zip_name)
+
+        pages = None
+        if request.page_ranges:
+            total_pages = await asyncio.to_thread(get_page_count, fpath)
+            pages = PdfService._parse_page_ranges(request.page_ranges, total_pages)
+
+        async def run(ctx: JobContext, tmp_path: str):
+            await render_document_images(ctx, fpath, tmp_path, pages)  # 2x zoom for quality
+
+        return await get_job_runner().submit(
+            user_id, "pdf2img", [fpath], {"pages": pages}, save_path, run,
+            PdfService._job_finalizer(user_id, f"PDF 转图片: {zip_name}", zip_name, "pdf2img")
+        )
 
     @staticmethod
     async def list_history(db: AsyncSession, user_id: int, page: int = 1, page_size: int = 20) -> Tuple[List[Pdf], int]:
@@ -572,112 +497,54 @@ class PdfService:
     @staticmethod
     async def pdf_to_word(db: AsyncSession, user_id: int, request: PdfToWordRequest) -> str:
         """PDF 转 Word 文档"""
-        try:
-            fpath, old_name = await PdfService._resolve_file(db, user_id, request.file_id, request.path)
-            
-            output_name = request.output_name or os.path.splitext(old_name)[0] + ".docx"
-            if not output_name.lower().endswith(".docx"):
-                output_name += ".docx"
-            
-            save_path = PdfService._get_output_path(user_id, output_name)
-            
-            # 尝试使用 pdf2docx 库（如果可用）
-            try:
-                from pdf2docx import Converter
-                cv = Converter(fpath)
-                cv.convert(str(save_path))
-                cv.close()
-            except ImportError:
-                # 如果没有 pdf2docx，则提取文本并创建简单的 docx
-                from docx import Document
-                doc = fitz.open(fpath)
-                word_doc = Document()
-                
-                for page_num in range(doc.page_count):
-                    page = doc.load_page(page_num)
-                    text = page.get_text()
-                    if page_num > 0:
-                        word_doc.add_page_break()
-                    word_doc.add_paragraph(text)
-                
-                doc.close()
-                word_doc.save(str(save_path))
-            
-            await PdfService._save_history(db, user_id, f"PDF 转 Word: {output_name}", output_name, "pdf2word")
-            await PdfService._register_to_filemanager(db, user_id, output_name, str(save_path), os.path.getsize(save_path))
+        job = await PdfService.submit_job(db, user_id, "pdf2word", request)
+        return await job.wait()
 
-            return str(save_path)
-        except Exception as e:
-            logger.error(f"PDF转Word失败: {e}")
-            raise ValueError(f"转换失败: {str(e)}")
+    @staticmethod
+    async def _job_pdf2word(db: AsyncSession, user_id: int, request: PdfToWordRequest) -> PdfJob:
+        fpath, old_name = await PdfService._resolve_file(db, user_id, request.file_id, request.path)
+
+        output_name = request.output_name or os.path.splitext(old_name)[0] + ".docx"
+        if not output_name.lower().endswith(".docx"):
+            output_name += ".docx"
+        save_path = PdfService._get_output_path(user_id, output_name)
+
+        async def run(ctx: JobContext, tmp_path: str):
+            await document_to_word(ctx, fpath, tmp_path)
+
+        return await get_job_runner().submit(
+            user_id, "pdf2word", [fpath], {}, save_path, run,
+            PdfService._job_finalizer(user_id, f"PDF 转 Word: {output_name}", output_name, "pdf2word")
+        )
 
     @staticmethod
     async def pdf_to_excel(db: AsyncSession, user_id: int, request: PdfToExcelRequest) -> str:
         """PDF 转 Excel（提取表格）"""
-        try:
-            fpath, old_name = await PdfService._resolve_file(db, user_id, request.file_id, request.path)
-            
-            output_name = request.output_name or os.path.splitext(old_name)[0] + ".xlsx"
-            if not output_name.lower().endswith(".xlsx"):
-                output_name += ".xlsx"
-            
-            save_path = PdfService._get_output_path(user_id, output_name)
-            
-            doc = fitz.open(fpath)
-            
-            # 确定要处理的页面
-            if request.page_ranges:
-                pages_to_process = PdfService._parse_page_ranges(request.page_ranges, doc.page_count)
-            else:
-                pages_to_process = list(range(doc.page_count))
-            
-            # 使用 openpyxl 创建 Excel
-            from openpyxl import Workbook
-            wb = Workbook()
-            ws = wb.active
-            ws.title = "表格数据"
-            
-            row_idx = 1
-            for page_num in pages_to_process:
-                page = doc.load_page(page_num)
-                # 提取表格
-                # PyMuPDF 的 find_tables 返回 TableFinder 对象
-                finder = page.find_tables()
-                
-                if finder.tables:
-                    for table in finder:
-                        # 写入表头分隔
-                        ws.cell(row=row_idx, column=1, value=f"--- 第 {page_num + 1} 页表格 ---")
-                        row_idx += 1
-                        
-                        # 提取表格数据
-                        for row_data in table.extract():
-                            for col_idx, cell_value in enumerate(row_data, 1):
-                                ws.cell(row=row_idx, column=col_idx, value=cell_value or "")
-                            row_idx += 1
-                        row_idx += 1  # 表格之间空一行
-                else:
-                    # Fallback: 如果未检测到表格，提取纯文本
-                    text = page.get_text()
-                    if text.strip():
-                        ws.cell(row=row_idx, column=1, value=f"--- 第 {page_num + 1} 页文本（未检测到表格）---")
-                        row_idx += 1
-                        for line in text.split('\n'):
-                            if line.strip():
-                                ws.cell(row=row_idx, column=1, value=line.strip())
-                                row_idx += 1
-                        row_idx += 1
-            
-            doc.close()
-            wb.save(str(save_path))
-            
-            await PdfService._save_history(db, user_id, f"PDF 转 Excel: {output_name}", output_name, "pdf2excel")
-            await PdfService._register_to_filemanager(db, user_id, output_name, str(save_path), os.path.getsize(save_path))
+        job = await PdfService.submit_job(db, user_id, "pdf2excel", request)
+        return await job.wait()
 
-            return str(save_path)
-        except Exception as e:
-            logger.error(f"PDF转Excel失败: {e}")
-            raise ValueError(f"转换失败: {str(e)}")
+    @staticmethod
+    async def _job_pdf2excel(db: AsyncSession, user_id: int, request: PdfToExcelRequest) -> PdfJob:
+        fpath, old_name = await PdfService._resolve_file(db, user_id, request.file_id, request.path)
+
+        output_name = request.output_name or os.path.splitext(old_name)[0] + ".xlsx"
+        if not output_name.lower().endswith(".xlsx"):
+            output_name += ".xlsx"
+        save_path = PdfService._get_output_path(user_id, output_name)
+
+        # 确定要处理的页面
+        pages = None
+        if request.page_ranges:
+            total_pages = await asyncio.to_thread(get_page_count, fpath)
+            pages = PdfService._parse_page_ranges(request.page_ranges, total_pages)
+
+        async def run(ctx: JobContext, tmp_path: str):
+            await document_to_excel(ctx, fpath, tmp_path, pages)
+
+        return await get_job_runner().submit(
+            user_id, "pdf2excel", [fpath], {"pages": pages}, save_path, run,
+            PdfService._job_finalizer(user_id, f"PDF 转 Excel: {output_name}", output_name, "pdf2excel")
+        )
 
     @staticmethod
     async def remove_watermark(db: AsyncSession, user_id: int, request: PdfRemoveWatermarkRequest) -> str:
@@ -81,3 +81,22 @@ class TestPdfToolboxAPI:
             "filename": "nonexistent.pdf", "angle": 90
         })
         assert resp.status_code in (200, 400, 404, 500)
+
+    async def test_background_compress_no_file(self, admin_client: AsyncClient):
+        """测试后台压缩：输入无效时直接返回错误，不创建任务"""
+        resp = await admin_client.post("/api/v1/pdf/compress?background=true", json={
+            "path": "modules/pdf/uploads/nonexistent.pdf"
+        })
+        assert resp.status_code in (200, 400, 404)
+        assert resp.json()["code"] != 0
+
+    async def test_jobs(self, admin_client: AsyncClient):
+        """测试任务列表与不存在的任务"""
+        resp = await admin_client.get("/api/v1/pdf/jobs")
+        assert resp.status_code == 200
+        assert isinstance(resp.json()["data"], list)
+
+        resp = await admin_client.get("/api/v1/pdf/jobs/nonexistent")
+        assert resp.status_code == 404
+        resp = await admin_client.post("/api/v1/pdf/jobs/nonexistent/cancel")
+        assert resp.status_code == 404
@@ -128,6 +128,105 @@ class TestPdfService:
 
 
 
+    @pytest.mark.asyncio
+
+    async def test_render_cache_and_prefetch(self, tmp_workspace, tmp_path, monkeypatch):
+
+        """测试渲染缓存命中、相邻页预取与文件修改后失效"""
+
+        import asyncio
+
+        from modules.pdf import pdf_render
+
+        from modules.pdf.pdf_render import PageRenderer
+
+        # 预取只使用空闲渲染进程，固定预算避免依赖测试机核数
+
+        monkeypatch.setattr(pdf_render, "RENDER_WORKERS", 4)
+
+        path = tmp_path / "multi.pdf"
+
+        doc = fitz.open()
+
+        for i in range(4):
+
+            doc.new_page(width=200, height=200).insert_text((20, 40), f"page {i}")
+
+        doc.save(str(path))
+
+        doc.close()
+
+
+
+        renderer = PageRenderer()
+
+        first = await renderer.render(str(path), 0, zoom=1.0)
+
+        await asyncio.gather(*renderer._prefetching)
+
+        cache = renderer.cache
+
+        st = os.stat(path)
+
+        # 当前页与后续两页均已写入缓存，末页不在预取范围
+
+        cached = [cache.contains(cache.make_key(str(path), st, n, 1.0, "png"), "png") for n in range(4)]
+
+        assert cached == [True, True, True, False]
+
+
+
+        # 命中缓存时不再渲染
+
+        async def fail(*args, **kwargs):
+
+            raise AssertionError("不应重新渲染")
+
+        renderer._render_uncached = fail
+
+        assert await renderer.render(str(path), 0, zoom=1.0, prefetch=False) == first
+
+        assert (await renderer.render(str(path), 1, zoom=1.0, prefetch=False)).startswith(b"\x89PNG")
+
+
+
+        with pytest.raises(AssertionError):
+
+            await renderer.render(str(path), 0, zoom=1.0, fmt="jpeg", prefetch=False)
+
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+
+        with pytest.raises(AssertionError):
+
+            await renderer.render(str(path), 0, zoom=1.0, prefetch=False)
+
+
+
+    def test_render_cache_eviction(self, tmp_path):
+
+        """测试渲染缓存超过容量时淘汰最久未访问的条目"""
+
+        from modules.pdf.pdf_render import RenderCache
+
+        cache = RenderCache(tmp_path / "cache", max_bytes=250)
+
+        keys = [f"{i:02d}" + "0" * 62 for i in range(3)]
+
+        for i, key in enumerate(keys):
+
+            cache.put(key, "png", b"x" * 100)
+
+            entry = cache._entry(key, "png")
+
+            os.utime(entry, (1000 + i, 1000 + i))
+
+        assert not cache.contains(keys[0], "png")
+
+        assert cache.contains(keys[2], "png")
+
+
+
+
     @pytest.mark.asyncio
 
     async def test_merge_pdfs(self, db_session, sample_user_id, pdf_file):
@@ -228,6 +327,284 @@ class TestPdfService:
 
         
 
+    @pytest.fixture
+
+    def job_workers(self, monkeypatch):
+
+        """任务进程池按 2 个进程、每段 2 页分段（与机器核数无关）"""
+
+        from modules.pdf import pdf_jobs
+
+        from utils.process_pool import shutdown_process_pool
+
+        shutdown_process_pool(pdf_jobs.POOL_NAME)
+
+        monkeypatch.setattr(pdf_jobs, "JOB_WORKERS", 2)
+
+        monkeypatch.setattr(pdf_jobs, "CHUNK_SIZE", 2)
+
+        yield pdf_jobs
+
+        shutdown_process_pool(pdf_jobs.POOL_NAME)
+
+
+
+    @pytest.fixture
+
+    def multi_page_pdf(self, tmp_workspace, sample_user_id):
+
+        """创建 7 页、每页带一张大图与一个表格的 PDF"""
+
+        import io
+
+        import numpy as np
+
+        from PIL import Image
+
+        from utils.storage import get_storage_manager
+
+        upload_dir = get_storage_manager().get_module_dir("pdf", "uploads", sample_user_id)
+
+        doc = fitz.open()
+
+        for i in range(7):
+
+            page = doc.new_page(width=500, height=700)
+
+            page.insert_text((50, 50), f"Page {i + 1}")
+
+            arr = (np.random.default_rng(i).random((300, 300, 3)) * 255).astype("uint8")
+
+            buffer = io.BytesIO()
+
+            Image.fromarray(arr).save(buffer, format="PNG")
+
+            page.insert_image(fitz.Rect(50, 80, 350, 380), stream=buffer.getvalue())
+
+            for r in range(4):
+
+                y = 420 + r * 30
+
+                page.draw_line((50, y), (350, y))
+
+                page.insert_text((60, y + 20), f"r{r}c1")
+
+                page.insert_text((210, y + 20), f"r{r}c2")
+
+            page.draw_line((50, 420), (50, 510))
+
+            page.draw_line((200, 420), (200, 510))
+
+            page.draw_line((350, 420), (350, 510))
+
+        doc.save(str(upload_dir / "multi.pdf"))
+
+        doc.close()
+
+        return f"modules/pdf/uploads/user_{sample_user_id}/multi.pdf"
+
+
+
+    @pytest.mark.asyncio
+
+    async def test_compress_pdf_parallel(self, db_session, sample_user_id, multi_page_pdf, job_workers):
+
+        """测试分段并行压缩：图片按 JPEG 写回且可解码，其余内容保留"""
+
+        request = PdfCompressRequest(path=multi_page_pdf, level=2, output_name="compressed_multi.pdf")
+
+        output_path_str = await PdfService.compress_pdf(db_session, sample_user_id, request)
+
+
+
+        from utils.storage import get_storage_manager
+
+        src_size = os.path.getsize(get_storage_manager().get_file_path(multi_page_pdf))
+
+        assert os.path.getsize(output_path_str) < src_size
+
+
+
+        doc = fitz.open(output_path_str)
+
+        assert doc.page_count == 7
+
+        for page in doc:
+
+            assert f"Page {page.number + 1}" in page.get_text()
+
+            xref = page.get_images()[0][0]
+
+            assert "/DCTDecode" in doc.xref_object(xref)
+
+            assert fitz.Pixmap(doc, xref).width == 300
+
+        doc.close()
+
+
+
+        # 临时文件不残留
+
+        assert [p.name for p in Path(output_path_str).parent.iterdir() if p.name.startswith(".")] == []
+
+
+
+    @pytest.mark.asyncio
+
+    async def test_pdf_to_images_in_page_order(self, db_session, sample_user_id, multi_page_pdf, job_workers):
+
+        """测试 PDF 转图片：分段渲染后按页序写入 zip，并支持页码范围"""
+
+        import zipfile
+
+        from modules.pdf.pdf_schemas import PdfToImagesRequest
+
+
+
+        output_path_str = await PdfService.pdf_to_images(
+
+            db_session, sample_user_id, PdfToImagesRequest(path=multi_page_pdf)
+
+        )
+
+        with zipfile.ZipFile(output_path_str) as zf:
+
+            assert zf.namelist() == [f"page_{i:03d}.png" for i in range(1, 8)]
+
+
+
+        output_path_str = await PdfService.pdf_to_images(
+
+            db_session, sample_user_id, PdfToImagesRequest(path=multi_page_pdf, page_ranges="2-3,6")
+
+        )
+
+        with zipfile.ZipFile(output_path_str) as zf:
+
+            assert zf.namelist() == ["page_002.png", "page_003.png", "page_006.png"]
+
+
+
+    @pytest.mark.asyncio
+
+    async def test_pdf_to_excel_and_word(self, db_session, sample_user_id, multi_page_pdf, job_workers):
+
+        """测试 PDF 转 Excel / Word"""
+
+        from openpyxl import load_workbook
+
+        from modules.pdf.pdf_schemas import PdfToExcelRequest, PdfToWordRequest
+
+
+
+        output_path_str = await PdfService.pdf_to_excel(
+
+            db_session, sample_user_id, PdfToExcelRequest(path=multi_page_pdf, page_ranges="1-5")
+
+        )
+
+        ws = load_workbook(output_path_str).active
+
+        markers = [row[0] for row in ws.iter_rows(values_only=True) if row and row[0] and str(row[0]).startswith("---")]
+
+        assert [m.split(" ")[2] for m in markers] == ["1", "2", "3", "4", "5"]
+
+
+
+        output_path_str = await PdfService.pdf_to_word(
+
+            db_session, sample_user_id, PdfToWordRequest(path=multi_page_pdf)
+
+        )
+
+        assert os.path.getsize(output_path_str) > 0
+
+
+
+    @pytest.mark.asyncio
+
+    async def test_job_dedup(self, db_session, sample_user_id, multi_page_pdf, job_workers):
+
+        """测试相同输入与参数的任务合并，参数不同或输出被删除后重新执行"""
+
+        request = PdfCompressRequest(path=multi_page_pdf, level=1, output_name="dedup.pdf")
+
+        first = await PdfService.submit_job(db_session, sample_user_id, "compress", request)
+
+        second = await PdfService.submit_job(db_session, sample_user_id, "compress", request)
+
+        assert second is first
+
+        output_path_str = await first.wait()
+
+
+
+        # 已完成且输出仍在：直接复用
+
+        assert await PdfService.submit_job(db_session, sample_user_id, "compress", request) is first
+
+
+
+        other = await PdfService.submit_job(
+
+            db_session, sample_user_id, "compress", PdfCompressRequest(path=multi_page_pdf, level=2, output_name="dedup.pdf")
+
+        )
+
+        assert other is not first
+
+        await other.wait()
+
+
+
+        os.remove(output_path_str)
+
+        again = await PdfService.submit_job(db_session, sample_user_id, "compress", request)
+
+        assert again is not first
+
+        assert await again.wait() == output_path_str
+
+        assert os.path.exists(output_path_str)
+
+
+
+    @pytest.mark.asyncio
+
+    async def test_job_cancel(self, db_session, sample_user_id, multi_page_pdf, job_workers):
+
+        """测试取消任务：抛出取消异常，不留下输出与临时文件"""
+
+        from modules.pdf.pdf_jobs import PdfJobCancelled, get_job_runner
+
+        from modules.pdf.pdf_schemas import PdfToImagesRequest
+
+
+
+        job = await PdfService.submit_job(
+
+            db_session, sample_user_id, "pdf2img", PdfToImagesRequest(path=multi_page_pdf)
+
+        )
+
+        assert get_job_runner().cancel(job.id, sample_user_id + 1) is None
+
+        assert get_job_runner().cancel(job.id, sample_user_id) is job
+
+
+
+        with pytest.raises(PdfJobCancelled):
+
+            await job.wait()
+
+        assert job.to_dict()["status"] == "cancelled"
+
+        outputs_dir = PdfService._get_output_path(sample_user_id, "x").parent
+
+        assert list(outputs_dir.iterdir()) == []
+
+
+
     @pytest.mark.asyncio
 
     async def test_extract_text(self, pdf_file, tmp_workspace):
@@ -0,0 +1,168 @@
+"""
+PDF 任务工作函数
+
+以下函数在进程池子进程中执行（见 pdf_jobs），参数与返回值只使用路径、页码列表与 bytes/str。
+逐页类操作每次调用处理一段页面（或一批图片对象），由主进程按段序汇总写盘；
+合并、拆分、加水印等整文档操作在单个子进程中完成并直接写出文件。
+本模块模块级只依赖 PyMuPDF
+"""
+
+import io
+import os
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+logger = logging.getLogger(__name__)
+
+# 子进程内缓存最近打开的源文档（按路径 + mtime），同一任务的后续分片无需重复解析
+_open_docs: Dict[Tuple[str, int], "fitz.Document"] = {}
+
+
+def _open(path: str) -> "fitz.Document":
+    key = (path, os.stat(path).st_mtime_ns)
+    doc = _open_docs.get(key)
+    if doc is None:
+        for old in _open_docs.values():
+            old.close()
+        _open_docs.clear()
+        doc = _open_docs[key] = fitz.open(path)
+    return doc
+
+
+def compress_images(path: str, xrefs: List[int], level: int) -> List[Tuple[int, bytes]]:
+    """
+    重新编码一批图片对象为 JPEG
+
+    Returns:
+        [(xref, 新图片数据)]，只包含压缩后体积确实减小的图片
+    """
+    from PIL import Image
+
+    doc = _open(path)
+    results = []
+    for xref in xrefs:
+        try:
+            # 提取图片
+            pix = fitz.Pixmap(doc, xref)
+
+            # 如果图片很小 (<50KB) 或尺寸很小，跳过
+            if pix.size < 50 * 1024 or pix.width < 100 or pix.height < 100:
+                continue
+
+            # 处理颜色空间
+            if pix.n - pix.alpha > 3: # CMYK 等
+                pix = fitz.Pixmap(fitz.csRGB, pix)
+
+            image = Image.open(io.BytesIO(pix.tobytes()))
+
+            # 确定压缩参数
+            quality = 75
+            if level >= 3:
+                quality = 50
+                # 如果图片过大，进行缩放
+                if image.width > 1500 or image.height > 1500:
+                    factor = 1500 / max(image.width, image.height)
+                    image = image.resize(
+                        (int(image.width * factor), int(image.height * factor)), Image.Resampling.LANCZOS
+                    )
+
+            # 统一转 RGB 并存为 JPEG
+            buffer = io.BytesIO()
+            image.convert("RGB").save(buffer, format="JPEG", quality=quality, optimize=True)
+            new_bytes = buffer.getvalue()
+
+            # 只有当压缩后体积确实小于原图片数据时才替换
+            if len(new_bytes) < len(doc.xref_stream_raw(xref)):
+                results.append((xref, new_bytes))
+        except Exception as e:
+            # 个别图片处理失败不应中断整个流程
+            logger.warning(f"压缩图片失败 xref={xref}: {e}")
+    return results
+
+
+def render_pages(path: str, pages: List[int], zoom: float) -> List[Tuple[int, bytes]]:
+    """渲染一段页面为 PNG"""
+    doc = _open(path)
+    return [
+        (i, doc.load_page(i).get_pixmap(matrix=fitz.Matrix(zoom, zoom)).tobytes("png"))
+        for i in pages
+    ]
+
+
+def extract_text(path: str, pages: List[int]) -> List[Tuple[int, str]]:
+    """提取一段页面的文本"""
+    doc = _open(path)
+    return [(i, doc.load_page(i).get_text()) for i in pages]
+
+
+def extract_tables(path: str, pages: List[int]) -> List[Tuple[int, List[List[List[Optional[str]]]], str]]:
+    """
+    提取一段页面的表格
+
+    Returns:
+        [(页码, 表格列表, 文本)]：检测到表格时文本为空，否则返回整页文本作为兜底
+    """
+    doc = _open(path)
+    results = []
+    for i in pages:
+        page = doc.load_page(i)
+        # PyMuPDF 的 find_tables 返回 TableFinder 对象
+        finder = page.find_tables()
+        if finder.tables:
+            results.append((i, [table.extract() for table in finder], ""))
+        else:
+            results.append((i, [], page.get_text()))
+    return results
+
+
+def watermark_file(path: str, output_path: str, text: str, fontsize: int,
+                   color: List[float], opacity: float):
+    """为每页添加文字水印并写入输出文件"""
+    with fitz.open(path) as doc:
+        for page in doc:
+            rect = page.rect
+            # 使用 insert_text 配合 morph 矩阵实现旋转
+            center_point = fitz.Point(rect.width / 2, rect.height / 2)
+            # 创建旋转矩阵 (顺时针 45 度)
+            mat = fitz.Matrix(45)
+            page.insert_text(
+                center_point,
+                text,
+                fontsize=fontsize,
+                fontname="china-s",  # 支持简体中文的内置字体
+                color=color,
+                fill_opacity=opacity,
+                morph=(center_point, mat)  # (固定点, 矩阵) 实现围绕该点旋转
+            )
+        doc.save(output_path)
+
+
+def merge_files(paths: List[str], output_path: str):
+    """按顺序合并多个 PDF 并写入输出文件"""
+    result_doc = fitz.open()
+    try:
+        for fpath in paths:
+            with fitz.open(fpath) as doc:
+                result_doc.insert_pdf(doc)
+        result_doc.save(output_path)
+    finally:
+        result_doc.close()
+
+
+def select_pages(path: str, pages: List[int], output_path: str):
+    """保留/重排选中的页面并写入输出文件"""
+    with fitz.open(path) as doc:
+        doc.select(pages)
+        doc.save(output_path)
+
+
+def convert_docx(path: str, output_path: str):
+    """使用 pdf2docx 转换为 Word（保留版式）"""
+    from pdf2docx import Converter
+    cv = Converter(path)
+    try:
+        cv.convert(output_path)
+    finally:
+        cv.close()
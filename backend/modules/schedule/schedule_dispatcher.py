@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+日程模块 - 提醒调度
+
+按窗口一次联表加载即将到期的提醒，放入进程内时间轮，到点即触发，不再每分钟轮询全表。
+触发时批量原子认领（见 ReminderService.claim_reminders），多 worker 加载同一窗口时
+每条提醒仍只推送一次；认领即标记已发送，推送失败不会重复提醒。
+"""
+
+import math
+import heapq
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Set
+
+from core.database import get_db_session
+from core.ws_manager import manager as ws_manager
+from utils.timezone import get_beijing_time
+
+from .schedule_services import ReminderService
+
+logger = logging.getLogger(__name__)
+
+# 时间轮刻度（秒）
+WHEEL_TICK_SECONDS = 1.0
+# 每次加载的时间窗口（秒），窗口内的提醒常驻内存
+WINDOW_SECONDS = 300
+# 单次认领的最大条数（控制 IN 列表长度）
+CLAIM_BATCH_SIZE = 500
+
+
+def _now() -> datetime:
+    """提醒时间按北京时间无时区存储，这里取同口径的当前时间"""
+    return get_beijing_time().replace(tzinfo=None)
+
+
+class TimerWheel:
+    """
+    按刻度分桶的时间轮
+
+    同一刻度内到期的条目落在同一个桶，桶序号用小根堆维护，
+    取下一个到期时间与弹出到期桶都只触及堆顶，与条目总数无关。
+    时间使用事件循环的单调时钟，不受系统时间调整影响。
+    """
+
+    def __init__(self, tick: float = WHEEL_TICK_SECONDS):
+        self.tick = tick
+        self._buckets: Dict[int, Set[int]] = {}
+        self._slots: List[int] = []
+        self._armed: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._armed)
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._armed
+
+    def _slot_of(self, due: float) -> int:
+        # 向上取整，保证不会提前触发
+        return math.ceil(due / self.tick)
+
+    def add(self, item_id: int, due: float):
+        """挂载条目，已挂载的条目按新的到期时间移动"""
+        slot = self._slot_of(due)
+        current = self._armed.get(item_id)
+        if current == slot:
+            return
+        if current is not None:
+            self._buckets.get(current, set()).discard(item_id)
+        bucket = self._buckets.get(slot)
+        if bucket is None:
+            bucket = self._buckets[slot] = set()
+            heapq.heappush(self._slots, slot)
+        bucket.add(item_id)
+        self._armed[item_id] = slot
+
+    def discard(self, item_id: int):
+        slot = self._armed.pop(item_id, None)
+        if slot is not None:
+            self._buckets.get(slot, set()).discard(item_id)
+
+    def _skip_empty(self):
+        while self._slots and not self._buckets.get(self._slots[0]):
+            self._buckets.pop(heapq.heappop(self._slots), None)
+
+    def next_due(self) -> Optional[float]:
+        """最近一个非空桶的触发时间"""
+        self._skip_empty()
+        return self._slots[0] * self.tick if self._slots else None
+
+    def pop_due(self, now: float) -> List[int]:
+        """弹出所有已到期的条目，按到期先后排列"""
+        due: List[int] = []
+        self._skip_empty()
+        while self._slots and self._slots[0] * self.tick <= now:
+            bucket = self._buckets.pop(heapq.heappop(self._slots), set())
+            for item_id in sorted(bucket):
+                self._armed.pop(item_id, None)
+                due.append(item_id)
+            self._skip_empty()
+        return due
+
+
+class ReminderDispatcher:
+    """日程提醒调度器"""
+
+    def __init__(
+        self,
+        window_seconds: int = WINDOW_SECONDS,
+        session_factory: Callable = get_db_session
+    ):
+        self.window_seconds = window_seconds
+        self._session_factory = session_factory
+        self._wheel = TimerWheel()
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # 当前窗口的截止时间（北京时间），晚于它的提醒留给下次加载
+        self._horizon: Optional[datetime] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _arm(self, reminder_id: int, remind_time: datetime, now: datetime):
+        loop = asyncio.get_running_loop()
+        self._wheel.add(reminder_id, loop.time() + (remind_time - now).total_seconds())
+
+    async def load_window(self) -> int:
+        """加载截至窗口末尾的待发送提醒（含已逾期的），返回条数"""
+        now = _now()
+        horizon = now + timedelta(seconds=self.window_seconds)
+        async with self._session_factory() as db:
+            rows = await ReminderService.load_due_window(db, horizon)
+        for reminder_id, remind_time in rows:
+            self._arm(reminder_id, remind_time, now)
+        self._horizon = horizon
+        return len(rows)
+
+    def arm(self, reminder_id: int, remind_time: datetime):
+        """
+        挂载新建的提醒
+
+        落在当前窗口内的提醒立即挂载，否则等下次加载窗口时读取；调度器未运行时忽略
+        """
+        if not self.running or self._horizon is None or remind_time > self._horizon:
+            return
+        self._arm(reminder_id, remind_time, _now())
+        self._wake.set()
+
+    async def fire_due(self) -> int:
+        """认领并推送所有已到期的提醒，返回本 worker 实际推送的条数"""
+        due = self._wheel.pop_due(asyncio.get_running_loop().time())
+        sent = 0
+        for start in range(0, len(due), CLAIM_BATCH_SIZE):
+            async with self._session_factory() as db:
+                claimed = await ReminderService.claim_reminders(db, due[start:start + CLAIM_BATCH_SIZE])
+            for item in claimed:
+                try:
+                    await ws_manager.send_personal_message({
+                        "type": "schedule_reminder",
+                        "data": {
+                            "event_id": item["event_id"],
+                            "title": item["title"],
+                            "start_date": item["start_date"].isoformat() if item["start_date"] else None,
+                            "start_time": item["start_time"].isoformat() if item["start_time"] else None,
+                            "location": item["location"],
+                            "is_all_day": item["is_all_day"],
+                            "remind_before_minutes": item["remind_before_minutes"]
+                        }
+                    }, item["user_id"])
+                    sent += 1
+                    logger.debug(f"📅 已推送提醒: {item['title']} -> 用户 {item['user_id']}")
+                except Exception as e:
+                    logger.error(f"推送单个提醒失败: {e}")
+        return sent
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_load = 0.0
+        while True:
+            self._wake.clear()
+            try:
+                if loop.time() >= next_load:
+                    await self.load_window()
+                    # 提前一个刻度刷新，窗口之间不留空隙
+                    next_load = loop.time() + self.window_seconds - WHEEL_TICK_SECONDS
+                await self.fire_due()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"日程提醒调度失败: {e}")
+                next_load = min(next_load, loop.time() + 60)
+
+            wake_at = next_load
+            next_due = self._wheel.next_due()
+            if next_due is not None:
+                wake_at = min(wake_at, next_due)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=max(wake_at - loop.time(), 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        if self.running:
+            return
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info("日程提醒调度已启动")
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._horizon = None
+
+
+_dispatcher: Optional[ReminderDispatcher] = None
+
+
+def get_reminder_dispatcher() -> ReminderDispatcher:
+    """获取提醒调度器单例"""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = ReminderDispatcher()
+    return _dispatcher
@@ -5,7 +5,7 @@
 
 from datetime import datetime, date, time
 from typing import Optional, List
-from sqlalchemy import String, Text, Integer, DateTime, Date, Time, ForeignKey, Boolean, Enum as SQLEnum
+from sqlalchemy import String, Text, Integer, DateTime, Date, Time, ForeignKey, Boolean, Index, Enum as SQLEnum
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 import enum
 
@@ -73,7 +73,11 @@ class ScheduleEvent(Base):
 class ScheduleReminder(Base):
     """日程提醒表"""
     __tablename__ = "schedule_reminders"
-    __table_args__ = {'extend_existing': True, 'comment': '日程提醒表'}
+    __table_args__ = (
+        # 提醒调度按 (未发送, 提醒时间) 范围加载到期窗口
+        Index("idx_schedule_reminder_due", "is_sent", "remind_time"),
+        {'extend_existing': True, 'comment': '日程提醒表'}
+    )
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True, comment="主键ID")
     event_id: Mapped[int] = mapped_column(ForeignKey("schedule_events.id", ondelete="CASCADE"), comment="关联日程ID")
@@ -45,6 +45,7 @@ class ScheduleService:
         await db.flush()
         
         # 创建提醒
+        reminder = None
         if data.remind_before_minutes is not None and data.remind_before_minutes >= 0:
             remind_time = ScheduleService._calculate_remind_time(
                 data.start_date, 
@@ -61,6 +62,10 @@ class ScheduleService:
         
         await db.commit()
         await db.refresh(event, attribute_names=['reminders'])
+        if reminder is not None:
+            # 落在当前调度窗口内的提醒立即挂上时间轮
+            from .schedule_dispatcher import get_reminder_dispatcher
+            get_reminder_dispatcher().arm(reminder.id, reminder.remind_time)
         logger.info(f"用户 {user_id} 创建日程: {event.title}")
         return event
     
@@ -327,6 +332,78 @@ class ReminderService:
         result = await db.execute(stmt)
         return list(result.scalars().all())
     
+    @staticmethod
+    async def load_due_window(db: AsyncSession, until: datetime) -> List[Tuple[int, datetime]]:
+        """一次联表读出截至 until 的待发送提醒，返回 (提醒ID, 提醒时间) 列表"""
+        stmt = select(ScheduleReminder.id, ScheduleReminder.remind_time).join(
+            ScheduleEvent, ScheduleReminder.event_id == ScheduleEvent.id
+        ).where(
+            and_(
+                ScheduleReminder.is_sent == False,
+                ScheduleReminder.remind_time <= until,
+                ScheduleEvent.is_deleted == False
+            )
+        ).order_by(ScheduleReminder.remind_time)
+        result = await db.execute(stmt)
+        return [(row.id, row.remind_time) for row in result.all()]
+    
+    @staticmethod
+    async def claim_reminders(db: AsyncSession, reminder_ids: List[int]) -> List[dict]:
+        """
+        原子认领提醒并批量标记已发送
+        
+        先以 FOR UPDATE SKIP LOCKED 锁定仍未发送的行（其他 worker 正在认领的行直接跳过），
+        再用带 is_sent 条件的单条 UPDATE 标记，多 worker 同时认领同一批提醒时每条只会被一个 worker 拿到。
+        不支持行锁的 SQLite 依靠写锁串行化，更新行数不符时回滚重试。
+        
+        Returns:
+            本次认领成功的提醒（含推送所需的日程字段）
+        """
+        if not reminder_ids:
+            return []
+        
+        stmt = select(
+            ScheduleReminder.id,
+            ScheduleReminder.remind_before_minutes,
+            ScheduleEvent.id.label("event_id"),
+            ScheduleEvent.user_id,
+            ScheduleEvent.title,
+            ScheduleEvent.start_date,
+            ScheduleEvent.start_time,
+            ScheduleEvent.location,
+            ScheduleEvent.is_all_day
+        ).join(
+            ScheduleEvent, ScheduleReminder.event_id == ScheduleEvent.id
+        ).where(
+            and_(
+                ScheduleReminder.id.in_(reminder_ids),
+                ScheduleReminder.is_sent == False,
+                ScheduleEvent.is_deleted == False
+            )
+        ).with_for_update(skip_locked=True, of=ScheduleReminder)
+        
+        for _ in range(2):
+            rows = (await db.execute(stmt)).all()
+            if not rows:
+                await db.commit()
+                return []
+            claimed_ids = [row.id for row in rows]
+            result = await db.execute(
+                update(ScheduleReminder).where(
+                    and_(
+                        ScheduleReminder.id.in_(claimed_ids),
+                        ScheduleReminder.is_sent == False
+                    )
+                ).values(is_sent=True, sent_at=get_beijing_time())
+            )
+            if result.rowcount == len(claimed_ids):
+                await db.commit()
+                return [dict(row._mapping) for row in rows]
+            # 部分行已被其他 worker 标记：回滚后按最新状态重新认领
+            await db.rollback()
+        logger.warning(f"认领日程提醒冲突，本轮跳过: {len(reminder_ids)} 条")
+        return []
+    
     @staticmethod
     async def mark_reminder_sent(db: AsyncSession, reminder_id: int) -> bool:
         """标记提醒已发送"""
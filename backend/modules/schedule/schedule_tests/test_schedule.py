@@ -99,6 +99,80 @@ class TestScheduleService:
         assert isinstance(stats, dict)
 
 
+# ==================== 提醒调度测试 ====================
+class TestReminderDispatcher:
+    def test_timer_wheel_order_and_rearm(self):
+        from modules.schedule.schedule_dispatcher import TimerWheel
+        wheel = TimerWheel(tick=1.0)
+        wheel.add(1, 10.2)
+        wheel.add(2, 5.0)
+        wheel.add(3, 30.0)
+        assert wheel.next_due() == 5.0
+        # 重新挂载后只在新时间触发一次
+        wheel.add(3, 4.5)
+        assert wheel.pop_due(9.0) == [2, 3]
+        assert wheel.next_due() == 11.0
+        assert wheel.pop_due(10.5) == []
+        wheel.discard(1)
+        assert len(wheel) == 0 and wheel.next_due() is None
+
+    @staticmethod
+    async def _create_due_reminder(db_session):
+        from modules.schedule.schedule_services import ScheduleService
+        from modules.schedule.schedule_schemas import EventCreate
+        from modules.schedule.schedule_dispatcher import _now
+        start = _now() + timedelta(minutes=10)
+        event = await ScheduleService.create_event(db_session, user_id=1, data=EventCreate(
+            title="站会", start_date=start.date(), start_time=start.time().replace(microsecond=0),
+            remind_before_minutes=30
+        ))
+        return event
+
+    @pytest.mark.asyncio
+    async def test_claim_is_exactly_once(self, db_session):
+        from modules.schedule.schedule_services import ReminderService
+        from modules.schedule.schedule_dispatcher import _now
+        event = await self._create_due_reminder(db_session)
+        window = await ReminderService.load_due_window(db_session, _now())
+        ids = [rid for rid, _ in window]
+        assert event.reminders[0].id in ids
+
+        first = await ReminderService.claim_reminders(db_session, ids)
+        second = await ReminderService.claim_reminders(db_session, ids)
+        assert [item["event_id"] for item in first] == [event.id]
+        assert second == []
+        assert await ReminderService.load_due_window(db_session, _now()) == []
+
+    @pytest.mark.asyncio
+    async def test_dispatchers_share_window_fire_once(self, db_session, monkeypatch):
+        from contextlib import asynccontextmanager
+        from core.ws_manager import manager
+        from modules.schedule.schedule_dispatcher import ReminderDispatcher
+        event = await self._create_due_reminder(db_session)
+
+        pushed = []
+
+        async def fake_send(message, user_id):
+            pushed.append((user_id, message))
+        monkeypatch.setattr(manager, "send_personal_message", fake_send)
+
+        @asynccontextmanager
+        async def session_factory():
+            yield db_session
+
+        # 两个 worker 加载同一窗口，逾期提醒立即到期
+        workers = [ReminderDispatcher(session_factory=session_factory) for _ in range(2)]
+        assert [await w.load_window() for w in workers] == [1, 1]
+        assert [await w.fire_due() for w in workers] == [1, 0]
+
+        assert len(pushed) == 1
+        user_id, message = pushed[0]
+        assert user_id == 1
+        assert message["type"] == "schedule_reminder"
+        assert message["data"]["event_id"] == event.id
+        assert message["data"]["remind_before_minutes"] == 30
+
+
 # ==================== API 路由测试 ====================
 @pytest.mark.asyncio
 class TestScheduleEventAPI:
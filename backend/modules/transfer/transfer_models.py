@@ -62,6 +62,8 @@ class TransferSession(Base):
     transferred_bytes = Column(BigInteger, default=0, comment="已传输字节数")
     total_chunks = Column(Integer, default=0, comment="总分块数")
     completed_chunks = Column(Integer, default=0, comment="已完成分块数")
+    chunk_size = Column(Integer, nullable=True, comment="协商的分块大小(字节)")
+    file_hash = Column(String(64), nullable=True, comment="整文件树哈希(SHA-256)")
     
     # 临时文件路径
     temp_file_path = Column(String(512), nullable=True, comment="临时文件存储路径")
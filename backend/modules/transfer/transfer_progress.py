@@ -0,0 +1,170 @@
+"""
+快传模块 - 上传进度状态
+分块位图与累计计数保存在 Redis（多 worker 共享）或进程内存中，
+通过原子位操作判断分块是否首次到达，重传的分块不会被重复计数。
+同时记录每个分块的 SHA-256 摘要，完成时据此计算整文件树哈希，无需回读文件。
+数据库中的进度仅按批次落盘，由 ChunkService 负责
+"""
+
+import time
+import hashlib
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 状态保留时长（秒），足够覆盖一次大文件传输
+STATE_TTL_SECONDS = 24 * 3600
+
+# 原子标记分块并记录分块摘要：返回 {是否首次标记, 已完成分块数, 已传输字节数}
+_MARK_SCRIPT = """
+local old = redis.call('SETBIT', KEYS[1], ARGV[1], 1)
+if old == 0 then
+    redis.call('HINCRBY', KEYS[2], 'chunks', 1)
+    redis.call('HINCRBY', KEYS[2], 'bytes', ARGV[2])
+end
+if ARGV[4] ~= '' then
+    redis.call('HSET', KEYS[3], ARGV[1], ARGV[4])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+redis.call('EXPIRE', KEYS[2], ARGV[3])
+redis.call('EXPIRE', KEYS[3], ARGV[3])
+local v = redis.call('HMGET', KEYS[2], 'chunks', 'bytes')
+return {1 - old, tonumber(v[1]) or 0, tonumber(v[2]) or 0}
+"""
+
+
+class MemoryProgressStore:
+    """进程内进度状态（未配置 Redis 时使用）"""
+
+    def __init__(self, ttl: int = STATE_TTL_SECONDS):
+        self.ttl = ttl
+        self._states: Dict[str, dict] = {}
+
+    def _purge(self):
+        now = time.monotonic()
+        expired = [code for code, s in self._states.items() if now - s["touched"] > self.ttl]
+        for code in expired:
+            del self._states[code]
+
+    async def mark(
+        self, session_code: str, chunk_index: int, size: int, digest: Optional[str] = None
+    ) -> Tuple[bool, int, int]:
+        """标记分块已写入并记录其摘要，返回 (是否首次, 已完成分块数, 已传输字节数)"""
+        state = self._states.get(session_code)
+        if state is None:
+            self._purge()
+            state = self._states[session_code] = {
+                "bits": bytearray(), "chunks": 0, "bytes": 0, "leaves": {}
+            }
+        state["touched"] = time.monotonic()
+
+        bits: bytearray = state["bits"]
+        byte_index, mask = chunk_index >> 3, 0x80 >> (chunk_index & 7)
+        if byte_index >= len(bits):
+            bits.extend(b"\x00" * (byte_index + 1 - len(bits)))
+        is_new = not bits[byte_index] & mask
+        if is_new:
+            bits[byte_index] |= mask
+            state["chunks"] += 1
+            state["bytes"] += size
+        if digest:
+            # 重传的分块以最后写入的内容为准
+            state["leaves"][chunk_index] = digest
+        return is_new, state["chunks"], state["bytes"]
+
+    async def get(self, session_code: str) -> Optional[Tuple[int, int]]:
+        state = self._states.get(session_code)
+        if state is None:
+            return None
+        return state["chunks"], state["bytes"]
+
+    async def missing(self, session_code: str, total_chunks: int) -> List[int]:
+        state = self._states.get(session_code)
+        bits = state["bits"] if state else bytearray()
+        return [
+            i for i in range(total_chunks)
+            if (i >> 3) >= len(bits) or not bits[i >> 3] & (0x80 >> (i & 7))
+        ]
+
+    async def leaves(self, session_code: str, total_chunks: int) -> List[Optional[str]]:
+        """按索引顺序返回分块摘要"""
+        state = self._states.get(session_code)
+        leaves = state["leaves"] if state else {}
+        return [leaves.get(i) for i in range(total_chunks)]
+
+    async def clear(self, session_code: str):
+        self._states.pop(session_code, None)
+
+
+class RedisProgressStore:
+    """基于 Redis 位图的进度状态，多 worker 共享"""
+
+    def __init__(self, client, prefix: str = "transfer:upload", ttl: int = STATE_TTL_SECONDS):
+        self.client = client
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _keys(self, session_code: str) -> Tuple[str, str, str]:
+        base = f"{self.prefix}:{session_code}"
+        return f"{base}:bits", f"{base}:stat", f"{base}:leaves"
+
+    async def mark(
+        self, session_code: str, chunk_index: int, size: int, digest: Optional[str] = None
+    ) -> Tuple[bool, int, int]:
+        is_new, chunks, total_bytes = await self.client.eval(
+            _MARK_SCRIPT, 3, *self._keys(session_code), chunk_index, size, self.ttl, digest or ""
+        )
+        return bool(int(is_new)), int(chunks), int(total_bytes)
+
+    async def get(self, session_code: str) -> Optional[Tuple[int, int]]:
+        _, stat_key, _ = self._keys(session_code)
+        chunks, total_bytes = await self.client.hmget(stat_key, "chunks", "bytes")
+        if chunks is None:
+            return None
+        return int(chunks), int(total_bytes or 0)
+
+    async def missing(self, session_code: str, total_chunks: int) -> List[int]:
+        bits_key = self._keys(session_code)[0]
+        pipe = self.client.pipeline(transaction=False)
+        for i in range(total_chunks):
+            pipe.getbit(bits_key, i)
+        flags = await pipe.execute()
+        return [i for i, flag in enumerate(flags) if not int(flag)]
+
+    async def leaves(self, session_code: str, total_chunks: int) -> List[Optional[str]]:
+        values = await self.client.hgetall(self._keys(session_code)[2])
+        return [values.get(str(i)) for i in range(total_chunks)]
+
+    async def clear(self, session_code: str):
+        await self.client.delete(*self._keys(session_code))
+
+
+def compute_tree_hash(leaves: List[str]) -> str:
+    """
+    由分块摘要计算整文件树哈希（二叉 Merkle 树，SHA-256）
+
+    逐层两两拼接后取哈希，奇数个节点时最后一个直接晋升；
+    只有一个分块时根即该分块的摘要
+    """
+    level = [bytes.fromhex(leaf) for leaf in leaves]
+    if not level:
+        return hashlib.sha256(b"").hexdigest()
+    while len(level) > 1:
+        paired = [hashlib.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            paired.append(level[-1])
+        level = paired
+    return level[0].hex()
+
+
+_memory_store = MemoryProgressStore()
+
+
+def get_progress_store():
+    """Redis 可用时使用共享位图，否则退回进程内存"""
+    from core import cache
+    client = cache._redis_client
+    if client is not None:
+        return RedisProgressStore(client)
+    return _memory_store
@@ -7,8 +7,8 @@ import os
 import logging
 from typing import Optional
 from pathlib import Path
-from fastapi import APIRouter, Depends, UploadFile, File, Form, Query, Request
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Query, Request, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from io import BytesIO
 
@@ -16,6 +16,8 @@ from core.database import get_db
 from core.security import get_current_user, require_permission, TokenData
 from core.errors import NotFoundException, PermissionException, AuthException, BusinessException, ErrorCode
 
+from utils.download import file_response
+
 from .transfer_schemas import (
     SessionCreate, SessionJoin, SessionResponse, SessionStatus,
     ChunkUploadResponse, HistoryItem, HistoryListResponse, HistoryStats,
@@ -39,6 +41,7 @@ async def get_config():
         chunk_size=ServiceConfig.CHUNK_SIZE,
         session_expire_minutes=ServiceConfig.SESSION_EXPIRE_MINUTES,
         history_days=ServiceConfig.HISTORY_DAYS,
+        max_chunk_size=ServiceConfig.MAX_CHUNK_SIZE,
         concurrent_chunks=ServiceConfig.CONCURRENT_CHUNKS
     )
 
@@ -65,6 +68,7 @@ async def create_session(
     
     try:
         session = await TransferService.create_session(db, current_user.user_id, data)
+        _, concurrent_chunks = ServiceConfig.negotiate(session.file_size)
         
         return {
             "code": 0,
@@ -75,7 +79,8 @@ async def create_session(
                 "file_size": session.file_size,
                 "total_chunks": session.total_chunks,
                 "expires_at": session.expires_at.isoformat(),
-                "chunk_size": ServiceConfig.CHUNK_SIZE
+                "chunk_size": ChunkService.chunk_size_of(session),
+                "concurrent_chunks": concurrent_chunks
             }
         }
     except ValueError as e:
@@ -116,7 +121,7 @@ async def join_session(
                 "file_size": session.file_size,
                 "file_type": session.file_type,
                 "total_chunks": session.total_chunks,
-                "chunk_size": ServiceConfig.CHUNK_SIZE,
+                "chunk_size": ChunkService.chunk_size_of(session),
                 "sender_id": session.sender_id
             }
         }
@@ -160,10 +165,11 @@ async def get_session_status(
     if not session:
         raise NotFoundException("会话")
     
-    # 计算进度
+    # 计算进度（传输中以上传状态为准，数据库按批次落盘）
+    completed_chunks, transferred_bytes = await ChunkService.get_progress(session)
     progress = 0.0
     if session.file_size > 0:
-        progress = round(session.transferred_bytes / session.file_size * 100, 2)
+        progress = round(transferred_bytes / session.file_size * 100, 2)
     
     # 获取对方信息
     peer_connected = session.receiver_id is not None
@@ -186,9 +192,11 @@ async def get_session_status(
             "status": session.status,
             "file_name": session.file_name,
             "file_size": session.file_size,
-            "transferred_bytes": session.transferred_bytes,
+            "transferred_bytes": transferred_bytes,
             "total_chunks": session.total_chunks,
-            "completed_chunks": session.completed_chunks,
+            "completed_chunks": completed_chunks,
+            "chunk_size": ChunkService.chunk_size_of(session),
+            "file_hash": session.file_hash if session.status == TransferStatus.COMPLETED else None,
             "progress_percent": progress,
             "peer_connected": peer_connected,
             "peer_nickname": peer_nickname,
@@ -209,9 +217,10 @@ async def get_active_sessions(
     
     result = []
     for session in sessions:
+        _, transferred_bytes = await ChunkService.get_progress(session)
         progress = 0.0
         if session.file_size > 0:
-            progress = round(session.transferred_bytes / session.file_size * 100, 2)
+            progress = round(transferred_bytes / session.file_size * 100, 2)
         
         result.append({
             "session_code": session.session_code,
@@ -273,7 +282,7 @@ async def upload_chunk(
         raise PermissionException("只有发送方可以上传分块")
     
     # 读取分块数据（限制单个分块大小，防止内存耗尽）
-    MAX_CHUNK_SIZE = 10 * 1024 * 1024  # 10MB 单块上限
+    MAX_CHUNK_SIZE = ServiceConfig.MAX_CHUNK_SIZE
     chunk_data = await chunk.read(MAX_CHUNK_SIZE + 1)
     if len(chunk_data) > MAX_CHUNK_SIZE:
         raise BusinessException(ErrorCode.FILE_TOO_LARGE, f"分块大小超过限制（最大 {MAX_CHUNK_SIZE // 1024 // 1024}MB）")
@@ -286,9 +295,10 @@ async def upload_chunk(
     if not success:
         raise BusinessException(ErrorCode.VALIDATION_ERROR, message)
     
-    # 获取更新后的会话状态
+    # 获取更新后的会话状态（进度取自上传状态，避免每个分块回读数据库计数）
     session = await TransferService.get_session(db, session_code)
-    progress = round(session.transferred_bytes / session.file_size * 100, 2) if session.file_size > 0 else 0
+    completed_chunks, transferred_bytes = await ChunkService.get_progress(session)
+    progress = round(transferred_bytes / session.file_size * 100, 2) if session.file_size > 0 else 0
     
     return {
         "code": 0,
@@ -296,8 +306,8 @@ async def upload_chunk(
         "data": {
             "chunk_index": chunk_index,
             "success": True,
-            "transferred_bytes": session.transferred_bytes,
-            "completed_chunks": session.completed_chunks,
+            "transferred_bytes": transferred_bytes,
+            "completed_chunks": completed_chunks,
             "total_chunks": session.total_chunks,
             "progress_percent": progress,
             "status": session.status
@@ -305,6 +315,36 @@ async def upload_chunk(
     }
 
 
+@router.get("/chunk/missing/{session_code}", summary="获取未上传的分块")
+async def get_missing_chunks(
+    session_code: str,
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenData = Depends(require_permission("transfer.send"))
+):
+    """
+    获取尚未到达的分块索引
+    
+    发送方断线重连后只需补传这些分块
+    """
+    session = await TransferService.get_session(db, session_code, current_user.user_id)
+    if not session:
+        raise NotFoundException("会话")
+    
+    missing = await ChunkService.get_missing_chunks(session)
+    completed_chunks, transferred_bytes = await ChunkService.get_progress(session)
+    
+    return {
+        "code": 0,
+        "data": {
+            "session_code": session.session_code,
+            "total_chunks": session.total_chunks,
+            "completed_chunks": completed_chunks,
+            "transferred_bytes": transferred_bytes,
+            "missing_chunks": missing
+        }
+    }
+
+
 @router.get("/chunk/download/{session_code}/{chunk_index}", summary="下载分块")
 async def download_chunk(
     session_code: str,
@@ -386,15 +426,13 @@ async def download_file(
     if not str(resolved_path).startswith(str(temp_dir.resolve())):
         raise PermissionException("文件路径非法")
     
-    # URL 编码文件名以支持中文
-    from urllib.parse import quote
-    encoded_filename = quote(session.file_name)
-    
-    return FileResponse(
-        str(resolved_path),
-        filename=session.file_name,
+    # 支持断点续传与条件请求，中断的大文件下载可从断点继续
+    return file_response(
+        request,
+        resolved_path,
         media_type=session.file_type or "application/octet-stream",
-        headers={"Content-Disposition": f"attachment; filename*=UTF-8''{encoded_filename}"}
+        filename=session.file_name,
+        headers={"X-File-Hash": session.file_hash or ""}
     )
 
 
@@ -36,6 +36,9 @@ class SessionCreate(BaseModel):
     file_size: int = Field(..., gt=0, description="文件大小(字节)")
     file_type: Optional[str] = Field(None, max_length=64, description="文件MIME类型")
     device_info: Optional[str] = Field(None, max_length=128, description="设备信息")
+    file_hash: Optional[str] = Field(
+        None, pattern=r"^[0-9a-fA-F]{64}$", description="可选，整文件树哈希，完成时用于校验"
+    )
 
 
 class SessionJoin(BaseModel):
@@ -201,4 +204,5 @@ class TransferConfig(BaseModel):
     chunk_size: int = Field(default=1048576, description="分块大小(1MB)")
     session_expire_minutes: int = Field(default=10, description="会话过期时间(分钟)")
     history_days: int = Field(default=30, description="历史保留天数")
-    concurrent_chunks: int = Field(default=3, description="并发分块数")
+    max_chunk_size: int = Field(default=8388608, description="大文件分块上限(8MB)")
+    concurrent_chunks: int = Field(default=4, description="并发分块数")
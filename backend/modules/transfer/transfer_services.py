@@ -4,7 +4,9 @@
 """
 
 import os
+import time
 import random
+import asyncio
 import hashlib
 import aiofiles
 import logging
@@ -18,6 +20,7 @@ from sqlalchemy.orm import selectinload
 
 from core.config import get_settings
 from .transfer_models import TransferSession, TransferHistory, TransferChunk, TransferStatus, TransferDirection
+from .transfer_progress import get_progress_store, compute_tree_hash
 from .transfer_schemas import (
     SessionCreate, SessionResponse, HistoryItem, HistoryStats,
     TransferStatusEnum, TransferDirectionEnum
@@ -31,10 +34,34 @@ class TransferConfig:
     """传输配置"""
     # 默认配置值
     MAX_FILE_SIZE = 1024 * 1024 * 1024  # 1GB
-    CHUNK_SIZE = 1024 * 1024  # 1MB
+    CHUNK_SIZE = 1024 * 1024  # 1MB（默认/最小分块）
+    MAX_CHUNK_SIZE = 8 * 1024 * 1024  # 8MB（大文件分块上限）
     SESSION_EXPIRE_MINUTES = 10
     HISTORY_DAYS = 30
-    CONCURRENT_CHUNKS = 3
+    CONCURRENT_CHUNKS = 4
+    # 单文件目标分块数：文件越大分块越大，减少请求次数
+    TARGET_CHUNKS = 256
+    # 进度落盘批次：每完成 N 个分块或间隔 T 秒写一次数据库
+    PROGRESS_FLUSH_CHUNKS = 32
+    PROGRESS_FLUSH_SECONDS = 2.0
+    
+    @classmethod
+    def negotiate(cls, file_size: int) -> Tuple[int, int]:
+        """
+        为会话协商分块大小与并发数
+        
+        分块大小取 2 的幂，使总分块数接近 TARGET_CHUNKS，限制在 [CHUNK_SIZE, MAX_CHUNK_SIZE]；
+        并发数不超过分块总数
+        
+        Returns:
+            Tuple[int, int]: (分块大小, 并发分块数)
+        """
+        chunk_size = cls.CHUNK_SIZE
+        while chunk_size < cls.MAX_CHUNK_SIZE and file_size > chunk_size * cls.TARGET_CHUNKS:
+            chunk_size *= 2
+        chunk_size = min(chunk_size, cls.MAX_CHUNK_SIZE)
+        total_chunks = max(1, (file_size + chunk_size - 1) // chunk_size)
+        return chunk_size, max(1, min(cls.CONCURRENT_CHUNKS, total_chunks))
     
     @classmethod
     def get_temp_dir(cls) -> Path:
@@ -98,13 +125,18 @@ class TransferService:
         if not session_code:
             raise ValueError("生成传输码失败，请重试")
         
-        # 计算分块数
-        chunk_size = TransferConfig.CHUNK_SIZE
+        # 协商分块大小并计算分块数
+        chunk_size, _ = TransferConfig.negotiate(data.file_size)
         total_chunks = (data.file_size + chunk_size - 1) // chunk_size
         
         # 计算过期时间
         expires_at = get_beijing_time() + timedelta(minutes=TransferConfig.SESSION_EXPIRE_MINUTES)
         
+        # 临时文件路径在创建时确定，分块上传时无需再写回会话
+        temp_file_path = ChunkService.resolve_temp_path(session_code, data.file_name)
+        if not temp_file_path:
+            raise ValueError("文件名包含非法字符")
+        
         # 创建会话
         session = TransferSession(
             session_code=session_code,
@@ -116,6 +148,9 @@ class TransferService:
             file_type=data.file_type,
             file_count=1,
             total_chunks=total_chunks,
+            chunk_size=chunk_size,
+            file_hash=data.file_hash.lower() if data.file_hash else None,
+            temp_file_path=temp_file_path,
             expires_at=expires_at
         )
         
@@ -333,8 +368,9 @@ class TransferService:
         )
         await db.commit()
         
-        # 清理临时文件
+        # 清理临时文件与上传状态
         await TransferService.cleanup_temp_files(session)
+        await ChunkService.clear_progress(session_code)
         
         logger.info(f"会话已取消: {session_code}")
         
@@ -342,13 +378,16 @@ class TransferService:
     
     @staticmethod
     async def cleanup_temp_files(session: TransferSession):
-        """清理会话的临时文件"""
-        if session.temp_file_path and os.path.exists(session.temp_file_path):
-            try:
-                os.remove(session.temp_file_path)
-                logger.info(f"已清理临时文件: {session.temp_file_path}")
-            except Exception as e:
-                logger.error(f"清理临时文件失败: {e}")
+        """清理会话的临时文件（含未完成的 .part 文件）"""
+        if not session.temp_file_path:
+            return
+        for path in (session.temp_file_path, ChunkService.part_path(session.temp_file_path)):
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                    logger.info(f"已清理临时文件: {path}")
+                except Exception as e:
+                    logger.error(f"清理临时文件失败: {e}")
     
     @staticmethod
     async def cleanup_expired_sessions(db: AsyncSession) -> int:
@@ -371,6 +410,7 @@ class TransferService:
         for session in expired_sessions:
             session.status = TransferStatus.EXPIRED
             await TransferService.cleanup_temp_files(session)
+            await ChunkService.clear_progress(session.session_code)
             count += 1
         
         if count > 0:
@@ -381,13 +421,242 @@ class TransferService:
 
 
 class ChunkService:
-    """分块传输服务"""
+    """
+    分块传输服务
+
+    分块是否到达由进度存储（Redis 位图/进程内存）原子记录，数据库中的
+    transferred_bytes / completed_chunks 只按批次或在完成时落盘，
+    避免每个分块一次提交使会话行成为锁热点。
+    """
+    
+    # 会话码 -> (上次落盘的分块数, 落盘时间)，仅用于决定本进程何时落盘
+    _flushed: dict = {}
     
     @staticmethod
     def calculate_chunk_hash(data: bytes) -> str:
         """计算分块的MD5哈希"""
         return hashlib.md5(data).hexdigest()
     
+    @staticmethod
+    def resolve_temp_path(session_code: str, file_name: str) -> Optional[str]:
+        """计算会话临时文件路径（对文件名进行安全过滤，防止路径穿越）"""
+        temp_dir = TransferConfig.get_temp_dir()
+        # 只保留文件名部分，移除任何路径分隔符防止路径穿越
+        safe_name = os.path.basename(file_name or '').replace('..', '_')
+        if not safe_name:
+            safe_name = 'unnamed'
+        resolved = (temp_dir / f"{session_code}_{safe_name}").resolve()
+        # 验证最终路径确实在临时目录下
+        if not str(resolved).startswith(str(temp_dir.resolve())):
+            return None
+        return str(resolved)
+    
+    @staticmethod
+    def part_path(temp_file_path: str) -> str:
+        """传输中的文件路径，完成后重命名为正式路径"""
+        return f"{temp_file_path}.part"
+    
+    @staticmethod
+    def chunk_size_of(session: TransferSession) -> int:
+        """会话协商的分块大小（旧会话没有记录时使用默认值）"""
+        return session.chunk_size or TransferConfig.CHUNK_SIZE
+    
+    @staticmethod
+    def _preallocate(fd: int, size: int):
+        """预分配文件空间，文件系统不支持 fallocate 时退化为稀疏文件"""
+        try:
+            os.posix_fallocate(fd, 0, size)
+        except (AttributeError, OSError):
+            os.ftruncate(fd, size)
+    
+    @staticmethod
+    def _write_chunk(
+        path: str,
+        offset: int,
+        data: bytes,
+        chunk_hash: Optional[str],
+        file_size: int
+    ) -> Optional[str]:
+        """
+        在线程中校验并写入分块
+        
+        首个到达的分块负责预分配整个文件，之后各分块用 pwrite 按偏移写入，
+        互不影响文件指针，可以并发执行。
+        
+        Returns:
+            分块的 SHA-256 摘要；MD5 校验失败时返回 None
+        """
+        if chunk_hash and hashlib.md5(data).hexdigest() != chunk_hash.lower():
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        
+        # O_CREAT 不截断已有内容
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            if os.fstat(fd).st_size < file_size:
+                ChunkService._preallocate(fd, file_size)
+            view = memoryview(data)
+            written = 0
+            while written < len(view):
+                if hasattr(os, 'pwrite'):
+                    written += os.pwrite(fd, view[written:], offset + written)
+                else:
+                    os.lseek(fd, offset + written, os.SEEK_SET)
+                    written += os.write(fd, view[written:])
+        finally:
+            os.close(fd)
+        return digest
+    
+    @staticmethod
+    def _hash_file_chunks(path: str, chunk_size: int) -> List[str]:
+        """重新读取文件计算各分块摘要（进度状态丢失时的兜底）"""
+        leaves = []
+        with open(path, 'rb') as f:
+            while True:
+                data = f.read(chunk_size)
+                if not data:
+                    break
+                leaves.append(hashlib.sha256(data).hexdigest())
+        return leaves
+    
+    @staticmethod
+    def _should_flush(session_code: str, completed: int, total: int) -> bool:
+        last_chunks, last_time = ChunkService._flushed.get(session_code, (0, 0.0))
+        return (
+            completed >= total
+            or last_chunks == 0
+            or completed - last_chunks >= TransferConfig.PROGRESS_FLUSH_CHUNKS
+            or time.monotonic() - last_time >= TransferConfig.PROGRESS_FLUSH_SECONDS
+        )
+    
+    @staticmethod
+    async def _flush_progress(
+        db: AsyncSession,
+        session: TransferSession,
+        completed: int,
+        transferred: int
+    ):
+        """把进度写入数据库（只前进不后退，多个 worker 乱序落盘也安全）"""
+        from sqlalchemy import case
+        
+        values = {
+            "completed_chunks": completed,
+            "transferred_bytes": transferred,
+            "status": case(
+                (TransferSession.status == TransferStatus.CONNECTED.value, TransferStatus.TRANSFERRING.value),
+                else_=TransferSession.status
+            )
+        }
+        if not session.temp_file_path:
+            values["temp_file_path"] = ChunkService.resolve_temp_path(session.session_code, session.file_name)
+        
+        await db.execute(
+            update(TransferSession)
+            .where(
+                TransferSession.id == session.id,
+                TransferSession.completed_chunks < completed
+            )
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        ChunkService._flushed[session.session_code] = (completed, time.monotonic())
+    
+    @staticmethod
+    async def _complete(db: AsyncSession, session: TransferSession, transferred: int) -> bool:
+        """
+        全部分块到达：由分块摘要计算整文件树哈希，校验通过后
+        把 .part 文件重命名为正式文件，并一次提交完成状态与历史记录
+        
+        Returns:
+            bool: 整文件校验是否通过
+        """
+        final_path = session.temp_file_path or ChunkService.resolve_temp_path(session.session_code, session.file_name)
+        part_path = ChunkService.part_path(final_path)
+        
+        leaves = await get_progress_store().leaves(session.session_code, session.total_chunks)
+        if any(leaf is None for leaf in leaves):
+            leaves = await asyncio.to_thread(
+                ChunkService._hash_file_chunks, part_path, ChunkService.chunk_size_of(session)
+            )
+        file_hash = compute_tree_hash(leaves)
+        
+        if session.file_hash and session.file_hash != file_hash:
+            await db.execute(
+                update(TransferSession)
+                .where(TransferSession.id == session.id)
+                .values(status=TransferStatus.FAILED.value, completed_at=get_beijing_time())
+                .execution_options(synchronize_session=False)
+            )
+            await db.refresh(session)
+            await HistoryService.create_history(db, session, success=False, error_message="整文件校验失败")
+            await db.commit()
+            await TransferService.cleanup_temp_files(session)
+            await ChunkService.clear_progress(session.session_code)
+            logger.warning(f"传输 {session.session_code} 整文件校验失败")
+            return False
+        
+        # 同一文件系统内的重命名为 O(1)，不复制数据
+        await asyncio.to_thread(os.replace, part_path, final_path)
+        
+        result = await db.execute(
+            update(TransferSession)
+            .where(
+                TransferSession.id == session.id,
+                TransferSession.status != TransferStatus.COMPLETED.value
+            )
+            .values(
+                status=TransferStatus.COMPLETED.value,
+                completed_chunks=session.total_chunks,
+                transferred_bytes=transferred,
+                file_hash=file_hash,
+                temp_file_path=final_path,
+                completed_at=get_beijing_time()
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount:
+            await db.refresh(session)
+            await HistoryService.create_history(db, session)
+        else:
+            await db.commit()
+        await ChunkService.clear_progress(session.session_code)
+        return True
+    
+    @staticmethod
+    async def clear_progress(session_code: str):
+        """清理会话的上传状态"""
+        ChunkService._flushed.pop(session_code, None)
+        try:
+            await get_progress_store().clear(session_code)
+        except Exception as e:
+            logger.warning(f"清理上传状态失败: {e}")
+    
+    @staticmethod
+    async def get_progress(session: TransferSession) -> Tuple[int, int]:
+        """
+        获取实时进度 (已完成分块数, 已传输字节数)
+        
+        数据库中的进度按批次落盘，传输中以进度存储为准
+        """
+        completed, transferred = session.completed_chunks or 0, session.transferred_bytes or 0
+        if session.status in (TransferStatus.CONNECTED, TransferStatus.TRANSFERRING):
+            try:
+                live = await get_progress_store().get(session.session_code)
+            except Exception as e:
+                logger.warning(f"读取上传状态失败: {e}")
+                live = None
+            if live and live[0] > completed:
+                completed, transferred = live
+        return completed, transferred
+    
+    @staticmethod
+    async def get_missing_chunks(session: TransferSession) -> List[int]:
+        """获取尚未到达的分块索引（用于断点续传）"""
+        if session.status == TransferStatus.COMPLETED:
+            return []
+        return await get_progress_store().missing(session.session_code, session.total_chunks)
+    
     @staticmethod
     async def save_chunk(
         db: AsyncSession,
@@ -399,6 +668,9 @@ class ChunkService:
         """
         保存分块数据
         
+        哈希校验与文件写入在线程中执行，分块可以乱序、并发到达；
+        重复上传的分块只覆盖写入，不重复计数。
+        
         Args:
             db: 数据库会话
             session_code: 会话码
@@ -417,53 +689,35 @@ class ChunkService:
         if session.status not in [TransferStatus.CONNECTED, TransferStatus.TRANSFERRING]:
             return False, f"会话状态无效: {session.status}"
         
-        # 验证哈希
-        if chunk_hash:
-            calculated_hash = ChunkService.calculate_chunk_hash(chunk_data)
-            if calculated_hash != chunk_hash:
-                return False, "分块数据校验失败"
+        if chunk_index < 0 or chunk_index >= session.total_chunks:
+            return False, "分块索引超出范围"
+        
+        chunk_size = ChunkService.chunk_size_of(session)
+        offset = chunk_index * chunk_size
+        if len(chunk_data) != min(chunk_size, session.file_size - offset):
+            return False, "分块大小不匹配"
+        
+        temp_file_path = session.temp_file_path or ChunkService.resolve_temp_path(session_code, session.file_name)
+        if not temp_file_path:
+            return False, "文件名包含非法字符"
         
-        # 确定临时文件路径（对文件名进行安全过滤，防止路径穿越）
-        if not session.temp_file_path:
-            temp_dir = TransferConfig.get_temp_dir()
-            # 只保留文件名部分，移除任何路径分隔符防止路径穿越
-            safe_name = os.path.basename(session.file_name).replace('..', '_')
-            if not safe_name:
-                safe_name = 'unnamed'
-            temp_file = temp_dir / f"{session_code}_{safe_name}"
-            # 验证最终路径确实在临时目录下
-            resolved = temp_file.resolve()
-            if not str(resolved).startswith(str(temp_dir.resolve())):
-                return False, "文件名包含非法字符"
-            session.temp_file_path = str(resolved)
-        
-        # 写入分块数据
         try:
-            chunk_size = TransferConfig.CHUNK_SIZE
-            offset = chunk_index * chunk_size
-            
-            # 确保文件存在并预分配空间
-            async with aiofiles.open(session.temp_file_path, mode='r+b' if os.path.exists(session.temp_file_path) else 'wb') as f:
-                await f.seek(offset)
-                await f.write(chunk_data)
-            
-            # 更新进度
-            session.completed_chunks += 1
-            session.transferred_bytes += len(chunk_data)
-            
-            if session.status == TransferStatus.CONNECTED:
-                session.status = TransferStatus.TRANSFERRING
+            digest = await asyncio.to_thread(
+                ChunkService._write_chunk,
+                ChunkService.part_path(temp_file_path), offset, chunk_data, chunk_hash, session.file_size
+            )
+            if digest is None:
+                return False, "分块数据校验失败"
             
-            # 检查是否完成
-            # 检查是否完成
-            if session.completed_chunks >= session.total_chunks:
-                session.status = TransferStatus.COMPLETED
-                session.completed_at = get_beijing_time()
-                
-                # 创建历史记录
-                await HistoryService.create_history(db, session)
+            is_new, completed, transferred = await get_progress_store().mark(
+                session_code, chunk_index, len(chunk_data), digest
+            )
             
-            await db.commit()
+            if is_new and completed >= session.total_chunks:
+                if not await ChunkService._complete(db, session, transferred):
+                    return False, "整文件校验失败"
+            elif is_new and ChunkService._should_flush(session_code, completed, session.total_chunks):
+                await ChunkService._flush_progress(db, session, completed, transferred)
             
             return True, "分块保存成功"
             
@@ -492,11 +746,15 @@ class ChunkService:
         if not session or not session.temp_file_path:
             return None
         
+        path = session.temp_file_path
+        if not os.path.exists(path):
+            path = ChunkService.part_path(path)
+        
         try:
-            chunk_size = TransferConfig.CHUNK_SIZE
+            chunk_size = ChunkService.chunk_size_of(session)
             offset = chunk_index * chunk_size
             
-            async with aiofiles.open(session.temp_file_path, mode='rb') as f:
+            async with aiofiles.open(path, mode='rb') as f:
                 await f.seek(offset)
                 
                 # 最后一个分块可能不满
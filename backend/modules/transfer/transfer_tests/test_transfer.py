@@ -3,10 +3,13 @@
 快传模块测试
 覆盖：模型、Schema、服务层、API 路由端点
 """
+import os
+import hashlib
 import pytest
 from httpx import AsyncClient
 from modules.transfer.transfer_models import TransferSession, TransferHistory, TransferStatus
 from modules.transfer.transfer_schemas import SessionCreate
+from modules.transfer.transfer_progress import compute_tree_hash
 
 
 class TestTransferModels:
@@ -71,6 +74,166 @@ class TestTransferService:
         assert len(h) > 0
 
 
+class TestChunkUploadState:
+    """分块上传状态：位图去重、批量落盘、完成检测"""
+
+    async def _connected_session(self, db_session, file_size):
+        from modules.transfer.transfer_services import TransferService
+        session = await TransferService.create_session(db_session, user_id=1, data=SessionCreate(
+            file_name="chunks.bin", file_size=file_size
+        ))
+        return await TransferService.join_session(db_session, 2, session.session_code)
+
+    @pytest.fixture
+    def small_chunks(self, monkeypatch, tmp_workspace):
+        from modules.transfer.transfer_services import TransferConfig
+        monkeypatch.setattr(TransferConfig, "CHUNK_SIZE", 4)
+        monkeypatch.setattr(TransferConfig, "PROGRESS_FLUSH_CHUNKS", 3)
+        monkeypatch.setattr(TransferConfig, "PROGRESS_FLUSH_SECONDS", 3600)
+        return TransferConfig
+
+    @pytest.mark.asyncio
+    async def test_memory_store_dedup(self):
+        from modules.transfer.transfer_progress import MemoryProgressStore
+        store = MemoryProgressStore()
+        assert await store.mark("s", 9, 4) == (True, 1, 4)
+        assert await store.mark("s", 9, 4) == (False, 1, 4)
+        assert await store.mark("s", 0, 2) == (True, 2, 6)
+        assert await store.missing("s", 11) == [1, 2, 3, 4, 5, 6, 7, 8, 10]
+        await store.clear("s")
+        assert await store.get("s") is None
+
+    @pytest.mark.asyncio
+    async def test_retry_not_double_counted(self, db_session, small_chunks):
+        from modules.transfer.transfer_services import ChunkService
+        session = await self._connected_session(db_session, 16)
+        code = session.session_code
+
+        assert (await ChunkService.save_chunk(db_session, code, 1, b"bbbb"))[0]
+        assert (await ChunkService.save_chunk(db_session, code, 1, b"bbbb"))[0]
+        assert await ChunkService.get_progress(session) == (1, 4)
+        assert await ChunkService.get_missing_chunks(session) == [0, 2, 3]
+
+        ok, message = await ChunkService.save_chunk(db_session, code, 4, b"eeee")
+        assert not ok
+
+    @pytest.mark.asyncio
+    async def test_progress_flushed_in_batches(self, db_session, small_chunks, monkeypatch):
+        from modules.transfer.transfer_services import ChunkService, TransferService
+        session = await self._connected_session(db_session, 40)
+        code = session.session_code
+
+        commits = []
+        original_commit = db_session.commit
+
+        async def counting_commit():
+            commits.append(1)
+            await original_commit()
+
+        monkeypatch.setattr(db_session, "commit", counting_commit)
+        for index in range(9):
+            ok, _ = await ChunkService.save_chunk(db_session, code, index, b"x" * 4)
+            assert ok
+        # 首个分块落盘一次，之后每 3 个分块落盘一次
+        assert len(commits) == 3
+
+        await db_session.refresh(session)
+        assert session.status == TransferStatus.TRANSFERRING
+        assert session.completed_chunks == 7
+        assert await ChunkService.get_progress(session) == (9, 36)
+
+    @pytest.mark.asyncio
+    async def test_completion_writes_file_and_history(self, db_session, small_chunks):
+        from modules.transfer.transfer_services import ChunkService, HistoryService
+        session = await self._connected_session(db_session, 10)
+        code = session.session_code
+
+        # 乱序到达，带校验值
+        for index, data in [(2, b"ij"), (0, b"abcd"), (1, b"efgh")]:
+            ok, _ = await ChunkService.save_chunk(
+                db_session, code, index, data, ChunkService.calculate_chunk_hash(data)
+            )
+            assert ok
+
+        await db_session.refresh(session)
+        assert session.status == TransferStatus.COMPLETED
+        assert session.completed_chunks == 3
+        assert session.transferred_bytes == 10
+        with open(session.temp_file_path, "rb") as f:
+            assert f.read() == b"abcdefghij"
+        assert not os.path.exists(ChunkService.part_path(session.temp_file_path))
+        leaves = [hashlib.sha256(d).hexdigest() for d in (b"abcd", b"efgh", b"ij")]
+        assert session.file_hash == compute_tree_hash(leaves)
+        items, total = await HistoryService.get_history(db_session, 1)
+        assert total == 1
+
+    @pytest.mark.asyncio
+    async def test_expected_file_hash_mismatch_fails(self, db_session, small_chunks):
+        from modules.transfer.transfer_services import ChunkService, TransferService
+        session = await TransferService.create_session(db_session, user_id=1, data=SessionCreate(
+            file_name="verify.bin", file_size=4, file_hash="0" * 64
+        ))
+        session = await TransferService.join_session(db_session, 2, session.session_code)
+
+        ok, message = await ChunkService.save_chunk(db_session, session.session_code, 0, b"abcd")
+        assert not ok
+        await db_session.refresh(session)
+        assert session.status == TransferStatus.FAILED
+        assert not os.path.exists(ChunkService.part_path(session.temp_file_path))
+
+    @pytest.mark.asyncio
+    async def test_wrong_chunk_size_rejected(self, db_session, small_chunks):
+        from modules.transfer.transfer_services import ChunkService
+        session = await self._connected_session(db_session, 10)
+        ok, _ = await ChunkService.save_chunk(db_session, session.session_code, 0, b"abc")
+        assert not ok
+        ok, _ = await ChunkService.save_chunk(db_session, session.session_code, 2, b"ijk")
+        assert not ok
+
+    def test_concurrent_pwrite_into_preallocated_file(self, tmp_path):
+        from concurrent.futures import ThreadPoolExecutor
+        from modules.transfer.transfer_services import ChunkService
+        path = str(tmp_path / "parallel.part")
+        chunks = [bytes([i]) * 1000 for i in range(16)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            digests = list(pool.map(
+                lambda i: ChunkService._write_chunk(path, i * 1000, chunks[i], None, 16000),
+                reversed(range(16))
+            ))
+        with open(path, "rb") as f:
+            assert f.read() == b"".join(chunks)
+        assert sorted(digests) == sorted(hashlib.sha256(c).hexdigest() for c in chunks)
+
+
+    @pytest.mark.asyncio
+    async def test_hash_mismatch_rejected(self, db_session, small_chunks):
+        from modules.transfer.transfer_services import ChunkService
+        session = await self._connected_session(db_session, 8)
+        ok, message = await ChunkService.save_chunk(db_session, session.session_code, 0, b"abcd", "bad")
+        assert not ok
+        assert await ChunkService.get_progress(session) == (0, 0)
+
+class TestTransferNegotiation:
+    def test_small_file_uses_default_chunk(self):
+        from modules.transfer.transfer_services import TransferConfig
+        assert TransferConfig.negotiate(1024) == (TransferConfig.CHUNK_SIZE, 1)
+        assert TransferConfig.negotiate(10 * 1024 * 1024) == (TransferConfig.CHUNK_SIZE, TransferConfig.CONCURRENT_CHUNKS)
+
+    def test_large_file_grows_chunk_within_cap(self):
+        from modules.transfer.transfer_services import TransferConfig
+        chunk_size, _ = TransferConfig.negotiate(1024 * 1024 * 1024)
+        assert chunk_size == 4 * 1024 * 1024
+        chunk_size, _ = TransferConfig.negotiate(20 * 1024 * 1024 * 1024)
+        assert chunk_size == TransferConfig.MAX_CHUNK_SIZE
+
+    def test_tree_hash(self):
+        a, b, c = (hashlib.sha256(x).hexdigest() for x in (b"a", b"b", b"c"))
+        assert compute_tree_hash([a]) == a
+        ab = hashlib.sha256(bytes.fromhex(a) + bytes.fromhex(b)).digest()
+        assert compute_tree_hash([a, b]) == ab.hex()
+        assert compute_tree_hash([a, b, c]) == hashlib.sha256(ab + bytes.fromhex(c)).hexdigest()
+
+
 @pytest.mark.asyncio
 class TestTransferAPI:
     async def test_get_config(self, admin_client: AsyncClient):
@@ -5,7 +5,7 @@ RESTful风格，所有接口都需要认证且限定用户
 """
 
 from typing import Optional
-from fastapi import APIRouter, Depends, Query, Header
+from fastapi import APIRouter, Depends, Query, Header, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.database import get_db
@@ -20,6 +20,7 @@ from .vault_schemas import (
     PasswordGenerateRequest, PasswordGenerateResponse
 )
 from .vault_services import VaultService, VaultCrypto
+from .vault_sessions import issue_unlock_token, resolve_unlock_token, revoke_unlock_token
 
 router = APIRouter()
 
@@ -30,22 +31,54 @@ def get_service(db: AsyncSession, user: TokenData) -> VaultService:
 
 
 async def get_unlocked_service(
+    request: Request,
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(require_permission("vault.read")),
-    x_vault_key: Optional[str] = Header(None, alias="X-Vault-Key", description="加密密钥")
+    x_vault_token: Optional[str] = Header(None, alias="X-Vault-Token", description="解锁令牌"),
+    x_vault_key: Optional[str] = Header(None, alias="X-Vault-Key", description="主密码（兼容旧客户端）")
 ) -> VaultService:
     """获取已解锁的服务实例"""
     service = get_service(db, user)
     
-    if x_vault_key:
-        # 验证主密码并设置加密密钥
-        key = await service.verify_master_password(x_vault_key)
+    if x_vault_token:
+        # 解锁令牌：无需重复派生密钥
+        key = await resolve_unlock_token(x_vault_token, user.user_id, request.headers.get("user-agent"))
+        if key:
+            service.set_encryption_key(key)
+    elif x_vault_key:
+        # 兼容旧客户端：每次请求都验证主密码
+        try:
+            key = await service.verify_master_password(x_vault_key)
+        except ValueError as e:
+            raise BusinessException(ErrorCode.VALIDATION_ERROR, str(e))
         if key:
             service.set_encryption_key(key)
     
     return service
 
 
+def _progress_notifier(user_id: int, operation: str):
+    """批量加解密进度通过 WebSocket 推送给本人"""
+    async def notify(done: int, total: int):
+        from core.ws_manager import manager
+        try:
+            await manager.send_personal_message({
+                "type": "vault_progress",
+                "data": {"operation": operation, "done": done, "total": total}
+            }, user_id)
+        except Exception:
+            pass
+    return notify
+
+
+async def _unlock_payload(service: VaultService, request: Request) -> dict:
+    """为服务当前持有的密钥签发解锁令牌"""
+    token, expires_in = await issue_unlock_token(
+        service.user_id, service._encryption_key, request.headers.get("user-agent")
+    )
+    return {"unlock_token": token, "expires_in": expires_in}
+
+
 # ============ 主密码接口 ============
 
 @router.get("/master/status")
@@ -66,16 +99,18 @@ async def get_master_status(
 @router.post("/master/create")
 async def create_master_key(
     data: MasterKeyCreate,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(require_permission("vault.create"))
 ):
-    """创建主密码"""
+    """创建主密码（同时返回解锁令牌）"""
     service = get_service(db, user)
     try:
         ok, recovery_key = await service.create_master_key(data.master_password)
         return success({
             "recovery_key": recovery_key,
-            "message": "主密码创建成功，请妥善保管恢复码"
+            "message": "主密码创建成功，请妥善保管恢复码",
+            **await _unlock_payload(service, request)
         })
     except ValueError as e:
         raise BusinessException(ErrorCode.VALIDATION_ERROR, str(e))
@@ -101,17 +136,54 @@ async def verify_master_password(
         raise BusinessException(ErrorCode.VALIDATION_ERROR, str(e))
 
 
+@router.post("/master/unlock")
+async def unlock_vault(
+    data: MasterKeyVerify,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    user: TokenData = Depends(require_permission("vault.read"))
+):
+    """
+    解锁密码箱，返回短期解锁令牌
+    
+    后续请求在 X-Vault-Token 头中携带令牌，无需再次发送主密码
+    """
+    service = get_service(db, user)
+    try:
+        key = await service.verify_master_password(data.master_password)
+    except ValueError as e:
+        raise BusinessException(ErrorCode.VALIDATION_ERROR, str(e))
+    if not key:
+        raise BusinessException(ErrorCode.PASSWORD_INCORRECT, "主密码错误")
+    service.set_encryption_key(key)
+    return success(await _unlock_payload(service, request), "解锁成功")
+
+
+@router.post("/master/lock")
+async def lock_vault(
+    user: TokenData = Depends(require_permission("vault.read")),
+    x_vault_token: Optional[str] = Header(None, alias="X-Vault-Token", description="解锁令牌")
+):
+    """锁定密码箱（注销当前解锁令牌）"""
+    if x_vault_token:
+        await revoke_unlock_token(x_vault_token)
+    return success(message="密码箱已锁定")
+
+
 @router.post("/master/change")
 async def change_master_password(
     data: MasterKeyChange,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(require_permission("vault.update"))
 ):
-    """修改主密码"""
+    """修改主密码（原有解锁令牌失效，返回新令牌）"""
     service = get_service(db, user)
     try:
-        await service.change_master_password(data.old_password, data.new_password)
-        return success(message="主密码修改成功，请使用新密码重新解锁")
+        await service.change_master_password(
+            data.old_password, data.new_password, on_progress=_progress_notifier(user.user_id, "change")
+        )
+        return success(await _unlock_payload(service, request), "主密码修改成功")
     except ValueError as e:
         raise BusinessException(ErrorCode.VALIDATION_ERROR, str(e))
 
@@ -130,16 +202,20 @@ async def reset_vault(
 @router.post("/master/recover")
 async def recover_with_recovery_key(
     data: MasterKeyRecover,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(require_permission("vault.update"))
 ):
     """使用恢复码重置主密码"""
     service = get_service(db, user)
     try:
-        new_recovery_key = await service.recover_with_recovery_key(data.recovery_key, data.new_password)
+        new_recovery_key = await service.recover_with_recovery_key(
+            data.recovery_key, data.new_password, on_progress=_progress_notifier(user.user_id, "recover")
+        )
         return success({
             "recovery_key": new_recovery_key,
-            "message": "主密码重置成功，请保存新的恢复码"
+            "message": "主密码重置成功，请保存新的恢复码",
+            **await _unlock_payload(service, request)
         })
     except ValueError as e:
         raise BusinessException(ErrorCode.VALIDATION_ERROR, str(e))
@@ -495,7 +571,7 @@ async def import_data(
 ):
     """导入密码数据（需要解锁状态）"""
     try:
-        result = await service.import_data(data)
+        result = await service.import_data(data, on_progress=_progress_notifier(service.user_id, "import"))
         return success(result, f"导入完成：{result['imported_items']}个密码，{result['imported_categories']}个分类")
     except ValueError as e:
         raise BusinessException(ErrorCode.VALIDATION_ERROR, str(e))
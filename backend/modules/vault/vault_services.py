@@ -5,18 +5,18 @@
 """
 
 import os
+import asyncio
 import base64
 import hashlib
 import secrets
 import string
-from typing import List, Optional, Tuple
+from typing import Awaitable, Callable, Iterable, List, Optional, Sequence, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, delete, and_, or_, update
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from sqlalchemy import select, func, delete, and_, or_, update, insert
+from cryptography.fernet import Fernet, InvalidToken
 
 from .vault_models import VaultCategory, VaultItem, VaultMasterKey
+from .vault_sessions import revoke_user_unlocks
 from .vault_schemas import (
     CategoryCreate, CategoryUpdate,
     ItemCreate, ItemUpdate,
@@ -24,12 +24,20 @@ from .vault_schemas import (
 )
 from utils.timezone import get_beijing_time
 
+# 批量重加密/导入时每批处理的条目数
+REENCRYPT_BATCH_SIZE = 500
+
+# 进度回调：(已处理数, 总数)
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
 
 class VaultCrypto:
     """加密工具类"""
     
     # 验证字符串（用于验证主密码是否正确）
     VERIFICATION_STRING = "JEJE_VAULT_VERIFY_2026"
+    # PBKDF2 迭代次数（OWASP 推荐值）
+    KDF_ITERATIONS = 480000
     
     @staticmethod
     def generate_salt() -> str:
@@ -38,31 +46,42 @@ class VaultCrypto:
     
     @staticmethod
     def derive_key(password: str, salt: str) -> bytes:
-        """从主密码派生加密密钥"""
-        salt_bytes = bytes.fromhex(salt)
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt_bytes,
-            iterations=480000,  # OWASP推荐的迭代次数
+        """从主密码派生加密密钥（PBKDF2-HMAC-SHA256，计算期间释放 GIL）"""
+        key = hashlib.pbkdf2_hmac(
+            'sha256', password.encode('utf-8'), bytes.fromhex(salt), VaultCrypto.KDF_ITERATIONS, dklen=32
         )
-        key = kdf.derive(password.encode('utf-8'))
         return base64.urlsafe_b64encode(key)
     
+    @staticmethod
+    async def derive_key_async(password: str, salt: str) -> bytes:
+        """在线程中派生密钥，避免数百毫秒的计算阻塞事件循环"""
+        return await asyncio.to_thread(VaultCrypto.derive_key, password, salt)
+    
     @staticmethod
     def hash_password(password: str, salt: str) -> str:
         """哈希主密码（用于存储验证）"""
         salted = f"{salt}{password}{salt}".encode('utf-8')
         return hashlib.sha256(salted).hexdigest()
     
+    @staticmethod
+    def _encrypt_with(fernet: Fernet, plaintext: Optional[str]) -> str:
+        if not plaintext:
+            return ""
+        return base64.urlsafe_b64encode(fernet.encrypt(plaintext.encode('utf-8'))).decode('utf-8')
+    
+    @staticmethod
+    def _decrypt_with(fernet: Fernet, ciphertext: Optional[str]) -> str:
+        """解密文本，密钥不匹配或数据损坏时抛出 InvalidToken / ValueError"""
+        if not ciphertext:
+            return ""
+        return fernet.decrypt(base64.urlsafe_b64decode(ciphertext.encode('utf-8'))).decode('utf-8')
+    
     @staticmethod
     def encrypt(plaintext: str, key: bytes) -> str:
         """使用Fernet加密文本"""
         if not plaintext:
             return ""
-        fernet = Fernet(key)
-        encrypted = fernet.encrypt(plaintext.encode('utf-8'))
-        return base64.urlsafe_b64encode(encrypted).decode('utf-8')
+        return VaultCrypto._encrypt_with(Fernet(key), plaintext)
     
     @staticmethod
     def decrypt(ciphertext: str, key: bytes) -> str:
@@ -70,13 +89,60 @@ class VaultCrypto:
         if not ciphertext:
             return ""
         try:
-            fernet = Fernet(key)
-            encrypted = base64.urlsafe_b64decode(ciphertext.encode('utf-8'))
-            decrypted = fernet.decrypt(encrypted)
-            return decrypted.decode('utf-8')
+            return VaultCrypto._decrypt_with(Fernet(key), ciphertext)
         except Exception:
             return "[解密失败]"
     
+    # ---- 批量接口：整批共用一个 Fernet 实例，供线程中执行 ----
+    
+    @staticmethod
+    def reencrypt_rows(rows: Sequence[Tuple], old_key: bytes, new_key: bytes) -> List[dict]:
+        """
+        批量重加密条目
+        
+        Args:
+            rows: (id, username_encrypted, password_encrypted, notes_encrypted) 序列
+        
+        Returns:
+            可直接用于按主键批量 UPDATE 的字典列表
+        
+        Raises:
+            ValueError: 任一条目无法用旧密钥解密（中止整个操作，避免写入损坏数据）
+        """
+        old_fernet, new_fernet = Fernet(old_key), Fernet(new_key)
+        updates = []
+        for item_id, username, password, notes in rows:
+            try:
+                plain = [VaultCrypto._decrypt_with(old_fernet, v) for v in (username, password, notes)]
+            except (InvalidToken, ValueError):
+                raise ValueError(f"条目 {item_id} 解密失败，已取消操作")
+            updates.append({
+                "id": item_id,
+                "username_encrypted": VaultCrypto._encrypt_with(new_fernet, plain[0]),
+                "password_encrypted": VaultCrypto._encrypt_with(new_fernet, plain[1]),
+                "notes_encrypted": VaultCrypto._encrypt_with(new_fernet, plain[2]) if notes else None,
+            })
+        return updates
+    
+    @staticmethod
+    def decrypt_rows(rows: Iterable[Tuple[Optional[str], ...]], key: bytes) -> List[Tuple[str, ...]]:
+        """批量解密，单个字段失败时与 decrypt 一致返回占位文本"""
+        fernet = Fernet(key)
+        
+        def _safe(value):
+            try:
+                return VaultCrypto._decrypt_with(fernet, value)
+            except Exception:
+                return "[解密失败]"
+        
+        return [tuple(_safe(v) for v in row) for row in rows]
+    
+    @staticmethod
+    def encrypt_rows(rows: Iterable[Tuple[Optional[str], ...]], key: bytes) -> List[Tuple[str, ...]]:
+        """批量加密"""
+        fernet = Fernet(key)
+        return [tuple(VaultCrypto._encrypt_with(fernet, v) for v in row) for row in rows]
+    
     @staticmethod
     def generate_password(
         length: int = 16,
@@ -208,7 +274,7 @@ class VaultService:
         master_key_hash = VaultCrypto.hash_password(master_password, salt)
         
         # 派生加密密钥并加密验证字符串
-        key = VaultCrypto.derive_key(master_password, salt)
+        key = await VaultCrypto.derive_key_async(master_password, salt)
         verification_hash = VaultCrypto.encrypt(VaultCrypto.VERIFICATION_STRING, key)
         
         # 生成恢复码
@@ -216,7 +282,7 @@ class VaultService:
         recovery_salt = VaultCrypto.generate_salt()
         
         # 用恢复码派生密钥，加密数据密钥
-        recovery_derived_key = VaultCrypto.derive_key(recovery_key.replace('-', ''), recovery_salt)
+        recovery_derived_key = await VaultCrypto.derive_key_async(recovery_key.replace('-', ''), recovery_salt)
         encrypted_data_key = VaultCrypto.encrypt(key.decode('utf-8'), recovery_derived_key)
         
         # 保存
@@ -230,6 +296,7 @@ class VaultService:
         )
         self.db.add(master_key)
         await self.db.commit()
+        self._encryption_key = key
         
         return True, recovery_key
     
@@ -249,7 +316,7 @@ class VaultService:
         # 派生密钥并验证
         try:
             import secrets as _secrets
-            key = VaultCrypto.derive_key(master_password, master_key.salt)
+            key = await VaultCrypto.derive_key_async(master_password, master_key.salt)
             decrypted = VaultCrypto.decrypt(master_key.verification_hash, key)
             
             # 使用常量时间比较，防止时序攻击
@@ -270,14 +337,49 @@ class VaultService:
         if master_key.failed_attempts >= 5:
             master_key.is_locked = True
             await self.db.commit()
+            await revoke_user_unlocks(self.user_id)
             raise ValueError("主密码错误。由于失败次数过多，密码箱现已被锁定。请使用恢复码进行重置。")
             
         await self.db.commit()
         remaining = 5 - master_key.failed_attempts
         raise ValueError(f"主密码错误（还剩 {remaining} 次尝试机会）")
     
-    async def change_master_password(self, old_password: str, new_password: str) -> bool:
-        """修改主密码（需要重新加密所有数据）"""
+    async def _reencrypt_items(
+        self, old_key: bytes, new_key: bytes, on_progress: Optional[ProgressCallback] = None
+    ) -> int:
+        """
+        按主键分批重加密当前用户的全部条目（调用方负责提交或回滚事务）
+        
+        每批只读取加密字段，在线程中完成解密/加密，再以按主键的批量 UPDATE 写回
+        """
+        total = (await self.db.execute(
+            select(func.count(VaultItem.id)).where(VaultItem.user_id == self.user_id)
+        )).scalar() or 0
+        done = 0
+        last_id = 0
+        while True:
+            rows = (await self.db.execute(
+                select(
+                    VaultItem.id, VaultItem.username_encrypted,
+                    VaultItem.password_encrypted, VaultItem.notes_encrypted
+                ).where(
+                    VaultItem.user_id == self.user_id, VaultItem.id > last_id
+                ).order_by(VaultItem.id).limit(REENCRYPT_BATCH_SIZE)
+            )).all()
+            if not rows:
+                break
+            updates = await asyncio.to_thread(VaultCrypto.reencrypt_rows, rows, old_key, new_key)
+            await self.db.execute(update(VaultItem), updates)
+            last_id = rows[-1][0]
+            done += len(rows)
+            if on_progress:
+                await on_progress(done, max(total, done))
+        return done
+    
+    async def change_master_password(
+        self, old_password: str, new_password: str, on_progress: Optional[ProgressCallback] = None
+    ) -> bool:
+        """修改主密码（分批重新加密所有数据，单事务提交）"""
         # 验证旧密码
         old_key = await self.verify_master_password(old_password)
         if not old_key:
@@ -286,41 +388,33 @@ class VaultService:
         # 验证新密码复杂度
         VaultCrypto.validate_master_password(new_password)
         
-        # 获取所有条目
-        items_stmt = select(VaultItem).where(VaultItem.user_id == self.user_id)
-        items_result = await self.db.execute(items_stmt)
-        items = items_result.scalars().all()
-        
         # 生成新的盐值和密钥
         new_salt = VaultCrypto.generate_salt()
-        new_key = VaultCrypto.derive_key(new_password, new_salt)
+        new_key = await VaultCrypto.derive_key_async(new_password, new_salt)
         new_master_key_hash = VaultCrypto.hash_password(new_password, new_salt)
         new_verification_hash = VaultCrypto.encrypt(VaultCrypto.VERIFICATION_STRING, new_key)
         
-        # 重新加密所有条目
-        for item in items:
-            # 解密
-            username = VaultCrypto.decrypt(item.username_encrypted, old_key)
-            password = VaultCrypto.decrypt(item.password_encrypted, old_key)
-            notes = VaultCrypto.decrypt(item.notes_encrypted, old_key) if item.notes_encrypted else None
-            
-            # 重新加密
-            item.username_encrypted = VaultCrypto.encrypt(username, new_key)
-            item.password_encrypted = VaultCrypto.encrypt(password, new_key)
-            item.notes_encrypted = VaultCrypto.encrypt(notes, new_key) if notes else None
-        
-        # 更新主密钥
-        stmt = update(VaultMasterKey).where(
-            VaultMasterKey.user_id == self.user_id
-        ).values(
+        values = dict(
             master_key_hash=new_master_key_hash,
             salt=new_salt,
             verification_hash=new_verification_hash,
             updated_at=get_beijing_time()
         )
-        await self.db.execute(stmt)
-        await self.db.commit()
         
+        # 条目重加密与主密钥更新在同一事务中提交
+        try:
+            await self._reencrypt_items(old_key, new_key, on_progress)
+            await self.db.execute(
+                update(VaultMasterKey).where(VaultMasterKey.user_id == self.user_id).values(**values)
+            )
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
+        
+        # 旧密钥签发的解锁令牌全部作废
+        await revoke_user_unlocks(self.user_id)
+        self._encryption_key = new_key
         return True
     
 
@@ -335,9 +429,12 @@ class VaultService:
         await self.db.flush()
         
         await self.db.commit()
+        await revoke_user_unlocks(self.user_id)
         return True
     
-    async def recover_with_recovery_key(self, recovery_key: str, new_password: str) -> bool:
+    async def recover_with_recovery_key(
+        self, recovery_key: str, new_password: str, on_progress: Optional[ProgressCallback] = None
+    ) -> str:
         """使用恢复码重置主密码（不丢失数据）"""
         # 验证新密码复杂度
         VaultCrypto.validate_master_password(new_password)
@@ -355,7 +452,7 @@ class VaultService:
         
         # 用恢复码派生密钥，解密数据密钥
         recovery_key_clean = recovery_key.replace('-', '').upper()
-        recovery_derived_key = VaultCrypto.derive_key(recovery_key_clean, master_key_record.recovery_salt)
+        recovery_derived_key = await VaultCrypto.derive_key_async(recovery_key_clean, master_key_record.recovery_salt)
         
         try:
             old_key_str = VaultCrypto.decrypt(master_key_record.encrypted_data_key, recovery_derived_key)
@@ -365,34 +462,26 @@ class VaultService:
         except Exception:
             raise ValueError("恢复码错误")
         
-        # 获取所有条目
-        items_stmt = select(VaultItem).where(VaultItem.user_id == self.user_id)
-        items_result = await self.db.execute(items_stmt)
-        items = items_result.scalars().all()
-        
         # 生成新的盐值和密钥
         new_salt = VaultCrypto.generate_salt()
-        new_key = VaultCrypto.derive_key(new_password, new_salt)
+        new_key = await VaultCrypto.derive_key_async(new_password, new_salt)
         new_master_key_hash = VaultCrypto.hash_password(new_password, new_salt)
         new_verification_hash = VaultCrypto.encrypt(VaultCrypto.VERIFICATION_STRING, new_key)
         
         # 生成新的恢复码
         new_recovery_key = VaultCrypto.generate_recovery_key()
         new_recovery_salt = VaultCrypto.generate_salt()
-        new_recovery_derived_key = VaultCrypto.derive_key(new_recovery_key.replace('-', ''), new_recovery_salt)
+        new_recovery_derived_key = await VaultCrypto.derive_key_async(new_recovery_key.replace('-', ''), new_recovery_salt)
         new_encrypted_data_key = VaultCrypto.encrypt(new_key.decode('utf-8'), new_recovery_derived_key)
         
-        # 重新加密所有条目
-        for item in items:
-            username = VaultCrypto.decrypt(item.username_encrypted, old_key)
-            password = VaultCrypto.decrypt(item.password_encrypted, old_key)
-            notes = VaultCrypto.decrypt(item.notes_encrypted, old_key) if item.notes_encrypted else None
-            
-            item.username_encrypted = VaultCrypto.encrypt(username, new_key)
-            item.password_encrypted = VaultCrypto.encrypt(password, new_key)
-            item.notes_encrypted = VaultCrypto.encrypt(notes, new_key) if notes else None
+        # 分批重新加密所有条目
+        try:
+            await self._reencrypt_items(old_key, new_key, on_progress)
+        except Exception:
+            await self.db.rollback()
+            raise
         
-        # 更新主密钥记录（并重置锁定状态）
+        # 更新主密钥记录（并重置锁定状态），与条目在同一事务中提交
         master_key_record.master_key_hash = new_master_key_hash
         master_key_record.salt = new_salt
         master_key_record.verification_hash = new_verification_hash
@@ -404,6 +493,9 @@ class VaultService:
         
         await self.db.commit()
         
+        await revoke_user_unlocks(self.user_id)
+        self._encryption_key = new_key
+        
         # 返回新的恢复码
         return new_recovery_key
     
@@ -665,7 +757,7 @@ class VaultService:
     # ============ 导入导出 ============
     
     async def export_data(self) -> dict:
-        """导出所有数据（已解密）"""
+        """导出所有数据（已解密，整批在线程中解密）"""
         if not self._encryption_key:
             raise ValueError("请先解锁保险箱")
         
@@ -680,29 +772,34 @@ class VaultService:
             }
             for cat in categories
         ]
+        category_names = {cat.id: cat.name for cat in categories}
+        
+        # 获取所有条目（只取导出所需列）
+        rows = (await self.db.execute(
+            select(
+                VaultItem.title, VaultItem.website, VaultItem.category_id, VaultItem.is_starred,
+                VaultItem.username_encrypted, VaultItem.password_encrypted, VaultItem.notes_encrypted
+            ).where(VaultItem.user_id == self.user_id).order_by(
+                VaultItem.is_starred.desc(),
+                VaultItem.updated_at.desc()
+            )
+        )).all()
+        decrypted = await asyncio.to_thread(
+            VaultCrypto.decrypt_rows, [row[4:] for row in rows], self._encryption_key
+        )
         
-        # 获取所有条目
-        items, _ = await self.get_items(page=1, size=10000)
-        items_data = []
-        for item in items:
-            decrypted = self.decrypt_item(item)
-            # 获取分类名称
-            category_name = None
-            if item.category_id:
-                for cat in categories:
-                    if cat.id == item.category_id:
-                        category_name = cat.name
-                        break
-            
-            items_data.append({
-                "title": item.title,
-                "website": item.website,
-                "username": decrypted["username"],
-                "password": decrypted["password"],
-                "notes": decrypted["notes"],
-                "category_name": category_name,
-                "is_starred": item.is_starred
-            })
+        items_data = [
+            {
+                "title": row.title,
+                "website": row.website,
+                "username": username,
+                "password": password,
+                "notes": notes if row.notes_encrypted else None,
+                "category_name": category_names.get(row.category_id) if row.category_id else None,
+                "is_starred": row.is_starred
+            }
+            for row, (username, password, notes) in zip(rows, decrypted)
+        ]
         
         return {
             "version": "1.0",
@@ -711,65 +808,97 @@ class VaultService:
             "items": items_data
         }
     
-    async def import_data(self, data: dict) -> dict:
-        """导入数据"""
+    async def import_data(self, data: dict, on_progress: Optional[ProgressCallback] = None) -> dict:
+        """
+        导入数据
+        
+        一次查询取出已有条目做去重，整批在线程中加密后分批 INSERT，单事务提交
+        """
         if not self._encryption_key:
             raise ValueError("请先解锁保险箱")
         
         imported_categories = 0
-        imported_items = 0
         skipped_items = 0
         
         # 获取现有分类映射
         existing_categories = await self.get_categories()
         category_map = {cat.name: cat.id for cat in existing_categories}
         
-        # 导入分类
-        for cat_data in data.get("categories", []):
-            if cat_data["name"] not in category_map:
-                new_cat = await self.create_category(CategoryCreate(
-                    name=cat_data["name"],
-                    icon=cat_data.get("icon", "📁"),
-                    color=cat_data.get("color", "#3b82f6"),
-                    order=cat_data.get("order", 0)
-                ))
-                category_map[cat_data["name"]] = new_cat.id
-                imported_categories += 1
-        
-        # 导入条目
-        for item_data in data.get("items", []):
-            # 检查是否已存在（根据标题和网站判断）
-            existing = await self.db.execute(
-                select(VaultItem).where(
-                    and_(
-                        VaultItem.user_id == self.user_id,
-                        VaultItem.title == item_data["title"],
-                        VaultItem.website == item_data.get("website")
+        try:
+            # 导入分类
+            new_categories = []
+            for cat_data in data.get("categories", []):
+                if cat_data["name"] not in category_map:
+                    category = VaultCategory(
+                        user_id=self.user_id,
+                        name=cat_data["name"],
+                        icon=cat_data.get("icon", "📁"),
+                        color=cat_data.get("color", "#3b82f6"),
+                        order=cat_data.get("order", 0)
                     )
+                    self.db.add(category)
+                    new_categories.append(category)
+                    category_map[cat_data["name"]] = None
+            if new_categories:
+                await self.db.flush()
+                category_map.update({cat.name: cat.id for cat in new_categories})
+                imported_categories = len(new_categories)
+            
+            # 已存在的条目（根据标题和网站判断），导入文件内的重复条目同样跳过
+            seen = set((await self.db.execute(
+                select(VaultItem.title, VaultItem.website).where(VaultItem.user_id == self.user_id)
+            )).all())
+            pending = []
+            for item_data in data.get("items", []):
+                identity = (item_data["title"], item_data.get("website"))
+                if identity in seen:
+                    skipped_items += 1
+                    continue
+                seen.add(identity)
+                item = ItemCreate(
+                    title=item_data["title"],
+                    website=item_data.get("website"),
+                    username=item_data["username"],
+                    password=item_data["password"],
+                    notes=item_data.get("notes"),
+                    is_starred=item_data.get("is_starred", False)
                 )
-            )
-            if existing.scalar_one_or_none():
-                skipped_items += 1
-                continue
+                pending.append((item, item_data.get("category_name")))
             
-            # 获取分类ID
-            category_id = None
-            if item_data.get("category_name"):
-                category_id = category_map.get(item_data["category_name"])
+            now = get_beijing_time()
+            total = len(pending)
+            for offset in range(0, total, REENCRYPT_BATCH_SIZE):
+                batch = pending[offset:offset + REENCRYPT_BATCH_SIZE]
+                encrypted = await asyncio.to_thread(
+                    VaultCrypto.encrypt_rows,
+                    [(item.username, item.password, item.notes) for item, _ in batch],
+                    self._encryption_key
+                )
+                await self.db.execute(insert(VaultItem), [
+                    {
+                        "user_id": self.user_id,
+                        "title": item.title,
+                        "website": item.website,
+                        "username_encrypted": username,
+                        "password_encrypted": password,
+                        "notes_encrypted": notes or None,
+                        "category_id": category_map.get(category_name) if category_name else None,
+                        "is_starred": item.is_starred,
+                        "created_at": now,
+                        "updated_at": now,
+                    }
+                    for (item, category_name), (username, password, notes) in zip(batch, encrypted)
+                ])
+                if on_progress:
+                    await on_progress(offset + len(batch), total)
             
-            await self.create_item(ItemCreate(
-                title=item_data["title"],
-                website=item_data.get("website"),
-                username=item_data["username"],
-                password=item_data["password"],
-                notes=item_data.get("notes"),
-                category_id=category_id,
-                is_starred=item_data.get("is_starred", False)
-            ))
-            imported_items += 1
+            await self.db.commit()
+        except Exception:
+            await self.db.rollback()
+            raise
         
         return {
             "imported_categories": imported_categories,
-            "imported_items": imported_items,
+            "imported_items": total,
             "skipped_items": skipped_items
         }
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+密码保险箱解锁会话
+主密码只在解锁时派生一次密钥，之后请求携带短期解锁令牌（X-Vault-Token）即可使用密钥。
+
+令牌格式为 "{会话ID}.{包装密钥}"：服务端仅保存用包装密钥加密后的数据密钥，
+包装密钥只存在于客户端令牌中，因此服务端存储（Redis 或进程内存）泄露也无法还原数据密钥。
+会话绑定用户与客户端（User-Agent 指纹），空闲超时后失效，并设有绝对有效期。
+"""
+
+import json
+import time
+import hashlib
+import secrets
+import logging
+from typing import Dict, Optional, Tuple
+
+from cryptography.fernet import Fernet, InvalidToken
+
+logger = logging.getLogger(__name__)
+
+# 空闲超时（秒），每次使用后顺延
+UNLOCK_IDLE_SECONDS = 15 * 60
+# 绝对有效期（秒），到期后必须重新输入主密码
+UNLOCK_MAX_SECONDS = 8 * 3600
+
+
+def _fingerprint(user_agent: Optional[str]) -> str:
+    return hashlib.sha256((user_agent or "").encode("utf-8")).hexdigest()[:32]
+
+
+def _session_key(session_id: str) -> str:
+    # 存储键使用会话ID的摘要，存储内容本身不足以构造令牌
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+
+
+class MemoryUnlockStore:
+    """进程内解锁会话（未配置 Redis 时使用）"""
+
+    def __init__(self):
+        self._records: Dict[str, Tuple[float, dict]] = {}
+
+    def _purge(self):
+        now = time.monotonic()
+        for key in [k for k, (expires, _) in self._records.items() if expires <= now]:
+            del self._records[key]
+
+    async def set(self, key: str, record: dict, ttl: int):
+        self._purge()
+        self._records[key] = (time.monotonic() + ttl, record)
+
+    async def get(self, key: str) -> Optional[dict]:
+        entry = self._records.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            self._records.pop(key, None)
+            return None
+        return entry[1]
+
+    async def touch(self, key: str, ttl: int):
+        entry = self._records.get(key)
+        if entry is not None:
+            self._records[key] = (time.monotonic() + ttl, entry[1])
+
+    async def delete(self, key: str):
+        self._records.pop(key, None)
+
+    async def delete_user(self, user_id: int):
+        for key in [k for k, (_, r) in self._records.items() if r["user_id"] == user_id]:
+            del self._records[key]
+
+
+class RedisUnlockStore:
+    """基于 Redis 的解锁会话，多 worker 共享"""
+
+    def __init__(self, client, prefix: str = "vault:unlock"):
+        self.client = client
+        self.prefix = prefix
+
+    def _user_key(self, user_id: int) -> str:
+        return f"{self.prefix}:user:{user_id}"
+
+    async def set(self, key: str, record: dict, ttl: int):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set(f"{self.prefix}:{key}", json.dumps(record), ex=ttl)
+        pipe.sadd(self._user_key(record["user_id"]), key)
+        pipe.expire(self._user_key(record["user_id"]), UNLOCK_MAX_SECONDS)
+        await pipe.execute()
+
+    async def get(self, key: str) -> Optional[dict]:
+        raw = await self.client.get(f"{self.prefix}:{key}")
+        return json.loads(raw) if raw else None
+
+    async def touch(self, key: str, ttl: int):
+        await self.client.expire(f"{self.prefix}:{key}", ttl)
+
+    async def delete(self, key: str):
+        await self.client.delete(f"{self.prefix}:{key}")
+
+    async def delete_user(self, user_id: int):
+        keys = await self.client.smembers(self._user_key(user_id))
+        await self.client.delete(self._user_key(user_id), *(f"{self.prefix}:{k}" for k in keys))
+
+
+_memory_store = MemoryUnlockStore()
+
+
+def get_unlock_store():
+    """Redis 可用时使用共享存储，否则退回进程内存"""
+    from core import cache
+    client = cache._redis_client
+    if client is not None:
+        return RedisUnlockStore(client)
+    return _memory_store
+
+
+async def issue_unlock_token(user_id: int, key: bytes, user_agent: Optional[str]) -> Tuple[str, int]:
+    """
+    为已验证的数据密钥签发解锁令牌
+
+    Returns:
+        (令牌, 空闲超时秒数)
+    """
+    session_id = secrets.token_urlsafe(24)
+    wrap_key = Fernet.generate_key()
+    record = {
+        "user_id": user_id,
+        "fp": _fingerprint(user_agent),
+        "wrapped": Fernet(wrap_key).encrypt(key).decode("ascii"),
+        "created": time.time(),
+    }
+    await get_unlock_store().set(_session_key(session_id), record, UNLOCK_IDLE_SECONDS)
+    return f"{session_id}.{wrap_key.decode('ascii')}", UNLOCK_IDLE_SECONDS
+
+
+async def resolve_unlock_token(token: str, user_id: int, user_agent: Optional[str]) -> Optional[bytes]:
+    """校验解锁令牌并取回数据密钥，无效、过期或不属于当前用户/客户端时返回 None"""
+    session_id, sep, wrap_key = (token or "").partition(".")
+    if not sep or not session_id or not wrap_key:
+        return None
+
+    store = get_unlock_store()
+    key = _session_key(session_id)
+    record = await store.get(key)
+    if not record:
+        return None
+    if record["user_id"] != user_id or not secrets.compare_digest(record["fp"], _fingerprint(user_agent)):
+        return None
+    if time.time() - record["created"] > UNLOCK_MAX_SECONDS:
+        await store.delete(key)
+        return None
+
+    try:
+        data_key = Fernet(wrap_key.encode("ascii")).decrypt(record["wrapped"].encode("ascii"))
+    except (InvalidToken, ValueError):
+        return None
+
+    await store.touch(key, UNLOCK_IDLE_SECONDS)
+    return data_key
+
+
+async def revoke_unlock_token(token: str):
+    """注销单个解锁令牌"""
+    session_id = (token or "").partition(".")[0]
+    if session_id:
+        await get_unlock_store().delete(_session_key(session_id))
+
+
+async def revoke_user_unlocks(user_id: int):
+    """注销用户的全部解锁令牌（主密码修改、重置或因失败次数过多锁定时）"""
+    try:
+        await get_unlock_store().delete_user(user_id)
+    except Exception as e:
+        logger.warning(f"注销保险箱解锁会话失败: user={user_id}, {e}")
@@ -48,6 +48,17 @@ class TestVaultCrypto:
         decrypted = VaultCrypto.decrypt(encrypted, key)
         assert decrypted == plaintext
 
+    def test_derive_key_matches_pbkdf2hmac(self):
+        # 已有数据由 cryptography 的 PBKDF2HMAC 派生，新实现必须得到相同密钥
+        import base64
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+        from modules.vault.vault_services import VaultCrypto
+        salt = VaultCrypto.generate_salt()
+        kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=bytes.fromhex(salt), iterations=480000)
+        expected = base64.urlsafe_b64encode(kdf.derive("密码Pass1".encode("utf-8")))
+        assert VaultCrypto.derive_key("密码Pass1", salt) == expected
+
     def test_generate_password(self):
         from modules.vault.vault_services import VaultCrypto
         pwd = VaultCrypto.generate_password(length=16)
@@ -134,6 +145,155 @@ class TestVaultService:
         assert isinstance(stats, dict)
 
 
+class TestVaultBulkCrypto:
+    async def _setup(self, db_session, count=5):
+        from modules.vault.vault_services import VaultService
+        from modules.vault.vault_schemas import ItemCreate
+        svc = VaultService(db_session, user_id=1)
+        await svc.create_master_key("Bulk@12345")
+        for i in range(count):
+            await svc.create_item(ItemCreate(
+                title=f"site{i}", username=f"user{i}", password=f"pw{i}", notes="n" if i % 2 else None
+            ))
+        return svc
+
+    @pytest.mark.asyncio
+    async def test_change_password_batched(self, db_session, monkeypatch):
+        from modules.vault import vault_services
+        monkeypatch.setattr(vault_services, "REENCRYPT_BATCH_SIZE", 2)
+        svc = await self._setup(db_session)
+        progress = []
+
+        async def on_progress(done, total):
+            progress.append((done, total))
+
+        await svc.change_master_password("Bulk@12345", "Bulk@67890", on_progress=on_progress)
+        assert progress == [(2, 5), (4, 5), (5, 5)]
+
+        new_key = await svc.verify_master_password("Bulk@67890")
+        svc.set_encryption_key(new_key)
+        # 批量 UPDATE 不刷新会话中已加载的对象，重新查询前先使其过期
+        db_session.expire_all()
+        items, _ = await svc.get_items(size=100)
+        decrypted = sorted(svc.decrypt_item(item)["password"] for item in items)
+        assert decrypted == [f"pw{i}" for i in range(5)]
+        assert svc.decrypt_item(items[0])["notes"] in ("n", None)
+
+    @pytest.mark.asyncio
+    async def test_change_password_aborts_on_undecryptable_item(self, db_session):
+        from cryptography.fernet import Fernet
+        from modules.vault.vault_services import VaultCrypto
+        from modules.vault.vault_models import VaultItem
+        svc = await self._setup(db_session, count=2)
+        db_session.add(VaultItem(
+            user_id=1, title="bad",
+            username_encrypted=VaultCrypto.encrypt("x", Fernet.generate_key()),
+            password_encrypted=VaultCrypto.encrypt("y", Fernet.generate_key())
+        ))
+        await db_session.commit()
+
+        with pytest.raises(ValueError):
+            await svc.change_master_password("Bulk@12345", "Bulk@67890")
+        # 事务已回滚，旧密码仍然有效
+        assert await svc.verify_master_password("Bulk@12345")
+
+    @pytest.mark.asyncio
+    async def test_export_import_roundtrip(self, db_session):
+        from modules.vault.vault_services import VaultService
+        from modules.vault.vault_schemas import CategoryCreate, ItemCreate
+        svc = await self._setup(db_session, count=3)
+        cat = await svc.create_category(CategoryCreate(name="工作"))
+        await svc.create_item(ItemCreate(title="mail", username="u", password="p", category_id=cat.id))
+        exported = await svc.export_data()
+        assert len(exported["items"]) == 4
+        assert {i["category_name"] for i in exported["items"]} == {None, "工作"}
+
+        other = VaultService(db_session, user_id=2)
+        await other.create_master_key("Other@12345")
+        exported["items"].append(dict(exported["items"][0]))  # 文件内重复条目
+        result = await other.import_data(exported)
+        assert result == {"imported_categories": 1, "imported_items": 4, "skipped_items": 1}
+
+        again = await other.import_data(exported)
+        assert again["imported_items"] == 0 and again["skipped_items"] == 5
+
+        round_trip = await other.export_data()
+        key = lambda i: i["title"]
+        assert sorted(round_trip["items"], key=key) == sorted(exported["items"][:4], key=key)
+
+
+@pytest.mark.asyncio
+class TestVaultUnlockSessions:
+    async def test_token_roundtrip_and_binding(self):
+        from cryptography.fernet import Fernet
+        from modules.vault.vault_sessions import issue_unlock_token, resolve_unlock_token, revoke_unlock_token
+        token, expires_in = await issue_unlock_token(7, b"data-key", "UA-1")
+        assert expires_in > 0
+        assert await resolve_unlock_token(token, 7, "UA-1") == b"data-key"
+        # 绑定用户与客户端
+        assert await resolve_unlock_token(token, 8, "UA-1") is None
+        assert await resolve_unlock_token(token, 7, "UA-2") is None
+        # 包装密钥被篡改时无法取回数据密钥
+        session_id = token.partition(".")[0]
+        forged = f"{session_id}.{Fernet.generate_key().decode()}"
+        assert await resolve_unlock_token(forged, 7, "UA-1") is None
+        assert await resolve_unlock_token("garbage", 7, "UA-1") is None
+
+        await revoke_unlock_token(token)
+        assert await resolve_unlock_token(token, 7, "UA-1") is None
+
+    async def test_server_store_holds_only_wrapped_key(self):
+        from modules.vault import vault_sessions
+        token, _ = await vault_sessions.issue_unlock_token(9, b"secret-data-key", None)
+        records = [r for _, r in vault_sessions._memory_store._records.values() if r["user_id"] == 9]
+        assert records and b"secret-data-key" not in str(records).encode()
+        assert token.partition(".")[0] not in str(vault_sessions._memory_store._records)
+        await vault_sessions.revoke_user_unlocks(9)
+        assert await vault_sessions.resolve_unlock_token(token, 9, None) is None
+
+    async def test_expired_sessions(self, monkeypatch):
+        from modules.vault import vault_sessions
+        token, _ = await vault_sessions.issue_unlock_token(10, b"k", None)
+        monkeypatch.setattr(vault_sessions, "UNLOCK_MAX_SECONDS", -1)
+        assert await vault_sessions.resolve_unlock_token(token, 10, None) is None
+
+    async def test_unlock_then_use_token(self, admin_client: AsyncClient):
+        await admin_client.post("/api/v1/vault/master/create", json={"master_password": "Unlock@123"})
+        resp = await admin_client.post("/api/v1/vault/master/unlock", json={"master_password": "Unlock@123"})
+        assert resp.status_code == 200
+        token = resp.json()["data"]["unlock_token"]
+        headers = {"X-Vault-Token": token}
+
+        created = await admin_client.post("/api/v1/vault/items", json={
+            "title": "GitHub", "username": "octo", "password": "p@ss"
+        }, headers=headers)
+        assert created.status_code == 200
+        item_id = created.json()["data"]["id"]
+
+        detail = await admin_client.get(f"/api/v1/vault/items/{item_id}", headers=headers)
+        assert detail.json()["data"]["password"] == "p@ss"
+
+        # 修改主密码后旧令牌作废，返回的新令牌可用
+        changed = await admin_client.post("/api/v1/vault/master/change", json={
+            "old_password": "Unlock@123", "new_password": "Unlock@456"
+        })
+        new_token = changed.json()["data"]["unlock_token"]
+        stale = await admin_client.get(f"/api/v1/vault/items/{item_id}", headers=headers)
+        assert stale.json()["data"]["locked"] is True
+        fresh = await admin_client.get(f"/api/v1/vault/items/{item_id}", headers={"X-Vault-Token": new_token})
+        assert fresh.json()["data"]["password"] == "p@ss"
+
+        await admin_client.post("/api/v1/vault/master/lock", headers={"X-Vault-Token": new_token})
+        locked = await admin_client.get(f"/api/v1/vault/items/{item_id}", headers={"X-Vault-Token": new_token})
+        assert locked.json()["data"]["locked"] is True
+
+    async def test_unlock_wrong_password(self, admin_client: AsyncClient):
+        await admin_client.post("/api/v1/vault/master/create", json={"master_password": "Right@123"})
+        resp = await admin_client.post("/api/v1/vault/master/unlock", json={"master_password": "Wrong@123"})
+        assert resp.status_code == 400
+        assert "unlock_token" not in (resp.json().get("data") or {})
+
+
 @pytest.mark.asyncio
 class TestVaultAPI:
     async def test_master_status(self, admin_client: AsyncClient):
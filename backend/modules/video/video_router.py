@@ -10,8 +10,8 @@ import tempfile
 import aiofiles
 
 logger = logging.getLogger(__name__)
-from fastapi import APIRouter, Depends, UploadFile, File, Query, Header
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi import APIRouter, Depends, UploadFile, File, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.database import get_db
@@ -19,6 +19,7 @@ from core.security import get_current_user, get_optional_user, TokenData
 from core.errors import NotFoundException, PermissionException, AuthException, BusinessException, ErrorCode
 from schemas.response import success, error
 from utils.storage import get_storage_manager
+from utils.download import file_response
 
 from .video_schemas import (
     CollectionCreate, CollectionUpdate, CollectionResponse, CollectionListResponse, CollectionDetailResponse,
@@ -308,9 +309,9 @@ async def get_collection_videos(
 @router.get("/videos/{video_id}/file", summary="获取视频文件")
 async def get_video_file(
     video_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db),
-    user: TokenData = Depends(get_optional_user),
-    range: str = Header(None)
+    user: TokenData = Depends(get_optional_user)
 ):
     """获取视频文件（支持流式传输，支持公开视频集匿名访问）"""
     # 获取视频
@@ -349,16 +350,19 @@ async def get_video_file(
     # 确定 MIME 类型，对播放最友好的做法是强制 mp4 后缀为 video/mp4
     mime_type = "video/mp4" if video.filename.endswith(".mp4") else (video.mime_type or "video/mp4")
     
-    return FileResponse(
+    return file_response(
+        request,
         resolved,
         media_type=mime_type,
-        content_disposition_type="inline"
+        filename=video.filename,
+        disposition_type="inline"
     )
 
 
 @router.get("/videos/{video_id}/thumbnail", summary="获取视频缩略图")
 async def get_video_thumbnail(
     video_id: int,
+    request: Request,
     db: AsyncSession = Depends(get_db),
     user: TokenData = Depends(get_optional_user)
 ):
@@ -392,7 +396,8 @@ async def get_video_thumbnail(
         if not resolved.startswith(storage_root):
             raise PermissionException("文件路径非法")
         
-        return FileResponse(
+        return file_response(
+            request,
             resolved,
             media_type="image/jpeg"
         )
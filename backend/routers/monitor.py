@@ -12,6 +12,7 @@ from sqlalchemy import select, func, desc, and_
 
 from core.database import get_db, get_pool_status
 from core.security import require_admin, TokenData
+from core.events import event_bus
 from models.monitor import PerformanceMetric
 from schemas.monitor import SystemInfo, ProcessInfo, MetricInfo
 from schemas.response import success
@@ -166,3 +167,28 @@ async def get_stats(
 
 
 
+
+
+@router.get("/events")
+async def get_event_metrics(
+    current_user: TokenData = Depends(require_admin())
+):
+    """
+    获取事件总线分发指标（队列长度、各事件耗时、超时与丢弃次数）
+    
+    仅系统管理员可访问
+    """
+    return success(event_bus.get_metrics())
+
+
+@router.get("/jobs")
+async def get_job_metrics(
+    current_user: TokenData = Depends(require_admin())
+):
+    """
+    获取后台任务执行指标（执行/失败/跳过次数、耗时、最近执行记录）
+    
+    指标按 worker 统计，singleton 任务在其他 worker 上表现为跳过
+    """
+    from core.scheduler import get_scheduler
+    return success(get_scheduler().get_job_stats())
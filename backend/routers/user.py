@@ -34,7 +34,7 @@ async def _cleanup_user_im_data(db: AsyncSession, user_id: int):
     在删除用户前调用，防止 IntegrityError
     """
     try:
-        from modules.im.im_models import IMConversation, IMConversationMember, IMMessage, IMMessageRead, IMContact
+        from modules.im.im_models import IMConversation, IMConversationMember, IMMessage, IMContact
         
         logger.info(f"正在清理用户 {user_id} 的 IM 数据")
         
@@ -51,13 +51,7 @@ async def _cleanup_user_im_data(db: AsyncSession, user_id: int):
             .where(or_(IMContact.user_id == user_id, IMContact.contact_id == user_id))
         )
         
-        # 3. 删除消息已读记录
-        await db.execute(
-            delete(IMMessageRead)
-            .where(IMMessageRead.user_id == user_id)
-        )
-        
-        # 4. 处理用户发送的消息
+        # 3. 处理用户发送的消息
         user_msgs_result = await db.execute(select(IMMessage.id).where(IMMessage.sender_id == user_id))
         user_msg_ids = user_msgs_result.scalars().all()
         
@@ -0,0 +1,119 @@
+"""
+内容寻址 Blob 存储测试
+覆盖：去重硬链接、引用计数、秒传链接、无引用回收、StorageManager 开关
+"""
+
+import hashlib
+from pathlib import Path
+import pytest
+
+from utils.blob_store import BlobStore, hash_file
+
+
+DATA = b"same content" * 1000
+DIGEST = hashlib.sha256(DATA).hexdigest()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(tmp_path / "blobs")
+
+
+def _write(path, data=DATA):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+
+class TestBlobStore:
+    def test_fan_out_path(self, store):
+        path = store.blob_path(DIGEST)
+        assert path.parent.name == DIGEST[2:4]
+        assert path.parent.parent.name == DIGEST[:2]
+        with pytest.raises(ValueError):
+            store.blob_path("../etc/passwd")
+
+    def test_identical_files_share_inode(self, store, tmp_path):
+        a = _write(tmp_path / "album" / "a.jpg")
+        b = _write(tmp_path / "im" / "b.jpg")
+
+        assert store.ingest(a) == DIGEST
+        assert store.ingest(b, DIGEST) == DIGEST
+
+        assert a.stat().st_ino == b.stat().st_ino == store.blob_path(DIGEST).stat().st_ino
+        assert store.refcount(DIGEST) == 2
+        assert b.read_bytes() == DATA
+
+        # 重复纳入同一文件不改变引用数
+        store.ingest(a, DIGEST)
+        assert store.refcount(DIGEST) == 2
+
+    def test_link_for_instant_upload(self, store, tmp_path):
+        store.ingest(_write(tmp_path / "src.bin"))
+        target = tmp_path / "fm" / "new.bin"
+
+        assert store.exists(DIGEST, len(DATA))
+        assert not store.exists(DIGEST, len(DATA) + 1)
+        assert store.link(DIGEST, target)
+        assert target.read_bytes() == DATA
+        assert store.refcount(DIGEST) == 2
+        assert not store.link(hashlib.sha256(b"missing").hexdigest(), tmp_path / "x.bin")
+
+    def test_gc_removes_unreferenced(self, store, tmp_path):
+        a = _write(tmp_path / "a.bin")
+        other = _write(tmp_path / "other.bin", b"other")
+        store.ingest(a)
+        store.ingest(other)
+
+        a.unlink()
+        assert store.refcount(DIGEST) == 0
+        # 宽限期内不回收
+        assert store.gc() == (0, 0)
+
+        removed, freed = store.gc(grace_seconds=0)
+        assert (removed, freed) == (1, len(DATA))
+        assert not store.exists(DIGEST)
+        assert store.exists(hash_file(other))
+
+    def test_stats(self, store, tmp_path):
+        store.ingest(_write(tmp_path / "a.bin"))
+        store.ingest(_write(tmp_path / "b.bin"))
+        stats = store.stats()
+        assert stats == {"blobs": 1, "physical_bytes": len(DATA), "logical_bytes": 2 * len(DATA)}
+
+
+class TestStorageManagerDedup:
+    def test_disabled_by_default(self, tmp_workspace):
+        import utils.storage
+        utils.storage._storage_manager = None
+        mgr = utils.storage.get_storage_manager()
+
+        rel_path, full_path = mgr.generate_filename("a.txt", module="im")
+        _write(Path(full_path))
+        assert mgr.deduplicate(rel_path) is None
+        assert not mgr.link_blob(DIGEST, "modules/im/uploads/b.txt")
+
+        utils.storage._storage_manager = None
+
+    def test_deduplicate_and_link(self, tmp_workspace, monkeypatch):
+        from core.config import get_settings
+        import utils.storage
+        monkeypatch.setattr(get_settings(), "storage_dedup_enabled", True)
+        utils.storage._storage_manager = None
+        mgr = utils.storage.get_storage_manager()
+
+        rel_a, full_a = mgr.generate_filename("a.txt", module="im")
+        _write(Path(full_a))
+        assert mgr.deduplicate(rel_a) == DIGEST
+        assert mgr.blobs.root == mgr.system_dir / "blobs"
+
+        rel_b, full_b = mgr.generate_filename("b.txt", module="album")
+        assert mgr.link_blob(DIGEST, rel_b)
+        assert Path(full_b).read_bytes() == DATA
+        assert not mgr.link_blob(DIGEST, "../outside.txt")
+
+        # 删除模块文件即减少引用
+        assert mgr.delete_file(rel_a)
+        assert mgr.blobs.refcount(DIGEST) == 1
+
+        utils.storage._storage_manager = None
@@ -77,6 +77,7 @@ class TestCoreLifespan:
             # 设置 mock 为异步
             mock_audit.stop_auto_flush = AsyncMock()
             mock_event_bus.publish = AsyncMock()
+            mock_event_bus.shutdown = AsyncMock()
             
             # 设置 mock 返回值
             mock_settings.return_value.app_name = "TestApp"
@@ -0,0 +1,161 @@
+"""
+文件下载工具测试
+覆盖：ETag/304、Range/If-Range 206、多段区间、416、HEAD、zerocopysend
+"""
+
+import os
+import pytest
+from fastapi import FastAPI, Request
+from httpx import AsyncClient, ASGITransport
+
+from utils.download import file_response, make_etag, content_disposition, _parse_range, _RangeNotSatisfiable
+
+
+DATA = bytes(range(256)) * 4  # 1024 字节
+
+
+@pytest.fixture
+def sample_file(tmp_path):
+    path = tmp_path / "sample.bin"
+    path.write_bytes(DATA)
+    return path
+
+
+@pytest.fixture
+def client(sample_file):
+    app = FastAPI()
+
+    @app.api_route("/file", methods=["GET", "HEAD"])
+    async def download(request: Request):
+        return file_response(request, sample_file, media_type="application/octet-stream", filename="样例.bin")
+
+    return AsyncClient(transport=ASGITransport(app=app), base_url="http://test")
+
+
+class TestRangeParsing:
+    def test_single_and_open_ranges(self):
+        assert _parse_range("bytes=0-9", 100) == [(0, 10)]
+        assert _parse_range("bytes=90-", 100) == [(90, 100)]
+        assert _parse_range("bytes=-10", 100) == [(90, 100)]
+        assert _parse_range("bytes=95-200", 100) == [(95, 100)]
+
+    def test_overlapping_ranges_merged(self):
+        assert _parse_range("bytes=0-9,5-19,50-59", 100) == [(0, 20), (50, 60)]
+
+    def test_malformed_ignored(self):
+        assert _parse_range("items=0-1", 100) is None
+        assert _parse_range("bytes=abc", 100) is None
+        assert _parse_range("bytes=5-1", 100) is None
+
+    def test_unsatisfiable(self):
+        with pytest.raises(_RangeNotSatisfiable):
+            _parse_range("bytes=100-200", 100)
+
+
+class TestHelpers:
+    def test_etag_changes_with_content(self, sample_file):
+        before = make_etag(os.stat(sample_file))
+        sample_file.write_bytes(DATA + b"x")
+        assert make_etag(os.stat(sample_file)) != before
+        assert before.startswith('"') and not before.startswith("W/")
+
+    def test_content_disposition(self):
+        assert content_disposition("a.txt") == 'attachment; filename="a.txt"'
+        header = content_disposition("报告.pdf", "inline")
+        assert header.startswith('inline; filename=".pdf"')
+        assert "filename*=UTF-8''%E6%8A%A5%E5%91%8A.pdf" in header
+
+
+@pytest.mark.asyncio
+class TestFileResponse:
+    async def test_full_download(self, client):
+        async with client:
+            resp = await client.get("/file")
+        assert resp.status_code == 200
+        assert resp.content == DATA
+        assert resp.headers["accept-ranges"] == "bytes"
+        assert resp.headers["content-length"] == str(len(DATA))
+        assert "filename*=UTF-8''" in resp.headers["content-disposition"]
+
+    async def test_if_none_match_returns_304(self, client):
+        async with client:
+            etag = (await client.get("/file")).headers["etag"]
+            resp = await client.get("/file", headers={"If-None-Match": etag})
+            weak = await client.get("/file", headers={"If-None-Match": f'"other", W/{etag}'})
+        assert resp.status_code == 304
+        assert resp.content == b""
+        assert resp.headers["etag"] == etag
+        assert weak.status_code == 304
+
+    async def test_if_modified_since(self, client):
+        async with client:
+            last_modified = (await client.get("/file")).headers["last-modified"]
+            resp = await client.get("/file", headers={"If-Modified-Since": last_modified})
+        assert resp.status_code == 304
+
+    async def test_single_range(self, client):
+        async with client:
+            resp = await client.get("/file", headers={"Range": "bytes=100-199"})
+        assert resp.status_code == 206
+        assert resp.content == DATA[100:200]
+        assert resp.headers["content-range"] == f"bytes 100-199/{len(DATA)}"
+
+    async def test_if_range_mismatch_sends_full(self, client):
+        async with client:
+            etag = (await client.get("/file")).headers["etag"]
+            matched = await client.get("/file", headers={"Range": "bytes=0-9", "If-Range": etag})
+            stale = await client.get("/file", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+        assert matched.status_code == 206
+        assert stale.status_code == 200
+        assert stale.content == DATA
+
+    async def test_multi_range(self, client):
+        async with client:
+            resp = await client.get("/file", headers={"Range": "bytes=0-3,1000-"})
+        assert resp.status_code == 206
+        content_type = resp.headers["content-type"]
+        assert content_type.startswith("multipart/byteranges; boundary=")
+        boundary = content_type.split("boundary=")[1]
+        body = resp.content
+        assert len(body) == int(resp.headers["content-length"])
+        assert body.endswith(f"--{boundary}--\r\n".encode())
+        assert b"Content-Range: bytes 0-3/1024\r\n\r\n" + DATA[:4] in body
+        assert b"Content-Range: bytes 1000-1023/1024\r\n\r\n" + DATA[1000:] in body
+
+    async def test_unsatisfiable_range(self, client):
+        async with client:
+            resp = await client.get("/file", headers={"Range": "bytes=5000-"})
+        assert resp.status_code == 416
+        assert resp.headers["content-range"] == f"bytes */{len(DATA)}"
+
+    async def test_head_has_headers_only(self, client):
+        async with client:
+            resp = await client.head("/file")
+        assert resp.status_code == 200
+        assert resp.headers["content-length"] == str(len(DATA))
+        assert resp.content == b""
+
+
+@pytest.mark.asyncio
+async def test_zerocopysend_used_when_supported(sample_file):
+    from starlette.requests import Request as StarletteRequest
+
+    scope = {
+        "type": "http", "method": "GET", "path": "/", "query_string": b"",
+        "headers": [(b"range", b"bytes=10-19")],
+        "extensions": {"http.response.zerocopysend": {}},
+    }
+    response = file_response(StarletteRequest(scope), sample_file)
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    async def receive():
+        return {"type": "http.request"}
+
+    await response(scope, receive, send)
+    assert messages[0]["status"] == 206
+    zerocopy = [m for m in messages if m["type"] == "http.response.zerocopysend"]
+    assert len(zerocopy) == 1
+    assert zerocopy[0]["offset"] == 10 and zerocopy[0]["count"] == 10
@@ -0,0 +1,186 @@
+"""
+事件总线跨进程传输单元测试
+使用进程内 Redis Streams 模拟多个 worker
+"""
+
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from core.events import EventBus, Event
+from core.event_transport import (
+    RedisStreamTransport,
+    InMemoryStreamClient,
+    init_event_transport,
+    serialize_event,
+    deserialize_event,
+)
+
+
+async def _make_worker(client, worker_id):
+    bus = EventBus()
+    transport = RedisStreamTransport(client, stream="test:events", worker_id=worker_id, block_ms=50)
+    await transport.start(bus)
+    return bus, transport
+
+
+async def _wait_for(predicate, timeout: float = 1.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        if loop.time() > deadline:
+            raise AssertionError("等待超时")
+        await asyncio.sleep(0.01)
+
+
+class TestEventSerialization:
+    """事件序列化测试"""
+
+    def test_roundtrip(self):
+        event = Event(name="user.updated", source="auth", data={"user_id": 1, "tags": ["a"]})
+        restored = deserialize_event(serialize_event(event, "w1"))
+        assert restored.id == event.id
+        assert restored.name == event.name
+        assert restored.data == event.data
+        assert restored.origin == "w1"
+        assert restored.timestamp == event.timestamp
+
+    def test_bytes_fields(self):
+        event = Event(name="x", source="s")
+        fields = {k.encode(): v.encode() for k, v in serialize_event(event, "w1").items()}
+        assert deserialize_event(fields).id == event.id
+
+
+class TestRedisStreamTransport:
+    """跨进程广播测试"""
+
+    @pytest.mark.asyncio
+    async def test_event_reaches_other_worker(self):
+        client = InMemoryStreamClient()
+        bus_a, transport_a = await _make_worker(client, "a")
+        bus_b, transport_b = await _make_worker(client, "b")
+        received_a, received_b = [], []
+        bus_a.subscribe("user.updated", received_a.append)
+        bus_b.subscribe("user.updated", received_b.append)
+        try:
+            await bus_a.publish(Event(name="user.updated", source="test", data={"user_id": 7}))
+            await _wait_for(lambda: received_b)
+            assert received_b[0].data == {"user_id": 7}
+            assert received_b[0].origin == "a"
+            # 本进程只分发一次，不会从 Stream 再收到自己的事件
+            await asyncio.sleep(0.1)
+            assert len(received_a) == 1
+            assert len(received_b) == 1
+        finally:
+            await transport_a.stop()
+            await transport_b.stop()
+
+    @pytest.mark.asyncio
+    async def test_emit_is_forwarded(self):
+        client = InMemoryStreamClient()
+        bus_a, transport_a = await _make_worker(client, "a")
+        bus_b, transport_b = await _make_worker(client, "b")
+        received = []
+        bus_b.subscribe("cache.invalidate", received.append)
+        try:
+            bus_a.emit("cache.invalidate", "test", {"key": "k"})
+            await _wait_for(lambda: received)
+            assert received[0].data == {"key": "k"}
+        finally:
+            await bus_a.shutdown()
+            await transport_a.stop()
+            await transport_b.stop()
+
+    @pytest.mark.asyncio
+    async def test_system_events_stay_local(self):
+        client = InMemoryStreamClient()
+        bus_a, transport_a = await _make_worker(client, "a")
+        try:
+            await bus_a.publish(Event(name="system.startup", source="kernel"))
+            assert client.streams["test:events"] == []
+        finally:
+            await transport_a.stop()
+
+    @pytest.mark.asyncio
+    async def test_duplicate_delivery_ignored(self):
+        """同一事件重复投递只处理一次（幂等）"""
+        client = InMemoryStreamClient()
+        bus_b, transport_b = await _make_worker(client, "b")
+        received = []
+        bus_b.subscribe("user.updated", received.append)
+        try:
+            fields = serialize_event(Event(name="user.updated", source="test"), "a")
+            await client.xadd("test:events", fields)
+            await client.xadd("test:events", fields)
+            await _wait_for(lambda: transport_b.delivered >= 1)
+            await asyncio.sleep(0.1)
+            assert len(received) == 1
+        finally:
+            await transport_b.stop()
+
+    @pytest.mark.asyncio
+    async def test_unacked_events_replayed(self):
+        """未确认的事件在恢复时重放（至少一次投递）"""
+        client = InMemoryStreamClient()
+        transport = RedisStreamTransport(client, stream="test:events", worker_id="b", block_ms=50)
+        await transport._ensure_group()
+        await client.xadd("test:events", serialize_event(Event(name="user.updated", source="t"), "a"))
+        # 模拟读取后处理中断：事件已投递但未确认
+        assert len(await transport._read(">")) == 1
+
+        bus = EventBus()
+        received = []
+        bus.subscribe("user.updated", received.append)
+        try:
+            await transport.start(bus)
+            assert len(received) == 1
+            assert await transport._read("0") == []
+        finally:
+            await transport.stop()
+
+    @pytest.mark.asyncio
+    async def test_publish_failure_keeps_local_dispatch(self):
+        client = InMemoryStreamClient()
+        bus, transport = await _make_worker(client, "a")
+        received = []
+        bus.subscribe("user.updated", received.append)
+        try:
+            with patch.object(client, "xadd", AsyncMock(side_effect=ConnectionError("down"))):
+                await bus.publish(Event(name="user.updated", source="test"))
+            assert len(received) == 1
+            assert transport.failures == 1
+        finally:
+            await transport.stop()
+
+    @pytest.mark.asyncio
+    async def test_stop_removes_group(self):
+        client = InMemoryStreamClient()
+        bus, transport = await _make_worker(client, "a")
+        assert ("test:events", transport.group) in client.groups
+        await transport.stop()
+        assert ("test:events", transport.group) not in client.groups
+        assert bus.transport is None
+
+
+class TestTransportFallback:
+    """Redis 不可用时退化为进程内分发"""
+
+    @pytest.mark.asyncio
+    async def test_no_redis_stays_local(self):
+        bus = EventBus()
+        with patch("core.cache._redis_client", None):
+            assert await init_event_transport(bus) is False
+        assert bus.transport is None
+        received = []
+        bus.subscribe("user.updated", received.append)
+        await bus.publish(Event(name="user.updated", source="test"))
+        assert len(received) == 1
+        assert bus.get_metrics()["transport"] == "local"
+
+    @pytest.mark.asyncio
+    async def test_redis_error_on_start_stays_local(self):
+        bus = EventBus()
+        client = InMemoryStreamClient()
+        with patch.object(client, "xgroup_create", AsyncMock(side_effect=ConnectionError("down"))):
+            assert await init_event_transport(bus, client=client) is False
+        assert bus.transport is None
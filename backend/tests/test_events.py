@@ -45,7 +45,7 @@ class TestEventBus:
         bus = EventBus()
         
         assert bus._handlers == {}
-        assert bus._history == []
+        assert list(bus._history) == []
     
     def test_subscribe(self):
         """测试事件订阅"""
@@ -134,6 +134,174 @@ class TestEventBus:
         assert len(history_a) == 2
 
 
+class TestEventBusDispatch:
+    """并发分发、优先级与背压测试"""
+    
+    @pytest.mark.asyncio
+    async def test_slow_handler_does_not_delay_others(self):
+        """慢处理器不阻塞其他处理器"""
+        bus = EventBus()
+        fast_done = asyncio.Event()
+        
+        async def slow_handler(event):
+            await asyncio.sleep(0.3)
+        
+        async def fast_handler(event):
+            fast_done.set()
+        
+        bus.subscribe("test.event", slow_handler)
+        bus.subscribe("test.event", fast_handler)
+        
+        publish_task = asyncio.create_task(bus.publish(Event(name="test.event", source="test")))
+        await asyncio.wait_for(fast_done.wait(), timeout=0.1)
+        assert not publish_task.done()
+        await publish_task
+    
+    @pytest.mark.asyncio
+    async def test_handlers_run_concurrently(self):
+        """多个慢处理器的总耗时接近单个处理器"""
+        bus = EventBus()
+        
+        async def handler(event):
+            await asyncio.sleep(0.1)
+        
+        for _ in range(5):
+            bus.subscribe("test.event", lambda e: handler(e))
+        
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await bus.publish(Event(name="test.event", source="test"))
+        assert loop.time() - started < 0.3
+    
+    @pytest.mark.asyncio
+    async def test_per_handler_timeout(self):
+        """超时只影响超时的处理器"""
+        bus = EventBus(handler_timeout=0.05)
+        received = []
+        
+        async def hanging_handler(event):
+            await asyncio.sleep(10)
+        
+        async def ok_handler(event):
+            await asyncio.sleep(0.01)
+            received.append(event)
+        
+        bus.subscribe("test.event", hanging_handler)
+        bus.subscribe("test.event", ok_handler, timeout=1.0)
+        
+        await asyncio.wait_for(bus.publish(Event(name="test.event", source="test")), timeout=1.0)
+        assert len(received) == 1
+        metrics = bus.get_metrics("test.event")
+        assert metrics["timeouts"] == 1
+        assert metrics["count"] == 1
+    
+    @pytest.mark.asyncio
+    async def test_failing_handler_isolated(self):
+        """处理器异常不影响其他处理器"""
+        bus = EventBus()
+        received = []
+        
+        def bad_sync(event):
+            raise RuntimeError("boom")
+        
+        async def bad_async(event):
+            raise RuntimeError("boom")
+        
+        bus.subscribe("test.event", bad_sync)
+        bus.subscribe("test.event", bad_async)
+        bus.subscribe("test.event", received.append)
+        
+        await bus.publish(Event(name="test.event", source="test"))
+        assert len(received) == 1
+        assert bus.get_metrics("test.event")["errors"] == 2
+    
+    @pytest.mark.asyncio
+    async def test_handler_priority(self):
+        """高优先级处理器先执行"""
+        bus = EventBus()
+        order = []
+        
+        bus.subscribe("test.event", lambda e: order.append("low"), priority=-1)
+        bus.subscribe("test.event", lambda e: order.append("normal"))
+        bus.subscribe("test.event", lambda e: order.append("high"), priority=10)
+        
+        await bus.publish(Event(name="test.event", source="test"))
+        assert order == ["high", "normal", "low"]
+    
+    @pytest.mark.asyncio
+    async def test_emit_dispatches_via_queue(self):
+        """emit 经队列异步分发"""
+        bus = EventBus()
+        received = []
+        bus.subscribe("test.event", received.append)
+        
+        assert bus.emit("test.event", "test", {"n": 1}) is True
+        assert await bus.drain(timeout=1.0)
+        assert received[0].data == {"n": 1}
+        await bus.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_emit_queue_overflow_drop_new(self):
+        """队列满时丢弃新事件"""
+        bus = EventBus(max_queue_size=2, dispatch_workers=1)
+        gate = asyncio.Event()
+        
+        async def blocking(event):
+            await gate.wait()
+        
+        bus.subscribe("test.event", blocking)
+        assert bus.emit("test.event", "test")
+        await asyncio.sleep(0)  # 第一个事件出队开始处理
+        assert bus.emit("test.event", "test")
+        assert bus.emit("test.event", "test")
+        assert bus.emit("test.event", "test") is False
+        assert bus.get_metrics("test.event")["dropped"] == 1
+        gate.set()
+        assert await bus.drain(timeout=1.0)
+        assert bus.get_metrics("test.event")["count"] == 3
+        await bus.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_emit_queue_overflow_drop_oldest(self):
+        """drop_oldest 策略淘汰低优先级事件，高优先级事件先分发"""
+        bus = EventBus(max_queue_size=2, dispatch_workers=1, overflow_policy="drop_oldest")
+        gate = asyncio.Event()
+        received = []
+        
+        async def blocking(event):
+            await gate.wait()
+        
+        bus.subscribe("block", blocking)
+        bus.subscribe("test.event", lambda e: received.append(e.data["n"]))
+        bus.emit("block", "test")
+        await asyncio.sleep(0)
+        bus.emit("test.event", "test", {"n": 1})
+        bus.emit("test.event", "test", {"n": 2})
+        bus.emit("test.event", "test", {"n": 3}, priority=5)
+        gate.set()
+        assert await bus.drain(timeout=1.0)
+        assert received == [3, 2]
+        await bus.shutdown()
+    
+    @pytest.mark.asyncio
+    async def test_history_ring_buffer(self):
+        """历史记录为有界环形缓冲区"""
+        bus = EventBus(max_history=3)
+        for i in range(5):
+            await bus.publish(Event(name=f"e{i}", source="test"))
+        assert [e.name for e in bus.get_history()] == ["e2", "e3", "e4"]
+    
+    @pytest.mark.asyncio
+    async def test_metrics_summary(self):
+        bus = EventBus()
+        bus.subscribe("test.event", lambda e: None)
+        await bus.publish(Event(name="test.event", source="test"))
+        metrics = bus.get_metrics()
+        assert metrics["queue_size"] == 0
+        assert metrics["events"]["test.event"]["count"] == 1
+        assert metrics["events"]["test.event"]["avg_ms"] >= 0
+
+
 class TestEventNames:
     """预定义事件名称测试"""
     
@@ -51,3 +51,65 @@ class TestScheduler:
         s1 = get_scheduler()
         s2 = get_scheduler()
         assert s1 is s2
+
+
+class TestSingletonJobs:
+    """单实例任务租约测试（两个 Scheduler 实例模拟两个 worker，共享进程内租约）"""
+
+    @pytest.mark.asyncio
+    async def test_singleton_runs_once_per_slot(self):
+        from core.scheduler import JobStats
+        workers = [Scheduler(), Scheduler()]
+        stats = [JobStats(name="lease_once", kind="periodic", singleton=True) for _ in workers]
+        func = AsyncMock()
+
+        ran = [await w._execute(func, s, "1", hold_seconds=30) for w, s in zip(workers, stats)]
+        assert ran == [True, False]
+        assert func.call_count == 1
+        assert stats[1].skipped == 1
+
+        # 下一个时间片重新竞争
+        assert await workers[1]._execute(func, stats[1], "2", hold_seconds=30) is True
+        history = stats[0].history[-1]
+        assert history["status"] == "success"
+        assert stats[1].history[-1]["fence"] > history["fence"]
+
+    @pytest.mark.asyncio
+    async def test_failed_run_releases_lease(self):
+        from core.scheduler import JobStats
+        workers = [Scheduler(), Scheduler()]
+        stats = [JobStats(name="lease_retry", kind="periodic", singleton=True) for _ in workers]
+
+        with pytest.raises(RuntimeError):
+            await workers[0]._execute(AsyncMock(side_effect=RuntimeError("boom")), stats[0], "1", 30)
+        assert stats[0].failures == 1 and stats[0].last_error == "boom"
+
+        func = AsyncMock()
+        assert await workers[1]._execute(func, stats[1], "1", 30) is True
+        func.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_periodic_singleton_across_workers(self):
+        workers = [Scheduler(), Scheduler()]
+        func = AsyncMock()
+        for w in workers:
+            w.start()
+            await w.schedule_periodic(func, 10, name="lease_periodic", singleton=True)
+        await asyncio.sleep(0.1)
+        for w in workers:
+            await w.stop()
+
+        assert func.call_count == 1
+        jobs = [w.get_job_stats()["jobs"]["lease_periodic"] for w in workers]
+        assert sorted(j["runs"] for j in jobs) == [0, 1]
+        assert sorted(j["skipped"] for j in jobs) == [0, 1]
+
+    def test_missed_daily_run(self):
+        from datetime import datetime
+        from core.scheduler import _missed_daily_run
+        now = datetime(2026, 1, 2, 10, 0)
+        target = datetime(2026, 1, 2, 3, 0)
+        assert _missed_daily_run(now, 3, 0, None) is True
+        assert _missed_daily_run(now, 3, 0, target.timestamp() - 60) is True
+        assert _missed_daily_run(now, 3, 0, target.timestamp() + 60) is False
+        assert _missed_daily_run(now, 11, 0, None) is False
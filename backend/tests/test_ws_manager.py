@@ -2,8 +2,10 @@
 WebSocket 管理器单元测试
 """
 
+import asyncio
+import json
 import pytest
-from unittest.mock import AsyncMock, MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 from core.ws_manager import ConnectionManager
 
 class TestConnectionManager:
@@ -67,3 +69,248 @@ class TestConnectionManager:
         online_users = manager.get_online_users()
         assert online_users == {1, 2}
         assert manager.get_connection_count() == 2
+
+
+class _FakePubSub:
+    """进程内 Pub/Sub 模拟"""
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.channels = set()
+        self.queue = asyncio.Queue()
+        hub.subscribers.append(self)
+
+    async def subscribe(self, *channels):
+        self.channels.update(channels)
+
+    async def unsubscribe(self, *channels):
+        self.channels.difference_update(channels)
+
+    async def get_message(self, ignore_subscribe_messages=True, timeout=1.0):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def aclose(self):
+        self.hub.subscribers.remove(self)
+
+
+class _FakeRedis:
+    def __init__(self):
+        self.subscribers = []
+        self.published = []
+
+    def pubsub(self, ignore_subscribe_messages=True):
+        return _FakePubSub(self)
+
+    async def publish(self, channel, data):
+        self.published.append(channel)
+        count = 0
+        for sub in self.subscribers:
+            if channel in sub.channels:
+                sub.queue.put_nowait({"type": "message", "channel": channel, "data": data})
+                count += 1
+        return count
+
+
+async def _wait_for(predicate, timeout=1.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not predicate():
+        if loop.time() > deadline:
+            raise AssertionError("等待超时")
+        await asyncio.sleep(0.01)
+
+
+class TestConnectionManagerFanout:
+    """并发推送与慢连接处理测试"""
+
+    @pytest.mark.asyncio
+    async def test_broadcast_serializes_once(self):
+        manager = ConnectionManager()
+        sockets = [AsyncMock() for _ in range(5)]
+        for i, ws in enumerate(sockets):
+            await manager.connect(ws, i)
+
+        with patch("core.ws_manager.json.dumps", wraps=json.dumps) as dumps:
+            await manager.broadcast({"type": "broadcast"}, exclude_user_ids={0})
+        assert dumps.call_count == 1
+        sockets[0].send_text.assert_not_called()
+        for ws in sockets[1:]:
+            ws.send_text.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_slow_connection_does_not_block_others(self):
+        manager = ConnectionManager(send_timeout=0.05)
+        slow = AsyncMock()
+
+        async def stuck_send(text):
+            await asyncio.sleep(10)
+
+        slow.send_text.side_effect = stuck_send
+        fast = AsyncMock()
+        await manager.connect(slow, 1)
+        await manager.connect(fast, 2)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await manager.broadcast({"type": "x"})
+        assert loop.time() - started < 1
+        fast.send_text.assert_called_once()
+        # 超时的慢连接被断开
+        assert 1 not in manager.active_connections
+        slow.close.assert_called_once()
+        assert manager.dropped_connections == 1
+
+    @pytest.mark.asyncio
+    async def test_backlog_overflow_drops_connection(self):
+        manager = ConnectionManager(max_queue=2, send_timeout=5)
+        gate = asyncio.Event()
+        ws = AsyncMock()
+
+        async def blocked_send(text):
+            await gate.wait()
+
+        ws.send_text.side_effect = blocked_send
+        await manager.connect(ws, 1)
+
+        first = asyncio.create_task(manager.send_personal_message({"n": 0}, 1))
+        await asyncio.sleep(0.01)
+        # 发送进行中：新消息进入队列，调用方不等待
+        await manager.send_personal_message({"n": 1}, 1)
+        await manager.send_personal_message({"n": 2}, 1)
+        assert 1 in manager.active_connections
+        # 队列已满：判定为慢连接
+        await manager.send_personal_message({"n": 3}, 1)
+        assert 1 not in manager.active_connections
+        gate.set()
+        await first
+
+    @pytest.mark.asyncio
+    async def test_queued_messages_keep_order(self):
+        manager = ConnectionManager()
+        sent = []
+        gate = asyncio.Event()
+        ws = AsyncMock()
+
+        async def send(text):
+            if not sent:
+                await gate.wait()
+            sent.append(json.loads(text)["n"])
+
+        ws.send_text.side_effect = send
+        await manager.connect(ws, 1)
+        first = asyncio.create_task(manager.send_personal_message({"n": 0}, 1))
+        await asyncio.sleep(0.01)
+        for n in (1, 2, 3):
+            await manager.send_personal_message({"n": n}, 1)
+        gate.set()
+        await first
+        assert sent == [0, 1, 2, 3]
+
+
+class TestConnectionManagerBackplane:
+    """跨 worker 转发测试"""
+
+    @pytest.mark.asyncio
+    async def test_message_reaches_user_on_other_worker(self):
+        redis = _FakeRedis()
+        worker_a, worker_b = ConnectionManager(), ConnectionManager()
+        assert await worker_a.start_backplane(redis)
+        assert await worker_b.start_backplane(redis)
+        ws = AsyncMock()
+        await worker_b.connect(ws, 42)
+        try:
+            await worker_a.send_personal_message({"type": "im"}, 42)
+            await _wait_for(lambda: ws.send_text.called)
+            assert json.loads(ws.send_text.call_args[0][0]) == {"type": "im"}
+        finally:
+            await worker_a.stop_backplane()
+            await worker_b.stop_backplane()
+
+    @pytest.mark.asyncio
+    async def test_broadcast_across_workers_without_duplicates(self):
+        redis = _FakeRedis()
+        worker_a, worker_b = ConnectionManager(), ConnectionManager()
+        await worker_a.start_backplane(redis)
+        await worker_b.start_backplane(redis)
+        local, remote, excluded = AsyncMock(), AsyncMock(), AsyncMock()
+        await worker_a.connect(local, 1)
+        await worker_b.connect(remote, 2)
+        await worker_b.connect(excluded, 3)
+        try:
+            await worker_a.broadcast({"type": "notice"}, exclude_user_ids={3})
+            await _wait_for(lambda: remote.send_text.called)
+            await asyncio.sleep(0.05)
+            local.send_text.assert_called_once()
+            remote.send_text.assert_called_once()
+            excluded.send_text.assert_not_called()
+        finally:
+            await worker_a.stop_backplane()
+            await worker_b.stop_backplane()
+
+    @pytest.mark.asyncio
+    async def test_unsubscribes_when_user_leaves(self):
+        redis = _FakeRedis()
+        manager = ConnectionManager()
+        await manager.start_backplane(redis)
+        ws = AsyncMock()
+        await manager.connect(ws, 7)
+        pubsub = redis.subscribers[0]
+        assert manager.backplane.user_channel(7) in pubsub.channels
+        manager.disconnect(ws, 7)
+        await asyncio.sleep(0)
+        assert manager.backplane.user_channel(7) not in pubsub.channels
+        await manager.stop_backplane()
+
+    @pytest.mark.asyncio
+    async def test_no_redis_stays_local(self):
+        manager = ConnectionManager()
+        with patch("core.cache._redis_client", None):
+            assert await manager.start_backplane() is False
+        ws = AsyncMock()
+        await manager.connect(ws, 1)
+        await manager.send_personal_message({"type": "x"}, 1)
+        ws.send_text.assert_called_once()
+
+
+class TestSendToUsers:
+    """多用户推送测试"""
+
+    @pytest.mark.asyncio
+    async def test_send_to_users_serializes_once(self):
+        manager = ConnectionManager()
+        sockets = {uid: AsyncMock() for uid in (1, 2, 3)}
+        for uid, ws in sockets.items():
+            await manager.connect(ws, uid)
+
+        with patch("core.ws_manager.json.dumps", wraps=json.dumps) as dumps:
+            await manager.send_to_users({"type": "im"}, [1, 2, 2, 99])
+        assert dumps.call_count == 1
+        sockets[1].send_text.assert_called_once()
+        sockets[2].send_text.assert_called_once()
+        sockets[3].send_text.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_send_to_users_single_publish_across_workers(self):
+        redis = _FakeRedis()
+        worker_a, worker_b = ConnectionManager(), ConnectionManager()
+        await worker_a.start_backplane(redis)
+        await worker_b.start_backplane(redis)
+        local, remote, other = AsyncMock(), AsyncMock(), AsyncMock()
+        await worker_a.connect(local, 1)
+        await worker_b.connect(remote, 2)
+        await worker_b.connect(other, 3)
+        redis.published.clear()
+        try:
+            await worker_a.send_to_users({"type": "im"}, [1, 2])
+            await _wait_for(lambda: remote.send_text.called)
+            await asyncio.sleep(0.05)
+            assert len(redis.published) == 1
+            local.send_text.assert_called_once()
+            remote.send_text.assert_called_once()
+            other.send_text.assert_not_called()
+        finally:
+            await worker_a.stop_backplane()
+            await worker_b.stop_backplane()
@@ -0,0 +1,70 @@
+"""
+流式 ZIP 打包测试
+覆盖：可被标准库解压、数据描述符、媒体文件存储模式、同名去重、缺失文件跳过、ZIP64
+"""
+
+import io
+import zipfile
+import pytest
+
+from utils.zip_stream import iter_zip, compress_type_for
+
+
+def _build(entries, **kwargs) -> bytes:
+    return b"".join(iter_zip(entries, **kwargs))
+
+
+class TestZipStream:
+    def test_roundtrip(self, tmp_path):
+        text = tmp_path / "notes.txt"
+        text.write_bytes(b"hello world\n" * 5000)
+        photo = tmp_path / "照片.jpg"
+        photo.write_bytes(bytes(range(256)) * 100)
+
+        data = _build([(text, "dir/notes.txt"), (photo, "dir/照片.jpg")], chunk_size=4096)
+
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            assert zf.testzip() is None
+            assert zf.read("dir/notes.txt") == text.read_bytes()
+            assert zf.read("dir/照片.jpg") == photo.read_bytes()
+            notes = zf.getinfo("dir/notes.txt")
+            assert notes.compress_type == zipfile.ZIP_DEFLATED
+            assert notes.compress_size < notes.file_size
+            assert zf.getinfo("dir/照片.jpg").compress_type == zipfile.ZIP_STORED
+            # 流式写入使用数据描述符
+            assert notes.flag_bits & 0x08
+
+    def test_streams_incrementally(self, tmp_path):
+        big = tmp_path / "big.bin"
+        big.write_bytes(b"\0" * (1024 * 1024))
+        chunks = list(iter_zip([(big, "big.bin")], chunk_size=64 * 1024))
+        assert len(chunks) > 1
+
+    def test_duplicate_names_and_missing_files(self, tmp_path):
+        a = tmp_path / "a.png"
+        a.write_bytes(b"a")
+        b = tmp_path / "b.png"
+        b.write_bytes(b"b")
+
+        data = _build([(a, "same.png"), (tmp_path / "gone.png", "gone.png"), (b, "same.png")])
+
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            assert zf.namelist() == ["same.png", "same (1).png"]
+            assert zf.read("same (1).png") == b"b"
+
+    def test_compress_type_for(self):
+        assert compress_type_for("x.MP4") == zipfile.ZIP_STORED
+        assert compress_type_for("x.docx") == zipfile.ZIP_STORED
+        assert compress_type_for("x.csv") == zipfile.ZIP_DEFLATED
+        assert compress_type_for("README") == zipfile.ZIP_DEFLATED
+
+    def test_zip64_for_large_entries(self, tmp_path):
+        # 稀疏文件：stat 大小超过 4GB 即触发 ZIP64 头，这里只校验本地头中的 ZIP64 扩展字段
+        sparse = tmp_path / "huge.mp4"
+        with open(sparse, "wb") as f:
+            f.truncate(5 * 1024 ** 3)
+        first = next(iter_zip([(sparse, "huge.mp4")]))
+        assert first[:4] == b"PK\x03\x04"
+        name_len, extra_len = int.from_bytes(first[26:28], "little"), int.from_bytes(first[28:30], "little")
+        extra = first[30 + name_len:30 + name_len + extra_len]
+        assert extra[:2] == b"\x01\x00"  # ZIP64 扩展字段标识
@@ -254,6 +254,24 @@ async def process_schedule_backups():
             schedules = result.scalars().all()
             
             for schedule in schedules:
+                # 先以条件更新推进下次执行时间，认领本次执行：
+                # 调度租约失效导致两个 worker 同时检查时，只有一个能更新成功
+                next_run_at = calculate_next_run(
+                    schedule.schedule_type,
+                    schedule.schedule_time,
+                    schedule.schedule_day
+                )
+                claim = await db.execute(
+                    update(BackupSchedule)
+                    .where(BackupSchedule.id == schedule.id)
+                    .where(BackupSchedule.next_run_at == schedule.next_run_at)
+                    .values(next_run_at=next_run_at)
+                )
+                await db.commit()
+                if claim.rowcount == 0:
+                    logger.info(f"备份计划 {schedule.name} 已由其他进程执行，跳过")
+                    continue
+                
                 logger.info(f"触发自动备份计划: {schedule.name} (ID: {schedule.id})")
                 
                 # 1. 创建备份记录
@@ -296,12 +314,7 @@ async def process_schedule_backups():
                 schedule.last_run_at = now
                 schedule.last_status = 'success' # 简化处理，实际状态在 BackupRecord 中
                 
-                # 计算下一次时间
-                schedule.next_run_at = calculate_next_run(
-                    schedule.schedule_type,
-                    schedule.schedule_time,
-                    schedule.schedule_day
-                )
+                schedule.next_run_at = next_run_at
                 
                 # 4. (可选) 清理过期备份
                 if schedule.retention_days > 0:
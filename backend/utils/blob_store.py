@@ -0,0 +1,206 @@
+"""
+内容寻址 Blob 存储
+按 SHA-256 将文件内容保存在 system/blobs/{ab}/{cd}/{sha256}，
+模块目录中的文件以硬链接指向同一 inode，相同内容只占用一份磁盘空间。
+
+引用计数直接取 inode 链接数（st_nlink - 1）：模块删除文件即 unlink，
+计数自动递减，无需额外的数据库表，进程崩溃也不会造成计数漂移。
+链接数降为 1（仅剩 blob 自身）的内容由 gc() 回收。
+
+⚠️ 链接后的文件共享内容，写入方只能整体替换（写新文件后 os.replace），不能原地改写
+"""
+
+import os
+import time
+import errno
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# 计算摘要时的读块大小
+HASH_CHUNK_SIZE = 1024 * 1024
+# 新建或刚解除链接的 blob 在此时长内不回收，避免与正在进行的链接操作竞争
+GC_GRACE_SECONDS = 3600
+
+PathLike = Union[str, os.PathLike]
+
+
+def hash_file(path: PathLike) -> str:
+    """流式计算文件 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_sha256(value: str) -> bool:
+    return len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+
+class BlobStore:
+    """SHA-256 内容寻址存储，使用两级扇出目录避免单目录文件过多"""
+
+    def __init__(self, root: PathLike):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def blob_path(self, sha256: str) -> Path:
+        sha256 = sha256.lower()
+        if not _is_sha256(sha256):
+            raise ValueError(f"无效的 SHA-256 摘要: {sha256}")
+        return self.root / sha256[:2] / sha256[2:4] / sha256
+
+    def exists(self, sha256: str, size: Optional[int] = None) -> bool:
+        """blob 是否存在（提供 size 时同时校验大小）"""
+        try:
+            st = self.blob_path(sha256).stat()
+        except (OSError, ValueError):
+            return False
+        return size is None or st.st_size == size
+
+    def refcount(self, sha256: str) -> int:
+        """引用该内容的模块文件数"""
+        try:
+            return max(self.blob_path(sha256).stat().st_nlink - 1, 0)
+        except (OSError, ValueError):
+            return 0
+
+    @staticmethod
+    def _replace_with_link(source: Path, target: Path) -> bool:
+        """以 source 的硬链接原子替换 target，跨设备或链接数超限时返回 False"""
+        tmp = target.with_name(f".{target.name}.{os.getpid()}.link")
+        try:
+            os.link(source, tmp)
+        except OSError as e:
+            if e.errno in (errno.EXDEV, errno.EMLINK, errno.EPERM, errno.ENOTSUP):
+                return False
+            raise
+        try:
+            os.replace(tmp, target)
+        except OSError:
+            tmp.unlink(missing_ok=True)
+            raise
+        return True
+
+    def ingest(self, path: PathLike, sha256: Optional[str] = None) -> Optional[str]:
+        """
+        将已写入模块目录的文件纳入 blob 存储（同步方法，调用方应放入线程执行）
+
+        内容已存在时用 blob 的硬链接替换该文件，释放重复数据；
+        否则把该文件链接为新 blob。
+
+        Args:
+            path: 模块目录中的文件路径
+            sha256: 已知摘要（如上传时边写边算），为空时读取文件计算
+
+        Returns:
+            内容摘要；无法去重（跨设备等）时返回 None，文件保持原样
+        """
+        path = Path(path)
+        sha256 = (sha256 or hash_file(path)).lower()
+        blob = self.blob_path(sha256)
+        st = path.stat()
+
+        for _ in range(2):
+            try:
+                blob_st = blob.stat()
+            except FileNotFoundError:
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                try:
+                    os.link(path, blob)
+                    return sha256
+                except FileExistsError:
+                    # 并发写入了相同内容，转为链接已有 blob
+                    continue
+                except OSError as e:
+                    logger.debug(f"创建 blob 失败，跳过去重: {path}, {e}")
+                    return None
+
+            if blob_st.st_ino == st.st_ino and blob_st.st_dev == st.st_dev:
+                return sha256
+            if blob_st.st_size != st.st_size:
+                logger.warning(f"blob 大小与文件不一致，跳过去重: {sha256}")
+                return None
+            if self._replace_with_link(blob, path):
+                return sha256
+            return None
+        return None
+
+    def link(self, sha256: str, target: PathLike) -> bool:
+        """
+        把已有 blob 链接到目标路径（秒传），blob 不存在时返回 False
+
+        硬链接不可用时退回复制，保证秒传语义不变
+        """
+        blob = self.blob_path(sha256)
+        target = Path(target)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(blob, target)
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EMLINK, errno.EPERM, errno.ENOTSUP):
+                raise
+        if not blob.exists():
+            return False
+        shutil.copyfile(blob, target)
+        return True
+
+    def gc(self, grace_seconds: int = GC_GRACE_SECONDS) -> Tuple[int, int]:
+        """
+        回收无引用的 blob
+
+        Returns:
+            (删除的 blob 数, 释放的字节数)
+        """
+        removed = freed = 0
+        now = time.time()
+        for fan_out in self.root.iterdir():
+            if not fan_out.is_dir():
+                continue
+            for sub_dir in fan_out.iterdir():
+                if not sub_dir.is_dir():
+                    continue
+                for blob in sub_dir.iterdir():
+                    try:
+                        st = blob.stat()
+                        # st_ctime 在链接数变化时更新，宽限期内跳过
+                        if st.st_nlink > 1 or now - st.st_ctime < grace_seconds:
+                            continue
+                        blob.unlink()
+                        removed += 1
+                        freed += st.st_size
+                    except FileNotFoundError:
+                        continue
+                    except OSError as e:
+                        logger.warning(f"回收 blob 失败: {blob}, {e}")
+                try:
+                    sub_dir.rmdir()
+                except OSError:
+                    pass
+        if removed:
+            logger.info(f"已回收 {removed} 个无引用 blob，释放 {freed / 1024 / 1024:.1f}MB")
+        return removed, freed
+
+    def stats(self) -> dict:
+        """统计 blob 数、实际占用与逻辑大小（按引用数展开）"""
+        blobs = physical = logical = 0
+        for blob in self.root.glob("*/*/*"):
+            try:
+                st = blob.stat()
+            except OSError:
+                continue
+            blobs += 1
+            physical += st.st_size
+            logical += st.st_size * max(st.st_nlink - 1, 1)
+        return {"blobs": blobs, "physical_bytes": physical, "logical_bytes": logical}
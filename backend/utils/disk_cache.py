@@ -0,0 +1,83 @@
+"""
+磁盘缓存
+按键寻址的有容量上限的文件缓存，多进程（含进程池子进程、多个应用 worker）可共享同一目录，重启后仍然有效。
+
+条目文件名为键（通常是内容摘要），按前两位分目录；mtime 记录最近访问时间，
+总大小超过上限时按访问时间淘汰到上限的 80%。写入先落临时文件再原子替换，读者不会看到半写的条目。
+方法均为同步阻塞操作，异步调用方放入线程执行
+"""
+
+import os
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DiskCache:
+    """有容量上限的磁盘缓存"""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        # 本进程估计的缓存总大小（首次写入时扫描），其它进程的写入在下次淘汰扫描时计入
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _entry(self, key: str, suffix: str) -> Path:
+        return self.root / key[:2] / f"{key}.{suffix}"
+
+    def contains(self, key: str, suffix: str) -> bool:
+        return self._entry(key, suffix).exists()
+
+    def get(self, key: str, suffix: str) -> Optional[bytes]:
+        entry = self._entry(key, suffix)
+        try:
+            data = entry.read_bytes()
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def _scan(self) -> int:
+        return sum(f.stat().st_size for f in self.root.glob("*/*") if f.is_file())
+
+    def put(self, key: str, suffix: str, data: bytes):
+        entry = self._entry(key, suffix)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp = entry.with_name(f".{entry.name}.{os.getpid()}.{threading.get_ident()}")
+        tmp.write_bytes(data)
+        os.replace(tmp, entry)
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = []
+        for f in self.root.glob("*/*"):
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, f))
+        entries.sort()
+        size = sum(e[1] for e in entries)
+        target = int(self.max_bytes * 0.8)
+        removed = 0
+        for _, entry_size, f in entries:
+            if size <= target:
+                break
+            try:
+                f.unlink()
+                size -= entry_size
+                removed += 1
+            except FileNotFoundError:
+                continue
+        self._size = size
+        logger.debug(f"磁盘缓存 {self.root.name} 淘汰 {removed} 个条目，当前 {size / 1024 / 1024:.1f}MB")
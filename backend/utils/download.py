@@ -0,0 +1,294 @@
+"""
+文件下载工具
+统一处理条件请求与断点续传：强 ETag / Last-Modified、If-None-Match / If-Modified-Since 304、
+Range / If-Range 206（含多段 multipart/byteranges）、HEAD 请求；
+ASGI 服务器支持 zerocopysend 扩展时直接 sendfile，否则在线程中分块读取
+"""
+
+import os
+import asyncio
+import secrets
+from email.utils import formatdate, parsedate_to_datetime
+from typing import List, Mapping, Optional, Tuple, Union
+from urllib.parse import quote
+
+from fastapi import Request
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# 单次读取/发送的块大小
+READ_CHUNK_SIZE = 256 * 1024
+# 单个请求允许的最多区间数，防止大量小区间放大开销
+MAX_RANGES = 16
+
+# 响应体片段：bytes 为分隔头等固定内容，(start, end) 为文件区间 [start, end)
+_Segment = Union[bytes, Tuple[int, int]]
+
+
+class _RangeNotSatisfiable(Exception):
+    """请求区间无法满足"""
+
+
+def _read_at(fd: int, size: int, offset: int) -> bytes:
+    """按偏移读取（无 pread 的平台退化为 lseek + read，同一 fd 只被一个响应顺序使用）"""
+    if hasattr(os, "pread"):
+        return os.pread(fd, size, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, size)
+
+
+def make_etag(stat_result: os.stat_result) -> str:
+    """由 inode、修改时间与大小生成强 ETag，文件被替换或改写后即变化"""
+    return f'"{stat_result.st_ino:x}-{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def content_disposition(filename: str, disposition_type: str = "attachment") -> str:
+    """生成 Content-Disposition（ASCII 回退名 + RFC 5987 UTF-8 文件名）"""
+    fallback = filename.encode("ascii", "ignore").decode().replace('"', "").replace("\\", "") or "download"
+    if fallback == filename:
+        return f'{disposition_type}; filename="{filename}"'
+    return f"{disposition_type}; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+
+def _etag_matches(header: str, etag: str, weak: bool) -> bool:
+    """比较 If-None-Match / If-Range 中的 ETag 列表"""
+    if header.strip() == "*":
+        return True
+    target = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            if not weak:
+                continue
+            candidate = candidate[2:]
+        if candidate == target:
+            return True
+    return False
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag, weak=True)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _parse_range(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    解析 Range 头，返回合并后的区间列表 [start, end)
+
+    格式错误或非 bytes 单位时返回 None（按完整响应处理）；
+    所有区间都无法满足时抛出 _RangeNotSatisfiable
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    parts = [p.strip() for p in spec.split(",") if p.strip()]
+    if not parts or len(parts) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for part in parts:
+        first, sep, last = part.partition("-")
+        if not sep:
+            return None
+        try:
+            if not first:
+                # 后缀区间：最后 N 个字节
+                suffix = int(last)
+                if suffix <= 0:
+                    continue
+                start, end = max(size - suffix, 0), size
+            else:
+                start = int(first)
+                if last and int(last) < start:
+                    return None
+                end = min(int(last) + 1, size) if last else size
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, end))
+
+    if not ranges:
+        raise _RangeNotSatisfiable()
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class FileRangeResponse(Response):
+    """按区间输出文件内容的响应，由 file_response 构造"""
+
+    def __init__(
+        self,
+        path: str,
+        segments: List[_Segment],
+        status_code: int,
+        headers: Mapping[str, str],
+        media_type: str,
+        head_only: bool = False,
+        background: Optional[BackgroundTask] = None
+    ):
+        self.path = path
+        self.segments = segments
+        self.status_code = status_code
+        self.media_type = media_type
+        self.head_only = head_only
+        self.background = background
+        self.init_headers(headers)
+
+    async def _send_file_range(self, send: Send, fd: int, start: int, end: int, zerocopy: bool):
+        if zerocopy:
+            await send({
+                "type": "http.response.zerocopysend",
+                "file": fd,
+                "offset": start,
+                "count": end - start,
+                "more_body": True
+            })
+            return
+        position = start
+        while position < end:
+            data = await asyncio.to_thread(_read_at, fd, min(READ_CHUNK_SIZE, end - position), position)
+            if not data:
+                break
+            position += len(data)
+            await send({"type": "http.response.body", "body": data, "more_body": True})
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers
+        })
+        if not self.head_only:
+            zerocopy = "http.response.zerocopysend" in scope.get("extensions", {})
+            fd = await asyncio.to_thread(os.open, self.path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            try:
+                for segment in self.segments:
+                    if isinstance(segment, bytes):
+                        await send({"type": "http.response.body", "body": segment, "more_body": True})
+                    else:
+                        await self._send_file_range(send, fd, segment[0], segment[1], zerocopy)
+            finally:
+                os.close(fd)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
+
+
+def file_response(
+    request: Request,
+    path: Union[str, os.PathLike],
+    media_type: Optional[str] = None,
+    filename: Optional[str] = None,
+    disposition_type: str = "attachment",
+    headers: Optional[Mapping[str, str]] = None,
+    stat_result: Optional[os.stat_result] = None,
+    background: Optional[BackgroundTask] = None
+) -> Response:
+    """
+    构造文件下载响应
+
+    Args:
+        request: 当前请求（读取条件请求与 Range 头）
+        path: 文件路径（调用方负责权限与路径校验）
+        media_type: MIME 类型，默认 application/octet-stream
+        filename: 下载文件名，提供时生成 Content-Disposition
+        disposition_type: attachment 或 inline
+        headers: 额外响应头
+        stat_result: 已有的 os.stat 结果，避免重复 stat
+        background: 响应完成后执行的后台任务
+
+    Returns:
+        200 / 206 / 304 / 416 响应
+    """
+    path = os.fspath(path)
+    stat_result = stat_result or os.stat(path)
+    size = stat_result.st_size
+    etag = make_etag(stat_result)
+    last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+    media_type = media_type or "application/octet-stream"
+
+    base_headers = {
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "last-modified": last_modified,
+    }
+    if filename:
+        base_headers["content-disposition"] = content_disposition(filename, disposition_type)
+    if headers:
+        base_headers.update({k.lower(): v for k, v in headers.items()})
+
+    if _not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=base_headers, background=background)
+
+    head_only = request.method == "HEAD"
+    ranges = None
+    range_header = request.headers.get("range")
+    if range_header and size > 0:
+        if_range = request.headers.get("if-range")
+        # If-Range 不匹配时说明客户端缓存的是旧版本，返回完整内容
+        if if_range is None or _etag_matches(if_range, etag, weak=False) or if_range == last_modified:
+            try:
+                ranges = _parse_range(range_header, size)
+            except _RangeNotSatisfiable:
+                return Response(
+                    status_code=416,
+                    headers={**base_headers, "content-range": f"bytes */{size}"},
+                    background=background
+                )
+
+    if not ranges:
+        return FileRangeResponse(
+            path, [(0, size)], 200,
+            {**base_headers, "content-length": str(size)},
+            media_type, head_only, background
+        )
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        return FileRangeResponse(
+            path, [(start, end)], 206,
+            {
+                **base_headers,
+                "content-range": f"bytes {start}-{end - 1}/{size}",
+                "content-length": str(end - start)
+            },
+            media_type, head_only, background
+        )
+
+    boundary = secrets.token_hex(12)
+    segments: List[_Segment] = []
+    length = 0
+    for start, end in ranges:
+        part_header = (
+            f"--{boundary}\r\n"
+            f"Content-Type: {media_type}\r\n"
+            f"Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        segments.extend([part_header, (start, end), b"\r\n"])
+        length += len(part_header) + (end - start) + 2
+    closing = f"--{boundary}--\r\n".encode("latin-1")
+    segments.append(closing)
+    length += len(closing)
+
+    return FileRangeResponse(
+        path, segments, 206,
+        {**base_headers, "content-length": str(length)},
+        f"multipart/byteranges; boundary={boundary}", head_only, background
+    )
@@ -0,0 +1,71 @@
+"""
+进程池
+CPU 密集的同步任务（页面渲染、图像处理等）放入独立进程执行，不占用事件循环，也不受 GIL 限制。
+
+按名称复用进程池，使用 spawn 启动方式：子进程不继承父进程的事件循环、线程与数据库连接。
+提交给进程池的函数必须定义在模块顶层（可被 pickle），参数与返回值尽量使用 bytes 等简单类型
+"""
+
+import os
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# 单个进程池的默认进程数上限
+DEFAULT_MAX_WORKERS = 8
+
+_pools: Dict[str, ProcessPoolExecutor] = {}
+_lock = threading.Lock()
+
+
+def default_workers(limit: int = DEFAULT_MAX_WORKERS) -> int:
+    """默认进程数：CPU 核数，不超过 limit"""
+    return max(1, min(os.cpu_count() or 1, limit))
+
+
+def get_process_pool(name: str, max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    获取（必要时创建）命名进程池
+
+    子进程异常退出会使进程池进入 broken 状态，此时重新创建
+
+    Args:
+        name: 进程池名称，同名调用方共享
+        max_workers: 进程数，为空时取 default_workers()
+    """
+    with _lock:
+        pool = _pools.get(name)
+        if pool is None or getattr(pool, "_broken", False):
+            pool = ProcessPoolExecutor(
+                max_workers=max_workers or default_workers(),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            _pools[name] = pool
+            logger.debug(f"已创建进程池: {name}, 进程数: {pool._max_workers}")
+        return pool
+
+
+def pool_size(pool: ProcessPoolExecutor) -> int:
+    """进程池的进程数"""
+    return pool._max_workers
+
+
+def shutdown_process_pool(name: str):
+    """关闭指定进程池，未开始的任务直接取消"""
+    with _lock:
+        pool = _pools.pop(name, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_process_pools():
+    """关闭全部进程池（应用关闭时调用）"""
+    with _lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=False, cancel_futures=True)
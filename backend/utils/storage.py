@@ -40,7 +40,8 @@ class StorageManager:
     └── system/              # 系统运行维护区 (不计入用户配额)
         ├── backups/         # 数据库备份
         ├── logs/            # 运行日志
-        └── transfer_temp/   # [隔离区] 快传瞬时碎片 (即焚)
+        ├── transfer_temp/   # [隔离区] 快传瞬时碎片 (即焚)
+        └── blobs/           # 内容寻址存储 (storage_dedup_enabled 开启时使用)
         
     ⚠️ 存储原则:
     - 隔离原则: vault (加密隐私) 无可见存储目录；transfer 归口 system/ 且 24h 清理。
@@ -79,6 +80,8 @@ class StorageManager:
         
         # 初始化所有标准模块目录
         self._init_standard_dirs()
+        
+        self._blob_store = None
     
     def _init_standard_dirs(self):
         """
@@ -399,6 +402,70 @@ class StorageManager:
             logger.error(f"删除文件失败 {relative_path}: {e}")
             return False
     
+    @property
+    def dedup_enabled(self) -> bool:
+        """是否启用内容寻址去重"""
+        return get_settings().storage_dedup_enabled
+
+    @property
+    def blobs(self):
+        """内容寻址 blob 存储（system/blobs）"""
+        if self._blob_store is None:
+            from utils.blob_store import BlobStore
+            self._blob_store = BlobStore(self.get_system_dir("blobs"))
+        return self._blob_store
+
+    def _resolve_safe(self, relative_path: str) -> Optional[Path]:
+        if '..' in relative_path or relative_path.startswith('/'):
+            logger.warning(f"检测到可疑路径: {relative_path}")
+            return None
+        full_path = self.upload_dir / relative_path
+        if not self._is_safe_path(full_path):
+            logger.warning(f"路径遍历尝试被阻止: {relative_path}")
+            return None
+        return full_path
+
+    def deduplicate(self, relative_path: str, sha256: Optional[str] = None) -> Optional[str]:
+        """
+        对已保存的文件做内容去重（同步方法，调用方应放入线程执行）
+        
+        未启用去重或失败时文件保持原样，不影响业务流程
+        
+        Args:
+            relative_path: 相对路径
+            sha256: 已知摘要，为空时读取文件计算
+        
+        Returns:
+            内容摘要，未去重时返回 None
+        """
+        if not self.dedup_enabled:
+            return None
+        full_path = self._resolve_safe(relative_path)
+        if full_path is None or not full_path.is_file():
+            return None
+        try:
+            return self.blobs.ingest(full_path, sha256)
+        except Exception as e:
+            logger.warning(f"文件去重失败 {relative_path}: {e}")
+            return None
+
+    def link_blob(self, sha256: str, relative_path: str) -> bool:
+        """
+        把已有内容链接到指定相对路径（秒传）
+        
+        Returns:
+            内容存在且链接成功时返回 True
+        """
+        if not self.dedup_enabled:
+            return False
+        full_path = self._resolve_safe(relative_path)
+        if full_path is None:
+            return False
+        try:
+            return self.blobs.link(sha256, full_path)
+        except ValueError:
+            return False
+
     def get_file_info(self, relative_path: str) -> Optional[dict]:
         """
         获取文件信息
@@ -0,0 +1,120 @@
+"""
+流式 ZIP 打包
+边读文件边输出：写入不可回退的输出流时 zipfile 自动使用数据描述符（先写本地头，
+CRC 与大小写在数据之后），超过 4GB 的条目与归档自动启用 ZIP64。
+已压缩的媒体与容器格式直接存储，不再重复压缩。
+
+内存占用与归档总大小无关，只取决于读块大小；首个字节在打开第一个文件后即可发出
+"""
+
+import os
+import zipfile
+import logging
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# 单次读取的块大小
+READ_CHUNK_SIZE = 1024 * 1024
+
+# 已压缩格式：DEFLATE 几乎无收益，只浪费 CPU
+STORED_EXTENSIONS = {
+    # 图片
+    "jpg", "jpeg", "png", "gif", "webp", "heic", "heif", "avif",
+    # 音视频
+    "mp4", "m4v", "mov", "mkv", "webm", "avi", "flv", "mp3", "m4a", "aac", "ogg", "opus", "flac",
+    # 压缩包与基于 ZIP 的文档
+    "zip", "gz", "tgz", "bz2", "xz", "7z", "rar", "zst",
+    "docx", "xlsx", "pptx", "odt", "ods", "odp", "epub", "jar", "apk",
+}
+
+
+class _ChunkSink:
+    """收集 ZipFile 写出的字节，由生成器逐段取走（不支持 tell/seek，强制流式模式）"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        if data:
+            self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def compress_type_for(name: str) -> int:
+    """按扩展名选择压缩方式"""
+    ext = Path(name).suffix.lower().lstrip(".")
+    return zipfile.ZIP_STORED if ext in STORED_EXTENSIONS else zipfile.ZIP_DEFLATED
+
+
+def _unique_arcname(arcname: str, used: set) -> str:
+    """同名条目追加序号，避免解压时互相覆盖"""
+    if arcname not in used:
+        used.add(arcname)
+        return arcname
+    stem, ext = os.path.splitext(arcname)
+    index = 1
+    while f"{stem} ({index}){ext}" in used:
+        index += 1
+    arcname = f"{stem} ({index}){ext}"
+    used.add(arcname)
+    return arcname
+
+
+def iter_zip(
+    entries: Iterable[Tuple[Union[str, os.PathLike], str]],
+    chunk_size: int = READ_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """
+    流式生成 ZIP 数据
+
+    同步生成器，交给 StreamingResponse 时在线程池中迭代，读文件与压缩不阻塞事件循环。
+    无法读取的文件跳过并记录日志，不中断整个下载。
+
+    Args:
+        entries: (文件路径, 归档内名称) 序列
+        chunk_size: 读块大小
+
+    Yields:
+        ZIP 字节片段
+    """
+    sink = _ChunkSink()
+    used_names: set = set()
+    with zipfile.ZipFile(sink, "w") as zf:
+        for path, arcname in entries:
+            try:
+                src = open(path, "rb")
+            except OSError as e:
+                logger.warning(f"打包时跳过无法读取的文件: {arcname}, 错误: {e}")
+                continue
+            with src:
+                zinfo = zipfile.ZipInfo.from_file(
+                    path, _unique_arcname(arcname, used_names), strict_timestamps=False
+                )
+                zinfo.compress_type = compress_type_for(arcname)
+                # file_size 已由 stat 填入，zipfile 据此决定是否为该条目启用 ZIP64
+                with zf.open(zinfo, "w") as dest:
+                    while True:
+                        data = src.read(chunk_size)
+                        if not data:
+                            break
+                        dest.write(data)
+                        chunk = sink.drain()
+                        if chunk:
+                            yield chunk
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    # 中央目录（及 ZIP64 结束记录）
+    chunk = sink.drain()
+    if chunk:
+        yield chunk
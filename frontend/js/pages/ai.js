@@ -1237,6 +1237,20 @@ class AIPage extends Component {
                                 }
                                 throw new Error(errorMsg);
                             }
+                            // 本地推理排队位置（0 表示已开始生成）
+                            if (data.queue_position !== undefined) {
+                                const footerInfo = this.$('.ai-footer-info');
+                                if (footerInfo) {
+                                    let queueEl = footerInfo.querySelector('.queue-status');
+                                    if (!queueEl) {
+                                        queueEl = document.createElement('span');
+                                        queueEl.className = 'queue-status';
+                                        footerInfo.appendChild(queueEl);
+                                    }
+                                    queueEl.textContent = data.queue_position > 0 ? ` | 排队中：第 ${data.queue_position} 位` : '';
+                                }
+                                continue;
+                            }
                             if (data.content) {
                                 aiMsg.content += data.content;
                                 // Token统计：简单估算，每4个字符约等于1个token
@@ -1429,7 +1429,7 @@ class IMPage extends Component {
                                     <div class="im-conv-avatar">${conv.avatar && !/^\s*(javascript|vbscript|data):/i.test(conv.avatar) ? `<img src="${this.escapeHtml(conv.avatar)}" />` : '<i class="ri-user-3-fill"></i>'}</div>
                                     <div class="im-conv-info">
                                         <div class="im-conv-name">${this.escapeHtml(conv.name || '未命名会话')}</div>
-                                        <div class="im-conv-preview">${conv.last_message_time ? this.formatTime(conv.last_message_time) : ''}</div>
+                                        <div class="im-conv-preview">${conv.last_message ? this.escapeHtml(conv.last_message) : (conv.last_message_time ? this.formatTime(conv.last_message_time) : '')}</div>
                                     </div>
                                     ${conv.unread_count > 0 ? `<div class="im-unread-badge">${conv.unread_count > 99 ? '99+' : conv.unread_count}</div>` : ''}
                                 </div>
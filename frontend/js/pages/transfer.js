@@ -332,7 +332,11 @@ class TransferPage extends Component {
                 file_type: selectedFile.type
             });
             if (res.code === 0) {
-                this.setState({ sessionCode: res.data.session_code, isWaiting: true });
+                this.setState({
+                    sessionCode: res.data.session_code,
+                    isWaiting: true,
+                    uploadPlan: { chunkSize: res.data.chunk_size, concurrency: res.data.concurrent_chunks }
+                });
                 this.sendWSMessage('transfer_create', { session_code: res.data.session_code });
                 this.startPolling();
                 Toast.success('传输码已生成');
@@ -380,42 +384,55 @@ class TransferPage extends Component {
     }
 
     async uploadChunks() {
-        const { selectedFile, sessionCode, config } = this.state;
-        const chunkSize = config.chunk_size || 1024 * 1024;
+        const { selectedFile, sessionCode, config, uploadPlan } = this.state;
+        const chunkSize = uploadPlan?.chunkSize || config.chunk_size || 1024 * 1024;
+        const concurrency = Math.max(1, uploadPlan?.concurrency || config.concurrent_chunks || 1);
         const total = Math.ceil(selectedFile.size / chunkSize);
+        let transferred = 0;
+        let failure = null;
+
+        // 多个通道并行领取分块，服务端按偏移写入，到达顺序无关
+        const worker = async () => {
+            while (!failure && this.state.isTransferring && this.currentChunkIndex < total) {
+                const index = this.currentChunkIndex++;
+                const start = index * chunkSize;
+                const chunk = selectedFile.slice(start, Math.min(start + chunkSize, selectedFile.size));
+                const fd = new FormData();
+                fd.append('session_code', sessionCode);
+                fd.append('chunk_index', index);
+                fd.append('chunk', chunk);
 
-        while (this.currentChunkIndex < total) {
-            const start = this.currentChunkIndex * chunkSize;
-            const chunk = selectedFile.slice(start, Math.min(start + chunkSize, selectedFile.size));
-            const fd = new FormData();
-            fd.append('session_code', sessionCode);
-            fd.append('chunk_index', this.currentChunkIndex);
-            fd.append('chunk', chunk);
-
-            try {
                 const res = await Api.upload('/transfer/chunk/upload', fd);
-                if (res.code === 0) {
-                    const elapsed = (Date.now() - this.startTime) / 1000;
-                    this.setState({
-                        transferredBytes: res.data.transferred_bytes,
-                        transferProgress: res.data.progress_percent,
-                        transferSpeed: elapsed > 0 ? res.data.transferred_bytes / elapsed : 0
-                    });
-                    this.sendWSMessage('transfer_progress', {
-                        session_code: sessionCode,
-                        transferred_bytes: res.data.transferred_bytes,
-                        progress_percent: res.data.progress_percent
-                    });
-                    this.currentChunkIndex++;
-                } else {
-                    throw new Error(res.message);
-                }
-            } catch (e) {
-                Toast.error('传输失败: ' + e.message);
-                this.cancelTransfer();
-                return;
+                if (res.code !== 0) throw new Error(res.message);
+
+                // 并发响应可能乱序，进度只前进
+                if (res.data.transferred_bytes <= transferred) continue;
+                transferred = res.data.transferred_bytes;
+                const elapsed = (Date.now() - this.startTime) / 1000;
+                this.setState({
+                    transferredBytes: transferred,
+                    transferProgress: res.data.progress_percent,
+                    transferSpeed: elapsed > 0 ? transferred / elapsed : 0
+                });
+                this.sendWSMessage('transfer_progress', {
+                    session_code: sessionCode,
+                    transferred_bytes: transferred,
+                    progress_percent: res.data.progress_percent
+                });
             }
+        };
+
+        await Promise.all(
+            Array.from({ length: Math.min(concurrency, total) }, () =>
+                worker().catch(e => { failure = failure || e; })
+            )
+        );
+        if (failure) {
+            Toast.error('传输失败: ' + failure.message);
+            this.cancelTransfer();
+            return;
         }
+        if (!this.state.isTransferring) return;
         this.sendWSMessage('transfer_complete', { session_code: sessionCode });
         this.handleTransferComplete();
     }
@@ -481,6 +498,7 @@ class TransferPage extends Component {
         this.setState({
             selectedFile: null,
             sessionCode: null,
+            uploadPlan: null,
             isWaiting: false,
             peerConnected: false,
             isTransferring: false,
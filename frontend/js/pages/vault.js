@@ -24,8 +24,8 @@ class VaultPage extends Component {
             selectedItem: null,
             showPassword: {}
         };
-        // 存储主密码（仅在内存中，页面刷新后需重新输入）
-        this._masterPassword = null;
+        // 解锁令牌（仅在内存中，页面刷新后需重新输入主密码；主密码本身不保留）
+        this._vaultToken = null;
 
         // 自动锁定配置（5分钟 = 300000毫秒）
         this._autoLockTimeout = 5 * 60 * 1000;
@@ -117,7 +117,7 @@ class VaultPage extends Component {
 
             // 加载条目列表
             const itemsRes = await Api.get('/vault/items', itemParams, {
-                headers: this._masterPassword ? { 'X-Vault-Key': this._masterPassword } : {}
+                headers: this._vaultHeaders()
             });
 
             let items = [];
@@ -147,18 +147,24 @@ class VaultPage extends Component {
         }
     }
 
+    _vaultHeaders() {
+        return this._vaultToken ? { 'X-Vault-Token': this._vaultToken } : {};
+    }
+
     async unlock() {
+        let token = null;
         const password = await this.showPasswordPrompt('请输入主密码', '输入您的密码箱主密码以解锁', false, async (pwd) => {
             try {
-                const res = await Api.post('/vault/master/verify', { master_password: pwd });
-                return res.data?.verified === true;
+                const res = await Api.post('/vault/master/unlock', { master_password: pwd });
+                token = res.data?.unlock_token || null;
+                return !!token;
             } catch (e) {
                 return e.message || '密码错误';
             }
         });
 
-        if (password) {
-            this._masterPassword = password;
+        if (password && token) {
+            this._vaultToken = token;
             this.setState({ unlocked: true, isLocked: false }); // 成功解锁，确保清除锁定标记
             this._startAutoLockTimer();
             Toast.success('密码箱已解锁');
@@ -183,7 +189,10 @@ class VaultPage extends Component {
 
     lock() {
         this._stopAutoLockTimer();
-        this._masterPassword = null;
+        if (this._vaultToken) {
+            Api.post('/vault/master/lock', {}, { headers: this._vaultHeaders() }).catch(() => {});
+        }
+        this._vaultToken = null;
         this.setState({ unlocked: false, selectedItem: null, showPassword: {} });
         Toast.info('密码箱已锁定');
     }
@@ -194,7 +203,7 @@ class VaultPage extends Component {
 
         try {
             const res = await Api.post('/vault/master/create', { master_password: password });
-            this._masterPassword = password;
+            this._vaultToken = res.data?.unlock_token || null;
             this.setState({ hasMasterKey: true, unlocked: true });
             this._startAutoLockTimer();
 
@@ -374,7 +383,7 @@ class VaultPage extends Component {
                                 if (modalTitle) modalTitle.textContent = '账户已锁定';
 
                                 // 重要：立即在主页面状态中标记已锁定
-                                this._masterPassword = null;
+                                this._vaultToken = null;
                                 this._stopAutoLockTimer();
                                 this.setState({
                                     isLocked: true,
@@ -554,25 +563,24 @@ class VaultPage extends Component {
     }
 
     async changeMasterKey() {
-        if (!this._masterPassword) {
+        if (!this._vaultToken) {
             Toast.error('请先解锁密码箱');
             return;
         }
 
-        const oldPwd = await this.showPasswordPrompt('验证身份', '请输入当前主密码', false, (pwd) => {
-            return pwd === this._masterPassword;
-        });
+        // 当前主密码由服务端在修改时校验
+        const oldPwd = await this.showPasswordPrompt('验证身份', '请输入当前主密码', false);
         if (!oldPwd) return;
 
         const newPwd = await this.showPasswordPrompt('修改主密码', '强密码要求：至少8位，包含大小写字母和数字', true);
         if (!newPwd) return;
 
         try {
-            await Api.post('/vault/master/change', {
+            const res = await Api.post('/vault/master/change', {
                 old_password: oldPwd,
                 new_password: newPwd
             });
-            this._masterPassword = newPwd;
+            this._vaultToken = res.data?.unlock_token || null;
             Toast.success('主密码修改成功');
         } catch (error) {
             Toast.error('修改失败: ' + (error.message || '未知错误'));
@@ -693,7 +701,7 @@ class VaultPage extends Component {
                 new_password: newPwd
             });
 
-            this._masterPassword = newPwd;
+            this._vaultToken = res.data?.unlock_token || null;
             this.setState({ unlocked: true });
             this._startAutoLockTimer();
 
@@ -740,7 +748,7 @@ class VaultPage extends Component {
 
         try {
             await Api.post('/vault/master/reset');
-            this._masterPassword = null;
+            this._vaultToken = null;
             this.setState({
                 hasMasterKey: false,
                 unlocked: false,
@@ -762,7 +770,7 @@ class VaultPage extends Component {
 
         try {
             const res = await Api.get(`/vault/items/${itemId}`, {}, {
-                headers: { 'X-Vault-Key': this._masterPassword }
+                headers: this._vaultHeaders()
             });
             this.setState({ selectedItem: res.data, view: 'detail' });
         } catch (error) {
@@ -874,12 +882,12 @@ class VaultPage extends Component {
                 try {
                     if (isEdit) {
                         await Api.put(`/vault/items/${item.id}`, data, {
-                            headers: { 'X-Vault-Key': this._masterPassword }
+                            headers: this._vaultHeaders()
                         });
                         Toast.success('保存成功');
                     } else {
                         await Api.post('/vault/items', data, {
-                            headers: { 'X-Vault-Key': this._masterPassword }
+                            headers: this._vaultHeaders()
                         });
                         Toast.success('添加成功');
                     }
@@ -1054,14 +1062,14 @@ class VaultPage extends Component {
     }
 
     async exportData() {
-        if (!this._masterPassword) {
+        if (!this._vaultToken) {
             Toast.error('请先解锁密码箱');
             return;
         }
 
         try {
             const res = await Api.get('/vault/export', {}, {
-                headers: { 'X-Vault-Key': this._masterPassword }
+                headers: this._vaultHeaders()
             });
 
             const data = res.data;
@@ -1082,7 +1090,7 @@ class VaultPage extends Component {
     }
 
     async importData() {
-        if (!this._masterPassword) {
+        if (!this._vaultToken) {
             Toast.error('请先解锁密码箱');
             return;
         }
@@ -1127,7 +1135,7 @@ class VaultPage extends Component {
                 if (!confirmed) return;
 
                 const res = await Api.post('/vault/import', data, {
-                    headers: { 'X-Vault-Key': this._masterPassword }
+                    headers: this._vaultHeaders()
                 });
 
                 Toast.success(`导入完成：${res.data?.imported_items || 0}个密码，${res.data?.skipped_items || 0}个跳过`);